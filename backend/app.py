@@ -58,7 +58,7 @@ except ImportError as exc:
 _log_startup_imports = os.getenv('LOG_STARTUP_IMPORTS', '0') in ('1', 'true', 'True')
 if _log_startup_imports:
 	print("DEBUG: Imported api blueprint from routes")
-from payment_methods_routes import payment_methods_api, ensure_default_payment_types  # 🆕 استيراد payment methods routes
+from payment_methods_routes import payment_methods_api, ensure_default_payment_types, sync_payment_methods_from_settings  # 🆕 استيراد payment methods routes
 if _log_startup_imports:
 	print("DEBUG: Imported payment_methods_api blueprint")
 # استيراد recurring_journal_routes ليتم تسجيل routes على نفس api blueprint
@@ -71,6 +71,7 @@ if _log_startup_imports:
 from branches_routes import branches_bp  # 🆕 استيراد branches routes
 if _log_startup_imports:
 	print("DEBUG: Imported branches_bp blueprint")
+from summary_routes import summary_bp  # 🆕 استيراد POS summary routes
 from posting_routes import posting_bp  # 🆕 استيراد posting routes
 if _log_startup_imports:
 	print("DEBUG: Imported posting_bp blueprint")
@@ -92,6 +93,9 @@ except ImportError as exc:
 	# Bonus routes are optional; avoid noisy warnings on every startup.
 	if _log_startup_imports:
 		print(f"[WARNING] Bonus routes disabled: {exc}")
+from request_limits import init_request_limits
+from audit_pipeline import init_audit_pipeline
+from query_metrics import init_query_metrics
 from schema_guard import (
 	ensure_profit_weight_columns,
 	ensure_invoice_item_scrap_columns,
@@ -106,7 +110,14 @@ from schema_guard import (
 	ensure_employee_gold_safe_columns,
 	ensure_employee_cash_safe_columns,
 	ensure_journal_line_dimension_columns,
+	ensure_journal_statement_indexes,
+	ensure_weight_closing_queue_indexes,
+	ensure_recurring_journal_indexes,
+	ensure_audit_log_indexes,
 	ensure_supplier_columns,
+	ensure_journal_line_entry_date,
+	ensure_invoice_date_indexes,
+	ensure_category_weight_snapshot_unique_index,
 )
 
 import os
@@ -196,7 +207,38 @@ else:
 	# (Flutter web runs on a different origin/port like http://localhost:8080)
 	CORS(app)
 
+
+def _env_int(name: str, default: int) -> int:
+	try:
+		return int(_env_str(name, str(default)).strip())
+	except (TypeError, ValueError):
+		return default
+
+
+def _engine_options_from_env(database_uri: str) -> dict:
+	"""Connection pool settings for server databases (ignored for SQLite).
+
+	Size the pool to the gunicorn thread count so every request thread can hold
+	a connection without queueing: DB_POOL_SIZE defaults to GUNICORN_THREADS.
+	"""
+	if (database_uri or '').startswith('sqlite'):
+		return {}
+	threads = max(_env_int('GUNICORN_THREADS', 8), 1)
+	return {
+		'pool_size': max(_env_int('DB_POOL_SIZE', threads), 1),
+		'max_overflow': max(_env_int('DB_MAX_OVERFLOW', 2), 0),
+		'pool_timeout': max(_env_int('DB_POOL_TIMEOUT', 10), 1),
+		'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+		'pool_pre_ping': _env_str('DB_POOL_PRE_PING', '1').strip().lower() in ('1', 'true', 'yes', 'y', 'on'),
+	}
+
+
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI']))
+
 db.init_app(app)
+init_request_limits(app, db)
+init_audit_pipeline(app)
+init_query_metrics(app, db)
 
 
 @app.after_request
@@ -218,7 +260,7 @@ def _ensure_cors_headers(response):
 			response.headers.setdefault('Vary', 'Origin')
 			response.headers.setdefault(
 				'Access-Control-Allow-Headers',
-				'Authorization, Content-Type, Accept',
+				'Authorization, Content-Type, Accept, Idempotency-Key',
 			)
 			response.headers.setdefault(
 				'Access-Control-Allow-Methods',
@@ -259,19 +301,6 @@ def bypass_auth_for_development():
 	if admin:
 		g.current_user = admin
 
-with app.app_context():
-	ensure_profit_weight_columns(db.engine)
-	ensure_invoice_item_scrap_columns(db.engine)
-	ensure_settings_columns(db.engine)
-	ensure_app_user_security_columns(db.engine)
-	ensure_auth_security_columns(db.engine)
-	ensure_weight_closing_columns(db.engine)
-	ensure_invoice_tax_columns(db.engine)
-	ensure_invoice_barter_columns(db.engine)
-	ensure_invoice_branch_columns(db.engine)
-	ensure_journal_line_dimension_columns(db.engine)
-	ensure_supplier_columns(db.engine)
-	# ensure_weight_closing_support_accounts()  # Moved to after create_tables()
 # ⚠️ ترتيب التسجيل مهم: auth_bp يجب أن يُسجل قبل api لأن auth_bp.login له أولوية
 app.register_blueprint(auth_bp, url_prefix='/api')  # 🆕 تسجيل auth & permissions routes (أولاً!)
 app.register_blueprint(permissions_bp, url_prefix='/api')  # 🆕 تسجيل permissions routes
@@ -282,6 +311,7 @@ if bonus_bp:
 	app.register_blueprint(bonus_bp, url_prefix='/api')  # 🆕 تسجيل bonus routes
 app.register_blueprint(offices_bp)  # 🆕 تسجيل offices routes (has its own prefix /api/offices)
 app.register_blueprint(branches_bp)  # 🆕 تسجيل branches routes (has its own prefix /api/branches)
+app.register_blueprint(summary_bp, url_prefix='/api')  # 🆕 تسجيل POS summary routes
 app.register_blueprint(public_api, url_prefix='/api')  # 🆕 Public (unauthenticated) API
 app.register_blueprint(api, url_prefix='/api')  # ✅ API الرئيسي (أخيراً)
 # recurring_journal_routes تستخدم نفس api blueprint، لذا لا حاجة لتسجيلها
@@ -316,9 +346,9 @@ def readinesscheck():
 	except Exception as exc:
 		return jsonify({'status': 'not_ready', 'error': str(exc)}), 503
 
-def create_tables():
+def run_schema_checks():
+	"""Additive schema self-healing (see schema_guard). Safe to run repeatedly."""
 	with app.app_context():
-		db.create_all()
 		ensure_profit_weight_columns(db.engine)
 		ensure_invoice_item_scrap_columns(db.engine)
 		ensure_settings_columns(db.engine)
@@ -332,14 +362,24 @@ def create_tables():
 		ensure_employee_gold_safe_columns(db.engine)
 		ensure_employee_cash_safe_columns(db.engine)
 		ensure_journal_line_dimension_columns(db.engine)
+		ensure_journal_line_entry_date(db.engine)
+		ensure_journal_statement_indexes(db.engine)
+		ensure_weight_closing_queue_indexes(db.engine)
+		ensure_recurring_journal_indexes(db.engine)
+		ensure_audit_log_indexes(db.engine)
+		ensure_invoice_date_indexes(db.engine)
+		ensure_category_weight_snapshot_unique_index(db.engine)
 		ensure_supplier_columns(db.engine)
 
 
-# In production Docker we run under Gunicorn (`backend.wsgi:app`).
-# In that mode `__main__` is not executed, so we must bootstrap DB tables here
-# to avoid 500s on first-load routes like `/api/auth/check-setup`.
-try:
-	create_tables()
+def create_tables():
+	with app.app_context():
+		db.create_all()
+	run_schema_checks()
+
+
+def _seed_startup_data():
+	"""Seed COA/support accounts/payment types for fresh databases (idempotent)."""
 	with app.app_context():
 		# Allow admin tooling (Full System Wipe) to intentionally keep the system empty
 		# without auto-creating COA/support accounts on worker restart.
@@ -355,59 +395,95 @@ try:
 
 		if bootstrap_disabled:
 			print('[INFO] Startup bootstrap disabled by settings; skipping COA/support account seeding.')
-		else:
-			# Seed chart of accounts only for fresh/empty databases.
-			try:
-				from coa_seed import seed_chart_of_accounts_if_empty
-				seeded = seed_chart_of_accounts_if_empty(db, '../exports/accounts_standard_220126.json')
-				if seeded:
-					print(f"[INFO] Seeded chart of accounts from standard JSON: {seeded} accounts")
-			except Exception as exc:
-				print(f"[WARNING] COA seed skipped/failed: {exc}")
-
-			# Repair/normalize employee gold custody group account numbering on startup.
-			try:
-				from employee_gold_safe_helpers import ensure_employee_gold_group_account
-				ensure_employee_gold_group_account(created_by='system')
-				db.session.commit()
-			except Exception as exc:
-				db.session.rollback()
-				print(f"[WARNING] Employee gold custody bootstrap skipped/failed: {exc}")
-
-			ensure_weight_closing_support_accounts()
-			# Ensure core VAT accounts exist (required by supplier purchase postings).
-			try:
-				from models import Account
-
-				def _ensure_account(account_number, name, acc_type):
-					acc = Account.query.filter_by(account_number=str(account_number)).first()
-					if acc:
-						return acc
-					acc = Account(
-						account_number=str(account_number),
-						name=str(name),
-						type=str(acc_type),
-						transaction_type='cash',
-						tracks_weight=False,
-						parent_id=None,
-					)
-					db.session.add(acc)
-					db.session.flush()
+			return
+
+		# Seed chart of accounts only for fresh/empty databases.
+		try:
+			from coa_seed import seed_chart_of_accounts_if_empty
+			seeded = seed_chart_of_accounts_if_empty(db, '../exports/accounts_standard_220126.json')
+			if seeded:
+				print(f"[INFO] Seeded chart of accounts from standard JSON: {seeded} accounts")
+		except Exception as exc:
+			print(f"[WARNING] COA seed skipped/failed: {exc}")
+
+		# Repair/normalize employee gold custody group account numbering on startup.
+		try:
+			from employee_gold_safe_helpers import ensure_employee_gold_group_account
+			ensure_employee_gold_group_account(created_by='system')
+			db.session.commit()
+		except Exception as exc:
+			db.session.rollback()
+			print(f"[WARNING] Employee gold custody bootstrap skipped/failed: {exc}")
+
+		ensure_weight_closing_support_accounts()
+		# Ensure core VAT accounts exist (required by supplier purchase postings).
+		try:
+			from models import Account
+
+			def _ensure_account(account_number, name, acc_type):
+				acc = Account.query.filter_by(account_number=str(account_number)).first()
+				if acc:
 					return acc
+				acc = Account(
+					account_number=str(account_number),
+					name=str(name),
+					type=str(acc_type),
+					transaction_type='cash',
+					tracks_weight=False,
+					parent_id=None,
+				)
+				db.session.add(acc)
+				db.session.flush()
+				return acc
+
+			_ensure_account('1500', 'ضريبة القيمة المضافة (مدفوعة)', 'Asset')
+			_ensure_account('2210', 'ضريبة القيمة المضافة المستحقة', 'Liability')
+			_ensure_account('1501', 'ضريبة عمولات نقاط البيع (مدفوعة)', 'Asset')
+			db.session.commit()
+		except Exception as exc:
+			db.session.rollback()
+			print(f"[WARNING] VAT accounts bootstrap skipped/failed: {exc}")
+		try:
+			ensure_default_payment_types()
+		except Exception as exc:
+			print(f"[WARNING] Default payment types bootstrap failed: {exc}")
+		# Legacy Settings.payment_methods -> PaymentMethod rows (was done on every GET).
+		try:
+			sync_payment_methods_from_settings()
+		except Exception as exc:
+			db.session.rollback()
+			print(f"[WARNING] Payment methods sync from settings failed: {exc}")
+
+
+def bootstrap_database():
+	"""One-shot DB bootstrap: create tables, schema checks, seed data.
+
+	Run once per deploy (`python backend/bootstrap.py`) or once in the gunicorn
+	master (`--preload`); workers then skip it via STARTUP_BOOTSTRAP=skip.
+	"""
+	create_tables()
+	_seed_startup_data()
+	# Connections opened here must not be inherited by forked workers.
+	with app.app_context():
+		db.session.remove()
+		db.engine.dispose()
+
+
+def _startup_bootstrap_mode() -> str:
+	# import (default): bootstrap when this module is imported (dev, tests, legacy deploys)
+	# skip: a separate one-shot step or the preloading master already did it
+	return (_env_str('STARTUP_BOOTSTRAP', 'import').strip().lower() or 'import')
 
-				_ensure_account('1500', 'ضريبة القيمة المضافة (مدفوعة)', 'Asset')
-				_ensure_account('2210', 'ضريبة القيمة المضافة المستحقة', 'Liability')
-				_ensure_account('1501', 'ضريبة عمولات نقاط البيع (مدفوعة)', 'Asset')
-				db.session.commit()
-			except Exception as exc:
-				db.session.rollback()
-				print(f"[WARNING] VAT accounts bootstrap skipped/failed: {exc}")
-			try:
-				ensure_default_payment_types()
-			except Exception as exc:
-				print(f"[WARNING] Default payment types bootstrap failed: {exc}")
-except Exception as exc:
-	print(f"[WARNING] Startup DB bootstrap failed: {exc}")
+
+# In production Docker we run under Gunicorn (`backend.wsgi:app`).
+# In that mode `__main__` is not executed, so unless bootstrap runs as a separate
+# step we must bootstrap DB tables here to avoid 500s on first-load routes like
+# `/api/auth/check-setup`.
+if _startup_bootstrap_mode() != 'skip':
+	try:
+		bootstrap_database()
+	except Exception as exc:
+		print(f"[WARNING] Startup DB bootstrap failed: {exc}")
 
 
 def reset_database():
@@ -455,12 +531,9 @@ if __name__ == "__main__":
 	print("[INFO] إذا كنت تستخدم جدار حماية أو VPN، أوقفه مؤقتاً.")
 	print(f"[INFO] افتح الرابط التالي من أي جهاز على الشبكة: http://<IP-الجهاز>:{port}/customers")
 	print(f"[INFO] Debug mode: {'ON' if debug_mode else 'OFF'}")
-	create_tables()
-	
-	# تنفيذ ensure_weight_closing_support_accounts داخل application context
-	with app.app_context():
-		ensure_weight_closing_support_accounts()
-	
+	# DB bootstrap (tables, schema checks, seeding) already ran at import time
+	# unless STARTUP_BOOTSTRAP=skip.
+
 	# تفعيل مجدول المكافآت التلقائي
 	try:
 		from schedulers import start_all_schedulers
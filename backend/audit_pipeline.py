@@ -0,0 +1,279 @@
+"""Write-behind audit log pipeline.
+
+`AuditLog.log_action` used to add one row to the request's session per call,
+so batch posting wrote its audit trail inside the same large transaction. With
+the pipeline enabled (`init_audit_pipeline`, AUDIT_WRITE_BEHIND=1) records go
+through a bounded in-process queue instead and a background thread writes them
+with bulk INSERTs:
+
+* a record logged while the caller's transaction is open is held until that
+  transaction commits (and dropped if it rolls back), so the trail never shows
+  work that did not happen; outside a transaction it is queued at once;
+* when the queue is full or the database is unavailable, records go to an
+  append-only JSON-lines spool on disk and are replayed on the next successful
+  write (also across restarts);
+* ``log_action(..., sync=True)`` keeps the old behaviour for security-critical
+  actions: the row joins the caller's transaction and is returned.
+
+Env: AUDIT_WRITE_BEHIND (1), AUDIT_QUEUE_SIZE (10000), AUDIT_BATCH_SIZE (500),
+AUDIT_FLUSH_SECONDS (1), AUDIT_SPOOL_DIR (instance folder).
+"""
+
+from __future__ import annotations
+
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from models import AuditLog, db
+
+LOGGER = logging.getLogger(__name__)
+
+AUDIT_FIELDS = (
+    'user_id', 'user_name', 'action', 'entity_type', 'entity_id', 'entity_number',
+    'details', 'ip_address', 'user_agent', 'success', 'error_message', 'timestamp',
+)
+SPOOL_PREFIX = 'audit-spool-'
+_PENDING_KEY = 'audit_pending'
+_EXTENSION_KEY = 'audit_writer'
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _db_row(record: dict) -> dict:
+    row = {name: record.get(name) for name in AUDIT_FIELDS}
+    if row['details'] is not None and not isinstance(row['details'], str):
+        row['details'] = json.dumps(row['details'], ensure_ascii=False, default=str)
+    if isinstance(row['timestamp'], str):
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    row['timestamp'] = row['timestamp'] or datetime.utcnow()
+    row['success'] = True if row['success'] is None else bool(row['success'])
+    return row
+
+
+class AuditWriter:
+    """Bounded queue + background bulk writer + on-disk spool for audit records."""
+
+    def __init__(self, app, spool_dir: Optional[str] = None, queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_seconds: Optional[float] = None,
+                 threaded: bool = True):
+        self.app = app
+        self.spool_dir = spool_dir or os.getenv('AUDIT_SPOOL_DIR') or app.instance_path
+        self.queue_size = max(queue_size or _env_int('AUDIT_QUEUE_SIZE', 10000), 1)
+        self.batch_size = max(batch_size or _env_int('AUDIT_BATCH_SIZE', 500), 1)
+        self.flush_seconds = flush_seconds if flush_seconds is not None else _env_int('AUDIT_FLUSH_SECONDS', 1)
+        self.threaded = threaded
+        self._spool_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue: queue.Queue = queue.Queue(self.queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    # -- submission ---------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if not self.threaded or (self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()):
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's queue and thread are not ours.
+                self._queue = queue.Queue(self.queue_size)
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, records: List[dict]) -> None:
+        """Queue records without blocking; overflow goes straight to the spool."""
+        self._ensure_thread()
+        overflow = []
+        for record in records:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                overflow.append(record)
+        if overflow:
+            LOGGER.warning('audit queue full, spooling %d record(s)', len(overflow))
+            self._spool(overflow)
+
+    # -- writing ------------------------------------------------------------
+
+    def _write(self, records: List[dict]) -> bool:
+        try:
+            with self.app.app_context():
+                try:
+                    db.session.execute(AuditLog.__table__.insert(), [_db_row(record) for record in records])
+                    db.session.commit()
+                finally:
+                    db.session.remove()
+            return True
+        except Exception:
+            LOGGER.exception('audit write of %d record(s) failed; spooling', len(records))
+            return False
+
+    def _write_or_spool(self, records: List[dict]) -> None:
+        if not records:
+            return
+        if self._write(records):
+            self.replay_spool()
+        else:
+            self._spool(records)
+
+    def _take_batch(self) -> List[dict]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds or 0.1)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._take_batch()
+            try:
+                self._write_or_spool(batch)
+            except Exception:
+                LOGGER.exception('audit writer loop failed')
+            finally:
+                for _record in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Block until every queued record is written (or spooled)."""
+        if self.threaded and self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._queue.join()
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self._write_or_spool(batch)
+            finally:
+                for _record in batch:
+                    self._queue.task_done()
+
+    def close(self) -> None:
+        self.flush()
+        self._stopping.set()
+
+    # -- spool --------------------------------------------------------------
+
+    def _spool_path(self) -> str:
+        return os.path.join(self.spool_dir, f'{SPOOL_PREFIX}{os.getpid()}.jsonl')
+
+    def _spool(self, records: List[dict]) -> None:
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with self._spool_lock, open(self._spool_path(), 'a', encoding='utf-8') as handle:
+                for record in records:
+                    handle.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                handle.flush()
+                os.fsync(handle.fileno())
+        except OSError:
+            LOGGER.exception('audit spool failed; %d record(s) lost', len(records))
+
+    def replay_spool(self) -> int:
+        """Insert spooled records (any process's) once the database is reachable again."""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f'{SPOOL_PREFIX}*.jsonl'))):
+            claimed = f'{path}.replaying-{os.getpid()}'
+            with self._spool_lock:
+                try:
+                    os.replace(path, claimed)  # atomic claim between processes
+                except OSError:
+                    continue
+            with open(claimed, encoding='utf-8') as handle:
+                records = [json.loads(line) for line in handle if line.strip()]
+            ok = True
+            for start in range(0, len(records), self.batch_size):
+                if not self._write(records[start:start + self.batch_size]):
+                    # Keep what is left for the next attempt.
+                    self._spool(records[start:])
+                    ok = False
+                    break
+                replayed += min(self.batch_size, len(records) - start)
+            os.remove(claimed)
+            if not ok:
+                break
+        return replayed
+
+
+# ---------------------------------------------------------------------------
+# Session integration
+# ---------------------------------------------------------------------------
+
+def current_writer() -> Optional[AuditWriter]:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get(_EXTENSION_KEY)
+
+
+def enqueue_audit(record: Dict) -> bool:
+    """Hand a record to the write-behind pipeline. False when it is not enabled here."""
+    writer = current_writer()
+    if writer is None:
+        return False
+    session = db.session()
+    if session.in_transaction():
+        session.info.setdefault(_PENDING_KEY, []).append(record)
+    else:
+        writer.submit([record])
+    return True
+
+
+def _release_pending(session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        writer = current_writer()
+        if writer is not None:
+            writer.submit(pending)
+
+
+def _drop_pending(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+_listeners_installed = False
+
+
+def init_audit_pipeline(app, writer: Optional[AuditWriter] = None) -> Optional[AuditWriter]:
+    """Enable write-behind audit logging for `app` (AUDIT_WRITE_BEHIND=0 keeps inline rows)."""
+    global _listeners_installed
+    if writer is None:
+        if os.getenv('AUDIT_WRITE_BEHIND', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        writer = AuditWriter(app)
+    app.extensions[_EXTENSION_KEY] = writer
+    if not _listeners_installed:
+        event.listen(db.session, 'after_commit', _release_pending)
+        event.listen(db.session, 'after_rollback', _drop_pending)
+        _listeners_installed = True
+    atexit.register(writer.close)
+    return writer
@@ -191,12 +191,23 @@ def _set_last_activity(user_type: str, user_id: int, when: datetime) -> None:
         db.session.rollback()
 
 
-def _touch_last_activity_throttled(user_type: str, user_id: int) -> None:
-    timeout = _idle_timeout_seconds()
+def _touch_last_activity_throttled(
+    user_type: str,
+    user_id: int,
+    timeout: Optional[int] = None,
+    last: Optional[datetime] = None,
+) -> None:
+    """Refresh the activity timestamp at most once per throttle window.
+
+    `timeout` / `last` let a caller that already read them skip the lookups.
+    """
+    if timeout is None:
+        timeout = _idle_timeout_seconds()
     if timeout <= 0:
         return
     now = _now()
-    last = _get_last_activity(user_type, user_id)
+    if last is None:
+        last = _get_last_activity(user_type, user_id)
     # Reduce DB writes, but avoid a throttle that's >= the idle timeout.
     # If timeout is small (e.g. 60s), throttling at 60s can cause false expirations.
     throttle_seconds = 60
@@ -295,7 +306,7 @@ def _enforce_idle_timeout(payload: Dict) -> bool:
         return False
 
     # Valid session: refresh activity timestamp (throttled).
-    _touch_last_activity_throttled(str(user_type), int(user_id))
+    _touch_last_activity_throttled(str(user_type), int(user_id), timeout=timeout, last=last)
     return True
 
 def _get_jwt_secret() -> str:
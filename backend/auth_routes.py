@@ -14,7 +14,7 @@ Endpoints:
 - POST /api/users/<id>/roles - إضافة/إزالة أدوار للمستخدم
 """
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, current_app, request, jsonify, g
 from models import (
     db,
     User,
@@ -38,9 +38,20 @@ from auth_decorators import (
     require_auth, require_permission, require_admin,
     generate_token, get_current_user, get_bearer_token, decode_token_raw
 )
-from config import JWT_REFRESH_TOKEN_EXP_DAYS, ENABLE_REDIS_CACHE
+from config import (
+    JWT_REFRESH_TOKEN_EXP_DAYS,
+    ENABLE_REDIS_CACHE,
+    LOGIN_RATE_LIMIT_MAX_FAILURES,
+    LOGIN_RATE_LIMIT_WINDOW_SECONDS,
+)
 
 from redis_client import get_redis
+from login_throttle import (
+    PasswordCheckBusy,
+    login_failure_bucket,
+    record_login_attempt_row,
+    verify_password_hash,
+)
 
 from typing import Optional, Dict, Tuple
 
@@ -345,50 +356,41 @@ def _issue_refresh_token_for_user(user, user_type: str, days: Optional[int] = No
     return plain
 
 
+def _login_rate_limit_key(ip: Optional[str], user_key: str) -> str:
+    return f'rl:login:{ip or ""}:{user_key}'
+
+
+def _rate_limited_response() -> Tuple[bool, Dict, int]:
+    return True, {
+        'success': False,
+        'message': 'محاولات كثيرة. الرجاء الانتظار دقيقة ثم المحاولة مرة أخرى',
+        'error': 'rate_limited',
+    }, 429
+
+
 def _rate_limit_login(username: Optional[str]) -> Optional[Tuple[bool, Dict, int]]:
     """Return (blocked_response) if too many failed attempts.
 
-    Prefer Redis counters when available; fallback to DB aggregation.
+    Prefer Redis counters when available; fallback to an in-process token
+    bucket (no DB aggregation on the login path).
     """
     ip = _client_ip() or ''
     user_key = (username or '').strip().lower()
+    key = _login_rate_limit_key(ip, user_key)
 
     if ENABLE_REDIS_CACHE:
         r = get_redis()
         if r is not None:
             try:
-                key = f'rl:login:{ip}:{user_key}'
                 current = r.get(key)
-                if current and int(current) >= 5:
-                    return True, {
-                        'success': False,
-                        'message': 'محاولات كثيرة. الرجاء الانتظار دقيقة ثم المحاولة مرة أخرى',
-                        'error': 'rate_limited',
-                    }, 429
+                if current and int(current) >= LOGIN_RATE_LIMIT_MAX_FAILURES:
+                    return _rate_limited_response()
                 return None
             except Exception:
                 pass
 
-    # DB fallback
-    window_start = _now() - timedelta(minutes=1)
-    try:
-        recent_count = (
-            LoginAttempt.query
-            .filter(LoginAttempt.ip_address == ip)
-            .filter(LoginAttempt.created_at >= window_start)
-            .filter(LoginAttempt.username == user_key)
-            .filter(LoginAttempt.success == False)  # noqa: E712
-            .count()
-        )
-        if recent_count >= 5:
-            return True, {
-                'success': False,
-                'message': 'محاولات كثيرة. الرجاء الانتظار دقيقة ثم المحاولة مرة أخرى',
-                'error': 'rate_limited',
-            }, 429
-    except Exception:
-        return None
-
+    if login_failure_bucket.is_blocked(key):
+        return _rate_limited_response()
     return None
 
 
@@ -396,26 +398,32 @@ def _record_login_attempt(username: Optional[str], success: bool, failure_reason
     user_key = (username or '').strip().lower()
     ip = _client_ip()
 
-    db.session.add(LoginAttempt(
-        username=user_key,
-        ip_address=ip,
-        user_agent=_user_agent(),
-        success=bool(success),
-        failure_reason=failure_reason,
-    ))
-    db.session.commit()
+    user_agent = _user_agent()
+    record_login_attempt_row(current_app._get_current_object(), {
+        'username': user_key,
+        'ip_address': ip,
+        'user_agent': user_agent[:255] if user_agent else user_agent,
+        'success': bool(success),
+        'failure_reason': failure_reason,
+    })
+
+    if success:
+        return
 
-    if not success and ENABLE_REDIS_CACHE:
+    key = _login_rate_limit_key(ip, user_key)
+    if ENABLE_REDIS_CACHE:
         r = get_redis()
         if r is not None:
             try:
-                key = f'rl:login:{ip or ""}:{user_key}'
                 value = r.incr(key)
                 if value == 1:
-                    r.expire(key, 60)
+                    r.expire(key, LOGIN_RATE_LIMIT_WINDOW_SECONDS)
+                return
             except Exception:
                 pass
 
+    login_failure_bucket.consume(key)
+
 
 # ==========================================
 # 🔐 المصادقة (Authentication)
@@ -468,7 +476,7 @@ def login():
             app_user = AppUser.query.filter(
                 func.lower(func.trim(AppUser.username)) == username_key
             ).first()
-        if app_user and app_user.check_password(password):
+        if app_user and verify_password_hash(app_user.password_hash, password):
             if not app_user.is_active:
                 _record_login_attempt(username, success=False, failure_reason='inactive_account')
                 return jsonify({'success': False, 'message': 'هذا الحساب غير نشط', 'error': 'inactive_account'}), 403
@@ -510,7 +518,9 @@ def login():
                 ip_address=_client_ip(),
                 user_agent=_user_agent(),
                 success=True,
+                sync=True,
             )
+            db.session.commit()
             return jsonify({
                 'success': True,
                 'message': 'تم تسجيل الدخول بنجاح',
@@ -527,7 +537,7 @@ def login():
                 func.lower(func.trim(User.username)) == username_key
             ).first()
 
-        if not user or not user.check_password(password):
+        if not user or not verify_password_hash(user.password_hash, password):
             _record_login_attempt(username, success=False, failure_reason='invalid_credentials')
 
             AuditLog.log_action(
@@ -539,7 +549,9 @@ def login():
                 user_agent=_user_agent(),
                 success=False,
                 error_message='invalid_credentials',
+                sync=True,
             )
+            db.session.commit()
             return jsonify({'success': False, 'message': 'اسم المستخدم أو كلمة المرور غير صحيحة', 'error': 'invalid_credentials'}), 401
 
         if not user.is_active:
@@ -568,7 +580,9 @@ def login():
             ip_address=_client_ip(),
             user_agent=_user_agent(),
             success=True,
+            sync=True,
         )
+        db.session.commit()
 
         return jsonify({
             'success': True,
@@ -578,7 +592,13 @@ def login():
             'user': user.to_dict(include_roles=True, include_permissions=True),
             'user_type': 'user',
         }), 200
-        
+
+    except PasswordCheckBusy:
+        return jsonify({
+            'success': False,
+            'message': 'الخادم مشغول حالياً. الرجاء المحاولة بعد لحظات',
+            'error': 'server_busy',
+        }), 503
     except Exception as e:
         try:
             db.session.rollback()
@@ -653,7 +673,9 @@ def logout():
             ip_address=_client_ip(),
             user_agent=_user_agent(),
             success=True,
+            sync=True,
         )
+        db.session.commit()
 
         return jsonify({'success': True, 'message': 'تم تسجيل الخروج بنجاح'}), 200
     except Exception as e:
@@ -11,8 +11,9 @@ Backups are stored on the server file system (not on the client device).
 For client-side backups (USB/cloud on the user's device), use the download
 endpoint from the Flutter UI and save/share the file.
 
-Note: Designed for single-process deployments (dev mode). In multi-worker
-setups you should run a singleton scheduler service to avoid duplicates.
+Runs are coordinated through scheduler_leases.singleton_job, so several
+scheduler replicas (or schedulers started inside web workers) still produce a
+single backup per slot.
 """
 
 from __future__ import annotations
@@ -26,6 +27,7 @@ from threading import Thread
 import schedule
 
 from models import Settings, db
+from scheduler_leases import singleton_job
 
 
 class BackupScheduler:
@@ -147,7 +149,7 @@ class BackupScheduler:
                 enabled, mode, interval, at_time, retention = self._read_config()
                 zip_path = self._create_backup_zip()
                 if zip_path is None:
-                    return
+                    raise RuntimeError("unsupported DB backend")
                 self._prune_old_backups(retention)
                 print(f"[BackupScheduler] ✓ Backup created: {zip_path}")
             except Exception as exc:
@@ -156,6 +158,7 @@ class BackupScheduler:
                 except Exception:
                     pass
                 print(f"[BackupScheduler] ❌ Backup failed: {exc}")
+                raise
 
     def _apply_schedule(self, enabled: bool, mode: str, interval_minutes: int, at_time: str) -> None:
         schedule.clear("backup")
@@ -166,7 +169,9 @@ class BackupScheduler:
         normalized = (mode or "daily").strip().lower()
         if normalized == "daily":
             try:
-                schedule.every().day.at(at_time).do(self.run_backup_now).tag("backup")
+                schedule.every().day.at(at_time).do(
+                    singleton_job(self.app, "backup", self.run_backup_now, window_seconds=12 * 3600)
+                ).tag("backup")
                 print(f"[BackupScheduler] Auto-backup enabled daily at {at_time}")
             except Exception as exc:
                 print(f"[BackupScheduler] Invalid daily time '{at_time}': {exc}")
@@ -176,7 +181,9 @@ class BackupScheduler:
         minutes = int(interval_minutes) if interval_minutes else 1440
         if minutes < 1:
             minutes = 1
-        schedule.every(minutes).minutes.do(self.run_backup_now).tag("backup")
+        schedule.every(minutes).minutes.do(
+            singleton_job(self.app, "backup", self.run_backup_now, window_seconds=minutes * 30)
+        ).tag("backup")
         print(f"[BackupScheduler] Auto-backup enabled every {minutes} minute(s)")
 
     def start(self) -> None:
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Latency / query-count benchmarks for the hot endpoints on a synthetic store.
+
+Opt-in (skipped by conftest unless RUN_BENCHMARKS=1):
+
+    RUN_BENCHMARKS=1 python -m pytest -q benchmarks/
+    RUN_BENCHMARKS=1 BENCH_SCALE=large BENCH_DATABASE_URL=postgresql://localhost/bench python -m pytest -q benchmarks/
+
+The store comes from devtools/synthetic_dataset.py. Without BENCH_DATABASE_URL
+it is generated once into a cached SQLite file in the temp dir and every run
+works on a fresh copy; a BENCH_DATABASE_URL database is generated only if it
+has no invoices yet.
+
+Each endpoint is called once to warm up, then BENCH_ROUNDS times (default 5).
+A test fails when its statement count (max over the rounds) exceeds the
+stored baseline, or its best latency (min over the rounds, the least noisy
+statistic) exceeds both baseline x BENCH_LATENCY_TOLERANCE (default 2.0) and
+baseline + BENCH_LATENCY_FLOOR_MS (default 50). Baselines live in
+benchmarks/baselines.json keyed by ``<scale>/<dialect>``; record or refresh
+them with BENCH_UPDATE_BASELINES=1. Statement counts are portable, latencies
+are not: record latency baselines on the machine that runs the suite, or set
+BENCH_LATENCY_TOLERANCE=0 to check statement counts only.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import Flask
+from sqlalchemy import event, update
+
+from auth_decorators import generate_token
+from devtools.synthetic_dataset import generate
+from models import db, Account, Customer, Invoice, User
+from posting_routes import posting_bp
+from routes import api as api_blueprint
+
+BASELINES_FILE = Path(__file__).with_name('baselines.json')
+SCALE = os.getenv('BENCH_SCALE', 'tiny')
+SEED = int(os.getenv('BENCH_SEED', '20250101'))
+ROUNDS = max(int(os.getenv('BENCH_ROUNDS', '5')), 1)
+LATENCY_TOLERANCE = float(os.getenv('BENCH_LATENCY_TOLERANCE', '2.0'))
+LATENCY_FLOOR_MS = float(os.getenv('BENCH_LATENCY_FLOOR_MS', '50'))
+UPDATE_BASELINES = os.getenv('BENCH_UPDATE_BASELINES') == '1'
+POST_BATCH_SIZE = 10
+
+
+def _database_url():
+    url = os.getenv('BENCH_DATABASE_URL')
+    if url:
+        return url
+    cached = Path(tempfile.gettempdir()) / f'synthetic-store-{SCALE}-{SEED}.sqlite'
+    if not cached.exists():
+        app = _make_app(f'sqlite:///{cached}.partial')
+        with app.app_context():
+            db.create_all()
+            generate(SCALE, SEED)
+            db.session.remove()
+            db.engine.dispose()
+        os.replace(f'{cached}.partial', cached)
+    working = Path(tempfile.mkdtemp(prefix='bench-')) / 'store.sqlite'
+    shutil.copyfile(cached, working)
+    return f'sqlite:///{working}'
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    app.register_blueprint(posting_bp, url_prefix='/api')
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+    return app
+
+
+def _load_baselines():
+    if BASELINES_FILE.exists():
+        return json.loads(BASELINES_FILE.read_text(encoding='utf-8'))
+    return {}
+
+
+class HotEndpointBenchmarks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = _make_app(_database_url())
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+        db.create_all()
+        if Invoice.query.first() is None:
+            generate(SCALE, SEED)
+
+        admin = User.query.filter_by(username='bench_admin').first()
+        if admin is None:
+            admin = User(username='bench_admin', password_hash='x', full_name='Bench', is_admin=True)
+            db.session.add(admin)
+            db.session.commit()
+        cls.client = cls.app.test_client()
+        cls.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+        cls.key = f'{SCALE}/{db.engine.dialect.name}'
+        cls.baselines = _load_baselines()
+        cls.results = {}
+        cls.cash_account_id = Account.query.filter_by(account_number='1100').one().id
+        cls.customer_id = Customer.query.filter(Customer.customer_code.like('SYN-%')).order_by(Customer.id).first().id
+        last = db.session.query(db.func.max(Invoice.date)).scalar()
+        cls.report_range = {
+            'start_date': (last - timedelta(days=90)).strftime('%Y-%m-%d'),
+            'end_date': last.strftime('%Y-%m-%d'),
+        }
+        cls.post_batch_ids = [
+            invoice_id for (invoice_id,) in db.session.query(Invoice.id)
+            .filter(Invoice.is_posted.is_(False)).order_by(Invoice.id).limit(POST_BATCH_SIZE)
+        ]
+        db.session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_BASELINES and cls.results:
+            baselines = _load_baselines()
+            baselines.setdefault(cls.key, {}).update(cls.results)
+            BASELINES_FILE.write_text(
+                json.dumps(baselines, indent=2, sort_keys=True, ensure_ascii=False) + '\n', encoding='utf-8')
+        db.session.remove()
+        cls.ctx.pop()
+
+    def _measure(self, name, call, before_round=None):
+        statements = []
+
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        timings, queries = [], []
+        for round_number in range(ROUNDS + 1):
+            if before_round:
+                before_round()
+            db.session.remove()
+            statements.clear()
+            event.listen(db.engine, 'before_cursor_execute', _count)
+            try:
+                started = time.perf_counter()
+                response = call()
+                elapsed_ms = (time.perf_counter() - started) * 1000.0
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', _count)
+            self.assertLess(response.status_code, 400, response.get_data(as_text=True)[:500])
+            if round_number:  # round 0 warms caches
+                timings.append(elapsed_ms)
+                queries.append(len(statements))
+
+        result = {'best_ms': round(min(timings), 1), 'queries': max(queries)}
+        type(self).results[name] = result
+        print(f'\n[bench] {self.key} {name}: {result}')
+        if UPDATE_BASELINES:
+            return
+
+        baseline = self.baselines.get(self.key, {}).get(name)
+        if baseline is None:
+            self.skipTest(f'no baseline for {self.key} {name}; record one with BENCH_UPDATE_BASELINES=1')
+        self.assertLessEqual(
+            result['queries'], baseline['queries'],
+            f"{name}: {result['queries']} statements, baseline {baseline['queries']}")
+        if LATENCY_TOLERANCE <= 0:
+            return
+        allowed_ms = max(baseline['best_ms'] * LATENCY_TOLERANCE, baseline['best_ms'] + LATENCY_FLOOR_MS)
+        self.assertLessEqual(
+            result['best_ms'], allowed_ms,
+            f"{name}: {result['best_ms']} ms, baseline {baseline['best_ms']} ms")
+
+    def test_get_invoices(self):
+        self._measure('get_invoices', lambda: self.client.get('/api/invoices?page=2&per_page=50'))
+
+    def test_get_account_ledger(self):
+        self._measure('get_account_ledger',
+                      lambda: self.client.get(f'/api/account_ledger/{self.cash_account_id}'))
+
+    def test_get_trial_balance(self):
+        self._measure('get_trial_balance', lambda: self.client.get('/api/trial_balance'))
+
+    def test_accounts_balances(self):
+        self._measure('accounts_balances', lambda: self.client.get('/api/accounts/balances'))
+
+    def test_add_invoice(self):
+        sale = {
+            'customer_id': self.customer_id,
+            'invoice_type': 'بيع',
+            'date': datetime.now().strftime('%Y-%m-%d'),
+            'items': [{'name': 'خاتم', 'karat': 21, 'weight': 5.5, 'wage': 10.0, 'price': 2000,
+                       'net': 2000, 'tax': 0, 'quantity': 1}],
+            'total': 2000,
+            'amount_paid': 2000,
+            'payment_method': 'نقدي',
+        }
+        self._measure('add_invoice', lambda: self.client.post('/api/invoices', json=sale))
+
+    def test_post_invoices_batch(self):
+        self.assertTrue(self.post_batch_ids, 'the synthetic store has no unposted invoices')
+
+        def unpost():
+            db.session.execute(
+                update(Invoice).where(Invoice.id.in_(self.post_batch_ids))
+                .values(is_posted=False, posted_at=None, posted_by=None))
+            db.session.commit()
+
+        self._measure(
+            'post_invoices_batch',
+            lambda: self.client.post('/api/invoices/post-batch', json={'invoice_ids': self.post_batch_ids}),
+            before_round=unpost)
+
+    def test_sales_overview_report(self):
+        self._measure('sales_overview',
+                      lambda: self.client.get('/api/reports/sales_overview', query_string=self.report_range))
+
+    def test_sales_by_customer_report(self):
+        self._measure('sales_by_customer',
+                      lambda: self.client.get('/api/reports/sales_by_customer', query_string=self.report_range))
+
+    def test_sales_by_item_report(self):
+        self._measure('sales_by_item',
+                      lambda: self.client.get('/api/reports/sales_by_item', query_string=self.report_range))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,8 @@
 
 from datetime import datetime, timedelta
 
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, insert
+from sqlalchemy.orm import joinedload
 
 from models import (
     BonusInvoiceLink,
@@ -53,7 +54,11 @@ class BonusCalculator:
             )
         )
         total_sales = sales_query.scalar() or 0.0
+        return BonusCalculator._evaluate_sales_bonus(employee, rule, total_sales)
 
+    @staticmethod
+    def _evaluate_sales_bonus(employee, rule, total_sales):
+        """تقييم قاعدة sales_target على إجمالي مبيعات محسوب مسبقاً."""
         conditions = rule.conditions or {}
         sales_target = conditions.get("sales_target", 0)
         if total_sales < sales_target:
@@ -180,20 +185,30 @@ class BonusCalculator:
             eligible_invoices_query = eligible_invoices_query.filter(Invoice.invoice_type.in_(applicable_types))
 
         eligible_invoices = eligible_invoices_query.all()
+        return BonusCalculator._evaluate_profit_bonus(employee, rule, eligible_invoices)
+
+    @staticmethod
+    def _invoice_profit(inv):
+        """الربح النقدي لفاتورة (كائن Invoice أو صف إسقاط بنفس الأعمدة)."""
+        if inv.invoice_type == 'شراء من عميل':
+            return inv.profit_cash or 0
+        total_value = inv.total or 0
+        tax_value = inv.total_tax or 0
+        cost_value = inv.total_cost or 0
+        commission = inv.commission_amount or 0
+        return total_value - tax_value - cost_value - commission
+
+    @staticmethod
+    def _evaluate_profit_bonus(employee, rule, eligible_invoices):
+        """تقييم قاعدة profit_based على فواتير مؤهلة محمّلة مسبقاً."""
+        applicable_types = rule.applicable_invoice_types
 
         # نحسب الربح لكل فاتورة ثم نستبعد الفواتير غير المربحة (<= 0)
         # حتى لا تُسقط فاتورة بخسارة مكافأة الفترة بالكامل.
         profitable_invoice_ids = []
         profitable_per_invoice_profit = []
         for inv in eligible_invoices:
-            if inv.invoice_type == 'شراء من عميل':
-                profit_val = inv.profit_cash or 0
-            else:
-                total_value = inv.total or 0
-                tax_value = inv.total_tax or 0
-                cost_value = inv.total_cost or 0
-                commission = inv.commission_amount or 0
-                profit_val = total_value - tax_value - cost_value - commission
+            profit_val = BonusCalculator._invoice_profit(inv)
             if profit_val > 0:
                 profitable_invoice_ids.append(inv.id)
                 profitable_per_invoice_profit.append(profit_val)
@@ -267,6 +282,10 @@ class BonusCalculator:
         elif rule.rule_type == "profit_based":
             result = BonusCalculator.calculate_profit_bonus(employee, rule, period_start, period_end)
 
+        return BonusCalculator._build_bonus(employee, rule, period_start, period_end, result)
+
+    @staticmethod
+    def _build_bonus(employee, rule, period_start, period_end, result):
         if not result:
             return None
 
@@ -286,123 +305,14 @@ class BonusCalculator:
 
     @staticmethod
     def calculate_all_bonuses_for_period(period_start, period_end, employee_ids=None, rule_ids=None, auto_approve=False, refresh_results=True):
-        bonuses = []
-        processed_bonus_ids = []
-
-        employees_query = Employee.query.filter_by(is_active=True)
-        if employee_ids:
-            employees_query = employees_query.filter(Employee.id.in_(employee_ids))
-        employees = employees_query.all()
-
-        rules_query = BonusRule.query.filter_by(is_active=True)
-        if rule_ids:
-            rules_query = rules_query.filter(BonusRule.id.in_(rule_ids))
-        rules = rules_query.all()
-
-        def _sync_invoice_links(bonus_obj, invoice_ids):
-            if invoice_ids is None:
-                return
-            BonusInvoiceLink.query.filter_by(bonus_id=bonus_obj.id).delete()
-            for inv_id in invoice_ids:
-                db.session.add(BonusInvoiceLink(bonus_id=bonus_obj.id, invoice_id=inv_id))
-
-        def _linked_invoice_ids_for(employee_id, rule_id):
-            bonus_ids = [
-                b.id
-                for b in EmployeeBonus.query.filter_by(
-                    employee_id=employee_id,
-                    bonus_rule_id=rule_id,
-                    period_start=period_start,
-                    period_end=period_end,
-                ).all()
-            ]
-            if not bonus_ids:
-                return set()
-            links = BonusInvoiceLink.query.filter(BonusInvoiceLink.bonus_id.in_(bonus_ids)).all()
-            return {l.invoice_id for l in links}
-
-        for employee in employees:
-            for rule in rules:
-                existing_bonuses = EmployeeBonus.query.filter_by(
-                    employee_id=employee.id,
-                    bonus_rule_id=rule.id,
-                    period_start=period_start,
-                    period_end=period_end,
-                ).all()
-
-                # إذا وجد مكافأة معتمدة/مدفوعة مسبقاً لنفس الفترة، لا نعدلها
-                # فقط نُعيدها في النتيجة
-                immutable_existing = next((b for b in existing_bonuses if b.status in ("approved", "paid")), None)
-                if immutable_existing and not auto_approve:
-                    for b in existing_bonuses:
-                        processed_bonus_ids.append(b.id)
-                        bonuses.append(b)
-                    continue
-
-                # السلوك الافتراضي السابق: إذا يوجد مكافأة مرفوضة، لا تغيّرها
-                if existing_bonuses and not auto_approve and any(b.status == "rejected" for b in existing_bonuses):
-                    for b in existing_bonuses:
-                        processed_bonus_ids.append(b.id)
-                        bonuses.append(b)
-                    continue
-
-                # إذا كانت هناك مكافآت معلقة متعددة، نحذف القديمة ونحتفظ بواحدة فقط
-                if len(existing_bonuses) > 1:
-                    # نحذف جميع المكافآت المعلقة ما عدا الأحدث
-                    existing_bonuses.sort(key=lambda x: x.id, reverse=True)
-                    for old_bonus in existing_bonuses[1:]:
-                        if old_bonus.status == "pending":
-                            db.session.delete(old_bonus)
-
-                existing = existing_bonuses[0] if existing_bonuses else None
-                bonus = BonusCalculator.calculate_bonus(employee, rule, period_start, period_end)
-                if not bonus:
-                    continue
-
-                target_status = "approved" if auto_approve else "pending"
-
-                if existing:
-                    existing.amount = bonus.amount
-                    existing.calculation_data = bonus.calculation_data
-                    existing.status = target_status
-                    if auto_approve:
-                        existing.approved_by = "system"
-                        existing.approved_at = datetime.utcnow()
-
-                    invoice_ids = bonus.calculation_data.get("invoice_ids") if bonus.calculation_data else None
-                    if invoice_ids is not None:
-                        _sync_invoice_links(existing, invoice_ids)
-
-                    processed_bonus_ids.append(existing.id)
-                    bonuses.append(existing)
-                else:
-                    if auto_approve:
-                        bonus.approve("system")
-                    db.session.add(bonus)
-                    db.session.flush()
-
-                    invoice_ids = bonus.calculation_data.get("invoice_ids") if bonus.calculation_data else None
-                    if invoice_ids is not None:
-                        _sync_invoice_links(bonus, invoice_ids)
-
-                    processed_bonus_ids.append(bonus.id)
-                    bonuses.append(bonus)
-
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            print(f"خطأ في حساب المكافآت: {e}")
-            return []
-
-        if refresh_results and processed_bonus_ids:
-            bonuses = (
-                EmployeeBonus.query.filter(EmployeeBonus.id.in_(processed_bonus_ids))
-                .order_by(EmployeeBonus.employee_id.asc(), EmployeeBonus.bonus_rule_id.asc().nullsfirst())
-                .all()
-            )
-
-        return bonuses
+        """حساب مكافآت جميع الموظفين/القواعد لفترة (يفوّض إلى BonusBatchEngine)."""
+        engine = BonusBatchEngine(
+            period_start,
+            period_end,
+            employee_ids=employee_ids,
+            rule_ids=rule_ids,
+        )
+        return engine.run(auto_approve=auto_approve, refresh_results=refresh_results)
 
     @staticmethod
     def calculate_bonus_for_invoice(invoice_id):
@@ -486,3 +396,246 @@ class BonusCalculator:
             "bonuses_count": len(bonuses),
             "bonuses": [b.to_dict(include_employee=False, include_rule=True) for b in bonuses],
         }
+
+
+class BonusBatchEngine:
+    """محرك حساب المكافآت على مستوى المجموعة (Set-based).
+
+    بدلاً من تنفيذ استعلام فواتير واستعلام مكافآت لكل (موظف × قاعدة):
+    - تُحمّل الفواتير المرحلة للفترة مرة واحدة (إسقاط أعمدة فقط) وتُجمّع حسب
+      posted_by ونوع الفاتورة.
+    - تُحمّل المكافآت الموجودة للفترة مرة واحدة وتُفهرس حسب (employee_id, rule_id).
+    - تُقيّم كل القواعد على هذه التجميعات في الذاكرة.
+    - تُكتب المكافآت الجديدة وروابط الفواتير دفعة واحدة (bulk) ثم commit واحد.
+    """
+
+    # الأعمدة المطلوبة لتقييم قواعد المبيعات والأرباح
+    _INVOICE_COLUMNS = (
+        Invoice.id,
+        Invoice.posted_by,
+        Invoice.invoice_type,
+        Invoice.total,
+        Invoice.total_tax,
+        Invoice.total_cost,
+        Invoice.commission_amount,
+        Invoice.profit_cash,
+    )
+
+    def __init__(self, period_start, period_end, employee_ids=None, rule_ids=None):
+        self.period_start = period_start
+        self.period_end = period_end
+        self.employee_ids = employee_ids
+        self.rule_ids = rule_ids
+
+        self.employees = []
+        self.rules = []
+        # username -> invoice_type -> [rows]
+        self._invoices_by_user = {}
+        # (employee_id, rule_id) -> [EmployeeBonus]
+        self._existing = {}
+
+    # ------------------------------------------------------------------
+    # التحميل
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _username_for(employee):
+        account = getattr(employee, "user_account", None)
+        return account.username if account and account.username else None
+
+    def _load_employees_and_rules(self):
+        employees_query = Employee.query.options(joinedload(Employee.user_account)).filter_by(is_active=True)
+        if self.employee_ids:
+            employees_query = employees_query.filter(Employee.id.in_(self.employee_ids))
+        self.employees = employees_query.all()
+
+        rules_query = BonusRule.query.filter_by(is_active=True)
+        if self.rule_ids:
+            rules_query = rules_query.filter(BonusRule.id.in_(self.rule_ids))
+        self.rules = rules_query.all()
+
+    def _load_invoices(self):
+        self._invoices_by_user = {}
+        usernames = {u for u in (self._username_for(e) for e in self.employees) if u}
+        if not usernames:
+            return
+
+        # القواعد الوحيدة التي تقرأ الفواتير هي المبيعات والأرباح
+        if not any(r.rule_type in ("sales_target", "profit_based") for r in self.rules):
+            return
+
+        try:
+            period_start_dt = datetime.combine(self.period_start, datetime.min.time())
+            period_end_dt = datetime.combine(self.period_end, datetime.max.time())
+        except (TypeError, AttributeError):
+            return
+
+        rows = (
+            db.session.query(*self._INVOICE_COLUMNS)
+            .filter(
+                Invoice.posted_by.in_(usernames),
+                Invoice.date >= period_start_dt,
+                Invoice.date <= period_end_dt,
+                Invoice.is_posted.is_(True),
+            )
+            .order_by(Invoice.id.asc())
+            .all()
+        )
+        for row in rows:
+            by_type = self._invoices_by_user.setdefault(row.posted_by, {})
+            by_type.setdefault(row.invoice_type, []).append(row)
+
+    def _load_existing_bonuses(self):
+        self._existing = {}
+        employee_ids = [e.id for e in self.employees]
+        rule_ids = [r.id for r in self.rules]
+        if not employee_ids or not rule_ids:
+            return
+
+        existing = EmployeeBonus.query.filter(
+            EmployeeBonus.employee_id.in_(employee_ids),
+            EmployeeBonus.bonus_rule_id.in_(rule_ids),
+            EmployeeBonus.period_start == self.period_start,
+            EmployeeBonus.period_end == self.period_end,
+        ).all()
+        for bonus in existing:
+            self._existing.setdefault((bonus.employee_id, bonus.bonus_rule_id), []).append(bonus)
+
+    # ------------------------------------------------------------------
+    # التقييم في الذاكرة
+    # ------------------------------------------------------------------
+    def _evaluate(self, employee, rule):
+        """مكافئ BonusCalculator.calculate_bonus لكن على البيانات المحمّلة مسبقاً."""
+        if not rule.is_active or not rule.is_valid_for_employee(employee):
+            return None
+
+        if rule.rule_type == "sales_target":
+            username = self._username_for(employee)
+            if not username:
+                return None
+            sales_rows = self._invoices_by_user.get(username, {}).get("بيع", [])
+            total_sales = sum((row.total or 0.0) for row in sales_rows)
+            result = BonusCalculator._evaluate_sales_bonus(employee, rule, total_sales)
+        elif rule.rule_type == "profit_based":
+            username = self._username_for(employee)
+            if not username:
+                return None
+            by_type = self._invoices_by_user.get(username, {})
+            applicable_types = rule.applicable_invoice_types
+            if applicable_types and len(applicable_types) > 0:
+                eligible = [row for t in applicable_types for row in by_type.get(t, [])]
+                eligible.sort(key=lambda row: row.id)
+            else:
+                eligible = sorted((row for rows in by_type.values() for row in rows), key=lambda row: row.id)
+            result = BonusCalculator._evaluate_profit_bonus(employee, rule, eligible)
+        elif rule.rule_type == "attendance":
+            result = BonusCalculator.calculate_attendance_bonus(employee, rule, self.period_start, self.period_end)
+        elif rule.rule_type == "performance":
+            result = BonusCalculator.calculate_performance_bonus(employee, rule, self.period_start, self.period_end)
+        elif rule.rule_type == "fixed":
+            result = BonusCalculator.calculate_fixed_bonus(employee, rule, self.period_start, self.period_end)
+        else:
+            result = None
+
+        return BonusCalculator._build_bonus(employee, rule, self.period_start, self.period_end, result)
+
+    # ------------------------------------------------------------------
+    # التشغيل
+    # ------------------------------------------------------------------
+    def run(self, auto_approve=False, refresh_results=True):
+        self._load_employees_and_rules()
+        self._load_invoices()
+        self._load_existing_bonuses()
+
+        bonuses = []
+        new_bonuses = []
+        stale_bonus_ids = []
+        # bonus object -> invoice ids (تُربط بعد flush حتى تتوفر المعرفات)
+        pending_links = []
+        target_status = "approved" if auto_approve else "pending"
+
+        for employee in self.employees:
+            for rule in self.rules:
+                existing_bonuses = list(self._existing.get((employee.id, rule.id), []))
+
+                # إذا وجد مكافأة معتمدة/مدفوعة مسبقاً لنفس الفترة، لا نعدلها
+                immutable_existing = next((b for b in existing_bonuses if b.status in ("approved", "paid")), None)
+                if immutable_existing and not auto_approve:
+                    bonuses.extend(existing_bonuses)
+                    continue
+
+                # السلوك الافتراضي السابق: إذا يوجد مكافأة مرفوضة، لا تغيّرها
+                if existing_bonuses and not auto_approve and any(b.status == "rejected" for b in existing_bonuses):
+                    bonuses.extend(existing_bonuses)
+                    continue
+
+                # إذا كانت هناك مكافآت معلقة متعددة، نحذف القديمة ونحتفظ بواحدة فقط
+                if len(existing_bonuses) > 1:
+                    existing_bonuses.sort(key=lambda x: x.id, reverse=True)
+                    for old_bonus in existing_bonuses[1:]:
+                        if old_bonus.status == "pending":
+                            stale_bonus_ids.append(old_bonus.id)
+
+                existing = existing_bonuses[0] if existing_bonuses else None
+                bonus = self._evaluate(employee, rule)
+                if not bonus:
+                    continue
+
+                invoice_ids = bonus.calculation_data.get("invoice_ids") if bonus.calculation_data else None
+
+                if existing:
+                    existing.amount = bonus.amount
+                    existing.calculation_data = bonus.calculation_data
+                    existing.status = target_status
+                    if auto_approve:
+                        existing.approved_by = "system"
+                        existing.approved_at = datetime.utcnow()
+                    if invoice_ids is not None:
+                        pending_links.append((existing, invoice_ids))
+                    bonuses.append(existing)
+                else:
+                    if auto_approve:
+                        bonus.approve("system")
+                    new_bonuses.append(bonus)
+                    if invoice_ids is not None:
+                        pending_links.append((bonus, invoice_ids))
+                    bonuses.append(bonus)
+
+        try:
+            if stale_bonus_ids:
+                BonusInvoiceLink.query.filter(BonusInvoiceLink.bonus_id.in_(stale_bonus_ids)).delete(
+                    synchronize_session=False
+                )
+                EmployeeBonus.query.filter(EmployeeBonus.id.in_(stale_bonus_ids)).delete(synchronize_session=False)
+
+            if new_bonuses:
+                db.session.add_all(new_bonuses)
+            db.session.flush()
+
+            if pending_links:
+                synced_ids = [b.id for b, _ in pending_links]
+                BonusInvoiceLink.query.filter(BonusInvoiceLink.bonus_id.in_(synced_ids)).delete(
+                    synchronize_session=False
+                )
+                link_rows = [
+                    {"bonus_id": b.id, "invoice_id": inv_id}
+                    for b, invoice_ids in pending_links
+                    for inv_id in invoice_ids
+                ]
+                if link_rows:
+                    db.session.execute(insert(BonusInvoiceLink), link_rows)
+
+            processed_bonus_ids = [b.id for b in bonuses]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"خطأ في حساب المكافآت: {e}")
+            return []
+
+        if refresh_results and processed_bonus_ids:
+            bonuses = (
+                EmployeeBonus.query.filter(EmployeeBonus.id.in_(processed_bonus_ids))
+                .order_by(EmployeeBonus.employee_id.asc(), EmployeeBonus.bonus_rule_id.asc().nullsfirst())
+                .all()
+            )
+
+        return bonuses
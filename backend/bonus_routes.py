@@ -17,6 +17,7 @@ Endpoints:
 from flask import Blueprint, request, jsonify, g
 from models import db, Employee, BonusRule, EmployeeBonus, Voucher, VoucherAccountLine, Account, Office, SafeBox
 from bonus_calculator import BonusCalculator
+from office_balances import apply_office_deltas, lock_office
 from datetime import datetime, date
 from auth_decorators import require_auth, require_permission, require_any_permission
 from sqlalchemy import or_, func
@@ -892,7 +893,8 @@ def pay_bonus(bonus_id):
             if not office_id:
                 return jsonify({'success': False, 'message': 'يجب تحديد الخزينة'}), 400
 
-            office = Office.query.get(office_id)
+            # قفل صف المكتب حتى لا يتجاوز صرفان متزامنان الرصيد نفسه
+            office = lock_office(office_id)
             if not office:
                 return jsonify({'success': False, 'message': 'الخزينة غير موجودة'}), 404
 
@@ -1003,7 +1005,7 @@ def pay_bonus(bonus_id):
             safe_type_ar = {'cash': 'نقدي', 'bank': 'بنكي', 'gold': 'ذهبي', 'check': 'شيكات'}.get(safe_box.safe_type, safe_box.safe_type)
             bonus.notes = f"{(bonus.notes or '').strip()}\nتم الدفع من خزينة: {safe_box.name} ({safe_type_ar})".strip()
         else:
-            office.balance_cash -= bonus.amount
+            apply_office_deltas(office.id, balance_cash=-bonus.amount)
 
         # تحديث المكافأة وربطها بالخزينة (office فقط لمسار التوافق)
         bonus.mark_as_paid(voucher_number)
@@ -14,7 +14,8 @@ import time
 from threading import Thread
 from datetime import datetime, date, timedelta
 from calendar import monthrange
-from bonus_calculator import BonusCalculator
+from bonus_calculator import BonusBatchEngine
+from scheduler_leases import singleton_job
 
 
 class BonusScheduler:
@@ -33,9 +34,7 @@ class BonusScheduler:
                 
                 print(f"[BonusScheduler] حساب المكافآت اليومية: {yesterday}")
                 
-                bonuses = BonusCalculator.calculate_all_bonuses_for_period(
-                    period_start=yesterday,
-                    period_end=yesterday,
+                bonuses = BonusBatchEngine(yesterday, yesterday).run(
                     auto_approve=False  # تتطلب الموافقة اليدوية
                 )
                 
@@ -46,6 +45,7 @@ class BonusScheduler:
                     
             except Exception as e:
                 print(f"[BonusScheduler] ❌ خطأ في حساب المكافآت اليومية: {e}")
+                raise
     
     def calculate_weekly_bonuses(self):
         """حساب المكافآت الأسبوعية"""
@@ -58,9 +58,7 @@ class BonusScheduler:
                 
                 print(f"[BonusScheduler] حساب المكافآت الأسبوعية: {last_monday} إلى {last_sunday}")
                 
-                bonuses = BonusCalculator.calculate_all_bonuses_for_period(
-                    period_start=last_monday,
-                    period_end=last_sunday,
+                bonuses = BonusBatchEngine(last_monday, last_sunday).run(
                     auto_approve=False
                 )
                 
@@ -71,6 +69,7 @@ class BonusScheduler:
                     
             except Exception as e:
                 print(f"[BonusScheduler] ❌ خطأ في حساب المكافآت الأسبوعية: {e}")
+                raise
     
     def calculate_monthly_bonuses(self):
         """حساب المكافآت الشهرية"""
@@ -93,9 +92,7 @@ class BonusScheduler:
                 
                 print(f"[BonusScheduler] حساب المكافآت الشهرية: {period_start} إلى {period_end}")
                 
-                bonuses = BonusCalculator.calculate_all_bonuses_for_period(
-                    period_start=period_start,
-                    period_end=period_end,
+                bonuses = BonusBatchEngine(period_start, period_end).run(
                     auto_approve=False
                 )
                 
@@ -107,6 +104,7 @@ class BonusScheduler:
                     
             except Exception as e:
                 print(f"[BonusScheduler] ❌ خطأ في حساب المكافآت الشهرية: {e}")
+                raise
     
     def check_pending_bonuses(self):
         """التحقق من المكافآت المعلقة وإرسال تنبيهات"""
@@ -121,20 +119,29 @@ class BonusScheduler:
                     
             except Exception as e:
                 print(f"[BonusScheduler] ❌ خطأ في التحقق من المكافآت المعلقة: {e}")
+                raise
     
     def setup_schedule(self):
         """إعداد جدول المهام"""
         # حساب المكافآت اليومية - كل يوم الساعة 1:00 صباحاً
-        schedule.every().day.at("01:00").do(self.calculate_daily_bonuses)
+        schedule.every().day.at("01:00").do(
+            singleton_job(self.app, "bonus_daily", self.calculate_daily_bonuses, window_seconds=12 * 3600)
+        )
         
         # حساب المكافآت الأسبوعية - كل يوم اثنين الساعة 2:00 صباحاً
-        schedule.every().monday.at("02:00").do(self.calculate_weekly_bonuses)
+        schedule.every().monday.at("02:00").do(
+            singleton_job(self.app, "bonus_weekly", self.calculate_weekly_bonuses, window_seconds=3 * 86400)
+        )
         
         # حساب المكافآت الشهرية - أول يوم من كل شهر الساعة 3:00 صباحاً
-        schedule.every().day.at("03:00").do(self._check_and_calculate_monthly)
+        schedule.every().day.at("03:00").do(
+            singleton_job(self.app, "bonus_monthly", self._check_and_calculate_monthly, window_seconds=12 * 3600)
+        )
         
         # التحقق من المكافآت المعلقة - كل 6 ساعات
-        schedule.every(6).hours.do(self.check_pending_bonuses)
+        schedule.every(6).hours.do(
+            singleton_job(self.app, "bonus_pending_check", self.check_pending_bonuses, window_seconds=3 * 3600)
+        )
         
         print("[BonusScheduler] ✓ تم إعداد جدول المكافآت التلقائية")
         print("[BonusScheduler] - مكافآت يومية: 1:00 صباحاً")
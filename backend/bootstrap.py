@@ -0,0 +1,35 @@
+"""One-shot database bootstrap (run once per deploy).
+
+Creates missing tables, runs the schema_guard checks and seeds the chart of
+accounts / support accounts / payment types. Web workers and the scheduler can
+then start with STARTUP_BOOTSTRAP=skip so they do none of this on import.
+
+Usage:
+	python backend/bootstrap.py
+"""
+
+import os
+import sys
+import time
+
+# Importing app must not bootstrap a second time.
+os.environ['STARTUP_BOOTSTRAP'] = 'skip'
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import bootstrap_database  # noqa: E402
+
+
+def main() -> int:
+	started = time.perf_counter()
+	try:
+		bootstrap_database()
+	except Exception as exc:
+		print(f"[ERROR] Bootstrap failed: {exc}")
+		return 1
+	print(f"[INFO] Bootstrap completed in {time.perf_counter() - started:.2f}s")
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
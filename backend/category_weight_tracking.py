@@ -1,10 +1,24 @@
 from __future__ import annotations
 
+from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from models import Category, CategoryWeightMovement, Employee, Invoice, Item, SafeBox, Settings, db
+from models import (
+    CATEGORY_WEIGHT_SNAPSHOT_BUCKET,
+    Category,
+    CategoryWeightMonthlySnapshot,
+    CategoryWeightMovement,
+    Employee,
+    Invoice,
+    Item,
+    SafeBox,
+    Settings,
+    db,
+)
 
 
 def _coerce_float(value, default: float = 0.0) -> float:
@@ -101,11 +115,13 @@ def resolve_gold_safe_box_id_for_invoice(invoice: Invoice, karat: Optional[float
 def record_category_weight_movements_for_invoice_payload(
     invoice_id: int,
     items_payload: Optional[List[Dict[str, Any]]] = None,
+    is_new_invoice: bool = False,
 ) -> Dict[str, Any]:
     """Create category-weight movements for a posted invoice (idempotent).
 
     Uses the original invoice request payload so category-only lines can be
-    tracked even when InvoiceItem doesn't store category_id.
+    tracked even when InvoiceItem doesn't store category_id. `is_new_invoice`
+    (invoice created in this transaction) skips the already-recorded probe.
     """
 
     invoice = Invoice.query.get(invoice_id)
@@ -116,7 +132,7 @@ def record_category_weight_movements_for_invoice_payload(
     if not bool(getattr(invoice, 'is_posted', False)):
         return {'status': 'skipped', 'reason': 'invoice_not_posted'}
 
-    existing = CategoryWeightMovement.query.filter_by(invoice_id=invoice.id).first()
+    existing = None if is_new_invoice else CategoryWeightMovement.query.filter_by(invoice_id=invoice.id).first()
     if existing:
         return {'status': 'ok', 'reason': 'already_recorded', 'created': 0}
 
@@ -223,68 +239,360 @@ def record_category_weight_movements_for_invoice_payload(
     return {'status': 'ok', 'created': created}
 
 
-def get_category_weight_balances(
+def _apply_balance_filters(
+    q,
+    model,
     safe_box_id: Optional[int] = None,
     category_id: Optional[int] = None,
     karat: Optional[float] = None,
-    group_by_karat: bool = False,
     gold_type: Optional[str] = None,
-) -> List[Dict[str, Any]]:
-    """Return balances aggregated by (safe_box, category[, karat])."""
-
-    select_cols = [
-        CategoryWeightMovement.safe_box_id,
-        CategoryWeightMovement.category_id,
-    ]
-    if group_by_karat:
-        select_cols.append(CategoryWeightMovement.karat)
-
-    q = db.session.query(
-        *select_cols,
-        func.sum(CategoryWeightMovement.weight_delta_main_karat).label('main_total'),
-        func.sum(CategoryWeightMovement.weight_delta_grams).label('grams_total'),
-    )
-
+):
+    """Apply the shared balance filters to a query over movements or snapshots."""
     if safe_box_id:
-        q = q.filter(CategoryWeightMovement.safe_box_id == int(safe_box_id))
+        q = q.filter(model.safe_box_id == int(safe_box_id))
     if category_id:
-        q = q.filter(CategoryWeightMovement.category_id == int(category_id))
+        q = q.filter(model.category_id == int(category_id))
     if gold_type:
         gt = str(gold_type).strip()
         if gt:
-            q = q.filter(CategoryWeightMovement.gold_type == gt)
+            q = q.filter(model.gold_type == gt)
     if karat is not None:
         k = _coerce_float(karat, 0.0)
         # Compare with tolerance to avoid float equality issues.
-        q = q.filter(func.abs(CategoryWeightMovement.karat - k) < 0.001)
+        q = q.filter(func.abs(model.karat - k) < 0.001)
+    return q
+
+
+def _balance_payload(
+    sb_id,
+    sb_name,
+    cat_id,
+    cat_name,
+    main_total,
+    grams_total,
+    group_by_karat: bool,
+    k=None,
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        'safe_box_id': sb_id,
+        'safe_box_name': sb_name,
+        'category_id': cat_id,
+        'category_name': cat_name,
+        'weight_main_karat': round(float(main_total or 0.0), 6),
+        'weight_grams_signed': round(float(grams_total or 0.0), 6),
+    }
+    if group_by_karat:
+        payload['karat'] = float(k) if k is not None else None
+    return payload
+
 
-    group_cols = [CategoryWeightMovement.safe_box_id, CategoryWeightMovement.category_id]
+def _balances_base_query(
+    safe_box_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    karat: Optional[float] = None,
+    group_by_karat: bool = False,
+    gold_type: Optional[str] = None,
+):
+    """Grouped aggregate with SafeBox/Category names joined in (no per-row lookups)."""
+    group_cols = [
+        CategoryWeightMovement.safe_box_id,
+        SafeBox.name,
+        CategoryWeightMovement.category_id,
+        Category.name,
+    ]
     if group_by_karat:
         group_cols.append(CategoryWeightMovement.karat)
+
+    main_sum = func.sum(CategoryWeightMovement.weight_delta_main_karat)
+    grams_sum = func.sum(CategoryWeightMovement.weight_delta_grams)
+
+    q = (
+        db.session.query(*group_cols)
+        .select_from(CategoryWeightMovement)
+        .outerjoin(SafeBox, SafeBox.id == CategoryWeightMovement.safe_box_id)
+        .outerjoin(Category, Category.id == CategoryWeightMovement.category_id)
+    )
+    q = _apply_balance_filters(
+        q,
+        CategoryWeightMovement,
+        safe_box_id=safe_box_id,
+        category_id=category_id,
+        karat=karat,
+        gold_type=gold_type,
+    )
     q = q.group_by(*group_cols)
 
-    rows = q.all() or []
+    order_cols = [
+        CategoryWeightMovement.safe_box_id.asc(),
+        CategoryWeightMovement.category_id.asc(),
+    ]
+    if group_by_karat:
+        order_cols.append(CategoryWeightMovement.karat.asc())
+
+    return q, main_sum, grams_sum, order_cols
+
+
+def count_category_weight_balances(
+    safe_box_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    karat: Optional[float] = None,
+    group_by_karat: bool = False,
+    gold_type: Optional[str] = None,
+) -> int:
+    """Number of balance rows get_category_weight_balances() would return (for paging)."""
+    q, _, _, _ = _balances_base_query(
+        safe_box_id=safe_box_id,
+        category_id=category_id,
+        karat=karat,
+        group_by_karat=group_by_karat,
+        gold_type=gold_type,
+    )
+    return int(q.order_by(None).count() or 0)
+
+
+def get_category_weight_balances(
+    safe_box_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    karat: Optional[float] = None,
+    group_by_karat: bool = False,
+    gold_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    include_running_total: bool = False,
+) -> List[Dict[str, Any]]:
+    """Return balances aggregated by (safe_box, category[, karat]).
+
+    Names are joined into the aggregate query. Rows are ordered by
+    (safe_box_id, category_id[, karat]) so `limit`/`offset` paging is stable.
+    With `include_running_total`, each row also carries cumulative totals over
+    the full ordered result (computed in SQL, so they stay correct across pages).
+    """
+
+    q, main_sum, grams_sum, order_cols = _balances_base_query(
+        safe_box_id=safe_box_id,
+        category_id=category_id,
+        karat=karat,
+        group_by_karat=group_by_karat,
+        gold_type=gold_type,
+    )
+
+    extra_cols = [main_sum.label('main_total'), grams_sum.label('grams_total')]
+    if include_running_total:
+        extra_cols.append(func.sum(main_sum).over(order_by=order_cols).label('running_main'))
+        extra_cols.append(func.sum(grams_sum).over(order_by=order_cols).label('running_grams'))
+    q = q.add_columns(*extra_cols).order_by(*order_cols)
+
+    if offset:
+        q = q.offset(max(int(offset), 0))
+    if limit is not None:
+        q = q.limit(max(int(limit), 0))
+
     out: List[Dict[str, Any]] = []
+    for row in q.all() or []:
+        payload = _balance_payload(
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row.main_total,
+            row.grams_total,
+            group_by_karat,
+            k=row[4] if group_by_karat else None,
+        )
+        if include_running_total:
+            payload['running_weight_main_karat'] = round(float(row.running_main or 0.0), 6)
+            payload['running_weight_grams_signed'] = round(float(row.running_grams or 0.0), 6)
+        out.append(payload)
 
-    for row in rows:
-        if group_by_karat:
-            sb_id, cat_id, k, main_total, grams_total = row
-        else:
-            sb_id, cat_id, main_total, grams_total = row
-            k = None
-
-        sb = SafeBox.query.get(sb_id)
-        cat = Category.query.get(cat_id)
-        payload: Dict[str, Any] = {
-            'safe_box_id': sb_id,
-            'safe_box_name': sb.name if sb else None,
-            'category_id': cat_id,
-            'category_name': cat.name if cat else None,
-            'weight_main_karat': round(float(main_total or 0.0), 6),
-            'weight_grams_signed': round(float(grams_total or 0.0), 6),
-        }
+    return out
+
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month: date) -> date:
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def _snapshot_horizon() -> Optional[date]:
+    """Last month covered by snapshots (snapshots are always a contiguous prefix)."""
+    return db.session.query(func.max(CategoryWeightMonthlySnapshot.month)).scalar()
+
+
+def refresh_category_weight_snapshots(through: Optional[date] = None) -> Dict[str, Any]:
+    """Build monthly snapshots for every closed month not yet snapshotted.
+
+    Each missing month is materialised with a single INSERT ... SELECT ... GROUP BY
+    that upserts on uq_cw_snapshot_bucket, so two refreshes racing over the same
+    month leave one row per bucket. The current month is never snapshotted.
+    Caller commits.
+    """
+    last_month = _month_start(_month_start(date.today()) - timedelta(days=1))
+    if through and _month_start(through) < last_month:
+        last_month = _month_start(through)
+
+    horizon = _snapshot_horizon()
+    if horizon is not None:
+        month = _next_month(horizon)
+    else:
+        first_at = db.session.query(func.min(CategoryWeightMovement.created_at)).scalar()
+        if not first_at:
+            return {'status': 'ok', 'months': 0, 'rows': 0}
+        month = _month_start(first_at)
+
+    months = 0
+    rows = 0
+    snapshot_table = CategoryWeightMonthlySnapshot.__table__
+    dialect = db.session.get_bind().dialect.name
+    insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+    while month <= last_month:
+        month_end = _next_month(month)
+        start_dt = datetime.combine(month, datetime.min.time())
+        end_dt = datetime.combine(month_end, datetime.min.time())
+        source = (
+            select(
+                literal(month).label('month'),
+                CategoryWeightMovement.safe_box_id,
+                CategoryWeightMovement.category_id,
+                CategoryWeightMovement.karat,
+                CategoryWeightMovement.gold_type,
+                func.sum(CategoryWeightMovement.weight_delta_main_karat),
+                func.sum(CategoryWeightMovement.weight_delta_grams),
+                func.count(CategoryWeightMovement.id),
+                literal(datetime.utcnow()),
+            )
+            .where(CategoryWeightMovement.created_at >= start_dt, CategoryWeightMovement.created_at < end_dt)
+            .group_by(
+                CategoryWeightMovement.safe_box_id,
+                CategoryWeightMovement.category_id,
+                CategoryWeightMovement.karat,
+                CategoryWeightMovement.gold_type,
+            )
+        )
+        statement = insert(snapshot_table).from_select(
+            [
+                'month',
+                'safe_box_id',
+                'category_id',
+                'karat',
+                'gold_type',
+                'weight_main_karat',
+                'weight_grams',
+                'movement_count',
+                'created_at',
+            ],
+            source,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=list(CATEGORY_WEIGHT_SNAPSHOT_BUCKET),
+            set_={
+                'weight_main_karat': statement.excluded.weight_main_karat,
+                'weight_grams': statement.excluded.weight_grams,
+                'movement_count': statement.excluded.movement_count,
+                'created_at': statement.excluded.created_at,
+            },
+        )
+        result = db.session.execute(statement)
+        rows += max(int(result.rowcount or 0), 0)
+        months += 1
+        month = month_end
+
+    return {'status': 'ok', 'months': months, 'rows': rows}
+
+
+def get_category_weight_balances_as_of(
+    as_of: date,
+    safe_box_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    karat: Optional[float] = None,
+    group_by_karat: bool = False,
+    gold_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    include_running_total: bool = False,
+) -> List[Dict[str, Any]]:
+    """Balances as of the end of `as_of` (inclusive).
+
+    Sums closed-month snapshots up to the snapshot horizon, then scans only the
+    movements between the horizon and the as-of date.
+    """
+    end_dt = datetime.combine(as_of, datetime.min.time()) + timedelta(days=1)
+    tail_start = _month_start(end_dt)
+    horizon = _snapshot_horizon()
+    if horizon is None:
+        tail_start = None
+    elif _next_month(horizon) < tail_start:
+        tail_start = _next_month(horizon)
+
+    filters = dict(safe_box_id=safe_box_id, category_id=category_id, karat=karat, gold_type=gold_type)
+    totals: Dict[Tuple, List[float]] = {}
+
+    def _accumulate(rows) -> None:
+        for row in rows:
+            key = (row[0], row[1], row[2] if group_by_karat else None)
+            bucket = totals.setdefault(key, [0.0, 0.0])
+            bucket[0] += float(row.main_total or 0.0)
+            bucket[1] += float(row.grams_total or 0.0)
+
+    if tail_start is not None:
+        snap = CategoryWeightMonthlySnapshot
+        snap_cols = [snap.safe_box_id, snap.category_id]
         if group_by_karat:
-            payload['karat'] = float(k) if k is not None else None
+            snap_cols.append(snap.karat)
+        q = db.session.query(
+            *snap_cols,
+            func.sum(snap.weight_main_karat).label('main_total'),
+            func.sum(snap.weight_grams).label('grams_total'),
+        ).filter(snap.month < tail_start)
+        q = _apply_balance_filters(q, snap, **filters)
+        _accumulate(q.group_by(*snap_cols).all())
+
+    mv = CategoryWeightMovement
+    mv_cols = [mv.safe_box_id, mv.category_id]
+    if group_by_karat:
+        mv_cols.append(mv.karat)
+    q = db.session.query(
+        *mv_cols,
+        func.sum(mv.weight_delta_main_karat).label('main_total'),
+        func.sum(mv.weight_delta_grams).label('grams_total'),
+    ).filter(mv.created_at < end_dt)
+    if tail_start is not None:
+        q = q.filter(mv.created_at >= datetime.combine(tail_start, datetime.min.time()))
+    q = _apply_balance_filters(q, mv, **filters)
+    _accumulate(q.group_by(*mv_cols).all())
+
+    safe_ids = {k[0] for k in totals}
+    cat_ids = {k[1] for k in totals}
+    safe_names = dict(db.session.query(SafeBox.id, SafeBox.name).filter(SafeBox.id.in_(safe_ids)).all()) if safe_ids else {}
+    cat_names = dict(db.session.query(Category.id, Category.name).filter(Category.id.in_(cat_ids)).all()) if cat_ids else {}
+
+    ordered_keys = sorted(totals, key=lambda k: (k[0], k[1], k[2] if k[2] is not None else -1.0))
+    out: List[Dict[str, Any]] = []
+    running_main = 0.0
+    running_grams = 0.0
+    for key in ordered_keys:
+        main_total, grams_total = totals[key]
+        payload = _balance_payload(
+            key[0],
+            safe_names.get(key[0]),
+            key[1],
+            cat_names.get(key[1]),
+            main_total,
+            grams_total,
+            group_by_karat,
+            k=key[2],
+        )
+        if include_running_total:
+            running_main += main_total
+            running_grams += grams_total
+            payload['running_weight_main_karat'] = round(running_main, 6)
+            payload['running_weight_grams_signed'] = round(running_grams, 6)
         out.append(payload)
 
-    return out
+    start = max(int(offset or 0), 0)
+    if limit is not None:
+        return out[start:start + max(int(limit), 0)]
+    return out[start:]
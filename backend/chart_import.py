@@ -0,0 +1,526 @@
+"""Chart-of-accounts import engine: validate in memory, write in one transaction.
+
+A chart (the /accounts/export JSON, the legacy JSON dict/list exports, or a CSV
+with the export's columns) is normalised and validated entirely in memory.
+Parents and memo twins are resolved through dicts keyed by account number, so
+duplicates, missing references and parent cycles are all reported together
+before anything is written.
+
+`apply_chart` writes a plan with a few executemany statements (insert the new
+accounts, update the changed ones, relink parent/memo ids) and `renumber_chart`
+rewrites account numbers with one set-based ``UPDATE ... CASE``. Neither
+commits: the caller commits once, so a failed import leaves no partial chart
+behind. `ChartPlan.changes()` is the dry-run diff.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional
+
+from sqlalchemy import String, case, cast, delete, insert, literal, select, update
+
+from config import WEIGHT_SUPPORT_ACCOUNTS
+from mapping_resolver import DEFAULT_ACCOUNT_NUMBERS, mark_accounts_changed
+from models import Account, db
+
+TRANSACTION_TYPES = ('cash', 'gold', 'both')
+ATTRIBUTES = ('name', 'type', 'transaction_type', 'tracks_weight', 'bank_name', 'account_number_external', 'account_type')
+LINKS = ('parent_account_number', 'memo_account_number')
+ACCOUNT_NUMBER_LENGTH = Account.__table__.c.account_number.type.length
+
+# النسخة الوزنية لكل حساب مالي: '7' + رقم الحساب، تحت جذر المذكرة (7)
+MEMO_PREFIX = '7'
+MEMO_ROOT_NUMBER = '7'
+MEMO_ROOT_NAME = 'حسابات المذكرة'
+
+# حسابات يبحث عنها الكود برقمها مباشرة (routes.py، حسابات الموظفين والمكاتب).
+# تغيير رقمها يجعل الترحيل يفشل في إيجادها أو يجد حساباً آخر بنفس الرقم.
+CODE_REFERENCED_ACCOUNT_NUMBERS = (
+    '110', '1100', '1110', '1112', '1120', '120', '1200', '130', '1290',
+    '1300', '1310', '1320', '1330', '1340', '1350', '1500', '170', '1700',
+    '21', '210', '2100', '211', '21100', '21110', '220', '240', '51', '5113', '5114',
+    '71', '71100', '71300', '71310', '71320', '71330', '71340', '7340',
+)
+
+
+class ChartImportError(ValueError):
+    """The chart failed validation; `errors` lists every problem found."""
+
+    def __init__(self, errors: List[str]):
+        self.errors = list(errors)
+        message = '; '.join(self.errors[:5])
+        if len(self.errors) > 5:
+            message += f' (+{len(self.errors) - 5} more)'
+        super().__init__(message)
+
+
+def memo_number(financial_number: str) -> str:
+    return f'{MEMO_PREFIX}{financial_number}'
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def protected_account_numbers() -> FrozenSet[str]:
+    """Account numbers the code or config looks up by number (see plan_renumbering)."""
+    numbers = set(CODE_REFERENCED_ACCOUNT_NUMBERS)
+    numbers.update(str(number) for number in DEFAULT_ACCOUNT_NUMBERS.values() if number is not None)
+    for entry in WEIGHT_SUPPORT_ACCOUNTS:
+        for side in ('financial', 'memo'):
+            spec = entry.get(side) or {}
+            numbers.update(str(spec[key]) for key in ('account_number', 'parent_number') if spec.get(key))
+    return frozenset(numbers)
+
+
+def derive_transaction_type(account_number: str, tracks_weight: bool) -> str:
+    number = (account_number or '').strip()
+    if number.startswith(('1W', '2W', '3W', '4W', '5W')):
+        return 'gold'
+    # Legacy memo tree commonly used 7xxxx
+    if number.startswith(MEMO_PREFIX) and tracks_weight:
+        return 'gold'
+    return 'cash'
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def read_chart(content: Any, fmt: str = 'json', default_transaction_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Normalised rows of a chart. `content` is text/bytes or already-parsed JSON."""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if fmt == 'csv':
+        return normalize_rows(list(csv.DictReader(io.StringIO(content))), default_transaction_type)
+
+    raw = json.loads(content) if isinstance(content, str) else content
+    if isinstance(raw, dict):
+        if isinstance(raw.get('accounts'), list):
+            rows = raw['accounts']
+        elif isinstance(raw.get('data'), list):
+            rows = raw['data']
+        elif raw and all(isinstance(value, dict) for value in raw.values()):
+            # Legacy import dict keyed by account_number
+            rows = list(raw.values())
+        else:
+            raise ChartImportError(['Unsupported JSON chart format'])
+    elif isinstance(raw, list):
+        rows = raw
+    else:
+        raise ChartImportError(['Unsupported JSON chart format'])
+
+    bad_rows = [str(index) for index, row in enumerate(rows, start=1) if not isinstance(row, dict)]
+    if bad_rows:
+        raise ChartImportError([f'row {index}: account row must be an object' for index in bad_rows])
+    return normalize_rows(rows, default_transaction_type)
+
+
+def read_chart_file(path, default_transaction_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    path = Path(path)
+    return read_chart(path.read_bytes(), 'csv' if path.suffix.lower() == '.csv' else 'json', default_transaction_type)
+
+
+def normalize_rows(rows: List[Mapping[str, Any]], default_transaction_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rows keyed by account number; legacy ``parent_id``/``memo_account_id`` are translated.
+
+    A row without transaction_type gets `default_transaction_type`, or when
+    that is None the type derived from its number (`derive_transaction_type`).
+    """
+    id_to_number: Dict[int, str] = {}
+    for row in rows:
+        number = _text(row.get('account_number'))
+        try:
+            if number and row.get('id') not in (None, ''):
+                id_to_number[int(row['id'])] = number
+        except (TypeError, ValueError):
+            pass
+
+    def reference(row, number_key, legacy_key):
+        number = _text(row.get(number_key))
+        if number is None and row.get(legacy_key) not in (None, ''):
+            try:
+                number = id_to_number.get(int(row[legacy_key]))
+            except (TypeError, ValueError):
+                number = None
+        return number
+
+    normalized = []
+    for row in rows:
+        number = _text(row.get('account_number'))
+        tracks_weight = _flag(row.get('tracks_weight'))
+        transaction_type = (
+            _text(row.get('transaction_type'))
+            or default_transaction_type
+            or derive_transaction_type(number, tracks_weight)
+        )
+        normalized.append({
+            'account_number': number,
+            'name': _text(row.get('name')),
+            'type': _text(row.get('type')),
+            'transaction_type': transaction_type.lower(),
+            'tracks_weight': tracks_weight,
+            'bank_name': _text(row.get('bank_name')),
+            'account_number_external': _text(row.get('account_number_external')),
+            'account_type': _text(row.get('account_type')),
+            'parent_account_number': reference(row, 'parent_account_number', 'parent_id') or _text(row.get('parent_number')),
+            'memo_account_number': reference(row, 'memo_account_number', 'memo_account_id'),
+        })
+    return normalized
+
+
+# ---------------------------------------------------------------------------
+# Planning (in memory)
+# ---------------------------------------------------------------------------
+
+def _existing_accounts() -> Dict[str, Dict[str, Any]]:
+    """Every stored account keyed by number, with parent/memo as numbers (one query)."""
+    rows = db.session.execute(select(
+        Account.id,
+        Account.account_number,
+        Account.parent_id,
+        Account.memo_account_id,
+        *(getattr(Account, attribute) for attribute in ATTRIBUTES),
+    )).mappings().all()
+    id_to_number = {row['id']: row['account_number'] for row in rows}
+    return {
+        row['account_number']: {
+            'id': row['id'],
+            **{attribute: row[attribute] for attribute in ATTRIBUTES},
+            'tracks_weight': bool(row['tracks_weight']),
+            'parent_account_number': id_to_number.get(row['parent_id']),
+            'memo_account_number': id_to_number.get(row['memo_account_id']),
+        }
+        for row in rows
+    }
+
+
+@dataclass
+class ChartPlan:
+    rows: Dict[str, Dict[str, Any]]
+    replace: bool = False
+    create: List[str] = field(default_factory=list)
+    update: List[dict] = field(default_factory=list)
+    relink: List[dict] = field(default_factory=list)
+    delete: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def summary(self) -> dict:
+        return {
+            'count': len(self.rows),
+            'created': len(self.create),
+            'updated': len(self.update),
+            'relinked': len(self.relink),
+            'deleted': len(self.delete),
+            'unchanged': self.unchanged,
+        }
+
+    def changes(self, limit: Optional[int] = 200) -> dict:
+        """Dry-run diff: summary counts plus up to `limit` entries per kind."""
+        cut = slice(None, limit)
+        return {
+            **self.summary(),
+            'create': [
+                {'account_number': number, 'name': self.rows[number]['name']} for number in self.create[cut]
+            ],
+            'update': self.update[cut],
+            'relink': self.relink[cut],
+            'delete': self.delete[cut],
+        }
+
+
+def _add_memo_twins(rows: Dict[str, Dict[str, Any]], known: Dict[str, Dict[str, Any]], errors: List[str]) -> None:
+    """Give every financial (cash) account without a memo link its '7' + number twin."""
+    financial = [row for row in rows.values() if row['transaction_type'] == 'cash' and not row['memo_account_number']]
+    if not financial:
+        return
+    for row in financial:
+        row['memo_account_number'] = memo_number(row['account_number'])
+
+    if MEMO_ROOT_NUMBER not in rows and MEMO_ROOT_NUMBER not in known:
+        rows[MEMO_ROOT_NUMBER] = {
+            'account_number': MEMO_ROOT_NUMBER, 'name': MEMO_ROOT_NAME, 'type': 'Equity',
+            'transaction_type': 'gold', 'tracks_weight': True,
+            'bank_name': None, 'account_number_external': None, 'account_type': None,
+            'parent_account_number': None, 'memo_account_number': None,
+        }
+
+    for row in financial:
+        twin = row['memo_account_number']
+        if twin in rows or twin in known:
+            continue
+        if len(twin) > ACCOUNT_NUMBER_LENGTH:
+            errors.append(f'{twin}: memo twin number is longer than {ACCOUNT_NUMBER_LENGTH} characters')
+            continue
+        parent = row['parent_account_number']
+        parent_row = rows.get(parent) or known.get(parent) or {}
+        rows[twin] = {
+            'account_number': twin,
+            'name': f"{row['name']} وزني",
+            'type': row['type'],
+            'transaction_type': 'gold',
+            'tracks_weight': True,
+            'bank_name': None,
+            'account_number_external': None,
+            'account_type': None,
+            'parent_account_number': parent_row.get('memo_account_number') or MEMO_ROOT_NUMBER,
+            'memo_account_number': None,
+        }
+
+
+def plan_chart(rows: List[Dict[str, Any]], *, memo_twins: bool = False, replace: bool = False) -> ChartPlan:
+    """Validate `rows` against each other and the stored chart; raise ChartImportError on any problem.
+
+    `replace` plans a full rebuild: stored accounts missing from the chart are
+    deleted and references may only point inside the chart.
+    """
+    errors: List[str] = []
+    by_number: Dict[str, Dict[str, Any]] = {}
+    for index, row in enumerate(rows, start=1):
+        number = row.get('account_number')
+        if not number:
+            errors.append(f'row {index}: account_number is required')
+            continue
+        if number in by_number:
+            errors.append(f'{number}: duplicate account_number')
+            continue
+        if len(number) > ACCOUNT_NUMBER_LENGTH:
+            errors.append(f'{number}: account_number is longer than {ACCOUNT_NUMBER_LENGTH} characters')
+        for key in ('name', 'type'):
+            if not row.get(key):
+                errors.append(f'{number}: {key} is required')
+        if row.get('transaction_type') not in TRANSACTION_TYPES:
+            errors.append(f"{number}: transaction_type must be one of {', '.join(TRANSACTION_TYPES)}")
+        by_number[number] = dict(row)
+    if errors:
+        raise ChartImportError(errors)
+
+    existing = _existing_accounts()
+    known = {} if replace else existing
+    if memo_twins:
+        _add_memo_twins(by_number, known, errors)
+
+    parent_of = {number: account['parent_account_number'] for number, account in known.items()}
+    for number, row in by_number.items():
+        parent_of[number] = row['parent_account_number']
+        for key in LINKS:
+            reference = row[key]
+            if reference and reference not in by_number and reference not in known:
+                errors.append(f'{number}: {key} {reference} not found')
+
+    # Parent cycles (a -> b -> a) would make the tree unreachable from any root.
+    settled = set()
+    for start in by_number:
+        path, node = [], start
+        while node and node not in settled:
+            if node in path:
+                errors.append(f'{start}: parent cycle through {node}')
+                break
+            path.append(node)
+            node = parent_of.get(node)
+        settled.update(path)
+    if errors:
+        raise ChartImportError(errors)
+
+    plan = ChartPlan(rows=dict(sorted(by_number.items(), key=lambda item: (len(item[0]), item[0]))), replace=replace)
+    for number, row in plan.rows.items():
+        current = existing.get(number)
+        if current is None:
+            plan.create.append(number)
+            continue
+        fields = {
+            attribute: {'from': current[attribute], 'to': row[attribute]}
+            for attribute in ATTRIBUTES
+            if current[attribute] != row[attribute]
+        }
+        links = {
+            key: {'from': current[key], 'to': row[key]}
+            for key in LINKS
+            if current[key] != row[key]
+        }
+        if fields:
+            plan.update.append({'account_number': number, 'fields': fields})
+        if links:
+            plan.relink.append({'account_number': number, **links})
+        if not fields and not links:
+            plan.unchanged += 1
+    if replace:
+        plan.delete = sorted(set(existing) - set(plan.rows), key=lambda number: (len(number), number))
+    return plan
+
+
+# ---------------------------------------------------------------------------
+# Writing (caller commits)
+# ---------------------------------------------------------------------------
+
+def _expire_accounts() -> None:
+    for instance in list(db.session.identity_map.values()):
+        if isinstance(instance, Account):
+            db.session.expire(instance)
+
+
+def apply_chart(plan: ChartPlan) -> dict:
+    """Write `plan` with executemany statements inside the current transaction.
+
+    In replace mode every stored account is deleted first; rows referencing
+    accounts (journal lines, safe boxes, mappings, ...) must already be gone.
+    """
+    db.session.flush()
+    if plan.replace:
+        db.session.execute(update(Account).values(parent_id=None, memo_account_id=None))
+        db.session.execute(delete(Account).execution_options(synchronize_session=False))
+        inserted = list(plan.rows)
+        updated = []
+    else:
+        inserted = plan.create
+        updated = [entry['account_number'] for entry in plan.update]
+
+    if inserted:
+        db.session.execute(insert(Account), [
+            {'account_number': number, **{attribute: plan.rows[number][attribute] for attribute in ATTRIBUTES}}
+            for number in inserted
+        ])
+    number_to_id = dict(db.session.execute(select(Account.account_number, Account.id)).all())
+
+    if updated:
+        db.session.execute(update(Account).execution_options(synchronize_session=False), [
+            {'id': number_to_id[number], **{attribute: plan.rows[number][attribute] for attribute in ATTRIBUTES}}
+            for number in updated
+        ])
+
+    linked = [number for number in inserted if any(plan.rows[number][key] for key in LINKS)]
+    if not plan.replace:
+        linked += [entry['account_number'] for entry in plan.relink]
+    if linked:
+        db.session.execute(update(Account).execution_options(synchronize_session=False), [
+            {
+                'id': number_to_id[number],
+                'parent_id': number_to_id.get(plan.rows[number]['parent_account_number']),
+                'memo_account_id': number_to_id.get(plan.rows[number]['memo_account_number']),
+            }
+            for number in linked
+        ])
+
+    mark_accounts_changed(db.session)
+    _expire_accounts()
+    return plan.summary()
+
+
+def import_chart(rows: List[Dict[str, Any]], *, memo_twins: bool = False, replace: bool = False,
+                 dry_run: bool = False, limit: Optional[int] = 200) -> dict:
+    """Plan and (unless `dry_run`) apply a chart; returns the diff. The caller commits."""
+    plan = plan_chart(rows, memo_twins=memo_twins, replace=replace)
+    if not dry_run:
+        apply_chart(plan)
+    return {'dry_run': dry_run, **plan.changes(limit)}
+
+
+# ---------------------------------------------------------------------------
+# Renumbering
+# ---------------------------------------------------------------------------
+
+def plan_renumbering(mapping: Mapping[str, str], follow_memo_twins: bool = True,
+                     allow_protected: bool = False) -> List[dict]:
+    """Validate an ``{old_number: new_number}`` mapping; raise ChartImportError on any problem.
+
+    With `follow_memo_twins`, a renumbered financial account takes its
+    '7' + number memo twin along unless the mapping already moves it.
+    Moving an account from or onto a `protected_account_numbers()` number is
+    rejected unless `allow_protected` is set.
+    """
+    errors: List[str] = []
+    rows = db.session.execute(select(Account.id, Account.account_number, Account.memo_account_id)).all()
+    by_number = {number: (account_id, memo_id) for account_id, number, memo_id in rows}
+    id_to_number = {account_id: number for account_id, number, _memo_id in rows}
+
+    moves: Dict[str, str] = {}
+    for old, new in mapping.items():
+        old, new = _text(old), _text(new)
+        if not old or not new:
+            errors.append(f'{old or new or "?"}: both the current and the new account number are required')
+        elif old not in by_number:
+            errors.append(f'{old}: account not found')
+        elif len(new) > ACCOUNT_NUMBER_LENGTH:
+            errors.append(f'{new}: account_number is longer than {ACCOUNT_NUMBER_LENGTH} characters')
+        else:
+            moves[old] = new
+
+    if follow_memo_twins:
+        for old, new in list(moves.items()):
+            twin = id_to_number.get(by_number[old][1])
+            if twin == memo_number(old) and twin not in moves:
+                moves[twin] = memo_number(new)
+
+    moves = {old: new for old, new in moves.items() if old != new}
+    if not allow_protected:
+        protected = protected_account_numbers()
+        for old, new in moves.items():
+            for number in (old, new):
+                if number in protected:
+                    errors.append(f'{number}: account number is referenced by the system (set allow_protected to renumber it)')
+    targets: Dict[str, str] = {}
+    for old, new in moves.items():
+        if new in targets:
+            errors.append(f'{new}: target of both {targets[new]} and {old}')
+        targets[new] = old
+        if new in by_number and new not in moves:
+            errors.append(f'{new}: already used by another account')
+    if errors:
+        raise ChartImportError(errors)
+
+    return [
+        {'id': by_number[old][0], 'from': old, 'to': new}
+        for old, new in sorted(moves.items(), key=lambda item: (len(item[0]), item[0]))
+    ]
+
+
+def renumber_chart(mapping: Mapping[str, str], *, follow_memo_twins: bool = True, dry_run: bool = False,
+                   allow_protected: bool = False) -> dict:
+    """Rewrite account numbers in one set-based UPDATE (the caller commits).
+
+    Ids do not change, so journal lines, parents and memo links follow on their
+    own. Chains and swaps (a -> b, b -> a) first park the moved rows on a
+    temporary number so the unique index never sees two rows with one number.
+    """
+    changes = plan_renumbering(mapping, follow_memo_twins=follow_memo_twins, allow_protected=allow_protected)
+    if changes and not dry_run:
+        db.session.flush()
+        ids = [change['id'] for change in changes]
+        moved = update(Account).where(Account.id.in_(ids)).execution_options(synchronize_session=False)
+        if {change['from'] for change in changes} & {change['to'] for change in changes}:
+            db.session.execute(moved.values(account_number=literal('#', String) + cast(Account.id, String)))
+        db.session.execute(moved.values(
+            account_number=case({change['id']: change['to'] for change in changes}, value=Account.id),
+        ))
+        mark_accounts_changed(db.session)
+        _expire_accounts()
+    return {'dry_run': dry_run, 'count': len(changes), 'changes': changes}
+
+
+__all__ = [
+    'ChartImportError',
+    'ChartPlan',
+    'apply_chart',
+    'import_chart',
+    'memo_number',
+    'plan_chart',
+    'plan_renumbering',
+    'protected_account_numbers',
+    'read_chart',
+    'read_chart_file',
+    'renumber_chart',
+]
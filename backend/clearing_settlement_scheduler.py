@@ -22,6 +22,7 @@ import schedule
 from sqlalchemy import case, func
 
 from models import db, PaymentMethod, SafeBoxTransaction, Voucher
+from scheduler_leases import singleton_job
 
 
 @dataclass
@@ -222,7 +223,9 @@ class ClearingSettlementScheduler:
 
     def setup_schedule(self):
         # Run once per day at 04:10.
-        schedule.every().day.at('04:10').do(self.process_due_settlements)
+        schedule.every().day.at('04:10').do(
+            singleton_job(self.app, 'clearing_settlement', self.process_due_settlements, window_seconds=12 * 3600)
+        )
         print('[ClearingSettlementScheduler] ✓ Auto settlement scheduled daily at 04:10')
 
     def start(self):
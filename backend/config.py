@@ -75,6 +75,53 @@ REDIS_URL = os.getenv('REDIS_URL', '').strip()
 ENABLE_REDIS_CACHE = _env_bool('ENABLE_REDIS_CACHE', default=bool(REDIS_URL))
 
 
+# ╔════════════════════════════════════════════════════════════╗
+# ║  Login throughput (rate limit / attempt logging / hashing) ║
+# ╚════════════════════════════════════════════════════════════╝
+# - LOGIN_RATE_LIMIT_*: token bucket للمحاولات الفاشلة لكل (IP, username).
+#   يُستخدم Redis أولاً، وعند غيابه bucket داخل العملية (لكل worker).
+# - LOGIN_ATTEMPT_BUFFER_*: تجميع صفوف LoginAttempt وإدخالها دفعة واحدة
+#   بواسطة خيط خلفي بدلاً من commit لكل محاولة.
+# - PASSWORD_HASH_*: pool محدود للتحقق من كلمات المرور (scrypt/pbkdf2)؛
+#   إذا امتلأ الـ pool وطابوره (PASSWORD_HASH_QUEUE) يُرفض الطلب فوراً بـ 503.
+
+LOGIN_RATE_LIMIT_MAX_FAILURES = _env_int('LOGIN_RATE_LIMIT_MAX_FAILURES', default=5)
+LOGIN_RATE_LIMIT_WINDOW_SECONDS = _env_int('LOGIN_RATE_LIMIT_WINDOW_SECONDS', default=60)
+LOGIN_RATE_LIMIT_MAX_KEYS = _env_int('LOGIN_RATE_LIMIT_MAX_KEYS', default=10000)
+
+LOGIN_ATTEMPT_BUFFER_ENABLED = _env_bool('LOGIN_ATTEMPT_BUFFER_ENABLED', default=True)
+LOGIN_ATTEMPT_FLUSH_SECONDS = _env_int('LOGIN_ATTEMPT_FLUSH_SECONDS', default=2)
+LOGIN_ATTEMPT_BUFFER_MAX = _env_int('LOGIN_ATTEMPT_BUFFER_MAX', default=5000)
+
+PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', default=4)
+PASSWORD_HASH_TIMEOUT_SECONDS = _env_int('PASSWORD_HASH_TIMEOUT_SECONDS', default=10)
+PASSWORD_HASH_QUEUE = _env_int('PASSWORD_HASH_QUEUE', default=PASSWORD_HASH_WORKERS * 2)
+
+
+# ╔════════════════════════════════════════════════════════════╗
+# ║  Versioned in-memory caches                                ║
+# ╚════════════════════════════════════════════════════════════╝
+# - جدول الربط المحاسبي (AccountingMapping + رقم الحساب → المعرف).
+# - كتالوج وسائل الدفع وأنواعها (لشاشات نقاط البيع).
+# يُحمّل كل منها مرة واحدة في الذاكرة ويُعاد بناؤه عند التعديل. رقم الإصدار
+# محفوظ في جدول cache_version ويُرفع في نفس معاملة التعديل، ويفحصه كل worker
+# كل N ثانية على الأكثر. مع Redis يُفحص Redis بدلاً منه، ويُراجع الجدول كل
+# CACHE_VERSION_DB_CHECK_SECONDS فقط (احتياطاً لأي إشعار Redis مفقود).
+
+ACCOUNTING_MAPPING_VERSION_CHECK_SECONDS = _env_int('ACCOUNTING_MAPPING_VERSION_CHECK_SECONDS', default=2)
+PAYMENT_METHOD_CATALOG_VERSION_CHECK_SECONDS = _env_int('PAYMENT_METHOD_CATALOG_VERSION_CHECK_SECONDS', default=2)
+CACHE_VERSION_DB_CHECK_SECONDS = _env_int('CACHE_VERSION_DB_CHECK_SECONDS', default=30)
+
+
+# ╔════════════════════════════════════════════════════════════╗
+# ║  المنطقة الزمنية للمتجر                                    ║
+# ╚════════════════════════════════════════════════════════════╝
+# اسم IANA (مثل Asia/Riyadh) يحدد بداية "اليوم" في الملخصات والتقارير
+# (date_ranges.py). فارغ = توقيت الخادم المحلي.
+
+STORE_TIMEZONE = os.getenv('STORE_TIMEZONE', '').strip()
+
+
 # ╔════════════════════════════════════════════════════════════╗
 # ║  إعدادات الحسابات الداعمة لتسكير الوزن                    ║
 # ╚════════════════════════════════════════════════════════════╝
@@ -90,7 +90,15 @@ def pytest_collection_modifyitems(config, items):
     Tests that rely on a running HTTP server (the files starting with
     `test_invoices.py` and `test_supplier_purchase.py`) are skipped by default.
     Set RUN_SERVER_TESTS=1 to run them.
+
+    The synthetic-store benchmarks under `benchmarks/` need RUN_BENCHMARKS=1.
     """
+    if os.getenv('RUN_BENCHMARKS') != '1':
+        bench_marker = pytest.mark.skip(reason="Benchmarks skipped; set RUN_BENCHMARKS=1 to enable")
+        for item in items:
+            if item.fspath.dirpath().basename == 'benchmarks':
+                item.add_marker(bench_marker)
+
     run_server = os.getenv('RUN_SERVER_TESTS') == '1'
     if run_server:
         return
@@ -0,0 +1,132 @@
+"""Half-open ``[start, end)`` datetime bounds for date filters.
+
+Report and summary queries filter on ``column >= start AND column < end``
+instead of wrapping the column (``func.date(Invoice.date) == today``,
+``extract('year', ...) == y``), so an index on the date column turns into a
+range scan.
+
+Stored timestamps are naive wall-clock times of the store. "Today" (and the
+default week/month) is taken in STORE_TIMEZONE (config.py) rather than the
+server clock, so a server running in UTC still closes the day at the store's
+midnight. Weeks start on Monday, like the weekly report buckets.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from config import STORE_TIMEZONE
+
+Bounds = Tuple[datetime, datetime]
+
+
+@lru_cache(maxsize=None)
+def _store_zone(name: str):
+    if not name:
+        return None
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(name)
+
+
+def store_now() -> datetime:
+    """Current naive wall-clock time in the store's timezone."""
+    zone = _store_zone(STORE_TIMEZONE)
+    if zone is None:
+        return datetime.now()
+    return datetime.now(zone).replace(tzinfo=None)
+
+
+def store_today() -> date:
+    return store_now().date()
+
+
+def parse_iso_date(value, field_name: str) -> Optional[date]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f'Invalid {field_name} format. Expected YYYY-MM-DD')
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def day_range(day: Optional[date] = None) -> Bounds:
+    start = day_start(day or store_today())
+    return start, start + timedelta(days=1)
+
+
+def week_range(day: Optional[date] = None) -> Bounds:
+    day = day or store_today()
+    start = day_start(day - timedelta(days=day.weekday()))
+    return start, start + timedelta(days=7)
+
+
+def month_range(day: Optional[date] = None) -> Bounds:
+    day = day or store_today()
+    start = datetime(day.year, day.month, 1)
+    end = datetime(day.year + 1, 1, 1) if day.month == 12 else datetime(day.year, day.month + 1, 1)
+    return start, end
+
+
+def year_range(year: int) -> Bounds:
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+PERIODS = {'day': day_range, 'week': week_range, 'month': month_range}
+
+
+def period_range(period: str, day: Optional[date] = None) -> Bounds:
+    """Bounds of the day/week/month containing `day` (default: store today)."""
+    try:
+        return PERIODS[period](day)
+    except KeyError:
+        raise ValueError(f'Invalid period {period!r}. Expected one of: {", ".join(PERIODS)}')
+
+
+def date_bounds(start=None, end=None, start_field: str = 'start_date',
+                end_field: str = 'end_date') -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Bounds for the inclusive calendar dates `start`..`end` (date or YYYY-MM-DD).
+
+    Either side may be missing and stays open (None). Raises ValueError naming
+    the offending field.
+    """
+    start_value = parse_iso_date(start, start_field)
+    end_value = parse_iso_date(end, end_field)
+    return (
+        day_start(start_value) if start_value else None,
+        day_start(end_value) + timedelta(days=1) if end_value else None,
+    )
+
+
+def within(column, start: Optional[datetime], end: Optional[datetime]) -> list:
+    """Filter conditions for ``start <= column < end``; open sides are skipped."""
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if end is not None:
+        conditions.append(column < end)
+    return conditions
+
+
+__all__ = [
+    'date_bounds',
+    'day_range',
+    'day_start',
+    'month_range',
+    'parse_iso_date',
+    'period_range',
+    'store_now',
+    'store_today',
+    'week_range',
+    'within',
+    'year_range',
+]
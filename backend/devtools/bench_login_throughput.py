@@ -0,0 +1,157 @@
+"""Benchmark POST /api/auth/login throughput.
+
+Simulates a shift-start burst: N cashiers logging in concurrently through the
+Flask test client (in-process, no network). Reports logins/sec and latency
+percentiles so changes to rate limiting, attempt logging or hash verification
+can be compared.
+
+The benchmark creates `bench_cashier_NNNN` users with a known password, so it
+refuses to run unless DATABASE_URL is an in-memory SQLite database or a SQLite
+file under the system temp directory (pass --allow-database to override).
+The users and their login attempts are deleted when the run ends.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python devtools/bench_login_throughput.py --users 100 --concurrency 16
+    DATABASE_URL=sqlite:////tmp/bench.db python devtools/bench_login_throughput.py --users 100 --failures 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+# Allow running as a script (python devtools/...) while importing backend modules.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import app
+from login_throttle import login_attempt_buffer, login_failure_bucket
+from models import AppUser, LoginAttempt, db
+
+BENCH_PREFIX = 'bench_cashier_'
+BENCH_PASSWORD = 'Bench#Pass123'
+
+
+def _is_scratch_database(uri: str) -> bool:
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return False
+    database = url.database or ''
+    if database in ('', ':memory:'):
+        return True
+    temp_dir = Path(tempfile.gettempdir()).resolve()
+    return temp_dir in Path(database).expanduser().resolve().parents
+
+
+def _delete_users(usernames: list[str]) -> None:
+    with app.app_context():
+        LoginAttempt.query.filter(LoginAttempt.username.in_(usernames)).delete(synchronize_session=False)
+        AppUser.query.filter(AppUser.username.in_(usernames)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _ensure_users(count: int) -> list[str]:
+    usernames = [f'{BENCH_PREFIX}{idx:04d}' for idx in range(count)]
+    with app.app_context():
+        existing = {
+            u for (u,) in db.session.query(AppUser.username).filter(AppUser.username.in_(usernames)).all()
+        }
+        template = AppUser(username='__tmp__', password_hash='x')
+        template.set_password(BENCH_PASSWORD)
+        for username in usernames:
+            if username in existing:
+                continue
+            db.session.add(AppUser(
+                username=username,
+                full_name=username,
+                password_hash=template.password_hash,
+                role='employee',
+                is_active=True,
+            ))
+        db.session.commit()
+    return usernames
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Login throughput benchmark')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--failures', type=int, default=0, help='wrong-password attempts per user before success')
+    parser.add_argument(
+        '--allow-database',
+        action='store_true',
+        help='run against a database other than in-memory/temp-dir SQLite (bench users are still deleted afterwards)',
+    )
+    args = parser.parse_args()
+
+    db_uri = str(app.config.get('SQLALCHEMY_DATABASE_URI') or '')
+    if not args.allow_database and not _is_scratch_database(db_uri):
+        print(
+            f'refusing to create benchmark users in {make_url(db_uri).render_as_string(hide_password=True)}; '
+            'point DATABASE_URL at a temp SQLite file or pass --allow-database',
+            file=sys.stderr,
+        )
+        return 2
+
+    usernames = [f'{BENCH_PREFIX}{idx:04d}' for idx in range(args.users)]
+    try:
+        _ensure_users(args.users)
+        _run(args, usernames)
+    finally:
+        login_attempt_buffer.flush()
+        _delete_users(usernames)
+    return 0
+
+
+def _run(args, usernames: list[str]) -> None:
+    login_failure_bucket.reset()
+    client = app.test_client()
+
+    def _login(username: str) -> tuple[float, int]:
+        for _ in range(args.failures):
+            client.post('/api/auth/login', json={'username': username, 'password': 'wrong'})
+        started = time.perf_counter()
+        resp = client.post('/api/auth/login', json={'username': username, 'password': BENCH_PASSWORD})
+        return time.perf_counter() - started, resp.status_code
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        results = list(pool.map(_login, usernames))
+    wall = time.perf_counter() - wall_started
+    login_attempt_buffer.flush()
+
+    latencies = [r[0] * 1000.0 for r in results]
+    statuses: dict[int, int] = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f'db_uri: {make_url(app.config["SQLALCHEMY_DATABASE_URI"]).render_as_string(hide_password=True)}')
+    print(f'logins: {len(results)}  concurrency: {args.concurrency}  wall: {wall:.2f}s')
+    print(f'throughput: {len(results) / wall:.1f} logins/s' if wall > 0 else 'throughput: n/a')
+    print(
+        'latency ms: p50={:.1f} p95={:.1f} max={:.1f} mean={:.1f}'.format(
+            _percentile(latencies, 50),
+            _percentile(latencies, 95),
+            max(latencies) if latencies else 0.0,
+            statistics.mean(latencies) if latencies else 0.0,
+        )
+    )
+    print(f'status codes: {statuses}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Load test: do heavy reports starve POS endpoints?
+
+Runs against a live server (gunicorn or `python app.py`) over HTTP. A few
+threads loop on heavy endpoints (reports, full general ledger) while a larger
+pool fires light POS-style requests; the light-request latency percentiles show
+whether the worker profile / pool sizing keeps the counter responsive.
+
+Compare profiles by restarting the server with different env, e.g.:
+    GUNICORN_WORKER_CLASS=sync    gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+Usage:
+    python devtools/load_test_concurrency.py --base-url http://127.0.0.1:8001 \
+        --username admin --password secret --heavy 4 --light 200 --concurrency 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HEAVY_PATHS = (
+    '/api/general_ledger_all',
+    '/api/reports/sales_overview',
+    '/api/reports/inventory_status',
+    '/api/trial_balance',
+)
+
+LIGHT_PATHS = (
+    '/api/gold_price',
+    '/api/items?per_page=20',
+    '/api/customers',
+)
+
+
+def _request(base_url: str, path: str, token: str | None = None, payload: dict | None = None, timeout: float = 120.0):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(base_url.rstrip('/') + path, data=data, method='POST' if data else 'GET')
+    req.add_header('Accept', 'application/json')
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as exc:
+        body = exc.read()
+        status = exc.code
+    except (urllib.error.URLError, TimeoutError, OSError):
+        body = b''
+        status = 0
+    return status, (time.perf_counter() - started) * 1000.0, body
+
+
+def _login(base_url: str, username: str, password: str) -> str:
+    status, _, body = _request(base_url, '/api/auth/login', payload={'username': username, 'password': password})
+    if status != 200:
+        raise SystemExit(f'login failed ({status}): {body[:200]!r}')
+    payload = json.loads(body or b'{}')
+    token = payload.get('token') or (payload.get('data') or {}).get('token')
+    if not token:
+        raise SystemExit('login response did not include a token')
+    return token
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def _summary(label: str, samples: list[tuple[int, float]]) -> None:
+    latencies = [ms for _, ms in samples]
+    statuses: dict[int, int] = {}
+    for status, _ in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(
+        '{:<6} n={:<5} p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f} mean={:.1f} ms  status={}'.format(
+            label,
+            len(samples),
+            _percentile(latencies, 50),
+            _percentile(latencies, 95),
+            _percentile(latencies, 99),
+            max(latencies) if latencies else 0.0,
+            statistics.mean(latencies) if latencies else 0.0,
+            statuses,
+        )
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Heavy vs light endpoint load test')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8001')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--heavy', type=int, default=4, help='concurrent heavy-request loops')
+    parser.add_argument('--light', type=int, default=200, help='total light requests')
+    parser.add_argument('--concurrency', type=int, default=16, help='light-request threads')
+    args = parser.parse_args()
+
+    token = _login(args.base_url, args.username, args.password)
+
+    # Baseline: light requests with nothing heavy running.
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        baseline = list(pool.map(
+            lambda i: _request(args.base_url, LIGHT_PATHS[i % len(LIGHT_PATHS)], token)[:2],
+            range(max(args.light // 4, 1)),
+        ))
+
+    stop = threading.Event()
+    heavy_samples: list[tuple[int, float]] = []
+    heavy_lock = threading.Lock()
+
+    def _heavy_loop(offset: int) -> None:
+        i = offset
+        while not stop.is_set():
+            status, ms, _ = _request(args.base_url, HEAVY_PATHS[i % len(HEAVY_PATHS)], token, timeout=600.0)
+            with heavy_lock:
+                heavy_samples.append((status, ms))
+            i += 1
+
+    heavy_threads = [threading.Thread(target=_heavy_loop, args=(n,), daemon=True) for n in range(args.heavy)]
+    for t in heavy_threads:
+        t.start()
+    time.sleep(0.5)  # let heavy requests occupy the server first
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        loaded = list(pool.map(
+            lambda i: _request(args.base_url, LIGHT_PATHS[i % len(LIGHT_PATHS)], token)[:2],
+            range(args.light),
+        ))
+    wall = time.perf_counter() - wall_started
+    stop.set()
+    for t in heavy_threads:
+        t.join(timeout=1.0)
+
+    print(f'base_url: {args.base_url}  heavy loops: {args.heavy}  light concurrency: {args.concurrency}')
+    _summary('idle', baseline)
+    _summary('light', loaded)
+    with heavy_lock:
+        _summary('heavy', list(heavy_samples))
+    print(f'light throughput under load: {len(loaded) / wall:.1f} req/s' if wall > 0 else 'light throughput: n/a')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""Deterministic synthetic store for scale tests and benchmarks.
+
+Builds, on SQLite or PostgreSQL, a store shaped like production: the standard
+dual chart of accounts (cash + weight memo twins), customers, items, posted
+invoices of the three common types with their lines, and one balanced journal
+entry per invoice whose weight legs use the per-karat columns. A small tail
+of invoices is left unposted so batch posting has work to do.
+
+The same ``--seed`` always yields the same rows. Rows are written with Core
+bulk inserts in chunks, so ``--scale large`` (10k customers, 50k items, 500k
+invoices, ~3M journal lines) fits in memory.
+
+Usage:
+    python devtools/synthetic_dataset.py --database-url sqlite:////tmp/bench.db --scale small
+    python devtools/synthetic_dataset.py --database-url postgresql://localhost/bench --scale large
+
+`generate()` can also be called inside any app context (see benchmarks/).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, text
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+COA_FILE = BACKEND_DIR.parent / 'exports' / 'accounts_standard_220126.json'
+
+SCALES = {
+    'tiny': {'customers': 50, 'items': 200, 'invoices': 1_000},
+    'small': {'customers': 1_000, 'items': 5_000, 'invoices': 25_000},
+    'large': {'customers': 10_000, 'items': 50_000, 'invoices': 500_000},
+}
+
+CHUNK = 5_000
+UNPOSTED_SHARE = 0.01
+CREDIT_SALE_SHARE = 0.3
+VAT_RATE = 0.15
+GOLD_PRICE_24K = 320.0
+KARATS = (18, 21, 21, 21, 22, 24)
+INVOICE_MIX = (('بيع', 0.80), ('شراء من عميل', 0.12), ('مرتجع بيع', 0.08))
+ITEM_NAMES = ('خاتم', 'سوار', 'عقد', 'حلق', 'طقم', 'دبلة', 'سلسلة', 'تعليقة')
+FIRST_NAMES = ('محمد', 'أحمد', 'فاطمة', 'نورة', 'خالد', 'سارة', 'عبدالله', 'ريم', 'فهد', 'منى')
+LAST_NAMES = ('العتيبي', 'القحطاني', 'الغامدي', 'الشهري', 'الدوسري', 'الحربي', 'الزهراني', 'المطيري')
+
+# Accounts used by the generated entries (standard chart numbers).
+ACCOUNT_NUMBERS = {
+    'cash': '1100',
+    'customers': '1200',
+    'inventory': '1300',
+    'scrap_inventory': '1310',
+    'revenue': '40',
+    'vat': '2210',
+}
+
+
+def _next_id(model) -> int:
+    from models import db
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows) -> None:
+    from models import db
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+
+
+def _accounts():
+    from models import Account
+    found = {}
+    for key, number in ACCOUNT_NUMBERS.items():
+        account = Account.query.filter_by(account_number=number).first()
+        if account is None or not account.memo_account_id:
+            raise RuntimeError(f'standard chart account {number} (with memo twin) is missing')
+        found[key] = (account.id, account.memo_account_id)
+    return found
+
+
+def _prepare_reference_data() -> None:
+    from coa_seed import seed_chart_of_accounts_if_empty
+    from models import GoldPrice, Settings, db
+    from payment_methods_routes import ensure_default_payment_types
+    from routes import ensure_weight_closing_support_accounts
+
+    seed_chart_of_accounts_if_empty(db, str(COA_FILE))
+    ensure_weight_closing_support_accounts()
+    ensure_default_payment_types()
+    if Settings.query.first() is None:
+        db.session.add(Settings(main_karat=21))
+    if GoldPrice.query.first() is None:
+        db.session.add(GoldPrice(price=GOLD_PRICE_24K * 31.1035, date=datetime(2025, 1, 1)))
+    db.session.commit()
+
+
+def _customers(rng: random.Random, count: int, created_at: datetime) -> list[int]:
+    from models import Customer, db
+    start = _next_id(Customer)
+    rows = []
+    for offset in range(count):
+        cid = start + offset
+        rows.append({
+            'id': cid,
+            'customer_code': f'SYN-C{cid:07d}',
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'phone': f'05{rng.randrange(10 ** 8):08d}',
+            'active': True,
+            'created_at': created_at,
+        })
+        if len(rows) >= CHUNK:
+            _insert(Customer, rows)
+            rows = []
+    _insert(Customer, rows)
+    db.session.commit()
+    return list(range(start, start + count))
+
+
+def _items(rng: random.Random, count: int) -> list[tuple]:
+    from models import Item, db
+    start = _next_id(Item)
+    rows, catalog = [], []
+    for offset in range(count):
+        iid = start + offset
+        karat = rng.choice(KARATS)
+        weight = round(rng.uniform(1.5, 40.0), 2)
+        wage = round(rng.uniform(5.0, 60.0), 2)
+        price = round(weight * (GOLD_PRICE_24K * karat / 24.0 + wage), 2)
+        rows.append({
+            'id': iid,
+            'item_code': f'SYN-I{iid:07d}',
+            'name': f'{rng.choice(ITEM_NAMES)} {karat} {iid}',
+            'barcode': f'SYN{iid:010d}',
+            'karat': str(karat),
+            'weight': weight,
+            'wage': wage,
+            'price': price,
+            'stock': rng.randint(0, 5),
+        })
+        catalog.append((iid, rows[-1]['name'], karat, weight, wage, price))
+        if len(rows) >= CHUNK:
+            _insert(Item, rows)
+            rows = []
+    _insert(Item, rows)
+    db.session.commit()
+    return catalog
+
+
+def _pick_type(rng: random.Random) -> str:
+    roll = rng.random()
+    for invoice_type, share in INVOICE_MIX:
+        if roll < share:
+            return invoice_type
+        roll -= share
+    return INVOICE_MIX[0][0]
+
+
+def _entry_lines(entry_id, invoice_type, customer_id, credit, total, net, tax, weights, accounts):
+    """Balanced cash legs plus per-karat weight legs on the memo twins."""
+    cash_account = accounts['customers' if credit else 'cash']
+    party = customer_id if credit else None
+    lines = []
+
+    def line(account_id, cash_debit=0.0, cash_credit=0.0, customer=None, **karat_columns):
+        row = {'journal_entry_id': entry_id, 'account_id': account_id, 'customer_id': customer,
+               'cash_debit': cash_debit, 'cash_credit': cash_credit}
+        row.update(karat_columns)
+        lines.append(row)
+
+    if invoice_type == 'بيع':
+        line(cash_account[0], cash_debit=total, customer=party)
+        line(accounts['revenue'][0], cash_credit=net)
+        line(accounts['vat'][0], cash_credit=tax)
+        for karat, weight in weights.items():
+            line(accounts['inventory'][1], **{f'credit_{karat}k': weight})
+            line(cash_account[1], customer=party, **{f'debit_{karat}k': weight})
+    elif invoice_type == 'مرتجع بيع':
+        line(accounts['revenue'][0], cash_debit=net)
+        line(accounts['vat'][0], cash_debit=tax)
+        line(cash_account[0], cash_credit=total, customer=party)
+        for karat, weight in weights.items():
+            line(accounts['inventory'][1], **{f'debit_{karat}k': weight})
+            line(cash_account[1], customer=party, **{f'credit_{karat}k': weight})
+    else:  # شراء من عميل
+        line(accounts['scrap_inventory'][0], cash_debit=total)
+        line(accounts['cash'][0], cash_credit=total)
+        for karat, weight in weights.items():
+            line(accounts['scrap_inventory'][1], **{f'debit_{karat}k': weight})
+            line(accounts['cash'][1], **{f'credit_{karat}k': weight})
+    return lines
+
+
+def _invoices(rng, count, customer_ids, catalog, accounts, end_date, days):
+    from models import Invoice, InvoiceItem, JournalEntry, JournalEntryLine, db
+
+    invoice_start = _next_id(Invoice)
+    entry_start = _next_id(JournalEntry)
+    type_counters = {
+        invoice_type: db.session.query(func.max(Invoice.invoice_type_id))
+        .filter(Invoice.invoice_type == invoice_type).scalar() or 0
+        for invoice_type, _share in INVOICE_MIX
+    }
+    first_day = end_date - timedelta(days=days)
+    step = days * 86_400 / max(count, 1)
+    unposted_from = count - int(count * UNPOSTED_SHARE)
+
+    invoices, items, entries, lines = [], [], [], []
+    line_count = 0
+
+    def flush():
+        nonlocal line_count
+        _insert(Invoice, invoices)
+        _insert(InvoiceItem, items)
+        _insert(JournalEntry, entries)
+        _insert(JournalEntryLine, lines)
+        db.session.commit()
+        line_count += len(lines)
+        for batch in (invoices, items, entries, lines):
+            batch.clear()
+
+    for offset in range(count):
+        invoice_id = invoice_start + offset
+        entry_id = entry_start + offset
+        invoice_type = _pick_type(rng)
+        type_counters[invoice_type] += 1
+        when = first_day + timedelta(seconds=int(offset * step) + rng.randrange(60))
+        customer_id = rng.choice(customer_ids)
+        credit = invoice_type == 'بيع' and rng.random() < CREDIT_SALE_SHARE
+        posted = offset < unposted_from
+
+        total = net = tax = total_weight = 0.0
+        weights: dict[int, float] = {}
+        for _ in range(rng.randint(1, 3)):
+            item_id, name, karat, weight, wage, price = rng.choice(catalog)
+            line_tax = round(price * VAT_RATE, 2) if invoice_type != 'شراء من عميل' else 0.0
+            items.append({
+                'invoice_id': invoice_id, 'item_id': item_id, 'name': name, 'quantity': 1,
+                'price': price, 'karat': float(karat), 'weight': weight, 'wage': wage,
+                'net': price, 'tax': line_tax,
+            })
+            net += price
+            tax += line_tax
+            total_weight += weight
+            weights[karat] = round(weights.get(karat, 0.0) + weight, 3)
+        net, tax = round(net, 2), round(tax, 2)
+        total = round(net + tax, 2)
+
+        invoices.append({
+            'id': invoice_id,
+            'invoice_type_id': type_counters[invoice_type],
+            'invoice_type': invoice_type,
+            'customer_id': customer_id,
+            'date': when,
+            'total': total,
+            'total_tax': tax,
+            'total_weight': round(total_weight, 3),
+            'gold_type': 'scrap' if invoice_type == 'شراء من عميل' else 'new',
+            'status': 'unpaid' if credit else 'paid',
+            'amount_paid': 0.0 if credit else total,
+            'payment_method': 'آجل' if credit else 'نقدي',
+            'is_posted': posted,
+            'posted_at': when if posted else None,
+            'posted_by': 'synthetic' if posted else None,
+        })
+        entries.append({
+            'id': entry_id,
+            'entry_number': f'SYN-{when.year}-{entry_id:08d}',
+            'date': when,
+            'description': f'فاتورة {invoice_type} رقم #{type_counters[invoice_type]}',
+            'entry_type': 'عادي',
+            'reference_type': 'invoice',
+            'reference_id': invoice_id,
+            'reference_number': str(type_counters[invoice_type]),
+            'created_by': 'synthetic',
+            'is_posted': posted,
+            'posted_at': when if posted else None,
+        })
+        entry_lines = _entry_lines(entry_id, invoice_type, customer_id, credit, total, net, tax, weights, accounts)
+        for line in entry_lines:
+            line['entry_date'] = when
+        lines.extend(entry_lines)
+        if len(invoices) >= CHUNK:
+            flush()
+    flush()
+    return line_count
+
+
+def _sync_sequences() -> None:
+    """PostgreSQL: explicit ids leave the serial sequences behind."""
+    from models import Customer, Invoice, InvoiceItem, Item, JournalEntry, JournalEntryLine, db
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (Customer, Item, Invoice, InvoiceItem, JournalEntry, JournalEntryLine):
+        table = model.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM \"{table}\"), 1))"
+        ))
+    db.session.commit()
+
+
+def generate(scale: str = 'small', seed: int = 20250101, end_date: datetime = datetime(2025, 12, 31),
+             days: int = 3 * 365, log=print) -> dict:
+    """Populate the database of the current app context; returns row counts."""
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    started = time.monotonic()
+
+    _prepare_reference_data()
+    accounts = _accounts()
+    customer_ids = _customers(rng, sizes['customers'], end_date - timedelta(days=days))
+    log(f'customers: {len(customer_ids)}')
+    catalog = _items(rng, sizes['items'])
+    log(f'items: {len(catalog)}')
+    line_count = _invoices(rng, sizes['invoices'], customer_ids, catalog, accounts, end_date, days)
+    log(f"invoices: {sizes['invoices']}, journal lines: {line_count}")
+    _sync_sequences()
+
+    summary = dict(sizes, journal_lines=line_count, seconds=round(time.monotonic() - started, 1))
+    log(f"done in {summary['seconds']}s")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='target database (default: DATABASE_URL / app default)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=20250101)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    # Allow running as a script (python devtools/...) while importing backend modules.
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        generate(args.scale, args.seed)
+
+
+if __name__ == '__main__':
+    main()
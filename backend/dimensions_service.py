@@ -180,9 +180,14 @@ def get_or_create_dimension_set(db_session, dimensions: list[DimensionInput]) ->
 def _get_price_per_gram_24k_sar(db_session) -> float | None:
     """Return SAR/gram for 24k based on latest GoldPrice (ounce USD)."""
     try:
+        from invoice_posting_context import current_posting_context
         from models import GoldPrice
 
-        latest = db_session.query(GoldPrice).order_by(GoldPrice.date.desc()).first()
+        posting = current_posting_context()
+        if posting is not None:
+            latest = posting.latest_gold_price
+        else:
+            latest = db_session.query(GoldPrice).order_by(GoldPrice.date.desc()).first()
         if not latest or not latest.price:
             return None
         # 1 oz = 31.1035g, 1 USD = 3.75 SAR
@@ -193,9 +198,11 @@ def _get_price_per_gram_24k_sar(db_session) -> float | None:
 
 def _get_main_karat(db_session) -> int:
     try:
+        from invoice_posting_context import current_posting_context
         from models import Settings
 
-        settings = db_session.query(Settings).first()
+        posting = current_posting_context()
+        settings = posting.settings if posting is not None else db_session.query(Settings).first()
         if settings and settings.main_karat:
             return int(settings.main_karat)
     except Exception:
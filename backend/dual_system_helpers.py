@@ -106,9 +106,15 @@ def create_dual_journal_entry(journal_entry_id, account_id, cash_debit=0, cash_c
     from flask import current_app
     from models import JournalEntryLine, Account, JournalEntry, Invoice, Voucher
     
+    from invoice_posting_context import current_posting_context
+
     db = current_app.extensions['sqlalchemy']
+    posting = current_posting_context()
 
-    account = db.session.query(Account).filter_by(id=account_id).first()
+    if posting is not None:
+        account = posting.account(account_id)
+    else:
+        account = db.session.query(Account).filter_by(id=account_id).first()
     if not account:
         raise ValueError(f"Account {account_id} not found while creating dual journal entry")
 
@@ -196,7 +202,10 @@ def create_dual_journal_entry(journal_entry_id, account_id, cash_debit=0, cash_c
             from models import GoldPrice, Settings
             
             # الحصول على آخر سعر ذهب (هو سعر الأونصة بالدولار)
-            latest_price = GoldPrice.query.order_by(GoldPrice.date.desc()).first()
+            if posting is not None:
+                latest_price = posting.latest_gold_price
+            else:
+                latest_price = GoldPrice.query.order_by(GoldPrice.date.desc()).first()
             if not latest_price:
                 raise Exception("لا يوجد سعر ذهب محفوظ")
             
@@ -206,7 +215,7 @@ def create_dual_journal_entry(journal_entry_id, account_id, cash_debit=0, cash_c
             price_per_gram_24k_sar = (latest_price.price / 31.1035) * 3.75
             
             # الحصول على العيار الرئيسي من الإعدادات
-            settings = Settings.query.first()
+            settings = posting.settings if posting is not None else Settings.query.first()
             main_karat = settings.main_karat if settings else 21
             
             # 🔧 FIXED: حساب السعر للعيار الرئيسي (SAR/gram)
@@ -349,7 +358,10 @@ def create_dual_journal_entry(journal_entry_id, account_id, cash_debit=0, cash_c
     try:
         if resolved_supplier_id:
             from models import Supplier
-            supplier = db.session.query(Supplier).filter_by(id=resolved_supplier_id).first()
+            if posting is not None:
+                supplier = posting.supplier(resolved_supplier_id)
+            else:
+                supplier = db.session.query(Supplier).filter_by(id=resolved_supplier_id).first()
             if supplier:
                 print(f"🔍 Updating supplier {resolved_supplier_id} balance:")
                 print(f"   Before: cash={supplier.balance_cash}, 18k={supplier.balance_gold_18k}, 21k={supplier.balance_gold_21k}")
@@ -364,7 +376,10 @@ def create_dual_journal_entry(journal_entry_id, account_id, cash_debit=0, cash_c
         
         if resolved_customer_id:
             from models import Customer
-            customer = db.session.query(Customer).filter_by(id=resolved_customer_id).first()
+            if posting is not None:
+                customer = posting.customer(resolved_customer_id)
+            else:
+                customer = db.session.query(Customer).filter_by(id=resolved_customer_id).first()
             if customer:
                 print(f"🔍 Updating customer {resolved_customer_id} balance:")
                 print(f"   Before: cash={customer.balance_cash}, 18k={customer.balance_gold_18k}, 21k={customer.balance_gold_21k}")
@@ -393,16 +408,10 @@ def verify_dual_balance(journal_entry_id):
     
     db = current_app.extensions['sqlalchemy']
     
-    cash_totals = db.session.query(
+    # Cash and weight totals in one aggregate.
+    totals = db.session.query(
         func.sum(JournalEntryLine.cash_debit).label('total_debit'),
-        func.sum(JournalEntryLine.cash_credit).label('total_credit')
-    ).filter_by(journal_entry_id=journal_entry_id).first()
-    
-    cash_debit = cash_totals.total_debit or 0
-    cash_credit = cash_totals.total_credit or 0
-    cash_balance = round(cash_debit - cash_credit, 2)
-    
-    weight_totals = db.session.query(
+        func.sum(JournalEntryLine.cash_credit).label('total_credit'),
         func.sum(JournalEntryLine.debit_18k).label('debit_18k'),
         func.sum(JournalEntryLine.credit_18k).label('credit_18k'),
         func.sum(JournalEntryLine.debit_21k).label('debit_21k'),
@@ -412,12 +421,16 @@ def verify_dual_balance(journal_entry_id):
         func.sum(JournalEntryLine.debit_24k).label('debit_24k'),
         func.sum(JournalEntryLine.credit_24k).label('credit_24k')
     ).filter_by(journal_entry_id=journal_entry_id).first()
+
+    cash_debit = totals.total_debit or 0
+    cash_credit = totals.total_credit or 0
+    cash_balance = round(cash_debit - cash_credit, 2)
     
     weight_balances = {
-        '18k': round((weight_totals.debit_18k or 0) - (weight_totals.credit_18k or 0), 3),
-        '21k': round((weight_totals.debit_21k or 0) - (weight_totals.credit_21k or 0), 3),
-        '22k': round((weight_totals.debit_22k or 0) - (weight_totals.credit_22k or 0), 3),
-        '24k': round((weight_totals.debit_24k or 0) - (weight_totals.credit_24k or 0), 3)
+        '18k': round((totals.debit_18k or 0) - (totals.credit_18k or 0), 3),
+        '21k': round((totals.debit_21k or 0) - (totals.credit_21k or 0), 3),
+        '22k': round((totals.debit_22k or 0) - (totals.credit_22k or 0), 3),
+        '24k': round((totals.debit_24k or 0) - (totals.credit_24k or 0), 3)
     }
 
     # Debug logging to trace imbalances (helps diagnose weight gaps)
@@ -425,31 +438,38 @@ def verify_dual_balance(journal_entry_id):
         log_lines = [
             f"🔍 Dual balance check for JE #{journal_entry_id}",
             f"   Cash -> debit: {cash_debit:.2f}, credit: {cash_credit:.2f}, diff: {cash_balance:.2f}",
-            f"   18k -> debit: {(weight_totals.debit_18k or 0):.3f}, credit: {(weight_totals.credit_18k or 0):.3f}, diff: {((weight_totals.debit_18k or 0) - (weight_totals.credit_18k or 0)):.3f}",
-            f"   21k -> debit: {(weight_totals.debit_21k or 0):.3f}, credit: {(weight_totals.credit_21k or 0):.3f}, diff: {((weight_totals.debit_21k or 0) - (weight_totals.credit_21k or 0)):.3f}",
-            f"   22k -> debit: {(weight_totals.debit_22k or 0):.3f}, credit: {(weight_totals.credit_22k or 0):.3f}, diff: {((weight_totals.debit_22k or 0) - (weight_totals.credit_22k or 0)):.3f}",
-            f"   24k -> debit: {(weight_totals.debit_24k or 0):.3f}, credit: {(weight_totals.credit_24k or 0):.3f}, diff: {((weight_totals.debit_24k or 0) - (weight_totals.credit_24k or 0)):.3f}"
+            f"   18k -> debit: {(totals.debit_18k or 0):.3f}, credit: {(totals.credit_18k or 0):.3f}, diff: {((totals.debit_18k or 0) - (totals.credit_18k or 0)):.3f}",
+            f"   21k -> debit: {(totals.debit_21k or 0):.3f}, credit: {(totals.credit_21k or 0):.3f}, diff: {((totals.debit_21k or 0) - (totals.credit_21k or 0)):.3f}",
+            f"   22k -> debit: {(totals.debit_22k or 0):.3f}, credit: {(totals.credit_22k or 0):.3f}, diff: {((totals.debit_22k or 0) - (totals.credit_22k or 0)):.3f}",
+            f"   24k -> debit: {(totals.debit_24k or 0):.3f}, credit: {(totals.credit_24k or 0):.3f}, diff: {((totals.debit_24k or 0) - (totals.credit_24k or 0)):.3f}"
         ]
         for line in log_lines:
             print(line)
         with open('/tmp/dual_balance.log', 'a', encoding='utf-8') as dbg:
             dbg.write('\n'.join(log_lines) + '\n')
 
-            # Log detailed lines to help trace imbalance sources
-            from models import JournalEntryLine, Account
-            lines = db.session.query(JournalEntryLine).filter_by(journal_entry_id=journal_entry_id).all()
-            for line in lines:
-                acc = line.account or db.session.query(Account).get(line.account_id)
-                acc_label = f"{acc.account_number} - {acc.name}" if acc else f"Account {line.account_id}"
-                detail = (
-                    f"      -> {acc_label}: cash({line.cash_debit:.2f}/{line.cash_credit:.2f}) "
-                    f"weights 18k({line.debit_18k:.3f}/{line.credit_18k:.3f}) "
-                    f"21k({line.debit_21k:.3f}/{line.credit_21k:.3f}) "
-                    f"22k({line.debit_22k:.3f}/{line.credit_22k:.3f}) "
-                    f"24k({line.debit_24k:.3f}/{line.credit_24k:.3f})"
+            # Log detailed lines only when there is an imbalance to trace
+            if abs(cash_balance) > 0.01 or any(abs(balance) > 0.01 for balance in weight_balances.values()):
+                from sqlalchemy.orm import joinedload
+
+                lines = (
+                    db.session.query(JournalEntryLine)
+                    .options(joinedload(JournalEntryLine.account))
+                    .filter_by(journal_entry_id=journal_entry_id)
+                    .all()
                 )
-                print(detail)
-                dbg.write(detail + '\n')
+                for line in lines:
+                    acc = line.account or db.session.query(Account).get(line.account_id)
+                    acc_label = f"{acc.account_number} - {acc.name}" if acc else f"Account {line.account_id}"
+                    detail = (
+                        f"      -> {acc_label}: cash({line.cash_debit:.2f}/{line.cash_credit:.2f}) "
+                        f"weights 18k({line.debit_18k:.3f}/{line.credit_18k:.3f}) "
+                        f"21k({line.debit_21k:.3f}/{line.credit_21k:.3f}) "
+                        f"22k({line.debit_22k:.3f}/{line.credit_22k:.3f}) "
+                        f"24k({line.debit_24k:.3f}/{line.credit_24k:.3f})"
+                    )
+                    print(detail)
+                    dbg.write(detail + '\n')
     except Exception as log_exc:
         with open('/tmp/dual_balance.log', 'a', encoding='utf-8') as dbg:
             dbg.write(f"⚠️ Failed to log dual balance details: {log_exc}\n")
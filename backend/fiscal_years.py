@@ -0,0 +1,302 @@
+"""Fiscal-year close and balances that start from the latest closed snapshot.
+
+Closing year Y writes, per account, the cumulative debit/credit totals (cash
+and each karat) of every journal line dated up to Dec 31 of Y into
+FiscalYearAccountBalance, and per safe box the cumulative in/out totals into
+FiscalYearSafeBoxBalance. From then on journal entries, journal lines and
+safe-box transactions dated in Y or earlier are read-only (models.py raises
+ClosedFiscalYearError), so the snapshot never goes stale.
+
+`account_totals()` / `safe_box_totals()` read the latest snapshot before the
+requested date and add only the rows after it, so current-year balances cost
+the same however many years of history exist. On PostgreSQL the line and
+transaction tables can additionally be range-partitioned by year
+(partition_ledger_tables.py); the tail filters below are on the partition keys.
+
+Closed years form a contiguous prefix: year Y can be closed only when Y-1 is
+closed or nothing is dated before Y, and only the latest closed year can be
+reopened. The current year is never closed.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, insert, select, update
+
+from models import (
+    ClosedFiscalYearError,
+    FiscalYear,
+    FiscalYearAccountBalance,
+    FiscalYearSafeBoxBalance,
+    JournalEntry,
+    JournalEntryLine,
+    SafeBoxTransaction,
+    db,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+KARATS = ('18k', '21k', '22k', '24k')
+ACCOUNT_COLUMNS = ('cash_debit', 'cash_credit') + tuple(
+    f'{side}_{karat}' for karat in KARATS for side in ('debit', 'credit')
+)
+SAFE_BOX_COLUMNS = ('cash_in', 'cash_out') + tuple(
+    f'weight_{direction}_{karat}' for karat in KARATS for direction in ('in', 'out')
+)
+
+
+def year_start(year: int) -> datetime:
+    return datetime(year, 1, 1)
+
+
+def closed_through() -> Optional[int]:
+    """Latest closed fiscal year, or None."""
+    return db.session.query(func.max(FiscalYear.year)).filter(FiscalYear.status == 'closed').scalar()
+
+
+def _snapshot_year(until: Optional[datetime]) -> Optional[int]:
+    """Latest closed year whose snapshot lies entirely before `until` (inclusive or not)."""
+    first, latest = db.session.query(func.min(FiscalYear.year), func.max(FiscalYear.year)) \
+        .filter(FiscalYear.status == 'closed').one()
+    if latest is None:
+        return None
+    # Snapshot Y covers rows dated before Jan 1 of Y+1; closed years are contiguous.
+    year = latest if until is None else min(latest, until.year - 1)
+    return year if year >= first else None
+
+
+def _line_sums():
+    line = JournalEntryLine
+    return [func.coalesce(func.sum(getattr(line, column)), 0.0).label(column) for column in ACCOUNT_COLUMNS]
+
+
+def _safe_box_sums():
+    tx = SafeBoxTransaction
+    sums = [
+        func.coalesce(func.sum(case((tx.direction == 'in', tx.amount_cash), else_=0.0)), 0.0).label('cash_in'),
+        func.coalesce(func.sum(case((tx.direction == 'out', tx.amount_cash), else_=0.0)), 0.0).label('cash_out'),
+    ]
+    for karat in KARATS:
+        column = getattr(tx, f'weight_{karat}')
+        sums.append(func.coalesce(func.sum(case((tx.direction == 'in', column), else_=0.0)), 0.0)
+                    .label(f'weight_in_{karat}'))
+        sums.append(func.coalesce(func.sum(case((tx.direction == 'out', column), else_=0.0)), 0.0)
+                    .label(f'weight_out_{karat}'))
+    return sums
+
+
+def _bounded(query, column, start: Optional[datetime], until: Optional[datetime], inclusive: bool):
+    if start is not None:
+        query = query.where(column >= start)
+    if until is not None:
+        query = query.where(column <= until if inclusive else column < until)
+    return query
+
+
+def _accumulate(totals: Dict[int, Dict[str, float]], rows, key: str, columns: Iterable[str]) -> None:
+    for row in rows:
+        mapping = row._mapping
+        bucket = totals.setdefault(mapping[key], dict.fromkeys(columns, 0.0))
+        for column in columns:
+            bucket[column] += float(mapping[column] or 0.0)
+
+
+def account_totals(account_ids: Optional[Iterable[int]] = None, until: Optional[datetime] = None,
+                   inclusive: bool = True, start: Optional[datetime] = None) -> Dict[int, Dict[str, float]]:
+    """Debit/credit totals per account of non-deleted lines dated up to `until`.
+
+    Without `start` the totals are cumulative: they start from the latest usable
+    fiscal-year snapshot and scan only later lines. With `start` only lines in
+    [start, until] are summed. Accounts without any activity are absent.
+    """
+    ids = list(account_ids) if account_ids is not None else None
+    base_year = _snapshot_year(until) if start is None else None
+    totals: Dict[int, Dict[str, float]] = {}
+
+    if base_year is not None:
+        snap = FiscalYearAccountBalance
+        query = select(snap.account_id, *[getattr(snap, column) for column in ACCOUNT_COLUMNS]) \
+            .where(snap.year == base_year)
+        if ids is not None:
+            query = query.where(snap.account_id.in_(ids))
+        _accumulate(totals, db.session.execute(query), 'account_id', ACCOUNT_COLUMNS)
+
+    line = JournalEntryLine
+    query = select(line.account_id, *_line_sums()).where(line.is_deleted.is_(False))
+    if ids is not None:
+        query = query.where(line.account_id.in_(ids))
+    if base_year is not None:
+        start = year_start(base_year + 1)
+    query = _bounded(query, line.entry_date, start, until, inclusive)
+    _accumulate(totals, db.session.execute(query.group_by(line.account_id)), 'account_id', ACCOUNT_COLUMNS)
+    return totals
+
+
+def safe_box_totals(safe_box_ids: Optional[Iterable[int]] = None, until: Optional[datetime] = None,
+                    inclusive: bool = True, start: Optional[datetime] = None) -> Dict[int, Dict[str, float]]:
+    """In/out totals per safe box of transactions up to `until` (see account_totals)."""
+    ids = list(safe_box_ids) if safe_box_ids is not None else None
+    base_year = _snapshot_year(until) if start is None else None
+    totals: Dict[int, Dict[str, float]] = {}
+
+    if base_year is not None:
+        snap = FiscalYearSafeBoxBalance
+        query = select(snap.safe_box_id, *[getattr(snap, column) for column in SAFE_BOX_COLUMNS]) \
+            .where(snap.year == base_year)
+        if ids is not None:
+            query = query.where(snap.safe_box_id.in_(ids))
+        _accumulate(totals, db.session.execute(query), 'safe_box_id', SAFE_BOX_COLUMNS)
+
+    tx = SafeBoxTransaction
+    query = select(tx.safe_box_id, *_safe_box_sums())
+    if ids is not None:
+        query = query.where(tx.safe_box_id.in_(ids))
+    if base_year is not None:
+        start = year_start(base_year + 1)
+    query = _bounded(query, tx.created_at, start, until, inclusive)
+    _accumulate(totals, db.session.execute(query.group_by(tx.safe_box_id)), 'safe_box_id', SAFE_BOX_COLUMNS)
+    return totals
+
+
+def backfill_line_entry_dates() -> int:
+    """Copy journal_entry.date onto lines that predate the entry_date column."""
+    entry_date = (
+        select(JournalEntry.date)
+        .where(JournalEntry.id == JournalEntryLine.journal_entry_id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(JournalEntryLine)
+        .where(JournalEntryLine.entry_date.is_(None))
+        .values(entry_date=entry_date)
+        .execution_options(synchronize_session=False)
+    )
+    return max(int(result.rowcount or 0), 0)
+
+
+def _write_snapshot(model, key: str, columns, previous_year, year, current_rows) -> int:
+    totals: Dict[int, Dict[str, float]] = {}
+    if previous_year is not None:
+        snapshot = select(getattr(model, key), *[getattr(model, column) for column in columns]) \
+            .where(model.year == previous_year)
+        _accumulate(totals, db.session.execute(snapshot), key, columns)
+    _accumulate(totals, current_rows, key, columns)
+    rows: List[dict] = [dict(values, year=year, **{key: owner}) for owner, values in totals.items()]
+    if rows:
+        db.session.execute(insert(model), rows)
+    return len(rows)
+
+
+def close_fiscal_year(year: int, closed_by: Optional[str] = None) -> dict:
+    """Snapshot closing balances for `year` and make it read-only. Caller commits."""
+    year = int(year)
+    if year >= datetime.now().year:
+        raise ValueError('only past fiscal years can be closed')
+
+    fiscal_year = FiscalYear.query.filter_by(year=year).first()
+    if fiscal_year is not None and fiscal_year.status == 'closed':
+        raise ValueError(f'fiscal year {year} is already closed')
+
+    previous = closed_through()
+    if previous is not None and previous != year - 1:
+        raise ValueError(f'close fiscal year {previous + 1} first' if previous < year
+                         else f'fiscal year {year} precedes the closed year {previous}')
+    if previous is None:
+        earlier_line = db.session.query(JournalEntryLine.id).filter(
+            JournalEntryLine.entry_date < year_start(year)).first()
+        earlier_tx = db.session.query(SafeBoxTransaction.id).filter(
+            SafeBoxTransaction.created_at < year_start(year)).first()
+        if earlier_line or earlier_tx:
+            raise ValueError(f'fiscal years before {year} have activity; close them first')
+
+    backfilled = backfill_line_entry_dates()
+    start, end = year_start(year), year_start(year + 1)
+
+    line = JournalEntryLine
+    year_lines = select(line.account_id, *_line_sums(), func.count(line.id).label('line_count')).where(
+        line.is_deleted.is_(False), line.entry_date >= start, line.entry_date < end,
+    ).group_by(line.account_id)
+    line_rows = db.session.execute(year_lines).all()
+    accounts = _write_snapshot(FiscalYearAccountBalance, 'account_id', ACCOUNT_COLUMNS, previous, year, line_rows)
+
+    tx = SafeBoxTransaction
+    year_tx = select(tx.safe_box_id, *_safe_box_sums(), func.count(tx.id).label('tx_count')).where(
+        tx.created_at >= start, tx.created_at < end,
+    ).group_by(tx.safe_box_id)
+    tx_rows = db.session.execute(year_tx).all()
+    safe_boxes = _write_snapshot(FiscalYearSafeBoxBalance, 'safe_box_id', SAFE_BOX_COLUMNS, previous, year, tx_rows)
+
+    if fiscal_year is None:
+        fiscal_year = FiscalYear(year=year)
+        db.session.add(fiscal_year)
+    fiscal_year.status = 'closed'
+    fiscal_year.closed_at = datetime.utcnow()
+    fiscal_year.closed_by = closed_by
+    fiscal_year.line_count = sum(int(row.line_count) for row in line_rows)
+    fiscal_year.safe_box_transaction_count = sum(int(row.tx_count) for row in tx_rows)
+    db.session.flush()
+
+    result = fiscal_year.to_dict()
+    result.update(accounts=accounts, safe_boxes=safe_boxes, backfilled_lines=backfilled)
+    return result
+
+
+def extend_ledger_partitions() -> List[str]:
+    """Add yearly ledger partitions up to two years ahead (PostgreSQL, partitioned tables only).
+
+    Call it after the close is committed, never inside it: the partition DDL
+    locks journal_entry_line, which an open close transaction already holds.
+    """
+    try:
+        from partition_ledger_tables import ensure_year_partitions
+        return ensure_year_partitions(db.engine, through_year=datetime.now().year + 2)
+    except Exception as exc:  # partitions are an optimisation; the close itself stands
+        LOGGER.warning('could not extend ledger partitions: %s', exc)
+        return []
+
+
+def reopen_fiscal_year(year: int) -> dict:
+    """Drop the snapshot of the latest closed year and make it writable again. Caller commits."""
+    year = int(year)
+    if closed_through() != year:
+        raise ValueError('only the latest closed fiscal year can be reopened')
+    FiscalYearAccountBalance.query.filter_by(year=year).delete(synchronize_session=False)
+    FiscalYearSafeBoxBalance.query.filter_by(year=year).delete(synchronize_session=False)
+    fiscal_year = FiscalYear.query.filter_by(year=year).one()
+    fiscal_year.status = 'open'
+    fiscal_year.closed_at = None
+    fiscal_year.closed_by = None
+    db.session.flush()
+    return fiscal_year.to_dict()
+
+
+def clear_fiscal_years() -> Dict[str, int]:
+    """Delete every fiscal year and its snapshots. Caller commits.
+
+    For the data-reset paths: they bulk-delete journal lines and safe-box
+    transactions (bypassing the closed-year guards), so the snapshots would keep
+    adding the old totals to every balance and the reset years would stay
+    closed to new postings. Snapshots only summarise rows, so dropping them
+    never changes a balance computed from the rows that remain.
+    """
+    return {
+        'fiscal_year_account_balances': FiscalYearAccountBalance.query.delete(synchronize_session=False),
+        'fiscal_year_safe_box_balances': FiscalYearSafeBoxBalance.query.delete(synchronize_session=False),
+        'fiscal_years': FiscalYear.query.delete(synchronize_session=False),
+    }
+
+
+__all__ = [
+    'ClosedFiscalYearError',
+    'account_totals',
+    'backfill_line_entry_dates',
+    'clear_fiscal_years',
+    'close_fiscal_year',
+    'closed_through',
+    'extend_ledger_partitions',
+    'reopen_fiscal_year',
+    'safe_box_totals',
+]
@@ -0,0 +1,280 @@
+"""Streaming general ledger rows and exports (CSV / NDJSON / XLSX).
+
+`ledger_rows` reads journal lines through a fixed column projection with
+``yield_per`` (a server-side cursor on PostgreSQL), so neither ORM objects nor
+the whole ledger are held in memory. Exports add per-account running balances
+in the same pass and are written chunk by chunk, optionally gzip-encoded, so a
+whole-year export costs O(page) memory.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import tempfile
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, or_, select
+
+from models import Account, JournalEntry, JournalEntryLine, SafeBox, db
+
+KARATS = (18, 21, 22, 24)
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = ('csv', 'ndjson', 'xlsx')
+
+BASE_COLUMNS = (
+    'id', 'date', 'entry_number', 'description', 'entry_type',
+    'account_number', 'account_name', 'account_branch',
+    'reference_type', 'reference_number', 'is_posted', 'created_by', 'posted_by',
+    'cash_debit', 'cash_credit', 'gold_debit', 'gold_credit',
+)
+KARAT_COLUMNS = tuple(f'{side}_{karat}k' for karat in KARATS for side in ('debit', 'credit'))
+BALANCE_COLUMNS = ('balance_cash', 'balance_gold')
+KARAT_BALANCE_COLUMNS = tuple(f'balance_{karat}k' for karat in KARATS)
+ALL_COLUMNS = BASE_COLUMNS + KARAT_COLUMNS + BALANCE_COLUMNS + KARAT_BALANCE_COLUMNS
+
+
+@dataclass
+class LedgerFilters:
+    account_id: Optional[int] = None
+    start_dt: Optional[datetime] = None
+    end_dt: Optional[datetime] = None  # exclusive
+    posted_only: bool = False
+    reference_types: List[str] = field(default_factory=list)
+    created_by: Optional[str] = None
+    posted_by: Optional[str] = None
+    user: Optional[str] = None
+    branch: Optional[str] = None  # normalized (lower-case)
+
+    def apply(self, query):
+        """Add the filters to a legacy Query or a 2.0 select() over lines/entries/accounts."""
+        query = query.filter(JournalEntryLine.is_deleted.is_(False), JournalEntry.is_deleted.is_(False))
+        if self.account_id:
+            query = query.filter(JournalEntryLine.account_id == self.account_id)
+        if self.start_dt:
+            query = query.filter(JournalEntry.date >= self.start_dt)
+        if self.end_dt:
+            query = query.filter(JournalEntry.date < self.end_dt)
+        if self.posted_only:
+            query = query.filter(JournalEntry.is_posted.is_(True))
+        if self.reference_types:
+            query = query.filter(JournalEntry.reference_type.in_(self.reference_types))
+        if self.created_by:
+            query = query.filter(JournalEntry.created_by == self.created_by)
+        if self.posted_by:
+            query = query.filter(JournalEntry.posted_by == self.posted_by)
+        if self.user:
+            query = query.filter(or_(JournalEntry.created_by == self.user, JournalEntry.posted_by == self.user))
+        if self.branch:
+            branch_accounts = select(SafeBox.account_id).where(
+                func.lower(func.coalesce(SafeBox.branch, '')) == self.branch
+            )
+            query = query.filter(JournalEntryLine.account_id.in_(branch_accounts))
+        return query
+
+
+def account_branches() -> Dict[int, str]:
+    """First safe-box branch of every account (the chart is small; one query)."""
+    branches: Dict[int, str] = {}
+    rows = db.session.execute(
+        select(SafeBox.account_id, SafeBox.branch)
+        .where(SafeBox.account_id.isnot(None), SafeBox.branch.isnot(None), SafeBox.branch != '')
+        .order_by(SafeBox.id)
+    )
+    for account_id, branch in rows:
+        branches.setdefault(account_id, branch)
+    return branches
+
+
+def ledger_rows(filters: LedgerFilters, yield_per: int = YIELD_PER):
+    """Journal lines (as Rows, not ORM objects) in (date, entry, line) order."""
+    stmt = (
+        select(
+            JournalEntryLine.id,
+            JournalEntryLine.journal_entry_id,
+            JournalEntryLine.account_id,
+            JournalEntryLine.description,
+            JournalEntryLine.cash_debit,
+            JournalEntryLine.cash_credit,
+            *(getattr(JournalEntryLine, column) for column in KARAT_COLUMNS),
+            JournalEntryLine.debit_weight,
+            JournalEntryLine.credit_weight,
+            JournalEntry.entry_number,
+            JournalEntry.date.label('entry_date'),
+            JournalEntry.description.label('entry_description'),
+            JournalEntry.entry_type,
+            JournalEntry.reference_type,
+            JournalEntry.reference_number,
+            JournalEntry.is_posted,
+            JournalEntry.created_by,
+            JournalEntry.posted_by,
+            Account.name.label('account_name'),
+            Account.account_number,
+        )
+        .join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
+        .join(Account, Account.id == JournalEntryLine.account_id)
+        .order_by(JournalEntry.date.asc(), JournalEntry.id.asc(), JournalEntryLine.id.asc())
+        .execution_options(yield_per=yield_per)
+    )
+    return db.session.execute(filters.apply(stmt))
+
+
+def line_weight(row, side: str, main_karat: float) -> float:
+    """Line weight on `side` in the main karat (falls back to the stored equivalent)."""
+    total = 0.0
+    for karat in KARATS:
+        value = getattr(row, f'{side}_{karat}k') or 0.0
+        if value:
+            total += float(value) * karat / main_karat
+    if total == 0:
+        total = float(getattr(row, f'{side}_weight') or 0.0)
+    return total
+
+
+def export_records(rows, main_karat: float, branches: Dict[int, str]) -> Iterator[dict]:
+    """Flat export records with running balances kept per account, in one pass."""
+    balances: Dict[int, List[float]] = {}
+    for row in rows:
+        cash_debit = float(row.cash_debit or 0.0)
+        cash_credit = float(row.cash_credit or 0.0)
+        running = balances.setdefault(row.account_id, [0.0] * (1 + len(KARATS)))
+        running[0] += cash_debit - cash_credit
+        record = {
+            'id': row.id,
+            'date': row.entry_date.isoformat() if row.entry_date else None,
+            'entry_number': row.entry_number,
+            'description': row.entry_description or row.description,
+            'entry_type': row.entry_type,
+            'account_number': row.account_number,
+            'account_name': row.account_name,
+            'account_branch': branches.get(row.account_id),
+            'reference_type': row.reference_type,
+            'reference_number': row.reference_number,
+            'is_posted': bool(row.is_posted),
+            'created_by': row.created_by,
+            'posted_by': row.posted_by,
+            'cash_debit': round(cash_debit, 2),
+            'cash_credit': round(cash_credit, 2),
+            'gold_debit': round(line_weight(row, 'debit', main_karat), 3),
+            'gold_credit': round(line_weight(row, 'credit', main_karat), 3),
+        }
+        gold_balance = 0.0
+        for index, karat in enumerate(KARATS, start=1):
+            debit = float(getattr(row, f'debit_{karat}k') or 0.0)
+            credit = float(getattr(row, f'credit_{karat}k') or 0.0)
+            running[index] += debit - credit
+            gold_balance += running[index] * karat / main_karat
+            record[f'debit_{karat}k'] = round(debit, 3)
+            record[f'credit_{karat}k'] = round(credit, 3)
+            record[f'balance_{karat}k'] = round(running[index], 3)
+        record['balance_cash'] = round(running[0], 2)
+        record['balance_gold'] = round(gold_balance, 3)
+        yield record
+
+
+def default_columns(show_balances: bool, karat_detail: bool) -> List[str]:
+    columns = list(BASE_COLUMNS)
+    if karat_detail:
+        columns.extend(KARAT_COLUMNS)
+    if show_balances:
+        columns.extend(BALANCE_COLUMNS)
+        if karat_detail:
+            columns.extend(KARAT_BALANCE_COLUMNS)
+    return columns
+
+
+def parse_columns(raw: Optional[str]) -> Optional[List[str]]:
+    """``?columns=a,b`` -> ['a', 'b']; raises ValueError on unknown names."""
+    if not raw:
+        return None
+    columns = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in columns if name not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(ALL_COLUMNS)}")
+    return columns or None
+
+
+# ---------------------------------------------------------------------------
+# Writers (each yields bytes chunks of roughly CHUNK_BYTES)
+# ---------------------------------------------------------------------------
+
+def csv_chunks(records: Iterable[dict], columns: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([record.get(column) for column in columns])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(records: Iterable[dict], columns: Sequence[str]) -> Iterator[bytes]:
+    parts: List[str] = []
+    size = 0
+    for record in records:
+        line = json.dumps({column: record.get(column) for column in columns}, ensure_ascii=False) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    yield ''.join(parts).encode('utf-8')
+
+
+def xlsx_chunks(records: Iterable[dict], columns: Sequence[str]) -> Iterator[bytes]:
+    """Write-only workbook (rows are flushed to disk as they come), streamed from a temp file."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('General Ledger')
+    sheet.append(list(columns))
+    for record in records:
+        sheet.append([record.get(column) for column in columns])
+    with tempfile.TemporaryFile() as handle:
+        workbook.save(handle)
+        handle.seek(0)
+        while True:
+            chunk = handle.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+WRITERS = {
+    'csv': (csv_chunks, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+    'xlsx': (xlsx_chunks, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(filters: LedgerFilters, export_format: str, columns: Sequence[str], main_karat: float,
+                  compress: bool = False) -> Iterator[bytes]:
+    writer, _content_type = WRITERS[export_format]
+    branches = account_branches() if 'account_branch' in columns else {}
+    chunks = writer(export_records(ledger_rows(filters), main_karat, branches), columns)
+    return gzip_chunks(chunks) if compress else chunks
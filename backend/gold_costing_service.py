@@ -1,10 +1,45 @@
-"""Gold costing service utilities for moving average calculations."""
+"""Gold costing service utilities for moving average calculations.
+
+The moving average lives in `InventoryCostingConfig`. `rebuild_costing` replays
+inventory invoices in (date, id) order to rebuild it and stores
+`InventoryCostingCheckpoint` rows along the way, so a later recompute resumes
+from the nearest checkpoint; invoice changes dated on or before a checkpoint
+invalidate it (see `_invalidate_checkpoints_on_flush`).
+"""
 from __future__ import annotations
 
+import os
 from dataclasses import asdict, dataclass
-from typing import Dict, Optional
+from datetime import date, datetime, time
+from typing import Dict, Iterable, Iterator, Optional
 
-from models import db, InventoryCostingConfig
+from sqlalchemy import and_, delete, event, func, or_, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, object_session, selectinload
+
+from jobs import report_progress
+from models import (
+    db,
+    Invoice,
+    InvoiceItem,
+    InvoiceKaratLine,
+    InventoryCostingCheckpoint,
+    InventoryCostingConfig,
+)
+
+# Invoice types that affect inventory weight
+ADD_INVOICE_TYPES = ('شراء', 'شراء من عميل', 'مرتجع بيع')
+CONSUME_INVOICE_TYPES = ('بيع', 'مرتجع شراء', 'مرتجع شراء (مورد)')
+COSTING_INVOICE_TYPES = ADD_INVOICE_TYPES + CONSUME_INVOICE_TYPES
+
+REPLAY_CHUNK_SIZE = 500
+
+
+def _checkpoint_every() -> int:
+    try:
+        return max(int(os.getenv('COSTING_CHECKPOINT_EVERY', 1)), 1)
+    except (TypeError, ValueError):
+        return 1
 
 
 @dataclass
@@ -19,6 +54,90 @@ class AverageSnapshot:
         return asdict(self)
 
 
+@dataclass(frozen=True)
+class CostingMovement:
+    """One inventory movement: ``purchase`` adds weight at a cost, ``consume`` removes it at average."""
+
+    kind: str
+    weight_grams: float
+    gold_price_per_gram: float = 0.0
+    manufacturing_wage_per_gram: float = 0.0
+
+
+@dataclass
+class CostingState:
+    """In-memory moving-average totals shared by the single, batch and replay paths."""
+
+    total_inventory_weight: float = 0.0
+    total_gold_value: float = 0.0
+    total_manufacturing_value: float = 0.0
+    avg_gold_price_per_gram: float = 0.0
+    avg_manufacturing_per_gram: float = 0.0
+    last_purchase_price: Optional[float] = None
+    last_purchase_weight: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'CostingState':
+        return cls(
+            total_inventory_weight=row.total_inventory_weight or 0.0,
+            total_gold_value=row.total_gold_value or 0.0,
+            total_manufacturing_value=row.total_manufacturing_value or 0.0,
+            avg_gold_price_per_gram=row.avg_gold_price_per_gram or 0.0,
+            avg_manufacturing_per_gram=row.avg_manufacturing_per_gram or 0.0,
+            last_purchase_price=row.last_purchase_price,
+            last_purchase_weight=row.last_purchase_weight,
+        )
+
+    def _refresh_averages(self) -> None:
+        if self.total_inventory_weight > 0:
+            self.avg_gold_price_per_gram = self.total_gold_value / self.total_inventory_weight
+            self.avg_manufacturing_per_gram = self.total_manufacturing_value / self.total_inventory_weight
+        else:
+            self.avg_gold_price_per_gram = 0.0
+            self.avg_manufacturing_per_gram = 0.0
+
+    def purchase(self, weight_grams: float, gold_price_per_gram: float, manufacturing_wage_per_gram: float = 0.0) -> None:
+        if weight_grams is None or weight_grams <= 0:
+            return
+        self.total_inventory_weight += weight_grams
+        self.total_gold_value += (gold_price_per_gram or 0.0) * weight_grams
+        self.total_manufacturing_value += (manufacturing_wage_per_gram or 0.0) * weight_grams
+        self._refresh_averages()
+        self.last_purchase_price = gold_price_per_gram
+        self.last_purchase_weight = weight_grams
+
+    def consume(self, weight_grams: float) -> None:
+        if weight_grams is None or weight_grams <= 0 or not self.total_inventory_weight:
+            return
+        deduction_weight = min(weight_grams, self.total_inventory_weight)
+        self.total_inventory_weight -= deduction_weight
+        self.total_gold_value = max(0.0, self.total_gold_value - self.avg_gold_price_per_gram * deduction_weight)
+        self.total_manufacturing_value = max(
+            0.0, self.total_manufacturing_value - self.avg_manufacturing_per_gram * deduction_weight
+        )
+        self._refresh_averages()
+
+    def apply(self, movement: CostingMovement) -> None:
+        if movement.kind == 'purchase':
+            self.purchase(movement.weight_grams, movement.gold_price_per_gram, movement.manufacturing_wage_per_gram)
+        elif movement.kind == 'consume':
+            self.consume(movement.weight_grams)
+        else:
+            raise ValueError(f'unknown costing movement {movement.kind!r}')
+
+    def write_to(self, row) -> None:
+        row.total_inventory_weight = self.total_inventory_weight
+        row.total_gold_value = self.total_gold_value
+        row.total_manufacturing_value = self.total_manufacturing_value
+        row.avg_gold_price_per_gram = self.avg_gold_price_per_gram
+        row.avg_manufacturing_per_gram = self.avg_manufacturing_per_gram
+        row.last_purchase_price = self.last_purchase_price
+        row.last_purchase_weight = self.last_purchase_weight
+        if isinstance(row, InventoryCostingConfig):
+            row.avg_total_cost_per_gram = self.avg_gold_price_per_gram + self.avg_manufacturing_per_gram
+            row.current_avg_cost_per_gram = row.avg_total_cost_per_gram
+
+
 class GoldCostingService:
     """Encapsulates moving-average costing logic (gold + manufacturing)."""
 
@@ -63,6 +182,23 @@ class GoldCostingService:
         db.session.commit()
         return config.to_dict()
 
+    @staticmethod
+    def apply_movements(movements: Iterable[CostingMovement], auto_commit: bool = True) -> AverageSnapshot:
+        """Apply many purchases/consumptions in order with a single config write."""
+        config = GoldCostingService._get_config()
+        state = CostingState.from_row(config)
+        applied = 0
+        for movement in movements:
+            state.apply(movement)
+            applied += 1
+        if applied:
+            state.write_to(config)
+            if auto_commit:
+                db.session.commit()
+            else:
+                db.session.flush()
+        return GoldCostingService.snapshot()
+
     @staticmethod
     def update_average_on_purchase(
         weight_grams: float,
@@ -73,78 +209,15 @@ class GoldCostingService:
         """Update moving averages when purchasing new gold inventory."""
         if weight_grams is None or weight_grams <= 0:
             return GoldCostingService.snapshot()
-
-        config = GoldCostingService._get_config()
-
-        gold_value = (gold_price_per_gram or 0.0) * weight_grams
-        manufacturing_value = (manufacturing_wage_per_gram or 0.0) * weight_grams
-        total_value = gold_value + manufacturing_value
-
-        config.total_inventory_weight = (config.total_inventory_weight or 0.0) + weight_grams
-        config.total_gold_value = (config.total_gold_value or 0.0) + gold_value
-        config.total_manufacturing_value = (config.total_manufacturing_value or 0.0) + manufacturing_value
-
-        if config.total_inventory_weight > 0:
-            config.avg_gold_price_per_gram = config.total_gold_value / config.total_inventory_weight
-            config.avg_manufacturing_per_gram = (
-                config.total_manufacturing_value / config.total_inventory_weight
-            )
-            config.avg_total_cost_per_gram = config.avg_gold_price_per_gram + config.avg_manufacturing_per_gram
-            config.current_avg_cost_per_gram = config.avg_total_cost_per_gram
-        else:
-            config.avg_gold_price_per_gram = 0.0
-            config.avg_manufacturing_per_gram = 0.0
-            config.avg_total_cost_per_gram = 0.0
-            config.current_avg_cost_per_gram = 0.0
-
-        config.last_purchase_price = gold_price_per_gram
-        config.last_purchase_weight = weight_grams
-
-        if auto_commit:
-            db.session.commit()
-        else:
-            db.session.flush()
-
-        return GoldCostingService.snapshot()
+        movement = CostingMovement('purchase', weight_grams, gold_price_per_gram, manufacturing_wage_per_gram)
+        return GoldCostingService.apply_movements([movement], auto_commit=auto_commit)
 
     @staticmethod
     def consume_inventory(weight_grams: float, auto_commit: bool = True) -> AverageSnapshot:
         """Reduce totals after a sale using the current moving average."""
         if weight_grams is None or weight_grams <= 0:
             return GoldCostingService.snapshot()
-
-        config = GoldCostingService._get_config()
-        if not config.total_inventory_weight:
-            return GoldCostingService.snapshot()
-
-        deduction_weight = min(weight_grams, config.total_inventory_weight)
-        gold_deduction = (config.avg_gold_price_per_gram or 0.0) * deduction_weight
-        manufacturing_deduction = (config.avg_manufacturing_per_gram or 0.0) * deduction_weight
-
-        config.total_inventory_weight -= deduction_weight
-        config.total_gold_value = max(0.0, (config.total_gold_value or 0.0) - gold_deduction)
-        config.total_manufacturing_value = max(
-            0.0, (config.total_manufacturing_value or 0.0) - manufacturing_deduction
-        )
-
-        if config.total_inventory_weight > 0:
-            config.avg_gold_price_per_gram = config.total_gold_value / config.total_inventory_weight
-            config.avg_manufacturing_per_gram = (
-                config.total_manufacturing_value / config.total_inventory_weight
-            )
-            config.avg_total_cost_per_gram = config.avg_gold_price_per_gram + config.avg_manufacturing_per_gram
-            config.current_avg_cost_per_gram = config.avg_total_cost_per_gram
-        else:
-            config.avg_gold_price_per_gram = 0.0
-            config.avg_manufacturing_per_gram = 0.0
-            config.avg_total_cost_per_gram = 0.0
-            config.current_avg_cost_per_gram = 0.0
-
-        if auto_commit:
-            db.session.commit()
-        else:
-            db.session.flush()
-        return GoldCostingService.snapshot()
+        return GoldCostingService.apply_movements([CostingMovement('consume', weight_grams)], auto_commit=auto_commit)
 
     @staticmethod
     def calculate_cogs(weight_grams: float) -> Dict[str, float]:
@@ -193,4 +266,248 @@ def calculate_closing_difference(
         'close_value': close_value,
         'difference_value': difference_value,
         'difference_weight': difference_weight,
-    }
\ No newline at end of file
+    }
+
+# ---------------------------------------------------------------------------
+# Invoice replay with checkpoints
+# ---------------------------------------------------------------------------
+
+def invoice_movement(inv: Invoice) -> Optional[CostingMovement]:
+    """The costing movement of an inventory invoice (None when it moves no weight)."""
+    try:
+        weight_main = float(inv.calculate_total_weight() or 0.0)
+    except Exception:
+        weight_main = float(getattr(inv, 'total_weight', 0.0) or 0.0)
+
+    if weight_main <= 0 or inv.invoice_type not in COSTING_INVOICE_TYPES:
+        return None
+    if inv.invoice_type in CONSUME_INVOICE_TYPES:
+        return CostingMovement('consume', weight_main)
+
+    # Add inventory (purchase or sales return)
+    gold_value_cash = 0.0
+    wage_value_cash = 0.0
+    if getattr(inv, 'karat_lines', None):
+        gold_value_cash = sum((line.gold_value_cash or 0.0) for line in inv.karat_lines)
+        wage_value_cash = sum((line.manufacturing_wage_cash or 0.0) for line in inv.karat_lines)
+
+    # Fallbacks when karat_lines are not present
+    if gold_value_cash == 0.0 and getattr(inv, 'gold_subtotal', None) is not None:
+        gold_value_cash = float(inv.gold_subtotal or 0.0)
+    if wage_value_cash == 0.0 and getattr(inv, 'wage_subtotal', None) is not None:
+        wage_value_cash = float(inv.wage_subtotal or 0.0)
+
+    # For sales return, if snapshot components exist, they are usually the most accurate
+    if inv.invoice_type == 'مرتجع بيع':
+        gold_component = float(getattr(inv, 'avg_cost_gold_component', 0.0) or 0.0)
+        wage_component = float(getattr(inv, 'avg_cost_manufacturing_component', 0.0) or 0.0)
+        if gold_component > 0 or wage_component > 0:
+            return CostingMovement('purchase', weight_main, gold_component, wage_component)
+
+    gold_price_per_gram = gold_value_cash / weight_main
+    wage_per_gram = wage_value_cash / weight_main
+
+    # Last-resort: if everything is 0, try using invoice total as total cost
+    if gold_price_per_gram == 0.0 and wage_per_gram == 0.0:
+        gold_price_per_gram = float(getattr(inv, 'total', 0.0) or 0.0) / weight_main
+
+    return CostingMovement('purchase', weight_main, gold_price_per_gram, wage_per_gram)
+
+
+def _after_position(position):
+    if position is None:
+        return None
+    last_date, last_id = position
+    return or_(Invoice.date > last_date, and_(Invoice.date == last_date, Invoice.id > last_id))
+
+
+def _iter_costing_invoices(position=None, limit: Optional[int] = None) -> Iterator[Invoice]:
+    """Inventory invoices after `position` in (date, id) order, loaded in keyset chunks."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = REPLAY_CHUNK_SIZE if remaining is None else min(REPLAY_CHUNK_SIZE, remaining)
+        query = (
+            Invoice.query
+            .filter(Invoice.invoice_type.in_(COSTING_INVOICE_TYPES))
+            .options(
+                selectinload(Invoice.karat_lines),
+                selectinload(Invoice.items).joinedload(InvoiceItem.item),
+            )
+        )
+        after = _after_position(position)
+        if after is not None:
+            query = query.filter(after)
+        chunk = query.order_by(Invoice.date.asc(), Invoice.id.asc()).limit(size).all()
+        if not chunk:
+            return
+        yield from chunk
+        position = (chunk[-1].date, chunk[-1].id)
+        if remaining is not None:
+            remaining -= len(chunk)
+        if len(chunk) < size:
+            return
+
+
+def _day_start(value) -> datetime:
+    if isinstance(value, datetime):
+        return datetime.combine(value.date(), time.min)
+    return datetime.combine(value, time.min)
+
+
+def invalidate_checkpoints(since) -> int:
+    """Delete checkpoints that include invoices dated on/after the day of `since`."""
+    result = db.session.execute(
+        delete(InventoryCostingCheckpoint)
+        .where(InventoryCostingCheckpoint.last_invoice_date >= _day_start(since))
+    )
+    return result.rowcount or 0
+
+
+def rebuild_costing(
+    limit: Optional[int] = None,
+    from_date: Optional[date] = None,
+    full: bool = False,
+    checkpoint_every: Optional[int] = None,
+) -> Dict[str, object]:
+    """Rebuild the moving average from invoices, resuming from the nearest checkpoint.
+
+    A checkpoint is written at the first day boundary after at least
+    `checkpoint_every` replayed invoices (COSTING_CHECKPOINT_EVERY, default one
+    per day) and after the last invoice. `from_date` discards checkpoints from
+    that day on; `full` (implied by `limit`) replays everything from zero.
+    """
+    checkpoint_every = checkpoint_every or _checkpoint_every()
+    full = full or limit is not None
+
+    if full:
+        db.session.execute(delete(InventoryCostingCheckpoint))
+        resume = None
+    else:
+        if from_date is not None:
+            invalidate_checkpoints(from_date)
+        resume = db.session.scalars(
+            select(InventoryCostingCheckpoint)
+            .order_by(InventoryCostingCheckpoint.last_invoice_date.desc(), InventoryCostingCheckpoint.last_invoice_id.desc())
+            .limit(1)
+        ).first()
+
+    state = CostingState.from_row(resume) if resume is not None else CostingState()
+    position = (resume.last_invoice_date, resume.last_invoice_id) if resume is not None else None
+    replayed_before = resume.invoices_replayed if resume is not None else 0
+
+    total_query = db.session.query(func.count(Invoice.id)).filter(Invoice.invoice_type.in_(COSTING_INVOICE_TYPES))
+    if position is not None:
+        total_query = total_query.filter(_after_position(position))
+    total = total_query.scalar() or 0
+    if limit is not None:
+        total = min(total, int(limit))
+
+    def _checkpoint(last_date, last_id, replayed):
+        checkpoint = InventoryCostingCheckpoint(
+            last_invoice_date=last_date,
+            last_invoice_id=last_id,
+            invoices_replayed=replayed,
+        )
+        state.write_to(checkpoint)
+        db.session.add(checkpoint)
+
+    processed = 0
+    replayed = 0
+    checkpoints_written = 0
+    since_checkpoint = 0
+    last = None
+    for inv in _iter_costing_invoices(position, limit=int(limit) if limit is not None else None):
+        report_progress(replayed, total, 'replaying invoices')
+        if last is not None and since_checkpoint >= checkpoint_every and inv.date.date() != last[0].date():
+            _checkpoint(last[0], last[1], replayed_before + replayed)
+            checkpoints_written += 1
+            since_checkpoint = 0
+
+        movement = invoice_movement(inv)
+        if movement is not None:
+            state.apply(movement)
+            processed += 1
+        replayed += 1
+        since_checkpoint += 1
+        last = (inv.date, inv.id)
+
+    if last is not None and since_checkpoint:
+        _checkpoint(last[0], last[1], replayed_before + replayed)
+        checkpoints_written += 1
+
+    config = GoldCostingService._get_config()
+    if resume is None and last is None:
+        # Nothing to replay: start from a clean slate.
+        CostingState().write_to(config)
+    else:
+        state.write_to(config)
+    db.session.commit()
+
+    return {
+        'processed_invoices': processed,
+        'replayed_invoices': replayed,
+        'resumed_from': resume.to_dict() if resume is not None else None,
+        'checkpoints_written': checkpoints_written,
+    }
+
+
+# Invoice columns read by `invoice_movement`; other updates leave checkpoints valid.
+_COSTING_INVOICE_FIELDS = (
+    'date', 'invoice_type', 'total', 'total_weight', 'gold_subtotal', 'wage_subtotal',
+    'avg_cost_gold_component', 'avg_cost_manufacturing_component',
+)
+_STALE_KEY = 'costing_checkpoints_stale'
+
+
+def _mark_stale(target, invoice_date=None, invoice_id=None) -> None:
+    session = object_session(target)
+    if session is None:
+        return
+    stale = session.info.setdefault(_STALE_KEY, {'dates': [], 'invoice_ids': set()})
+    if invoice_date is not None:
+        stale['dates'].append(invoice_date)
+    if invoice_id is not None:
+        stale['invoice_ids'].add(invoice_id)
+
+
+@event.listens_for(Invoice, 'after_insert')
+@event.listens_for(Invoice, 'after_delete')
+def _invoice_written(_mapper, _connection, target):
+    _mark_stale(target, invoice_date=target.date)
+
+
+@event.listens_for(Invoice, 'after_update')
+def _invoice_updated(_mapper, _connection, target):
+    state = sa_inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in _COSTING_INVOICE_FIELDS):
+        return
+    _mark_stale(target, invoice_date=target.date)
+    for value in state.attrs.date.history.deleted or ():
+        _mark_stale(target, invoice_date=value)
+
+
+@event.listens_for(InvoiceItem, 'after_insert')
+@event.listens_for(InvoiceItem, 'after_update')
+@event.listens_for(InvoiceItem, 'after_delete')
+@event.listens_for(InvoiceKaratLine, 'after_insert')
+@event.listens_for(InvoiceKaratLine, 'after_update')
+@event.listens_for(InvoiceKaratLine, 'after_delete')
+def _invoice_line_written(_mapper, _connection, target):
+    _mark_stale(target, invoice_id=target.invoice_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_checkpoints_on_flush(session, _flush_context):
+    """Drop checkpoints that include an invoice written in this flush (one DELETE per flush)."""
+    stale = session.info.pop(_STALE_KEY, None)
+    if not stale:
+        return
+    conditions = []
+    dates = [value for value in stale['dates'] if value is not None]
+    if dates:
+        conditions.append(InventoryCostingCheckpoint.last_invoice_date >= min(dates))
+    if stale['invoice_ids']:
+        first_date = select(func.min(Invoice.date)).where(Invoice.id.in_(stale['invoice_ids'])).scalar_subquery()
+        conditions.append(InventoryCostingCheckpoint.last_invoice_date >= first_date)
+    if conditions:
+        session.connection().execute(delete(InventoryCostingCheckpoint).where(or_(*conditions)))
@@ -1,20 +1,18 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 import time
 from threading import Thread
-import os
-import schedule
-import requests
-from bs4 import BeautifulSoup
 import datetime
 from models import db
 
+# Network/scraping stacks (requests, yfinance, schedule) are imported inside the
+# functions that use them so importing this module (via routes.py) stays cheap.
+
 def fetch_gold_price():
     """
     Fetches the gold price from the goldprice.org API.
     The new logic directly accesses the first item in the list.
     """
+    import requests
+
     try:
         url = "https://data-asg.goldprice.org/dbXRates/USD"
         headers = {
@@ -88,6 +86,8 @@ def auto_update_gold_price(app):
         print("[AutoUpdate] لم يتم جلب سعر الذهب.")
 
 def start_scheduler(app):
+    import schedule
+
     # Pass the app instance to the job
     schedule.every(1).minutes.do(auto_update_gold_price, app=app)
     def run():
@@ -20,6 +20,7 @@ import schedule
 
 from gold_price import fetch_gold_price, save_gold_price
 from models import GoldPrice, Settings, db
+from scheduler_leases import singleton_job
 
 
 class GoldPriceScheduler:
@@ -57,7 +58,9 @@ class GoldPriceScheduler:
                 if row:
                     at_time = (getattr(row, "gold_price_auto_update_time", None) or "09:00").strip()
             try:
-                schedule.every().day.at(at_time).do(self.update_from_internet).tag("gold_price")
+                schedule.every().day.at(at_time).do(
+                    singleton_job(self.app, "gold_price_update", self.update_from_internet, window_seconds=12 * 3600)
+                ).tag("gold_price")
                 print(f"[GoldPriceScheduler] Auto-update enabled daily at {at_time}")
             except Exception as exc:
                 print(f"[GoldPriceScheduler] Invalid daily time '{at_time}': {exc}")
@@ -71,7 +74,9 @@ class GoldPriceScheduler:
         if minutes < 1:
             minutes = 1
 
-        schedule.every(minutes).minutes.do(self.update_from_internet).tag("gold_price")
+        schedule.every(minutes).minutes.do(
+            singleton_job(self.app, "gold_price_update", self.update_from_internet, window_seconds=minutes * 30)
+        ).tag("gold_price")
         print(f"[GoldPriceScheduler] Auto-update enabled every {minutes} minute(s)")
 
     def update_from_internet(self) -> None:
@@ -79,8 +84,7 @@ class GoldPriceScheduler:
             try:
                 price = fetch_gold_price()
                 if price is None:
-                    print("[GoldPriceScheduler] No price fetched")
-                    return
+                    raise RuntimeError("no price fetched")
 
                 # Keep behavior consistent with the manual update endpoint.
                 save_gold_price(self.app, float(price))
@@ -91,6 +95,7 @@ class GoldPriceScheduler:
                 except Exception:
                     pass
                 print(f"[GoldPriceScheduler] ❌ Failed to auto-update gold price: {exc}")
+                raise
 
     def start(self) -> None:
         if self.is_running:
@@ -0,0 +1,41 @@
+"""Gunicorn configuration (production).
+
+The app is imported once in the master (`preload_app`), so the DB bootstrap in
+app.py runs once per restart instead of once per worker; workers are forked
+afterwards and get fresh DB connection pools (see post_fork).
+
+When bootstrap runs as a separate deploy step (`python backend/bootstrap.py`),
+set STARTUP_BOOTSTRAP=skip so the master skips it too.
+
+Worker profile: `gthread` by default, so a slow report only ties up one thread
+instead of a whole worker. Capacity is GUNICORN_WORKERS x GUNICORN_THREADS
+concurrent requests; keep DB_POOL_SIZE (default: GUNICORN_THREADS) in line so
+each thread can get a connection. `gevent` is accepted when installed, but the
+app is not tested under monkey-patching; `sync` restores the old behaviour.
+
+Usage:
+	gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8001')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread').strip() or 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+
+def post_fork(server, worker):
+	"""Never share pooled DB connections inherited from the master."""
+	app = getattr(server, 'app', None)
+	flask_app = app.wsgi() if app is not None and preload_app else None
+	sqlalchemy_ext = getattr(flask_app, 'extensions', {}).get('sqlalchemy') if flask_app else None
+	if sqlalchemy_ext is None:
+		return
+
+	with flask_app.app_context():
+		sqlalchemy_ext.engine.dispose(close=False)
@@ -0,0 +1,272 @@
+"""Idempotency keys for retried POST requests.
+
+POS tablets retry `POST /invoices` on flaky networks; without protection each
+retry re-runs the whole posting (journal entries, safe movements, a new
+invoice number). A client that sends ``Idempotency-Key: <uuid>`` gets at most
+one execution per key:
+
+* the first request claims the key (unique row in `idempotency_key`, committed
+  before the handler runs), runs the handler and stores the final response.
+  The handler's own commit also flips the claim to ``committed`` in the same
+  transaction, so once its writes are durable the key can no longer be
+  released or taken over, even if the worker dies before the response is
+  stored (retries then get 409 ``idempotency_key_response_lost``);
+* a retry with the same key and the same body gets the stored response back
+  (``Idempotent-Replayed: true``) from one unique-index lookup;
+* a retry that arrives while the first request is still running waits up to
+  IDEMPOTENCY_WAIT_SECONDS for it, then gets 409 + Retry-After;
+* the same key with a different body is a client bug and gets 422.
+
+Server errors (5xx, exceptions), transient refusals (401/403/409/429) and
+streamed responses release the key so the client can retry for real, unless
+the handler already committed: then the response is stored like any other.
+An uncommitted claim older than IDEMPOTENCY_LOCK_SECONDS is treated as
+abandoned (crashed worker) and can be taken over. Keys are purged after IDEMPOTENCY_TTL_HOURS by
+`purge_expired_idempotency_keys` (scheduled in schedulers.py).
+
+Requests without the header behave exactly as before.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Optional
+
+from flask import g, jsonify, make_response, request
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from jobs import owner_ref
+from models import IdempotencyKey, db
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+TRANSIENT_STATUSES = (401, 403, 409, 429)
+POLL_SECONDS = 0.1
+
+# session.info keys: the claim held by the running handler, and whether one of
+# its commits has already carried the claim to 'committed'.
+_SESSION_CLAIM_KEY = 'idempotency_claim_id'
+_SESSION_COMMITTED_KEY = 'idempotency_claim_committed'
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(str(os.getenv(name, default)).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def request_fingerprint() -> str:
+    """sha256 of method, path, query string and body (JSON compared semantically)."""
+    body = request.get_json(silent=True)
+    if body is not None:
+        payload = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    else:
+        payload = request.get_data() or b''
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.query_string, payload):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _owner() -> str:
+    user_id, user_kind, _username = owner_ref(g.get('current_user'))
+    return f'{user_kind}:{user_id}' if user_id is not None else ''
+
+
+def _replay(row: IdempotencyKey):
+    response = make_response(row.response_body or '', row.response_status)
+    if row.response_content_type:
+        response.headers['Content-Type'] = row.response_content_type
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _claim(scope: str, owner: str, key: str, fingerprint: str):
+    """Claim the key. Returns (row, claimed)."""
+    row = IdempotencyKey(scope=scope, owner=owner, key=key, request_hash=fingerprint)
+    db.session.add(row)
+    try:
+        db.session.commit()
+        return row, True
+    except IntegrityError:
+        db.session.rollback()
+    existing = IdempotencyKey.query.filter_by(scope=scope, owner=owner, key=key).first()
+    return existing, False
+
+
+def _take_over_if_stale(row: IdempotencyKey, lock_seconds: int) -> bool:
+    """Re-claim an in-progress key whose holder is gone (compare-and-set on locked_at)."""
+    now = datetime.utcnow()
+    if row.locked_at and row.locked_at > now - timedelta(seconds=lock_seconds):
+        return False
+    result = db.session.execute(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.id == row.id,
+            IdempotencyKey.status == 'in_progress',
+            IdempotencyKey.locked_at == row.locked_at,
+        )
+        .values(locked_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _release(row_id: int) -> None:
+    db.session.rollback()
+    db.session.execute(IdempotencyKey.__table__.delete().where(IdempotencyKey.id == row_id))
+    db.session.commit()
+
+
+@event.listens_for(Session, 'before_commit')
+def _commit_claim_with_handler(session):
+    row_id = session.info.get(_SESSION_CLAIM_KEY)
+    if row_id is None or session.info.get(_SESSION_COMMITTED_KEY) is True or session.in_nested_transaction():
+        return
+    session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == row_id, IdempotencyKey.status == 'in_progress')
+        .values(status='committed')
+        .execution_options(synchronize_session=False)
+    )
+    session.info[_SESSION_COMMITTED_KEY] = 'pending'
+
+
+@event.listens_for(Session, 'after_commit')
+def _claim_committed(session):
+    if session.info.get(_SESSION_COMMITTED_KEY) == 'pending':
+        session.info[_SESSION_COMMITTED_KEY] = True
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _claim_rolled_back(session, previous_transaction):
+    # A failed commit rolls the claim update back with the handler's writes.
+    if not previous_transaction.nested and session.info.get(_SESSION_COMMITTED_KEY) == 'pending':
+        session.info.pop(_SESSION_COMMITTED_KEY, None)
+
+
+def _run_handler(row_id: int, f, args, kwargs):
+    """Run the handler with its commits tied to the claim. Returns (response, committed)."""
+    info = db.session.info
+    info[_SESSION_CLAIM_KEY] = row_id
+    try:
+        return make_response(f(*args, **kwargs)), info.get(_SESSION_COMMITTED_KEY) is True
+    finally:
+        info.pop(_SESSION_CLAIM_KEY, None)
+
+
+def _store(row_id: int, response) -> None:
+    # Anything the handler left uncommitted would have been discarded at teardown.
+    db.session.rollback()
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == row_id)
+        .values(
+            status='completed',
+            response_status=response.status_code,
+            response_body=response.get_data(as_text=True),
+            response_content_type=response.content_type,
+            completed_at=datetime.utcnow(),
+        )
+    )
+    db.session.commit()
+
+
+def idempotent(f):
+    """Honour an ``Idempotency-Key`` header on a write endpoint (see module docstring).
+
+    Place it below the permission/auth decorators so keys are scoped to the
+    authenticated caller.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(HEADER) or '').strip()
+        if not key or g.get('background_job_id'):
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': 'invalid_idempotency_key', 'message': f'{HEADER} is too long'}), 400
+
+        scope = request.endpoint or request.path
+        fingerprint = request_fingerprint()
+        wait_seconds = max(_env_int('IDEMPOTENCY_WAIT_SECONDS', 5), 0)
+        lock_seconds = max(_env_int('IDEMPOTENCY_LOCK_SECONDS', 300), 1)
+
+        row, claimed = _claim(scope, _owner(), key, fingerprint)
+        deadline = time.monotonic() + wait_seconds
+        while not claimed:
+            if row is None:  # released meanwhile; try again
+                row, claimed = _claim(scope, _owner(), key, fingerprint)
+                continue
+            if row.request_hash != fingerprint:
+                return jsonify({
+                    'error': 'idempotency_key_reused',
+                    'message': f'{HEADER} was already used for a different request',
+                }), 422
+            if row.status == 'completed':
+                return _replay(row)
+            if row.status == 'committed' and row.locked_at and row.locked_at <= datetime.utcnow() - timedelta(seconds=lock_seconds):
+                response = jsonify({
+                    'error': 'idempotency_key_response_lost',
+                    'message': 'The request with this Idempotency-Key was applied but its response was not recorded',
+                })
+                response.status_code = 409
+                return response
+            if _take_over_if_stale(row, lock_seconds):
+                claimed = True
+                break
+            if time.monotonic() >= deadline:
+                response = jsonify({
+                    'error': 'idempotency_key_in_progress',
+                    'message': 'A request with this Idempotency-Key is still being processed',
+                })
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            time.sleep(POLL_SECONDS)
+            db.session.rollback()
+            row = db.session.get(IdempotencyKey, row.id, populate_existing=True)
+
+        row_id = row.id
+        db.session.info.pop(_SESSION_COMMITTED_KEY, None)
+        try:
+            response, committed = _run_handler(row_id, f, args, kwargs)
+        except Exception:
+            if db.session.info.pop(_SESSION_COMMITTED_KEY, None) is True:
+                # Its writes are durable: keep the key so a retry cannot apply them twice.
+                db.session.rollback()
+            else:
+                _release(row_id)
+            raise
+        db.session.info.pop(_SESSION_COMMITTED_KEY, None)
+        if not committed and (
+            response.is_streamed or response.status_code >= 500 or response.status_code in TRANSIENT_STATUSES
+        ):
+            _release(row_id)
+        elif response.is_streamed:
+            # Committed but the body cannot be captured; keep the key marked 'committed'.
+            db.session.rollback()
+        else:
+            _store(row_id, response)
+        return response
+    return wrapper
+
+
+def purge_expired_idempotency_keys(ttl_hours: Optional[int] = None) -> int:
+    """Delete keys older than the retention window; returns the number removed."""
+    hours = ttl_hours if ttl_hours is not None else _env_int('IDEMPOTENCY_TTL_HOURS', 72)
+    cutoff = datetime.utcnow() - timedelta(hours=max(hours, 1))
+    result = db.session.execute(
+        IdempotencyKey.__table__.delete().where(IdempotencyKey.created_at < cutoff)
+    )
+    db.session.commit()
+    return result.rowcount or 0
@@ -0,0 +1,84 @@
+"""Idempotency key retention scheduler.
+
+Periodically deletes `idempotency_key` rows older than IDEMPOTENCY_TTL_HOURS
+(see idempotency.py) so the table only holds keys clients may still retry.
+"""
+
+from __future__ import annotations
+
+import os
+from threading import Thread
+
+import schedule
+
+from idempotency import purge_expired_idempotency_keys
+from models import db
+from scheduler_leases import singleton_job
+
+
+class IdempotencyPurgeScheduler:
+    def __init__(self, app, interval_minutes: int | None = None):
+        self.app = app
+        self.is_running = False
+        self.interval_minutes = interval_minutes or int(os.getenv('IDEMPOTENCY_PURGE_INTERVAL_MINUTES', '60'))
+        self._job = None
+
+    def run_purge(self):
+        with self.app.app_context():
+            try:
+                removed = purge_expired_idempotency_keys()
+                if removed:
+                    print(f'[IdempotencyPurgeScheduler] ✓ removed {removed} expired keys')
+            except Exception as exc:
+                db.session.rollback()
+                print(f'[IdempotencyPurgeScheduler] ❌ Unexpected error: {exc}')
+                raise
+
+    def setup_schedule(self):
+        self._job = schedule.every(self.interval_minutes).minutes.do(
+            singleton_job(self.app, 'idempotency_purge', self.run_purge, window_seconds=self.interval_minutes * 30)
+        )
+        print(f'[IdempotencyPurgeScheduler] ✓ Purge scheduled every {self.interval_minutes} minutes')
+
+    def start(self):
+        if self.is_running:
+            print('[IdempotencyPurgeScheduler] already running')
+            return
+
+        self.setup_schedule()
+        self.is_running = True
+
+        def run_scheduler():
+            while self.is_running:
+                schedule.run_pending()
+                # Check every minute
+                import time as _time
+
+                _time.sleep(60)
+
+        thread = Thread(target=run_scheduler, daemon=True)
+        thread.start()
+        print('[IdempotencyPurgeScheduler] 🚀 started')
+
+    def stop(self):
+        self.is_running = False
+        if self._job is not None:
+            schedule.cancel_job(self._job)
+            self._job = None
+        print('[IdempotencyPurgeScheduler] stopped')
+
+
+_scheduler_instance: IdempotencyPurgeScheduler | None = None
+
+
+def get_idempotency_purge_scheduler(app):
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = IdempotencyPurgeScheduler(app)
+    return _scheduler_instance
+
+
+def start_idempotency_purge_scheduler(app):
+    scheduler = get_idempotency_purge_scheduler(app)
+    scheduler.start()
+    return scheduler
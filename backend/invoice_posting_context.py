@@ -0,0 +1,286 @@
+"""Per-request, preloaded lookups for the invoice posting path.
+
+`POST /invoices` used to re-read the same rows at every stage: settings seven
+times, the latest gold price once per journal line (through the dual-entry
+helpers and line analytics), the employee, payment method and safe box once
+per stage, and the default accounts by Arabic name without an index.
+
+`InvoicePostingContext` loads everything the payload references in a few
+staged IN-queries at the start of the request:
+
+1. settings and the latest gold price;
+2. employee, customer/supplier, branch, office, items and payment methods
+   (with their default safe boxes), plus any safe box given explicitly;
+3. every account those rows and the weight-closing settings point at, plus
+   the default accounts looked up by name/number;
+4. the memo (weight) twins of those accounts.
+
+Later stages read from the context instead of querying. Rows are ordinary
+session objects, so anything created or modified during the request is still
+visible; ids that were not preloaded fall back to `Session.get` (identity map
+first). The context is bound to `flask.g` by `uses_posting_context` and helpers
+outside routes.py (dual_system_helpers, dimensions_service) consult
+`current_posting_context()` when it is set and keep their own queries when not.
+"""
+
+from __future__ import annotations
+
+import json
+from functools import wraps
+from typing import Any, Dict, Iterable, Optional
+
+from flask import g, has_app_context
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.util import identity_key
+
+from mapping_resolver import DEFAULT_ACCOUNT_NUMBERS as MAPPING_DEFAULT_NUMBERS, DEFAULT_MAPPING_OPERATION_TYPE, mapping_resolver
+from models import (
+    Account, Branch, Customer, Employee, GoldPrice, Item, Office, PaymentMethod, SafeBox, Settings, Supplier, db,
+)
+
+G_KEY = 'invoice_posting_context'
+
+# Default accounts `add_invoice` resolves by name (see "الحسابات الأساسية").
+DEFAULT_ACCOUNT_NAMES = ('صندوق النقدية', 'المخزون', 'تكلفة البضاعة المباعة')
+DEFAULT_ACCOUNT_NAME_PREFIXES = ('مبيعات', 'الإيرادات')
+# Accounts resolved by number, incl. the inventory fallbacks (1300 new / 1310 scrap)
+# of routes._resolve_inventory_account_id_for_invoice.
+DEFAULT_ACCOUNT_NUMBERS = ('71100', '1500', '1300', '1310')
+
+_MISSING = object()
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        number = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def _ids(values: Iterable[Any]) -> set:
+    return {number for number in (_int_or_none(v) for v in values) if number is not None}
+
+
+class InvoicePostingContext:
+    """Entities referenced by one invoice posting, loaded once."""
+
+    def __init__(self, session=None):
+        self.session = session or db.session
+        self._settings = _MISSING
+        self._gold_price = _MISSING
+        self._rows: Dict[type, Dict[int, Any]] = {}
+        # Ids the preload asked for and did not find: later lookups skip the DB.
+        self._absent: Dict[type, set] = {}
+        self._accounts_by_name: Dict[str, Optional[Account]] = {}
+        self._accounts_by_prefix: Dict[str, Optional[Account]] = {}
+        self._accounts_by_number: Dict[str, Optional[Account]] = {}
+
+    # ------------------------------------------------------------------
+    # Preloading
+    # ------------------------------------------------------------------
+    def preload(self, data: dict) -> 'InvoicePostingContext':
+        """Load everything `data` (the POST /invoices payload) references."""
+        data = data if isinstance(data, dict) else {}
+        payments = [p for p in (data.get('payments') or []) if isinstance(p, dict)]
+        items = [i for i in (data.get('items') or []) if isinstance(i, dict)]
+
+        self.settings
+        self.latest_gold_price
+
+        self._load(Employee, _ids([data.get('employee_id'), data.get('scrap_holder_employee_id')]))
+        self._load(Customer, _ids([data.get('customer_id')]))
+        self._load(Supplier, _ids([data.get('supplier_id')]))
+        self._load(Branch, _ids([data.get('branch_id')]))
+        self._load(Office, _ids([data.get('office_id')]))
+        self._load(Item, _ids(i.get('item_id') for i in items))
+        self._load(
+            PaymentMethod,
+            _ids([data.get('payment_method_id')] + [p.get('payment_method_id') for p in payments]),
+            selectinload(PaymentMethod.default_safe_box),
+        )
+        safe_box_ids = _ids(
+            [data.get('safe_box_id'), data.get('settled_gold_safe_box_id')] + [p.get('safe_box_id') for p in payments]
+        )
+        self._load(SafeBox, safe_box_ids - set(self._rows.get(SafeBox, {})))
+
+        account_ids = _ids([data.get('bridge_account_id'), data.get('wage_expense_account_id'),
+                            data.get('wage_inventory_account_id')])
+        for model, attr in ((Customer, 'account_id'), (Supplier, 'account_id'), (Employee, 'account_id'),
+                            (SafeBox, 'account_id')):
+            account_ids |= _ids(getattr(row, attr, None) for row in self._rows.get(model, {}).values())
+        for method in self._rows.get(PaymentMethod, {}).values():
+            safe = method.default_safe_box
+            if safe is not None:
+                self._rows.setdefault(SafeBox, {})[safe.id] = safe
+                account_ids |= _ids([safe.account_id])
+        account_ids |= self._mapped_account_ids(data.get('invoice_type'))
+        account_ids |= self._settings_account_ids()
+        # Weight-closing settings hold ids or account numbers (the defaults are
+        # numbers) and are resolved id first, so the default numbers are probed as ids too.
+        account_ids |= _ids(DEFAULT_ACCOUNT_NUMBERS)
+        self._load_accounts(account_ids)
+        self._load(Account, _ids(a.memo_account_id for a in self._rows.get(Account, {}).values())
+                   - set(self._rows.get(Account, {})))
+        return self
+
+    def _load(self, model, ids: set, *options) -> None:
+        rows = self._rows.setdefault(model, {})
+        missing = ids - set(rows)
+        if not missing:
+            return
+        query = self.session.query(model).filter(model.id.in_(sorted(missing)))
+        if options:
+            query = query.options(*options)
+        for row in query:
+            rows[row.id] = row
+        self._absent.setdefault(model, set()).update(missing - set(rows))
+
+    @staticmethod
+    def _mapped_account_ids(invoice_type) -> set:
+        """Accounts the journal stage resolves through the (in-memory) mapping table."""
+        table = mapping_resolver.table()
+        operation_types = {str(invoice_type or '').strip(), DEFAULT_MAPPING_OPERATION_TYPE}
+        ids = {account_id for (operation_type, _type), account_id in table.mappings.items()
+               if operation_type in operation_types}
+        ids |= _ids(table.account_ids.get(str(number)) for number in MAPPING_DEFAULT_NUMBERS.values()
+                    if number is not None)
+        return ids
+
+    def _settings_account_ids(self) -> set:
+        """Accounts configured in Settings.weight_closing_settings (inventory, closing)."""
+        raw = getattr(self.settings, 'weight_closing_settings', None)
+        try:
+            payload = json.loads(raw) if raw else {}
+        except (TypeError, ValueError):
+            return set()
+        if not isinstance(payload, dict):
+            return set()
+        return _ids(value for key, value in payload.items() if key.endswith('_account_id'))
+
+    def _load_accounts(self, ids: set) -> None:
+        """Accounts by id plus the default accounts, in one query."""
+        conditions = [Account.name.in_(DEFAULT_ACCOUNT_NAMES), Account.account_number.in_(DEFAULT_ACCOUNT_NUMBERS)]
+        conditions += [Account.name.like(f'{prefix}%') for prefix in DEFAULT_ACCOUNT_NAME_PREFIXES]
+        if ids:
+            conditions.append(Account.id.in_(sorted(ids)))
+        rows = self._rows.setdefault(Account, {})
+        for account in self.session.query(Account).filter(or_(*conditions)).order_by(Account.id):
+            rows[account.id] = account
+            if account.name in DEFAULT_ACCOUNT_NAMES:
+                self._accounts_by_name.setdefault(account.name, account)
+            for prefix in DEFAULT_ACCOUNT_NAME_PREFIXES:
+                if (account.name or '').startswith(prefix):
+                    self._accounts_by_prefix.setdefault(prefix, account)
+            if account.account_number in DEFAULT_ACCOUNT_NUMBERS:
+                self._accounts_by_number.setdefault(account.account_number, account)
+        self._absent.setdefault(Account, set()).update(ids - set(rows))
+        # The defaults were all covered by the query above; remember the misses too.
+        for name in DEFAULT_ACCOUNT_NAMES:
+            self._accounts_by_name.setdefault(name, None)
+        for prefix in DEFAULT_ACCOUNT_NAME_PREFIXES:
+            self._accounts_by_prefix.setdefault(prefix, None)
+        for number in DEFAULT_ACCOUNT_NUMBERS:
+            self._accounts_by_number.setdefault(number, None)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    @property
+    def settings(self) -> Optional[Settings]:
+        if self._settings is _MISSING:
+            self._settings = self.session.query(Settings).first()
+        return self._settings
+
+    @property
+    def main_karat(self) -> int:
+        settings = self.settings
+        return settings.main_karat if settings and settings.main_karat else 21
+
+    @property
+    def latest_gold_price(self) -> Optional[GoldPrice]:
+        if self._gold_price is _MISSING:
+            self._gold_price = self.session.query(GoldPrice).order_by(GoldPrice.date.desc()).first()
+        return self._gold_price
+
+    def get(self, model, row_id):
+        row_id = _int_or_none(row_id)
+        if row_id is None:
+            return None
+        rows = self._rows.setdefault(model, {})
+        row = rows.get(row_id)
+        if row is None and row_id in self._absent.get(model, ()):
+            # Not in the database at preload time; only rows flushed since can exist.
+            return self.session.identity_map.get(identity_key(model, row_id))
+        if row is None:
+            row = self.session.get(model, row_id)
+            if row is not None:
+                rows[row_id] = row
+        return row
+
+    def employee(self, employee_id) -> Optional[Employee]:
+        return self.get(Employee, employee_id)
+
+    def customer(self, customer_id) -> Optional[Customer]:
+        return self.get(Customer, customer_id)
+
+    def supplier(self, supplier_id) -> Optional[Supplier]:
+        return self.get(Supplier, supplier_id)
+
+    def branch(self, branch_id) -> Optional[Branch]:
+        return self.get(Branch, branch_id)
+
+    def office(self, office_id) -> Optional[Office]:
+        return self.get(Office, office_id)
+
+    def item(self, item_id) -> Optional[Item]:
+        return self.get(Item, item_id)
+
+    def payment_method(self, payment_method_id) -> Optional[PaymentMethod]:
+        return self.get(PaymentMethod, payment_method_id)
+
+    def safe_box(self, safe_box_id) -> Optional[SafeBox]:
+        return self.get(SafeBox, safe_box_id)
+
+    def account(self, account_id) -> Optional[Account]:
+        return self.get(Account, account_id)
+
+    def account_by_name(self, name: str) -> Optional[Account]:
+        return self._cached_account(self._accounts_by_name, name, lambda q: q.filter_by(name=name))
+
+    def account_by_name_prefix(self, prefix: str) -> Optional[Account]:
+        return self._cached_account(self._accounts_by_prefix, prefix,
+                                    lambda q: q.filter(Account.name.like(f'{prefix}%')))
+
+    def account_by_number(self, account_number) -> Optional[Account]:
+        number = str(account_number).strip()
+        return self._cached_account(self._accounts_by_number, number, lambda q: q.filter_by(account_number=number))
+
+    def _cached_account(self, cache: dict, key: str, narrow) -> Optional[Account]:
+        if key not in cache:
+            cache[key] = narrow(self.session.query(Account)).first()
+        return cache[key]
+
+
+def current_posting_context() -> Optional[InvoicePostingContext]:
+    """The context bound to the current request, if any."""
+    if not has_app_context():
+        return None
+    return g.get(G_KEY)
+
+
+def uses_posting_context(f):
+    """Bind a fresh `InvoicePostingContext` to `g` for the duration of the view."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        previous = g.get(G_KEY)
+        setattr(g, G_KEY, InvoicePostingContext())
+        try:
+            return f(*args, **kwargs)
+        finally:
+            if previous is None:
+                g.pop(G_KEY, None)
+            else:
+                setattr(g, G_KEY, previous)
+    return wrapper
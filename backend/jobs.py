@@ -0,0 +1,523 @@
+"""DB-backed background jobs (no external broker).
+
+Long-running endpoints (system reset, costing rebuild, safe-box unification,
+chart-of-accounts import, large exports) can be queued instead of holding a
+gunicorn thread until the proxy times out:
+
+* `enqueue_job` stores a row in the ``job`` table (`BackgroundJob`).
+* `JobWorker` (started by run_schedulers.py) claims queued rows oldest first
+  and runs them on a thread pool, or on a process pool for CPU-bound job types.
+* Handlers report progress with `report_progress`, which also raises
+  `JobCancelled` once a cancellation was requested through the API.
+* The outcome (JSON result, or a file blob for exports) stays on the row and
+  is served by the `/jobs/<id>` polling API in routes.py.
+
+Endpoints opt in with `@background_capable()`: a request carrying ``?async=1``
+(or ``Prefer: respond-async``) is answered with 202 and replayed later by the
+worker as the same user, through the normal Flask dispatch (auth, permissions,
+validation and error handling all unchanged).
+
+Progress and cancel flags go through a separate connection so they are visible
+while the job's own transaction is still open. SQLite allows a single writer,
+so there intermediate progress is not persisted and a running job only sees a
+cancellation once its own writes are committed.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time as _time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, g, jsonify, request, url_for
+from sqlalchemy import select, update
+
+from models import AppUser, BackgroundJob, User, db
+
+LOGGER = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+EXECUTORS = ('thread', 'process')
+HTTP_REQUEST_JOB = 'http_request'
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class JobCancelled(BaseException):
+    """Raised inside a job once cancellation was requested.
+
+    Derives from BaseException so the broad ``except Exception`` blocks common
+    in endpoint code do not swallow it and report a normal failure instead.
+    """
+
+
+@dataclass
+class JobResult:
+    """Handler return value carrying a file next to (or instead of) JSON data."""
+    data: Any = None
+    blob: Optional[bytes] = None
+    content_type: Optional[str] = None
+    filename: Optional[str] = None
+    failed: bool = False
+
+
+@dataclass
+class _Handler:
+    func: Callable
+    executor: str
+
+
+_HANDLERS: Dict[str, _Handler] = {}
+_current_job: contextvars.ContextVar[Optional['JobContext']] = contextvars.ContextVar('current_job', default=None)
+
+
+def register_job_handler(job_type: str, func: Callable, executor: str = 'thread') -> None:
+    if executor not in EXECUTORS:
+        raise ValueError(f'unknown executor {executor!r}')
+    _HANDLERS[job_type] = _Handler(func, executor)
+
+
+def job_handler(job_type: str, executor: str = 'thread'):
+    """Register ``func(ctx, **params)`` as the handler of `job_type`."""
+    def decorator(func):
+        register_job_handler(job_type, func, executor)
+        return func
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Enqueue / cancel
+# ---------------------------------------------------------------------------
+
+def owner_ref(user):
+    if user is None:
+        return None, None, None
+    kind = 'app_user' if isinstance(user, AppUser) else 'user'
+    return getattr(user, 'id', None), kind, getattr(user, 'username', None)
+
+
+def enqueue_job(job_type: str, params: Optional[dict] = None, title: Optional[str] = None,
+                user=None, executor: Optional[str] = None) -> BackgroundJob:
+    handler = _HANDLERS.get(job_type)
+    if handler is None:
+        raise ValueError(f'unknown job type {job_type!r}')
+    user_id, user_kind, username = owner_ref(user)
+    job = BackgroundJob(
+        job_type=job_type,
+        title=title,
+        status='queued',
+        executor=executor or handler.executor,
+        params=json.dumps(params or {}, ensure_ascii=False, default=str),
+        created_by=username,
+        created_by_user_id=user_id,
+        created_by_user_kind=user_kind,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def request_cancel(job: BackgroundJob) -> BackgroundJob:
+    """Cancel a queued job at once; ask a running one to stop at its next checkpoint."""
+    if job.status == 'queued':
+        result = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.status == 'queued')
+            .values(status='cancelled', cancel_requested=True, finished_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            # Claimed meanwhile: fall through to a cooperative cancel.
+            job.cancel_requested = True
+    elif job.status == 'running':
+        job.cancel_requested = True
+    db.session.commit()
+    db.session.refresh(job)
+    return job
+
+
+def user_can_see_job(user, job: BackgroundJob) -> bool:
+    if user is None:
+        return False
+    if bool(getattr(user, 'is_admin', False)):
+        return True
+    user_id, user_kind, _username = owner_ref(user)
+    return job.created_by_user_id == user_id and job.created_by_user_kind == user_kind
+
+
+# ---------------------------------------------------------------------------
+# Progress / cancellation
+# ---------------------------------------------------------------------------
+
+class JobContext:
+    """Handle passed to job handlers (also reachable through `current_job()`)."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def _cancel_requested(self) -> bool:
+        query = select(BackgroundJob.cancel_requested).where(BackgroundJob.id == self.job_id)
+        if db.engine.dialect.name == 'sqlite':
+            return bool(db.session.scalar(query))
+        with db.engine.connect() as connection:
+            return bool(connection.scalar(query))
+
+    def check_cancelled(self) -> None:
+        if self._cancel_requested():
+            raise JobCancelled()
+
+    def progress(self, done: float, total: Optional[float] = None, message: Optional[str] = None,
+                 force: bool = False) -> None:
+        """Record progress (``done/total`` or a 0..1 fraction); raises JobCancelled when asked to stop."""
+        now = _time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_write = now
+
+        fraction = (float(done) / float(total)) if total else float(done)
+        fraction = min(max(fraction, 0.0), 1.0)
+        if db.engine.dialect.name != 'sqlite':
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == self.job_id)
+                    .values(
+                        progress=fraction,
+                        progress_message=(message or '')[:255] or None,
+                        heartbeat_at=datetime.utcnow(),
+                    )
+                )
+        self.check_cancelled()
+
+
+def current_job() -> Optional[JobContext]:
+    return _current_job.get()
+
+
+def report_progress(done: float, total: Optional[float] = None, message: Optional[str] = None) -> None:
+    """Progress hook for code that may or may not run inside a job (no-op outside)."""
+    ctx = _current_job.get()
+    if ctx is not None:
+        ctx.progress(done, total, message)
+
+
+# ---------------------------------------------------------------------------
+# Execution
+# ---------------------------------------------------------------------------
+
+def _finish(job_id: int, status: str, outcome: Any = None, error: Optional[str] = None) -> None:
+    values = {
+        'status': status,
+        'finished_at': datetime.utcnow(),
+        'heartbeat_at': datetime.utcnow(),
+        'error': error,
+    }
+    if status == 'succeeded':
+        values.update(progress=1.0)
+    if isinstance(outcome, JobResult):
+        values.update(
+            result=json.dumps(outcome.data, ensure_ascii=False, default=str) if outcome.data is not None else None,
+            result_blob=outcome.blob,
+            result_content_type=outcome.content_type if outcome.blob is not None else None,
+            result_filename=outcome.filename,
+        )
+    elif outcome is not None:
+        values['result'] = json.dumps(outcome, ensure_ascii=False, default=str)
+
+    result = db.session.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+    db.session.commit()
+    if result.rowcount == 0:
+        # e.g. a full system reset recreated the job table while the job ran.
+        LOGGER.warning('job %s vanished before its %s status could be stored', job_id, status)
+
+
+def execute_job(app, job_id: int) -> str:
+    """Run one claimed job to completion and store its outcome. Returns the final status."""
+    with app.app_context():
+        ctx = JobContext(job_id)
+        token = _current_job.set(ctx)
+        status = 'failed'
+        try:
+            job = db.session.get(BackgroundJob, job_id)
+            if job is None:
+                return 'failed'
+            handler = _HANDLERS.get(job.job_type)
+            params = json.loads(job.params) if job.params else {}
+            db.session.commit()
+            if handler is None:
+                _finish(job_id, 'failed', error=f'unknown job type {job.job_type!r}')
+                return 'failed'
+            ctx.check_cancelled()
+
+            outcome = handler.func(ctx, **params)
+            status = 'failed' if isinstance(outcome, JobResult) and outcome.failed else 'succeeded'
+            _finish(job_id, status, outcome)
+        except JobCancelled:
+            db.session.rollback()
+            status = 'cancelled'
+            _finish(job_id, status)
+        except Exception as exc:
+            db.session.rollback()
+            LOGGER.exception('job %s failed', job_id)
+            status = 'failed'
+            _finish(job_id, status, error=f'{exc}\n{traceback.format_exc(limit=5)}')
+        finally:
+            _current_job.reset(token)
+            db.session.remove()
+        return status
+
+
+_PROCESS_APP = None
+
+
+def _init_process_worker():
+    # Forked children must not reuse the parent's pooled DB connections.
+    with _PROCESS_APP.app_context():
+        db.engine.dispose(close=False)
+
+
+def _execute_in_process(job_id: int) -> str:
+    return execute_job(_PROCESS_APP, job_id)
+
+
+def claim_next_job(worker_id: str, executor: str) -> Optional[int]:
+    """Atomically move the oldest queued job of `executor` to running."""
+    skip_locked = db.engine.dialect.name == 'postgresql'
+    for _attempt in range(5):
+        query = (
+            select(BackgroundJob.id)
+            .where(BackgroundJob.status == 'queued', BackgroundJob.executor == executor)
+            .order_by(BackgroundJob.id)
+            .limit(1)
+        )
+        if skip_locked:
+            query = query.with_for_update(skip_locked=True)
+        job_id = db.session.scalar(query)
+        if job_id is None:
+            db.session.rollback()
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == 'queued')
+            .values(status='running', worker_id=worker_id, started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+    return None
+
+
+def fail_stale_jobs(stale_after_seconds: int) -> int:
+    """Fail running jobs whose worker stopped sending heartbeats (crash, redeploy)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after_seconds)
+    result = db.session.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.status == 'running', BackgroundJob.heartbeat_at < cutoff)
+        .values(status='failed', error='worker lost (no heartbeat)', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class JobWorker:
+    """Polls the job table and runs claimed jobs on thread/process pools.
+
+    Env: JOB_WORKER_THREADS (2), JOB_WORKER_PROCESSES (1), JOB_POLL_SECONDS (2),
+    JOB_STALE_SECONDS (900).
+    """
+
+    def __init__(self, app, threads: Optional[int] = None, processes: Optional[int] = None,
+                 poll_seconds: Optional[float] = None):
+        self.app = app
+        self.capacity = {
+            'thread': max(threads if threads is not None else _env_int('JOB_WORKER_THREADS', 2), 1),
+            'process': max(processes if processes is not None else _env_int('JOB_WORKER_PROCESSES', 1), 0),
+        }
+        self.poll_seconds = poll_seconds if poll_seconds is not None else _env_int('JOB_POLL_SECONDS', 2)
+        self.stale_seconds = _env_int('JOB_STALE_SECONDS', 900)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.is_running = False
+        self._running: Dict[str, set] = {'thread': set(), 'process': set()}
+        self._pools: Dict[str, Any] = {}
+
+    def _pool(self, executor: str):
+        pool = self._pools.get(executor)
+        if pool is None:
+            if executor == 'process':
+                global _PROCESS_APP
+                _PROCESS_APP = self.app
+                pool = ProcessPoolExecutor(
+                    max_workers=self.capacity['process'],
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_process_worker,
+                )
+            else:
+                pool = ThreadPoolExecutor(max_workers=self.capacity['thread'], thread_name_prefix='job')
+            self._pools[executor] = pool
+        return pool
+
+    def _submit(self, executor: str, job_id: int):
+        if executor == 'process':
+            future = self._pool('process').submit(_execute_in_process, job_id)
+        else:
+            future = self._pool('thread').submit(execute_job, self.app, job_id)
+        running = self._running[executor]
+        running.add(future)
+        future.add_done_callback(running.discard)
+
+    def _heartbeat(self):
+        db.session.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.status == 'running', BackgroundJob.worker_id == self.worker_id)
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def poll_once(self) -> int:
+        """Claim and submit as many jobs as there is free capacity. Returns how many."""
+        submitted = 0
+        with self.app.app_context():
+            try:
+                self._heartbeat()
+                for executor in EXECUTORS:
+                    while len(self._running[executor]) < self.capacity[executor]:
+                        job_id = claim_next_job(self.worker_id, executor)
+                        if job_id is None:
+                            break
+                        self._submit(executor, job_id)
+                        submitted += 1
+            finally:
+                db.session.remove()
+        return submitted
+
+    def run_forever(self):
+        self.is_running = True
+        with self.app.app_context():
+            failed = fail_stale_jobs(self.stale_seconds)
+            db.session.remove()
+        if failed:
+            print(f'[JobWorker] marked {failed} stale job(s) as failed')
+        print(f'[JobWorker] 🚀 started ({self.worker_id}, capacity={self.capacity})')
+        while self.is_running:
+            try:
+                self.poll_once()
+            except Exception as exc:
+                print(f'[JobWorker] ❌ poll failed: {exc}')
+            _time.sleep(self.poll_seconds)
+
+    def stop(self, wait: bool = True):
+        self.is_running = False
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
+
+
+# ---------------------------------------------------------------------------
+# Replaying endpoints in the background
+# ---------------------------------------------------------------------------
+
+def _load_user(user_id, user_kind):
+    if user_id is None:
+        return None
+    model = AppUser if user_kind == 'app_user' else User
+    user = db.session.get(model, user_id)
+    if user is None or not bool(getattr(user, 'is_active', True)):
+        return None
+    return user
+
+
+def _filename_from(response) -> Optional[str]:
+    disposition = response.headers.get('Content-Disposition') or ''
+    for part in disposition.split(';'):
+        key, _, value = part.strip().partition('=')
+        if key.lower() == 'filename' and value:
+            return value.strip('"')
+    return None
+
+
+@job_handler(HTTP_REQUEST_JOB)
+def _replay_request(ctx: JobContext, method: str, path: str, query_string: str = '',
+                    body: Any = None, user_id: Optional[int] = None, user_kind: Optional[str] = None):
+    app = current_app._get_current_object()
+    with app.test_request_context(path, method=method, query_string=query_string, json=body):
+        user = _load_user(user_id, user_kind)
+        if user is None:
+            raise RuntimeError('job owner is missing or inactive')
+        g.current_user = user
+        g.background_job_id = ctx.job_id
+        response = app.full_dispatch_request()
+        data = response.get_data()
+
+    failed = response.status_code >= 400
+    if response.is_json:
+        return JobResult(data={'status_code': response.status_code, 'body': json.loads(data or b'null')}, failed=failed)
+    return JobResult(
+        data={'status_code': response.status_code},
+        blob=data,
+        content_type=response.content_type,
+        filename=_filename_from(response),
+        failed=failed,
+    )
+
+
+def wants_background() -> bool:
+    if (request.args.get('async') or '').strip().lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in (request.headers.get('Prefer') or '').lower()
+
+
+def background_capable(executor: str = 'thread', title: Optional[str] = None):
+    """Let an endpoint run as a background job when the client asks for it.
+
+    Place it below the permission decorator so only callers allowed to run the
+    endpoint can queue it. Only JSON/query-string requests can be replayed.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if g.get('background_job_id') or not wants_background():
+                return f(*args, **kwargs)
+            if request.files:
+                return jsonify({'success': False, 'error': 'file uploads cannot run in the background'}), 400
+
+            user = g.get('current_user')
+            user_id, user_kind, _username = owner_ref(user)
+            job = enqueue_job(
+                HTTP_REQUEST_JOB,
+                params={
+                    'method': request.method,
+                    'path': request.path,
+                    'query_string': request.query_string.decode('utf-8', 'replace'),
+                    'body': request.get_json(silent=True),
+                    'user_id': user_id,
+                    'user_kind': user_kind,
+                },
+                title=title or f'{request.method} {request.path}',
+                user=user,
+                executor=executor,
+            )
+            status_url = url_for('api.get_job', job_id=job.id)
+            response = jsonify({'success': True, 'job': job.to_dict(), 'status_url': status_url})
+            response.status_code = 202
+            response.headers['Location'] = status_url
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,89 @@
+"""Ledger checks scheduler.
+
+Periodically runs `ledger_checks.run_ledger_checks` (bridge balances,
+inventory reconciliation and the office counter check) and records the results as SystemAlert rows, so the
+reports and the admin dashboard can serve the last computed status.
+"""
+
+from __future__ import annotations
+
+import os
+from threading import Thread
+
+import schedule
+
+from ledger_checks import run_ledger_checks
+from models import db
+from scheduler_leases import singleton_job
+
+
+class LedgerCheckScheduler:
+    def __init__(self, app, interval_minutes: int | None = None):
+        self.app = app
+        self.is_running = False
+        self.interval_minutes = interval_minutes or int(os.getenv('LEDGER_CHECK_INTERVAL_MINUTES', '60'))
+        self._job = None
+        self._run_singleton = singleton_job(
+            app, 'ledger_checks', self.run_checks, window_seconds=self.interval_minutes * 30
+        )
+
+    def run_checks(self):
+        with self.app.app_context():
+            try:
+                results = run_ledger_checks()
+                statuses = ', '.join(f"{name}={result['status']}" for name, result in results.items())
+                print(f'[LedgerCheckScheduler] ✓ {statuses}')
+            except Exception as exc:
+                db.session.rollback()
+                print(f'[LedgerCheckScheduler] ❌ Unexpected error: {exc}')
+                raise
+
+    def setup_schedule(self):
+        self._job = schedule.every(self.interval_minutes).minutes.do(self._run_singleton)
+        print(f'[LedgerCheckScheduler] ✓ Ledger checks scheduled every {self.interval_minutes} minutes')
+
+    def start(self):
+        if self.is_running:
+            print('[LedgerCheckScheduler] already running')
+            return
+
+        self.setup_schedule()
+        self.is_running = True
+
+        def run_scheduler():
+            # Record a fresh status right away instead of waiting a full interval
+            # (under the lease, like the scheduled runs).
+            self._run_singleton()
+            while self.is_running:
+                schedule.run_pending()
+                # Check every minute
+                import time as _time
+
+                _time.sleep(60)
+
+        thread = Thread(target=run_scheduler, daemon=True)
+        thread.start()
+        print('[LedgerCheckScheduler] 🚀 started')
+
+    def stop(self):
+        self.is_running = False
+        if self._job is not None:
+            schedule.cancel_job(self._job)
+            self._job = None
+        print('[LedgerCheckScheduler] stopped')
+
+
+_scheduler_instance: LedgerCheckScheduler | None = None
+
+
+def get_ledger_check_scheduler(app):
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = LedgerCheckScheduler(app)
+    return _scheduler_instance
+
+
+def start_ledger_check_scheduler(app):
+    scheduler = get_ledger_check_scheduler(app)
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,349 @@
+"""Set-based ledger health checks: bridge balances and inventory reconciliation.
+
+The ledger checks read balances with one grouped aggregate over journal lines for the
+whole account set, instead of loading every line of every account:
+
+* bridge accounts (active accounting mappings of a "*bridge*" account type, plus the
+  accounts named/numbered like bridges) must always net to zero;
+* financial inventory accounts (13xx) are paired with their weight twins
+  (``Account.memo_account_id``, falling back to the ``7`` + number convention)
+  and reported side by side with the implied value per gram.
+
+`run_ledger_checks` is called by the reconciliation scheduler. It also compares
+the denormalised office reservation counters with their source rows
+(`office_balances.recompute_office_balances`, report only; fixing is the explicit
+POST /api/offices/balances/recompute) and records each result as a `SystemAlert` (one row per status change; an unchanged status just
+refreshes the last row), so reports and the dashboard read the last computed
+status instead of recomputing on every request.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import aliased
+
+from models import Account, AccountingMapping, JournalEntry, JournalEntryLine, SystemAlert, db
+from office_balances import recompute_office_balances
+
+LOGGER = logging.getLogger(__name__)
+
+KARATS = (18, 21, 22, 24)
+CASH_TOLERANCE = 0.01
+GRAMS_TOLERANCE = 0.001
+BRIDGE_ERROR_THRESHOLD = 10.0
+
+BRIDGE_ALERT_TYPE = 'bridge_balance'
+INVENTORY_ALERT_TYPE = 'inventory_reconciliation'
+OFFICE_BALANCE_ALERT_TYPE = 'office_balance_drift'
+CHECK_ENTITY_TYPE = 'LedgerCheck'
+
+
+def _main_karat():
+    from config import MAIN_KARAT
+
+    return MAIN_KARAT or 21
+
+
+def account_balances(
+    account_ids: Iterable[int],
+    end_date: Optional[date] = None,
+    main_karat: Optional[float] = None,
+) -> Dict[int, Tuple[float, float]]:
+    """Return ``{account_id: (cash_balance, grams_in_main_karat)}`` in one query.
+
+    `end_date` is inclusive (whole day). Soft-deleted entries and lines are
+    ignored; accounts without lines are simply absent from the result.
+    """
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+    main_karat = float(main_karat or _main_karat())
+
+    grams = sum(
+        (func.coalesce(getattr(JournalEntryLine, f'debit_{k}k'), 0.0)
+         - func.coalesce(getattr(JournalEntryLine, f'credit_{k}k'), 0.0)) * (k / main_karat)
+        for k in KARATS
+    )
+    query = (
+        select(
+            JournalEntryLine.account_id,
+            func.coalesce(func.sum(
+                func.coalesce(JournalEntryLine.cash_debit, 0.0) - func.coalesce(JournalEntryLine.cash_credit, 0.0)
+            ), 0.0),
+            func.coalesce(func.sum(grams), 0.0),
+        )
+        .join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
+        .where(
+            JournalEntryLine.account_id.in_(account_ids),
+            JournalEntryLine.is_deleted.is_(False),
+            JournalEntry.is_deleted.is_(False),
+        )
+        .group_by(JournalEntryLine.account_id)
+    )
+    if end_date is not None:
+        query = query.where(JournalEntry.date < datetime.combine(end_date, time.min) + timedelta(days=1))
+
+    return {
+        account_id: (float(cash or 0.0), float(weight or 0.0))
+        for account_id, cash, weight in db.session.execute(query)
+    }
+
+
+# ---------------------------------------------------------------------------
+# Bridge balances
+# ---------------------------------------------------------------------------
+
+def bridge_accounts():
+    mapped = select(AccountingMapping.account_id).where(
+        AccountingMapping.account_type.like('%bridge%'),
+        AccountingMapping.is_active.is_(True),
+    )
+    return (
+        Account.query
+        .filter(or_(
+            Account.id.in_(mapped),
+            Account.name.like('%جسر%'),
+            Account.name.like('%bridge%'),
+            Account.account_number.like('%999%'),  # نمط شائع لحسابات الجسر
+        ))
+        .order_by(Account.account_number)
+        .all()
+    )
+
+
+def bridge_balance_report() -> dict:
+    """Bridge accounts with their ledger balance; any non-zero balance is an alert."""
+    accounts = bridge_accounts()
+    balances = account_balances([account.id for account in accounts])
+
+    accounts_data = []
+    alerts = []
+    total_imbalance = 0.0
+    for account in accounts:
+        balance = balances.get(account.id, (0.0, 0.0))[0]
+        is_balanced = abs(balance) <= CASH_TOLERANCE
+        accounts_data.append({
+            'account_id': account.id,
+            'account_number': account.account_number,
+            'account_name': account.name,
+            'balance': round(balance, 2),
+            'is_balanced': is_balanced,
+            'status': '✅ متوازن' if is_balanced else '⚠️ غير متوازن',
+        })
+        if not is_balanced:
+            total_imbalance += abs(balance)
+            alerts.append({
+                'severity': 'warning' if abs(balance) < BRIDGE_ERROR_THRESHOLD else 'error',
+                'account_number': account.account_number,
+                'account_name': account.name,
+                'balance': round(balance, 2),
+                'message': f'حساب الجسر {account.account_number} ({account.name}) به رصيد غير صفري: {balance:.2f} ريال',
+                'recommendation': 'يرجى مراجعة القيود المحاسبية للفواتير المرتبطة بهذا الحساب',
+            })
+
+    return {
+        'status': 'balanced' if not alerts else 'unbalanced',
+        'summary': {
+            'total_bridge_accounts': len(accounts_data),
+            'balanced_accounts': sum(1 for acc in accounts_data if acc['is_balanced']),
+            'unbalanced_accounts': sum(1 for acc in accounts_data if not acc['is_balanced']),
+            'total_imbalance': round(total_imbalance, 2),
+        },
+        'bridge_accounts': accounts_data,
+        'alerts': alerts,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Inventory reconciliation
+# ---------------------------------------------------------------------------
+
+def inventory_reconciliation_report(end_date: Optional[date] = None, main_karat: Optional[float] = None) -> dict:
+    """Financial inventory (13xx, SAR) next to its weight twin (grams, main karat)."""
+    main_karat = main_karat or _main_karat()
+    twin = aliased(Account)
+
+    financial = (
+        db.session.query(Account, twin)
+        .outerjoin(twin, twin.id == Account.memo_account_id)
+        .filter(
+            Account.account_number.like('13%'),
+            Account.transaction_type.in_(['cash', 'both']),
+        )
+        .order_by(Account.account_number)
+        .all()
+    )
+    gold_by_number = {
+        account.account_number: account
+        for account in Account.query.filter(
+            Account.account_number.like('7131%'),
+            Account.transaction_type == 'gold',
+        ).order_by(Account.account_number)
+    }
+
+    pairs = []
+    matched_gold = set()
+    for account, memo_twin in financial:
+        expected_gold_number = '7' + account.account_number
+        gold = memo_twin or gold_by_number.get(expected_gold_number)
+        if gold is not None:
+            matched_gold.add(gold.id)
+        pairs.append((account, gold, gold.account_number if gold else expected_gold_number))
+    for number, gold in gold_by_number.items():
+        if gold.id not in matched_gold:
+            pairs.append((None, gold, number))
+
+    ids = {acc.id for acc, _gold, _number in pairs if acc is not None}
+    ids.update(gold.id for _acc, gold, _number in pairs if gold is not None)
+    balances = account_balances(ids, end_date=end_date, main_karat=main_karat)
+
+    rows = []
+    issues = []
+    for fin, gold, gold_number in pairs:
+        balance_cash = balances.get(fin.id, (0.0, 0.0))[0] if fin else 0.0
+        balance_grams = balances.get(gold.id, (0.0, 0.0))[1] if gold else 0.0
+
+        price_per_gram = None
+        if abs(balance_grams) > 0.0001:
+            price_per_gram = balance_cash / balance_grams
+
+        row = {
+            'financial_account': fin.account_number if fin else gold_number,
+            'financial_name': fin.name if fin else None,
+            'gold_account': gold_number,
+            'gold_name': gold.name if gold else None,
+            'balance_cash': round(balance_cash, 2),
+            'balance_grams': round(balance_grams, 3),
+            'price_per_gram': round(price_per_gram, 2) if price_per_gram is not None else None,
+        }
+        rows.append(row)
+
+        has_cash = abs(balance_cash) > CASH_TOLERANCE
+        has_grams = abs(balance_grams) > GRAMS_TOLERANCE
+        if has_cash != has_grams or (price_per_gram is not None and has_cash and price_per_gram < 0):
+            issues.append(row)
+
+    return {
+        'report_type': 'inventory_reconciliation',
+        'date': (end_date or datetime.now().date()).isoformat(),
+        'main_karat': main_karat,
+        'status': 'consistent' if not issues else 'mismatch',
+        'rows': rows,
+        'issues': issues,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Recorded results (SystemAlert)
+# ---------------------------------------------------------------------------
+
+def _alert_details(alert: Optional[SystemAlert]) -> dict:
+    if alert is None or not alert.details:
+        return {}
+    try:
+        return json.loads(alert.details)
+    except (TypeError, ValueError):
+        return {}
+
+
+def _latest_alert(alert_type: str) -> Optional[SystemAlert]:
+    return (
+        SystemAlert.query
+        .filter(SystemAlert.alert_type == alert_type, SystemAlert.entity_type == CHECK_ENTITY_TYPE)
+        .order_by(SystemAlert.created_at.desc(), SystemAlert.id.desc())
+        .first()
+    )
+
+
+def record_check(alert_type: str, severity: str, title: str, message: str, result: dict) -> SystemAlert:
+    """Store `result` as the latest status of `alert_type` (new row only on change)."""
+    checked_at = datetime.now().isoformat()
+    latest = _latest_alert(alert_type)
+    previous = _alert_details(latest)
+    details = json.dumps({'checked_at': checked_at, 'result': result}, ensure_ascii=False, default=str)
+
+    if latest is not None and latest.severity == severity and previous.get('result', {}).get('status') == result.get('status'):
+        latest.message = message
+        latest.details = details
+        return latest
+
+    alert = SystemAlert(
+        alert_type=alert_type,
+        severity=severity,
+        title=title,
+        message=message,
+        entity_type=CHECK_ENTITY_TYPE,
+        entity_number=result.get('status'),
+        details=details,
+        created_by='system',
+    )
+    db.session.add(alert)
+    return alert
+
+
+def last_check(alert_type: str) -> Optional[dict]:
+    """The last recorded result of a check, or None if it never ran."""
+    alert = _latest_alert(alert_type)
+    details = _alert_details(alert)
+    if not details.get('result'):
+        return None
+    return {
+        'alert_id': alert.id,
+        'severity': alert.severity,
+        'checked_at': details.get('checked_at'),
+        'is_reviewed': bool(alert.is_reviewed),
+        'result': details['result'],
+    }
+
+
+def check_statuses() -> dict:
+    """Compact last-known status of every check (for the dashboard)."""
+    statuses = {}
+    for alert_type in (BRIDGE_ALERT_TYPE, INVENTORY_ALERT_TYPE, OFFICE_BALANCE_ALERT_TYPE):
+        last = last_check(alert_type)
+        statuses[alert_type] = None if last is None else {
+            'status': last['result'].get('status'),
+            'severity': last['severity'],
+            'checked_at': last['checked_at'],
+            'alert_id': last['alert_id'],
+        }
+    return statuses
+
+
+def run_ledger_checks() -> dict:
+    """Compute the checks and record them (scheduler entry point)."""
+    bridge = bridge_balance_report()
+    if bridge['status'] == 'balanced':
+        severity, message = 'info', 'جميع حسابات الجسر متوازنة'
+    else:
+        has_error = any(alert['severity'] == 'error' for alert in bridge['alerts'])
+        severity = 'critical' if has_error else 'warning'
+        message = (
+            f"{bridge['summary']['unbalanced_accounts']} حساب جسر غير متوازن "
+            f"(إجمالي {bridge['summary']['total_imbalance']:.2f} ريال)"
+        )
+    record_check(BRIDGE_ALERT_TYPE, severity, 'مراقبة رصيد حساب الجسر', message, bridge)
+
+    inventory = inventory_reconciliation_report()
+    if inventory['status'] == 'consistent':
+        severity, message = 'info', 'المخزون المالي مطابق للمخزون الوزني'
+    else:
+        severity = 'warning'
+        message = f"{len(inventory['issues'])} حساب مخزون غير مطابق بين القيمة والوزن"
+    record_check(INVENTORY_ALERT_TYPE, severity, 'مطابقة المخزون المالي مع الوزني', message, inventory)
+
+    offices = recompute_office_balances(fix=False)
+    if offices['status'] == 'consistent':
+        severity, message = 'info', 'عدادات المكاتب مطابقة للحجوزات'
+    else:
+        severity = 'warning'
+        message = f"عدادات {offices['drifted_offices']} مكتب لا تطابق الحجوزات (صححها من إعادة الحساب)"
+    record_check(OFFICE_BALANCE_ALERT_TYPE, severity, 'مطابقة أرصدة المكاتب', message, offices)
+
+    db.session.commit()
+    return {BRIDGE_ALERT_TYPE: bridge, INVENTORY_ALERT_TYPE: inventory, OFFICE_BALANCE_ALERT_TYPE: offices}
@@ -0,0 +1,233 @@
+"""Login path throughput helpers.
+
+- InProcessTokenBucket: rate limit for failed logins when Redis is unavailable.
+  Each (ip, username) key holds up to N tokens refilled over the window; every
+  failed attempt consumes one and the key is blocked while the bucket is empty.
+  State is per process (per gunicorn worker), bounded by LRU eviction.
+- LoginAttemptBuffer: queues LoginAttempt rows and writes them with one bulk
+  INSERT from a background thread instead of a commit per attempt.
+- verify_password_hash: runs werkzeug hash checks in a bounded thread pool.
+  The request thread still waits for its own check (up to
+  PASSWORD_HASH_TIMEOUT_SECONDS), but at most PASSWORD_HASH_WORKERS +
+  PASSWORD_HASH_QUEUE checks are admitted; beyond that it raises
+  PasswordCheckBusy at once (503) instead of queueing behind the burst.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from werkzeug.security import check_password_hash
+
+from config import (
+    LOGIN_ATTEMPT_BUFFER_ENABLED,
+    LOGIN_ATTEMPT_BUFFER_MAX,
+    LOGIN_ATTEMPT_FLUSH_SECONDS,
+    LOGIN_RATE_LIMIT_MAX_FAILURES,
+    LOGIN_RATE_LIMIT_MAX_KEYS,
+    LOGIN_RATE_LIMIT_WINDOW_SECONDS,
+    PASSWORD_HASH_QUEUE,
+    PASSWORD_HASH_TIMEOUT_SECONDS,
+    PASSWORD_HASH_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordCheckBusy(Exception):
+    """Raised when the password-hash pool is full or cannot answer within the timeout."""
+
+
+# ==========================================
+# Token bucket (Redis-less fallback)
+# ==========================================
+
+class InProcessTokenBucket:
+    def __init__(self, capacity: int, window_seconds: float, max_keys: int = 10000):
+        self.capacity = max(int(capacity), 1)
+        self.refill_per_second = self.capacity / max(float(window_seconds), 1.0)
+        self.max_keys = max(int(max_keys), 1)
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refilled(self, key: str, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.capacity), now]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            tokens, last = bucket
+            bucket[0] = min(float(self.capacity), tokens + (now - last) * self.refill_per_second)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def is_blocked(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if key not in self._buckets:
+                return False
+            return self._refilled(key, now)[0] < 1.0
+
+    def consume(self, key: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._refilled(key, now)
+            bucket[0] = max(bucket[0] - 1.0, 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+login_failure_bucket = InProcessTokenBucket(
+    capacity=LOGIN_RATE_LIMIT_MAX_FAILURES,
+    window_seconds=LOGIN_RATE_LIMIT_WINDOW_SECONDS,
+    max_keys=LOGIN_RATE_LIMIT_MAX_KEYS,
+)
+
+
+# ==========================================
+# Buffered LoginAttempt writes
+# ==========================================
+
+class LoginAttemptBuffer:
+    def __init__(self, flush_seconds: float = 2.0, max_pending: int = 5000):
+        self.flush_seconds = max(float(flush_seconds), 0.1)
+        self.max_pending = max(int(max_pending), 1)
+        self._pending: "deque[Dict[str, Any]]" = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+        self.dropped = 0
+
+    def add(self, app, row: Dict[str, Any]) -> None:
+        row.setdefault('created_at', datetime.utcnow())
+        with self._lock:
+            if self._app is None:
+                self._app = app
+            if len(self._pending) >= self.max_pending:
+                # Bounded: prefer losing the oldest audit rows over unbounded memory.
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(row)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='login-attempt-flush', daemon=True)
+                self._thread.start()
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = list(self._pending)
+            self._pending.clear()
+        return rows
+
+    def flush(self) -> int:
+        """Write all pending rows in one INSERT. Returns the number of rows written."""
+        rows = self._drain()
+        if not rows or self._app is None:
+            return 0
+
+        from models import LoginAttempt, db
+
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(LoginAttempt), rows)
+                db.session.commit()
+                return len(rows)
+            except Exception as exc:
+                db.session.rollback()
+                logger.warning('login attempt flush failed (%s rows re-queued): %s', len(rows), exc)
+                with self._lock:
+                    space = self.max_pending - len(self._pending)
+                    keep = rows[-space:] if space > 0 else []
+                    self.dropped += len(rows) - len(keep)
+                    self._pending.extendleft(reversed(keep))
+                return 0
+            finally:
+                db.session.remove()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+login_attempt_buffer = LoginAttemptBuffer(
+    flush_seconds=LOGIN_ATTEMPT_FLUSH_SECONDS,
+    max_pending=LOGIN_ATTEMPT_BUFFER_MAX,
+)
+
+atexit.register(login_attempt_buffer.flush)
+
+
+def record_login_attempt_row(app, row: Dict[str, Any]) -> None:
+    """Queue (or directly insert when buffering is disabled) one LoginAttempt row."""
+    if LOGIN_ATTEMPT_BUFFER_ENABLED:
+        login_attempt_buffer.add(app, row)
+        return
+
+    from models import LoginAttempt, db
+
+    db.session.add(LoginAttempt(**row))
+    db.session.commit()
+
+
+# ==========================================
+# Bounded password-hash verification
+# ==========================================
+
+_hash_pool: Optional[ThreadPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+# Admission slots: running + queued checks. Taken without blocking before submit.
+_hash_slots = threading.BoundedSemaphore(
+    max(int(PASSWORD_HASH_WORKERS), 1) + max(int(PASSWORD_HASH_QUEUE), 0)
+)
+
+
+def _get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = ThreadPoolExecutor(
+                    max_workers=max(int(PASSWORD_HASH_WORKERS), 1),
+                    thread_name_prefix='pwhash',
+                )
+    return _hash_pool
+
+
+def verify_password_hash(password_hash: Optional[str], password: str) -> bool:
+    if not password_hash:
+        return False
+
+    slots = _hash_slots
+    if not slots.acquire(blocking=False):
+        raise PasswordCheckBusy('password verification queue is full')
+    try:
+        future = _get_hash_pool().submit(check_password_hash, password_hash, password)
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the check finishes, even if this request gives up.
+    future.add_done_callback(lambda _f: slots.release())
+    try:
+        return bool(future.result(timeout=max(int(PASSWORD_HASH_TIMEOUT_SECONDS), 1)))
+    except FutureTimeoutError as exc:
+        future.cancel()
+        raise PasswordCheckBusy('password verification timed out') from exc
@@ -0,0 +1,210 @@
+"""Cached accounting-mapping resolution.
+
+`get_account_id_for_mapping` / `get_account_id_by_number` are called dozens of
+times per posted document. Instead of 1-3 queries per call, `MappingResolver`
+loads every active AccountingMapping plus the account_number -> id index once
+into an immutable `MappingTable` and answers lookups from memory.
+
+Invalidation (see versioned_cache):
+- Any ORM insert/update/delete of AccountingMapping, or of Account rows that
+  changes the number index, marks the session. Committing it bumps the
+  ``accounting_mapping`` row of cache_version in the same transaction and drops
+  this process's table; a rollback drops it too, in case it was built from
+  unflushed state. Bulk `query.delete()`/`update()` on either model is treated
+  the same way; creating/dropping either table (resets, tests) drops it
+  immediately.
+- Other gunicorn workers and the scheduler poll the shared version (Redis when
+  enabled, cache_version otherwise) at most every
+  ACCOUNTING_MAPPING_VERSION_CHECK_SECONDS and rebuild when it moved.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from config import ACCOUNTING_MAPPING_VERSION_CHECK_SECONDS
+from models import Account, AccountingMapping, db
+from versioned_cache import VersionedCache, mark_changed, register_cache
+
+DEFAULT_MAPPING_OPERATION_TYPE = 'افتراضي'
+
+# Internal fallback account numbers used when no mapping is saved.
+DEFAULT_ACCOUNT_NUMBERS = {
+    # المخزون النقدي (حسب العيار)
+    'inventory_18k': 1300,
+    'inventory_21k': 1310,
+    'inventory_22k': 1320,
+    'inventory_24k': 1330,
+    # مخزون أجور المصنعية
+    'manufacturing_wage_inventory': 1350,
+    # المخزون الوزني (حسب العيار) - حسابات المذكرة
+    'inventory_weight_18k': 7300,
+    'inventory_weight_21k': 7310,
+    'inventory_weight_22k': 7320,
+    'inventory_weight_24k': 7330,
+    # النقدية والبنوك
+    'cash': 1100,
+    'bank': 1110,
+    'bank_rajhi': 1120,
+    # العملاء والموردين
+    'customers': 1200,
+    'customers_scrap': 1210,
+    'suppliers': 210,
+    'suppliers_processed': 220,
+    # الإيرادات
+    'revenue': 40,
+    'sales_gold_new': 40,
+    'sales_wage': 41,
+    'sales_returns': 40,
+    # التكاليف
+    'cost': 50,
+    'cost_of_sales': 50,
+    'purchase_returns': 50,
+    # الضرائب والعمولات
+    'vat_payable': 2210,
+    'vat_receivable': 1500,
+    'commission': 5150,
+    'commission_vat': 1501,
+    # المصروفات
+    'operating_expenses': 51,
+    # حقوق الملكية
+    'capital': 31,
+    'retained_earnings': 32,
+    # حسابات للجسر والمصنعية في مشتريات الموردين
+    'supplier_bridge': None,
+    'manufacturing_wage': 5105,
+}
+
+CACHE_NAME = 'accounting_mapping'
+
+
+@dataclass(frozen=True)
+class MappingTable:
+    version: int
+    mappings: Mapping[Tuple[str, str], int]
+    account_ids: Mapping[str, int]
+
+    def mapped_account_id(self, operation_type, account_type) -> Optional[int]:
+        account_id = self.mappings.get((operation_type, account_type))
+        if account_id is None and operation_type != DEFAULT_MAPPING_OPERATION_TYPE:
+            account_id = self.mappings.get((DEFAULT_MAPPING_OPERATION_TYPE, account_type))
+        return account_id
+
+
+def _load_table(version: int) -> MappingTable:
+    mappings = {}
+    rows = (
+        db.session.query(AccountingMapping.operation_type, AccountingMapping.account_type, AccountingMapping.account_id)
+        .filter(AccountingMapping.is_active.is_(True))
+        .order_by(AccountingMapping.id)
+        .all()
+    )
+    for operation_type, account_type, account_id in rows:
+        mappings.setdefault((operation_type, account_type), account_id)
+
+    account_ids = {}
+    for number, account_id in db.session.query(Account.account_number, Account.id).order_by(Account.id).all():
+        if number:
+            account_ids.setdefault(str(number), account_id)
+
+    return MappingTable(
+        version=version,
+        mappings=MappingProxyType(mappings),
+        account_ids=MappingProxyType(account_ids),
+    )
+
+
+class MappingResolver:
+    def __init__(self, check_seconds: float = ACCOUNTING_MAPPING_VERSION_CHECK_SECONDS):
+        self.cache: VersionedCache[MappingTable] = VersionedCache(CACHE_NAME, _load_table, check_seconds)
+
+    @property
+    def version(self) -> int:
+        return self.cache.version
+
+    def table(self) -> MappingTable:
+        return self.cache.get()
+
+    def invalidate(self, broadcast: bool = True) -> None:
+        self.cache.invalidate(broadcast=broadcast)
+
+    def account_id_by_number(self, account_number) -> Optional[int]:
+        if not account_number:
+            return None
+        key = str(account_number)
+        account_id = self.table().account_ids.get(key)
+        if account_id is not None:
+            return account_id
+        # Misses are not cached: the account may have been added in the
+        # current (uncommitted) transaction.
+        row = db.session.query(Account.id).filter_by(account_number=key).first()
+        return row[0] if row else None
+
+    def account_id_for_mapping(self, operation_type, account_type) -> Optional[int]:
+        account_id = self.table().mapped_account_id(operation_type, account_type)
+        if account_id is not None:
+            return account_id
+        default_number = DEFAULT_ACCOUNT_NUMBERS.get(account_type)
+        if default_number is None:
+            return None
+        return self.account_id_by_number(default_number)
+
+
+mapping_resolver = MappingResolver()
+register_cache(mapping_resolver.cache)
+
+
+def invalidate_mapping_cache() -> None:
+    mapping_resolver.invalidate()
+
+
+def _mark_session_dirty(target) -> None:
+    mark_changed(Session.object_session(target), CACHE_NAME)
+
+
+def mark_accounts_changed(session) -> None:
+    """Invalidate the cache when `session` commits.
+
+    For bulk inserts/updates of accounts that bypass the mapper events.
+    """
+    mark_changed(session, CACHE_NAME)
+
+
+@event.listens_for(AccountingMapping, 'after_insert')
+@event.listens_for(AccountingMapping, 'after_update')
+@event.listens_for(AccountingMapping, 'after_delete')
+def _accounting_mapping_changed(mapper, connection, target):
+    _mark_session_dirty(target)
+
+
+@event.listens_for(Account, 'after_insert')
+@event.listens_for(Account, 'after_delete')
+def _account_added_or_removed(mapper, connection, target):
+    _mark_session_dirty(target)
+
+
+@event.listens_for(Account, 'after_update')
+def _account_updated(mapper, connection, target):
+    if sa_inspect(target).attrs.account_number.history.has_changes():
+        _mark_session_dirty(target)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _bump_after_bulk(context):
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None and mapper.class_ in (Account, AccountingMapping):
+        mark_changed(context.session, CACHE_NAME)
+
+
+@event.listens_for(Account.__table__, 'after_create')
+@event.listens_for(Account.__table__, 'after_drop')
+@event.listens_for(AccountingMapping.__table__, 'after_create')
+@event.listens_for(AccountingMapping.__table__, 'after_drop')
+def _bump_after_ddl(target, connection, **kw):
+    mapping_resolver.invalidate()
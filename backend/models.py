@@ -4,10 +4,12 @@ try:
 except ImportError:  # Local scripts running from backend/ directory
     from config import MAIN_KARAT
 # SQLAlchemy models for Customer, Item, Invoice, InvoiceItem
+import hashlib
 from datetime import datetime, date, time
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import check_password_hash, generate_password_hash
 from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
 
@@ -968,9 +970,73 @@ class Invoice(db.Model):
     # 🆕 تسويات الوزن (مصروف/تسكير)
     weight_settlements = db.relationship('InvoiceWeightSettlement', backref='invoice', lazy=True, cascade='all, delete-orphan')
 
-    __table_args__ = (db.UniqueConstraint('invoice_type', 'invoice_type_id', name='_invoice_type_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('invoice_type', 'invoice_type_id', name='_invoice_type_uc'),
+        # Summaries/reports filter one invoice type over a [start, end) date range (see date_ranges).
+        db.Index('ix_invoice_type_date', 'invoice_type', 'date'),
+    )
 
-    def to_dict(self):
+    @staticmethod
+    def list_load_options():
+        """Loader options that let `to_dict` serialize a page of invoices without per-row queries.
+
+        Every relationship `to_dict` touches is fetched with one SELECT ... IN per
+        relationship for the whole page, so the query count does not grow with the
+        page size. Use together with `to_dict_list`.
+        """
+        from sqlalchemy.orm import selectinload
+
+        return (
+            selectinload(Invoice.items).selectinload(InvoiceItem.weight_closing_logs),
+            selectinload(Invoice.payments).selectinload(InvoicePayment.payment_method)
+            .selectinload(PaymentMethod.default_safe_box),
+            selectinload(Invoice.karat_lines),
+            selectinload(Invoice.weight_settlements),
+            selectinload(Invoice.employee),
+            selectinload(Invoice.scrap_holder_employee),
+            selectinload(Invoice.branch),
+            selectinload(Invoice.safe_box),
+            selectinload(Invoice.payment_method_obj).selectinload(PaymentMethod.default_safe_box)
+            .selectinload(SafeBox.account),
+            selectinload(Invoice.customer),
+            selectinload(Invoice.supplier),
+        )
+
+    @staticmethod
+    def posted_by_employee_names(posted_by_values):
+        """Map normalized `posted_by` usernames to the linked employee name (one query).
+
+        Mirrors the per-invoice fallback in `to_dict`: the first AppUser whose
+        lower(trim(username)) matches wins, even if it has no employee.
+        """
+        from sqlalchemy import func
+        from sqlalchemy.orm import selectinload
+
+        keys = {str(value).strip().lower() for value in posted_by_values if value}
+        names = {}
+        if not keys:
+            return names
+        users = (
+            AppUser.query.options(selectinload(AppUser.employee))
+            .filter(func.lower(func.trim(AppUser.username)).in_(keys))
+            .order_by(AppUser.id)
+            .all()
+        )
+        for user in users:
+            key = str(user.username).strip().lower()
+            names.setdefault(key, user.employee.name if user.employee and user.employee.name else None)
+        return names
+
+    @staticmethod
+    def to_dict_list(invoices):
+        """`to_dict` for a list of invoices with the posted_by lookups batched."""
+        invoices = list(invoices)
+        names = Invoice.posted_by_employee_names(
+            inv.posted_by for inv in invoices if inv.posted_by and not (inv.employee and inv.employee.name)
+        )
+        return [inv.to_dict(posted_by_employee_names=names) for inv in invoices]
+
+    def to_dict(self, posted_by_employee_names=None):
         invoice_type_value = (self.invoice_type or '').strip()
         if 'مورد' in invoice_type_value and 'شراء' in invoice_type_value:
             if 'مرتجع' in invoice_type_value:
@@ -1080,7 +1146,7 @@ class Invoice(db.Model):
             # 1) Direct relationship / employee_id
             if self.employee and self.employee.name:
                 employee_name = self.employee.name
-            elif getattr(self, 'employee_id', None):
+            elif getattr(self, 'employee_id', None) and posted_by_employee_names is None:
                 try:
                     emp = Employee.query.get(self.employee_id)
                     if emp and emp.name:
@@ -1089,7 +1155,9 @@ class Invoice(db.Model):
                     employee_name = None
 
             # 2) Map posted_by to AppUser.username (case-insensitive/trim)
-            if employee_name is None and self.posted_by:
+            if employee_name is None and self.posted_by and posted_by_employee_names is not None:
+                employee_name = posted_by_employee_names.get(str(self.posted_by).strip().lower())
+            elif employee_name is None and self.posted_by:
                 try:
                     from sqlalchemy import func
 
@@ -1164,12 +1232,15 @@ class Invoice(db.Model):
         
         return result
 
-    def calculate_total_weight(self):
+    def calculate_total_weight(self, main_karat=None):
         """
         حساب إجمالي وزن الفاتورة بالعيار الرئيسي، بما في ذلك الأصناف اليدوية.
+
+        `main_karat` can be passed by callers that already loaded the settings.
         """
 
-        main_karat = _configured_main_karat_f()
+        if not main_karat:
+            main_karat = _configured_main_karat_f()
 
         def _to_float(value, default=0.0):
             try:
@@ -1329,6 +1400,101 @@ class CategoryWeightMovement(db.Model):
         }
 
 
+class CategoryWeightMonthlySnapshot(db.Model):
+    """Closed-month sums of CategoryWeightMovement per (safe_box, category, karat, gold_type).
+
+    Used by balance-as-of-date queries so they only scan the movements of the
+    open tail instead of the whole movement history. Rows for a month (and every
+    later month) are dropped whenever a movement is inserted, updated or deleted
+    inside an already-snapshotted month (bulk deletes/updates drop them all),
+    then rebuilt by refresh_category_weight_snapshots().
+
+    One row per bucket is enforced by uq_cw_snapshot_bucket; karat/gold_type
+    are nullable, so the index is over COALESCE()d values (NULLs never collide
+    in a plain unique index) and refreshes upsert against it.
+    """
+
+    __tablename__ = 'category_weight_monthly_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, index=True)  # first day of month
+
+    safe_box_id = db.Column(db.Integer, db.ForeignKey('safe_box.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    karat = db.Column(db.Float, nullable=True)
+    gold_type = db.Column(db.String(20), nullable=True)
+
+    weight_main_karat = db.Column(db.Float, nullable=False, default=0.0)
+    weight_grams = db.Column(db.Float, nullable=False, default=0.0)
+    movement_count = db.Column(db.Integer, nullable=False, default=0)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Bucket key of a snapshot row; refresh_category_weight_snapshots() upserts on
+# exactly these expressions (ON CONFLICT must name the same index elements).
+CATEGORY_WEIGHT_SNAPSHOT_BUCKET = (
+    CategoryWeightMonthlySnapshot.month,
+    CategoryWeightMonthlySnapshot.safe_box_id,
+    CategoryWeightMonthlySnapshot.category_id,
+    db.func.coalesce(CategoryWeightMonthlySnapshot.karat, db.literal_column('-1')),
+    db.func.coalesce(CategoryWeightMonthlySnapshot.gold_type, db.literal_column("''")),
+)
+db.Index('uq_cw_snapshot_bucket', *CATEGORY_WEIGHT_SNAPSHOT_BUCKET, unique=True)
+
+# Movement columns that feed the snapshots; changing any of them moves weight
+# between buckets or months.
+_CATEGORY_WEIGHT_SNAPSHOT_SOURCES = (
+    'created_at',
+    'safe_box_id',
+    'category_id',
+    'karat',
+    'gold_type',
+    'weight_delta_grams',
+    'weight_delta_main_karat',
+)
+
+
+def _invalidate_category_weight_snapshots(connection, created_at) -> None:
+    if not created_at:
+        return
+    month_start = date(created_at.year, created_at.month, 1)
+    today = date.today()
+    # Current month is never snapshotted, so normal postings need no invalidation.
+    if month_start >= date(today.year, today.month, 1):
+        return
+    snapshot_table = CategoryWeightMonthlySnapshot.__table__
+    connection.execute(snapshot_table.delete().where(snapshot_table.c.month >= month_start))
+
+
+@event.listens_for(CategoryWeightMovement, 'after_insert')
+@event.listens_for(CategoryWeightMovement, 'after_delete')
+def _category_weight_movement_changed(mapper, connection, target):
+    _invalidate_category_weight_snapshots(connection, getattr(target, 'created_at', None))
+
+
+@event.listens_for(CategoryWeightMovement, 'after_update')
+def _category_weight_movement_updated(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if not any(attrs[key].history.has_changes() for key in _CATEGORY_WEIGHT_SNAPSHOT_SOURCES):
+        return
+    # A moved movement leaves its old month as well as entering the new one.
+    dates = [value for value in (target.created_at, *attrs.created_at.history.deleted) if value]
+    if dates:
+        _invalidate_category_weight_snapshots(connection, min(dates))
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _category_weight_movements_bulk_changed(context):
+    mapper = getattr(context, 'mapper', None)
+    if mapper is None or mapper.class_ is not CategoryWeightMovement:
+        return
+    # Query.delete()/update() bypass the mapper events and the affected months
+    # are unknown afterwards, so every snapshot is dropped and rebuilt lazily.
+    context.session.execute(CategoryWeightMonthlySnapshot.__table__.delete())
+
+
 class InvoiceKaratLine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False)
@@ -1443,6 +1609,33 @@ class WeightClosingOrder(db.Model):
             payload['executions'] = [execution.to_dict() for execution in self.executions]
         return payload
 
+    __table_args__ = (
+        # FIFO queue scans: open orders by age (see weight_closing_queue).
+        db.Index('ix_wco_status_created', 'status', 'created_at'),
+    )
+
+
+class WeightClosingOpenTotals(db.Model):
+    """Running aggregate of open weight-closing orders, split into bucket rows.
+
+    Row 0 is the recomputed baseline, the others collect per-worker deltas;
+    the totals are their sum. Kept in step with WeightClosingOrder changes by
+    weight_closing_queue, so summaries never scan the order table.
+    """
+    __tablename__ = 'weight_closing_open_totals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    open_orders = db.Column(db.Integer, default=0, nullable=False)
+    open_weight_main_karat = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+    def to_dict(self):
+        return {
+            'open_orders': int(self.open_orders or 0),
+            'open_weight_main_karat': round(self.open_weight_main_karat or 0.0, 6),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
 
 class WeightClosingExecution(db.Model):
     __tablename__ = 'weight_closing_execution'
@@ -1557,6 +1750,46 @@ class InventoryCostingConfig(db.Model):
         }
 
 
+class InventoryCostingCheckpoint(db.Model):
+    """Moving-average costing state after replaying invoices up to (date, id).
+
+    Written by the costing rebuild (gold_costing_service.rebuild_costing) so a
+    later recompute resumes from the nearest checkpoint instead of replaying
+    every invoice. Invoice changes dated on or before a checkpoint delete it.
+    """
+    __tablename__ = 'inventory_costing_checkpoint'
+    __table_args__ = (
+        db.Index('ix_costing_checkpoint_position', 'last_invoice_date', 'last_invoice_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_invoice_date = db.Column(db.DateTime, nullable=False)
+    last_invoice_id = db.Column(db.Integer, nullable=False)
+    invoices_replayed = db.Column(db.Integer, nullable=False, default=0)
+    total_inventory_weight = db.Column(db.Float, default=0.0)
+    total_gold_value = db.Column(db.Float, default=0.0)
+    total_manufacturing_value = db.Column(db.Float, default=0.0)
+    avg_gold_price_per_gram = db.Column(db.Float, default=0.0)
+    avg_manufacturing_per_gram = db.Column(db.Float, default=0.0)
+    last_purchase_price = db.Column(db.Float, nullable=True)
+    last_purchase_weight = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'last_invoice_date': self.last_invoice_date.isoformat() if self.last_invoice_date else None,
+            'last_invoice_id': self.last_invoice_id,
+            'invoices_replayed': self.invoices_replayed,
+            'total_inventory_weight': self.total_inventory_weight,
+            'total_gold_value': self.total_gold_value,
+            'total_manufacturing_value': self.total_manufacturing_value,
+            'avg_gold_price_per_gram': self.avg_gold_price_per_gram,
+            'avg_manufacturing_per_gram': self.avg_manufacturing_per_gram,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+
 class SupplierGoldTransaction(db.Model):
     __tablename__ = 'supplier_gold_transaction'
 
@@ -1634,6 +1867,13 @@ class JournalEntry(db.Model):
     
     lines = db.relationship('JournalEntryLine', backref='journal_entry', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Statement ordering / date-range scans (see party_statement).
+        db.Index('ix_journal_entry_date_id', 'date', 'id'),
+        # Recurring occurrence lookups (template id + occurrence date).
+        db.Index('ix_journal_entry_recurring_date', 'recurring_template_id', 'date'),
+    )
+
     def soft_delete(self, deleted_by, reason=None):
         """حذف ناعم للقيد مع تسجيل المعلومات"""
         from datetime import datetime
@@ -1681,8 +1921,7 @@ class JournalEntry(db.Model):
 
 
 # Auto-generate `entry_number` for JournalEntry when not provided.
-def _generate_journal_entry_number_for_date(entry_date: datetime) -> str:
-    year = entry_date.year
+def _last_journal_entry_sequence(year: int) -> int:
     prefix = f'JE-{year}-'
 
     last_entry = (
@@ -1694,21 +1933,47 @@ def _generate_journal_entry_number_for_date(entry_date: datetime) -> str:
 
     if last_entry:
         try:
-            last_sequence = int(str(last_entry.entry_number).split('-')[-1])
+            return int(str(last_entry.entry_number).split('-')[-1])
         except (ValueError, AttributeError):
             # Fallback: count entries in the year
             start_of_year = datetime(year, 1, 1)
             end_of_year = datetime(year + 1, 1, 1)
-            last_sequence = (
+            return (
                 JournalEntry.query
                 .filter(JournalEntry.date >= start_of_year, JournalEntry.date < end_of_year)
                 .count()
             )
-    else:
-        last_sequence = 0
+    return 0
+
+
+def _generate_journal_entry_number_for_date(entry_date: datetime) -> str:
+    return allocate_journal_entry_numbers(entry_date.year, 1)[0]
+
+
+def _lock_journal_entry_numbers(year: int) -> None:
+    """On PostgreSQL, serialise number allocation for `year` until the transaction ends.
+
+    Without it two transactions (an invoice posting and a recurring catch-up)
+    read the same max sequence and the later insert fails on the unique
+    entry_number. Other backends already serialise writers.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return
+    digest = hashlib.sha256(f'journal_entry_number:{year}'.encode('utf-8')).digest()
+    connection.execute(db.select(db.func.pg_advisory_xact_lock(int.from_bytes(digest[:8], 'big', signed=True))))
+
+
+def allocate_journal_entry_numbers(year: int, count: int) -> list:
+    """Reserve `count` consecutive JE-<year>-NNNNN numbers with a single lookup.
 
-    next_sequence = last_sequence + 1
-    return f'{prefix}{next_sequence:05d}'
+    Used by batch writers (recurring journals) that insert many entries at once
+    instead of numbering them one by one in the before_insert hook. The year's
+    numbering stays locked until the caller's transaction ends.
+    """
+    _lock_journal_entry_numbers(year)
+    last_sequence = _last_journal_entry_sequence(year)
+    return [f'JE-{year}-{last_sequence + offset:05d}' for offset in range(1, count + 1)]
 
 
 @event.listens_for(JournalEntry, 'before_insert')
@@ -1785,6 +2050,19 @@ class JournalEntryLine(db.Model):
     analytic_weight_24k = db.Column(db.Float, nullable=True)
     analytic_weight_main = db.Column(db.Float, nullable=True)
 
+    # Copy of journal_entry.date (kept in sync by the listeners below): the
+    # PostgreSQL range-partition key and the filter behind balances that start
+    # from a fiscal-year snapshot (see fiscal_years.py).
+    entry_date = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Party statements filter by party and join on the entry (see party_statement).
+        db.Index('ix_jel_customer_entry', 'customer_id', 'journal_entry_id'),
+        db.Index('ix_jel_supplier_entry', 'supplier_id', 'journal_entry_id'),
+        db.Index('ix_jel_account_entry', 'account_id', 'journal_entry_id'),
+        db.Index('ix_jel_entry_date_account', 'entry_date', 'account_id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -3118,6 +3396,9 @@ class AuditLog(db.Model):
         db.Index('idx_audit_entity', 'entity_type', 'entity_id'),
         db.Index('idx_audit_timestamp', 'timestamp'),
         db.Index('idx_audit_entity_number', 'entity_number'),
+        # سجل كيان / مستخدم مرتباً زمنياً دون فرز إضافي
+        db.Index('idx_audit_entity_timestamp', 'entity_type', 'entity_id', 'timestamp'),
+        db.Index('idx_audit_user_timestamp', 'user_name', 'timestamp'),
     )
     
     def to_dict(self, include_details=True):
@@ -3184,9 +3465,14 @@ class AuditLog(db.Model):
     @staticmethod
     def log_action(user_name, action, entity_type, entity_id, entity_number=None, 
                    details=None, ip_address=None, user_agent=None, success=True, 
-                   error_message=None, user_id=None):
+                   error_message=None, user_id=None, sync=False):
         """
         دالة مساعدة لتسجيل عملية في سجل التدقيق
+
+        When the write-behind pipeline is enabled (see audit_pipeline.py) the
+        record is written in the background after the caller's transaction
+        commits and None is returned. ``sync=True`` (security-critical actions,
+        or callers that need the row) adds it to the current session instead.
         
         Parameters:
         -----------
@@ -3200,7 +3486,7 @@ class AuditLog(db.Model):
             معرف الكيان
         entity_number : str, optional
             رقم الفاتورة/القيد للبحث السريع
-        details : str, optional
+        details : str | dict, optional
             تفاصيل إضافية بصيغة JSON
         ip_address : str, optional
             عنوان IP للمستخدم
@@ -3212,11 +3498,13 @@ class AuditLog(db.Model):
             رسالة الخطأ إن فشلت العملية
         user_id : int, optional
             معرف المستخدم (للربط المستقبلي)
+        sync : bool, default=False
+            كتابة السجل ضمن معاملة المستدعي بدل الكتابة في الخلفية
         
         Returns:
         --------
-        AuditLog
-            كائن سجل التدقيق المُنشأ
+        AuditLog | None
+            كائن سجل التدقيق المُنشأ (None عند الكتابة في الخلفية)
         
         Example:
         --------
@@ -3231,7 +3519,30 @@ class AuditLog(db.Model):
             ip_address='192.168.1.10'
         )
         """
+        if not sync:
+            from audit_pipeline import enqueue_audit
+
+            record = {
+                'user_id': user_id,
+                'user_name': user_name,
+                'action': action,
+                'entity_type': entity_type,
+                'entity_id': entity_id,
+                'entity_number': entity_number,
+                'details': details,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+                'success': success,
+                'error_message': error_message,
+                'timestamp': datetime.utcnow(),
+            }
+            if enqueue_audit(record):
+                return None
+
         try:
+            if details is not None and not isinstance(details, str):
+                import json
+                details = json.dumps(details, ensure_ascii=False, default=str)
             log = AuditLog(
                 user_id=user_id,
                 user_name=user_name,
@@ -3853,7 +4164,332 @@ class SystemAlert(db.Model):
         }
 
 
+class BackgroundJob(db.Model):
+    """Long-running work (maintenance endpoints, rebuilds, exports) run by the job worker.
+
+    Rows are created by `jobs.enqueue_job`, claimed by the worker loop in
+    run_schedulers.py and polled through `/jobs/<id>`.
+    """
 
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(100), nullable=False, index=True)  # handler key (http_request, ...)
+    title = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued | running | succeeded | failed | cancelled
+    executor = db.Column(db.String(10), nullable=False, default='thread')  # thread | process (CPU-bound)
 
+    params = db.Column(db.Text, nullable=True)  # JSON
+
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0..1
+    progress_message = db.Column(db.String(255), nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+
+    result = db.Column(db.Text, nullable=True)  # JSON
+    result_blob = db.deferred(db.Column(db.LargeBinary, nullable=True))  # file results (CSV exports, ...)
+    result_content_type = db.Column(db.String(100), nullable=True)
+    result_filename = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_by = db.Column(db.String(100), nullable=True)
+    created_by_user_id = db.Column(db.Integer, nullable=True)
+    created_by_user_kind = db.Column(db.String(20), nullable=True)  # user | app_user
+
+    worker_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Worker claim order (oldest queued job first).
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+    def to_dict(self, include_result=True):
+        import json
+
+        data = {
+            'id': self.id,
+            'job_type': self.job_type,
+            'title': self.title,
+            'status': self.status,
+            'executor': self.executor,
+            'progress': round(float(self.progress or 0.0), 4),
+            'progress_message': self.progress_message,
+            'cancel_requested': bool(self.cancel_requested),
+            'has_file': self.result_content_type is not None,
+            'result_content_type': self.result_content_type,
+            'result_filename': self.result_filename,
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_result:
+            try:
+                data['result'] = json.loads(self.result) if self.result else None
+            except Exception:
+                data['result'] = None
+        return data
+
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a request sent with an ``Idempotency-Key`` header.
+
+    A row is claimed (status='in_progress') before the handler runs and holds
+    the final response once it finishes, so client retries are answered from
+    here with one unique-index probe instead of re-running the handler. See
+    idempotency.py.
+    """
+
+    __tablename__ = 'idempotency_key'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(100), nullable=False)  # endpoint, e.g. api.add_invoice
+    owner = db.Column(db.String(100), nullable=False, default='')  # user:1 / app_user:3 / '' (anonymous)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of method + path + body
+
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress | committed | completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_content_type = db.Column(db.String(100), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    locked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'owner', 'key', name='uq_idempotency_scope_owner_key'),
+    )
+
+
+
+
+
+
+
+
+class CacheVersion(db.Model):
+    """Shared version of a per-process cache (see versioned_cache.py).
+
+    Bumped in the same transaction as the write that invalidates the cache, so
+    every worker and the scheduler notice the change even without Redis.
+    """
+
+    __tablename__ = 'cache_version'
+
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class SchedulerLease(db.Model):
+    """Who is running a scheduled job right now (SQLite / non-PostgreSQL backends).
+
+    One row per job name. A runner owns the job while `expires_at` is in the
+    future and keeps pushing it forward with heartbeats; a crashed runner's
+    lease simply expires. On PostgreSQL `pg_try_advisory_lock` is used instead.
+    See scheduler_leases.py.
+    """
+
+    __tablename__ = 'scheduler_lease'
+
+    job_name = db.Column(db.String(100), primary_key=True)
+    holder = db.Column(db.String(150), nullable=False)  # host:pid:token of the current/last runner
+    acquired_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class SchedulerJobRun(db.Model):
+    """One execution of a scheduled job: duration and outcome (see scheduler_leases.py)."""
+
+    __tablename__ = 'scheduler_job_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(100), nullable=False)
+    holder = db.Column(db.String(150), nullable=True)
+    status = db.Column(db.String(20), nullable=False)  # succeeded | failed
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        # Latest runs per job (dedupe check, /scheduler/runs).
+        db.Index('ix_scheduler_job_run_job_started', 'job_name', 'started_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_name': self.job_name,
+            'holder': self.holder,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_ms': self.duration_ms,
+            'error': self.error,
+        }
+
+
+class ClosedFiscalYearError(Exception):
+    """Raised when a write would change a journal or safe-box row in a closed fiscal year."""
+
+
+class FiscalYear(db.Model):
+    """A calendar fiscal year. Once closed its journal lines and safe-box
+    transactions are read-only and its closing balances live in
+    FiscalYearAccountBalance / FiscalYearSafeBoxBalance (see fiscal_years.py).
+    Closed years always form a contiguous prefix of the history.
+    """
+
+    __tablename__ = 'fiscal_year'
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, unique=True, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # open | closed
+    closed_at = db.Column(db.DateTime, nullable=True)
+    closed_by = db.Column(db.String(100), nullable=True)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    safe_box_transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'year': self.year,
+            'status': self.status,
+            'closed_at': self.closed_at.isoformat() if self.closed_at else None,
+            'closed_by': self.closed_by,
+            'line_count': self.line_count,
+            'safe_box_transaction_count': self.safe_box_transaction_count,
+        }
+
+
+class FiscalYearAccountBalance(db.Model):
+    """Cumulative debit/credit totals per account (cash + each karat) through the
+    end of a closed year. Balances as of a later date add only the lines after it.
+    """
+
+    __tablename__ = 'fiscal_year_account_balance'
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id', ondelete='CASCADE'), nullable=False)
+    cash_debit = db.Column(db.Float, nullable=False, default=0.0)
+    cash_credit = db.Column(db.Float, nullable=False, default=0.0)
+    debit_18k = db.Column(db.Float, nullable=False, default=0.0)
+    credit_18k = db.Column(db.Float, nullable=False, default=0.0)
+    debit_21k = db.Column(db.Float, nullable=False, default=0.0)
+    credit_21k = db.Column(db.Float, nullable=False, default=0.0)
+    debit_22k = db.Column(db.Float, nullable=False, default=0.0)
+    credit_22k = db.Column(db.Float, nullable=False, default=0.0)
+    debit_24k = db.Column(db.Float, nullable=False, default=0.0)
+    credit_24k = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'account_id', name='uq_fiscal_year_account_balance'),
+    )
+
+
+class FiscalYearSafeBoxBalance(db.Model):
+    """Cumulative in/out totals per safe box through the end of a closed year."""
+
+    __tablename__ = 'fiscal_year_safe_box_balance'
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    safe_box_id = db.Column(db.Integer, db.ForeignKey('safe_box.id', ondelete='CASCADE'), nullable=False)
+    cash_in = db.Column(db.Float, nullable=False, default=0.0)
+    cash_out = db.Column(db.Float, nullable=False, default=0.0)
+    weight_in_18k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_out_18k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_in_21k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_out_21k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_in_22k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_out_22k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_in_24k = db.Column(db.Float, nullable=False, default=0.0)
+    weight_out_24k = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'safe_box_id', name='uq_fiscal_year_safe_box_balance'),
+    )
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    return None
+
+
+def assert_open_period(connection, value, what: str) -> None:
+    when = _as_datetime(value)
+    # The current year can never be closed, so normal postings cost no query.
+    if when is None or when >= datetime(datetime.now().year, 1, 1):
+        return
+    fiscal_year = FiscalYear.__table__
+    closed_through = connection.scalar(
+        db.select(db.func.max(fiscal_year.c.year)).where(fiscal_year.c.status == 'closed')
+    )
+    if closed_through is not None and when.year <= closed_through:
+        raise ClosedFiscalYearError(f'{what} dated {when.date().isoformat()} is in closed fiscal year {when.year}')
+
+
+def _changed_values(target, attribute: str) -> list:
+    history = db.inspect(target).attrs[attribute].history
+    return [getattr(target, attribute)] + list(history.deleted or ())
+
+
+@event.listens_for(JournalEntryLine, 'before_insert')
+def _set_line_entry_date(mapper, connection, target):
+    if target.entry_date is None:
+        entry = target.__dict__.get('journal_entry')
+        if entry is None and target.journal_entry_id is not None:
+            session = db.object_session(target)
+            if session is not None:
+                entry = session.identity_map.get(db.inspect(JournalEntry).identity_key_from_primary_key(
+                    (target.journal_entry_id,)))
+        entry_date = _as_datetime(entry.__dict__.get('date')) if entry is not None else None
+        if entry_date is None and target.journal_entry_id is not None:
+            entry_date = connection.scalar(
+                db.select(JournalEntry.__table__.c.date).where(JournalEntry.__table__.c.id == target.journal_entry_id)
+            )
+        target.entry_date = entry_date or datetime.now()
+    assert_open_period(connection, target.entry_date, 'Journal line')
+
+
+@event.listens_for(JournalEntryLine, 'before_update')
+@event.listens_for(JournalEntryLine, 'before_delete')
+def _guard_line_period(mapper, connection, target):
+    for value in _changed_values(target, 'entry_date'):
+        assert_open_period(connection, value, 'Journal line')
+
+
+@event.listens_for(JournalEntry, 'before_insert')
+@event.listens_for(JournalEntry, 'before_update')
+@event.listens_for(JournalEntry, 'before_delete')
+def _guard_entry_period(mapper, connection, target):
+    for value in _changed_values(target, 'date'):
+        assert_open_period(connection, value, 'Journal entry')
+
+
+@event.listens_for(JournalEntry, 'after_update')
+def _sync_line_entry_dates(mapper, connection, target):
+    if db.inspect(target).attrs.date.history.has_changes():
+        line_table = JournalEntryLine.__table__
+        connection.execute(
+            line_table.update().where(line_table.c.journal_entry_id == target.id).values(entry_date=target.date)
+        )
 
 
+@event.listens_for(SafeBoxTransaction, 'before_insert')
+@event.listens_for(SafeBoxTransaction, 'before_update')
+@event.listens_for(SafeBoxTransaction, 'before_delete')
+def _guard_safe_box_transaction_period(mapper, connection, target):
+    for value in _changed_values(target, 'created_at'):
+        assert_open_period(connection, value, 'Safe box transaction')
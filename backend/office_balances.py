@@ -0,0 +1,237 @@
+"""Office counters and balances: transactional deltas and a set-based recompute.
+
+`Office` keeps two kinds of denormalised columns:
+
+* treasury balances (``balance_cash``, ``balance_gold_<k>k``): what the office
+  holds, funded outside the system and read as cash/gold on hand (the office
+  bonus payout checks ``balance_cash``; the gold stock report lists the gold).
+  Reservations do not move them; a bonus paid from an office debits its cash.
+* reservation counters (``total_reservations``, ``total_weight_purchased``,
+  ``total_amount_paid``), derived entirely from office_reservation rows.
+
+Postings never read-modify-write either kind in Python: `apply_office_deltas`
+issues one ``UPDATE office SET col = coalesce(col, 0) + :delta``, which takes the
+row lock until commit, so concurrent postings serialise instead of losing
+updates. `recompute_office_balances` rebuilds the counters (the only columns
+with complete source rows) in one grouped query and reports, and optionally
+fixes, any drift.
+
+The supplier-style position of an office (debit - credit on its account: the
+amounts paid minus the reserved totals, and minus the reserved grams per
+karat) is not stored; `reservation_positions` derives it on read.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case, func, select, update
+
+from models import Office, OfficeReservation, db
+
+KARATS = (18, 21, 22, 24)
+BALANCE_COLUMNS = ('balance_cash',) + tuple(f'balance_gold_{k}k' for k in KARATS)
+COUNTER_COLUMNS = ('total_reservations', 'total_weight_purchased', 'total_amount_paid')
+COLUMNS = BALANCE_COLUMNS + COUNTER_COLUMNS
+
+CASH_TOLERANCE = 0.01
+GRAMS_TOLERANCE = 0.001
+
+
+def _tolerance(column: str) -> float:
+    if column == 'total_reservations':
+        return 0.5
+    if column == 'total_amount_paid':
+        return CASH_TOLERANCE
+    return GRAMS_TOLERANCE
+
+
+def lock_office(office_id: int) -> Optional[Office]:
+    """Load an office with ``SELECT ... FOR UPDATE`` (no-op lock on SQLite).
+
+    Use it before checking a balance that a posting is about to change, so the
+    check and the update see the same row.
+    """
+    return db.session.execute(
+        select(Office).where(Office.id == office_id).with_for_update().execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+def apply_office_deltas(office_id: int, **deltas: float) -> None:
+    """Add `deltas` to the office's stored balances/counters in one UPDATE."""
+    values = {}
+    for column, delta in deltas.items():
+        if column not in COLUMNS:
+            raise ValueError(f'Unknown office balance column: {column}')
+        if delta:
+            attribute = getattr(Office, column)
+            values[column] = func.coalesce(attribute, 0) + delta
+    if not values:
+        return
+
+    db.session.execute(
+        update(Office).where(Office.id == office_id).values(**values).execution_options(synchronize_session=False)
+    )
+    office = db.session.get(Office, office_id)
+    if office is not None:
+        db.session.expire(office, list(values))
+
+
+def reservation_deltas(reservation: OfficeReservation) -> Dict[str, float]:
+    """Counter changes caused by posting `reservation` (treasury balances are untouched)."""
+    return {
+        'total_reservations': 1,
+        'total_weight_purchased': float(reservation.weight_main_karat or 0.0),
+        'total_amount_paid': float(reservation.paid_amount or 0.0),
+    }
+
+
+def _office_ids(office_ids: Optional[Iterable[int]]) -> list:
+    query = select(Office.id)
+    if office_ids is not None:
+        office_ids = list(office_ids)
+        if not office_ids:
+            return []
+        query = query.where(Office.id.in_(office_ids))
+    return list(db.session.scalars(query))
+
+
+def expected_office_balances(office_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, float]]:
+    """``{office_id: {counter: value}}`` rebuilt from reservations in one grouped query.
+
+    Offices without reservations get zeros.
+    """
+    ids = _office_ids(office_ids)
+    expected = {office_id: {**dict.fromkeys(COUNTER_COLUMNS, 0.0), 'total_reservations': 0} for office_id in ids}
+    if not expected:
+        return {}
+
+    reservations = (
+        select(
+            OfficeReservation.office_id,
+            func.count(OfficeReservation.id),
+            func.sum(func.coalesce(OfficeReservation.weight_main_karat, 0.0)),
+            func.sum(func.coalesce(OfficeReservation.paid_amount, 0.0)),
+        )
+        .where(OfficeReservation.office_id.in_(ids))
+        .group_by(OfficeReservation.office_id)
+    )
+    for office_id, count, weight, paid_total in db.session.execute(reservations):
+        row = expected[office_id]
+        row['total_reservations'] = int(count or 0)
+        row['total_weight_purchased'] = float(weight or 0.0)
+        row['total_amount_paid'] = float(paid_total or 0.0)
+
+    return expected
+
+
+def reservation_positions(office_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, float]]:
+    """Supplier-style position per office from its reservations (debit - credit).
+
+    ``{office_id: {'cash': paid - total, 'gold': {'18k': -grams, ...}}}``; a
+    negative value is owed to the office. Computed on read, never stored.
+    """
+    ids = _office_ids(office_ids)
+    positions = {office_id: {'cash': 0.0, 'gold': {f'{k}k': 0.0 for k in KARATS}} for office_id in ids}
+    if not positions:
+        return {}
+
+    gold_columns = [
+        func.sum(case(
+            (func.coalesce(OfficeReservation.karat, 24) == k, func.coalesce(OfficeReservation.weight_grams, 0.0)),
+            else_=0.0,
+        ))
+        for k in KARATS
+    ]
+    rows = db.session.execute(
+        select(
+            OfficeReservation.office_id,
+            func.sum(
+                func.coalesce(OfficeReservation.paid_amount, 0.0) - func.coalesce(OfficeReservation.total_amount, 0.0)
+            ),
+            *gold_columns,
+        )
+        .where(OfficeReservation.office_id.in_(ids))
+        .group_by(OfficeReservation.office_id)
+    )
+    for office_id, cash, *gold in rows:
+        positions[office_id]['cash'] = float(cash or 0.0)
+        for k, grams in zip(KARATS, gold):
+            positions[office_id]['gold'][f'{k}k'] = -float(grams or 0.0)
+    return positions
+
+
+def stored_office_balances(office_ids: Iterable[int]) -> Dict[int, Dict[str, float]]:
+    office_ids = list(office_ids)
+    if not office_ids:
+        return {}
+    rows = db.session.execute(
+        select(Office.id, *(getattr(Office, column) for column in COUNTER_COLUMNS)).where(Office.id.in_(office_ids))
+    )
+    return {
+        office_id: {column: float(value or 0.0) for column, value in zip(COUNTER_COLUMNS, values)}
+        for office_id, *values in rows
+    }
+
+
+def _drift(expected: Dict[int, Dict[str, float]]) -> Dict[int, Dict[str, dict]]:
+    stored = stored_office_balances(expected)
+    drift = {}
+    for office_id, expected_row in expected.items():
+        stored_row = stored.get(office_id, {})
+        columns = {}
+        for column in COUNTER_COLUMNS:
+            stored_value = stored_row.get(column, 0.0)
+            difference = stored_value - expected_row[column]
+            if abs(difference) > _tolerance(column):
+                columns[column] = {
+                    'stored': round(stored_value, 3),
+                    'expected': round(expected_row[column], 3),
+                    'difference': round(difference, 3),
+                }
+        if columns:
+            drift[office_id] = columns
+    return drift
+
+
+def office_balance_drift(office_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, dict]]:
+    """``{office_id: {column: {'stored', 'expected', 'difference'}}}`` for drifted offices only."""
+    return _drift(expected_office_balances(office_ids))
+
+
+def recompute_office_balances(fix: bool = False) -> dict:
+    """Rebuild every office's reservation counters and report the drift.
+
+    Reports only by default (the scheduled check); with ``fix=True`` - the
+    explicit recompute endpoint - drifted offices are rewritten in one
+    executemany UPDATE. The caller commits.
+    """
+    expected = expected_office_balances()
+    drift = _drift(expected)
+
+    if fix and drift:
+        db.session.execute(
+            update(Office).execution_options(synchronize_session=False),
+            [{'id': office_id, **expected[office_id]} for office_id in drift],
+        )
+        for office in db.session.identity_map.values():
+            if isinstance(office, Office) and office.id in drift:
+                db.session.expire(office, list(COUNTER_COLUMNS))
+
+    return {
+        'status': 'consistent' if not drift else ('fixed' if fix else 'drift'),
+        'checked_offices': len(expected),
+        'drifted_offices': len(drift),
+        'drift': [{'office_id': office_id, 'columns': columns} for office_id, columns in sorted(drift.items())],
+    }
+
+
+__all__ = [
+    'apply_office_deltas',
+    'expected_office_balances',
+    'lock_office',
+    'office_balance_drift',
+    'recompute_office_balances',
+    'reservation_deltas',
+    'reservation_positions',
+]
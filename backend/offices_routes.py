@@ -10,6 +10,8 @@ from models import (
 )
 from office_supplier_service import ensure_office_supplier
 from office_account_service import ensure_office_account
+from office_balances import office_balance_drift, recompute_office_balances, reservation_positions
+from auth_decorators import require_permission
 
 # إنشاء Blueprint
 offices_bp = Blueprint('offices', __name__, url_prefix='/api/offices')
@@ -223,34 +225,49 @@ def activate_office(office_id):
 
 @offices_bp.route('/<int:office_id>/balance', methods=['GET'])
 def get_office_balance(office_id):
-    """الحصول على رصيد المكتب"""
+    """الحصول على رصيد المكتب
+
+    balance_cash / balance_gold: رصيد خزينة المكتب (النقد والذهب لديه).
+    reservation_position: مركز المكتب من الحجوزات (المدفوع - الإجمالي، والجرامات
+    المحجوزة بالسالب)، محسوب عند القراءة ولا يُخزن.
+
+    Query params (optional):
+      - verify: 1 لمقارنة عدادات الحجوزات المخزنة بإعادة حسابها من الحجوزات
+    """
     try:
         office = db.session.query(Office).get(office_id)
         if not office:
             return jsonify({'error': 'المكتب غير موجود'}), 404
-        
+
+        gold = {f'{k}k': float(getattr(office, f'balance_gold_{k}k') or 0.0) for k in (18, 21, 22, 24)}
         balance_data = {
             'office_id': office.id,
             'office_code': office.office_code,
             'office_name': office.name,
-            'balance_cash': round(office.balance_cash, 2),
+            'balance_cash': round(office.balance_cash or 0.0, 2),
             'balance_gold': {
-                '18k': round(office.balance_gold_18k, 3),
-                '21k': round(office.balance_gold_21k, 3),
-                '22k': round(office.balance_gold_22k, 3),
-                '24k': round(office.balance_gold_24k, 3),
-                'total': round(
-                    office.balance_gold_18k + office.balance_gold_21k +
-                    office.balance_gold_22k + office.balance_gold_24k, 3
-                )
+                **{karat: round(value, 3) for karat, value in gold.items()},
+                'total': round(sum(gold.values()), 3)
             },
             'statistics': {
-                'total_reservations': office.total_reservations,
-                'total_weight_purchased': round(office.total_weight_purchased, 3),
-                'total_amount_paid': round(office.total_amount_paid, 2)
+                'total_reservations': office.total_reservations or 0,
+                'total_weight_purchased': round(office.total_weight_purchased or 0.0, 3),
+                'total_amount_paid': round(office.total_amount_paid or 0.0, 2)
             }
         }
-        
+        position = reservation_positions([office.id])[office.id]
+        balance_data['reservation_position'] = {
+            'cash': round(position['cash'], 2),
+            'gold': {karat: round(value, 3) for karat, value in position['gold'].items()},
+        }
+
+        if str(request.args.get('verify', '')).strip().lower() in ('1', 'true', 'yes'):
+            drift = office_balance_drift([office.id]).get(office.id, {})
+            balance_data['verification'] = {
+                'status': 'drift' if drift else 'consistent',
+                'drift': drift,
+            }
+
         return jsonify(balance_data), 200
     
     except Exception as e:
@@ -260,31 +277,26 @@ def get_office_balance(office_id):
 
 @offices_bp.route('/statistics', methods=['GET'])
 def get_offices_statistics():
-    """إحصائيات عامة عن المكاتب"""
+    """إحصائيات عامة عن المكاتب (استعلام تجميعي واحد)"""
     try:
-        total_offices = db.session.query(Office).count()
-        active_offices = db.session.query(Office).filter_by(active=True).count()
-        inactive_offices = total_offices - active_offices
-        
-        total_reservations = db.session.query(
-            db.func.sum(Office.total_reservations)
-        ).scalar() or 0
-        
-        total_weight = db.session.query(
-            db.func.sum(Office.total_weight_purchased)
-        ).scalar() or 0
-        
-        total_paid = db.session.query(
-            db.func.sum(Office.total_amount_paid)
-        ).scalar() or 0
-        
+        row = db.session.query(
+            db.func.count(Office.id),
+            db.func.sum(db.case((Office.active.is_(True), 1), else_=0)),
+            db.func.sum(Office.total_reservations),
+            db.func.sum(Office.total_weight_purchased),
+            db.func.sum(Office.total_amount_paid),
+        ).one()
+        total_offices, active_offices, total_reservations, total_weight, total_paid = row
+        total_offices = int(total_offices or 0)
+        active_offices = int(active_offices or 0)
+
         statistics = {
             'total_offices': total_offices,
             'active_offices': active_offices,
-            'inactive_offices': inactive_offices,
-            'total_reservations': int(total_reservations),
-            'total_weight_purchased': round(float(total_weight), 3),
-            'total_amount_paid': round(float(total_paid), 2)
+            'inactive_offices': total_offices - active_offices,
+            'total_reservations': int(total_reservations or 0),
+            'total_weight_purchased': round(float(total_weight or 0), 3),
+            'total_amount_paid': round(float(total_paid or 0), 2)
         }
         
         return jsonify(statistics), 200
@@ -292,3 +304,23 @@ def get_offices_statistics():
     except Exception as e:
         print(f"❌ خطأ في جلب إحصائيات المكاتب: {e}")
         return jsonify({'error': str(e)}), 500
+
+
+@offices_bp.route('/balances/recompute', methods=['POST'])
+@require_permission('system.settings')
+def recompute_offices_balances():
+    """إعادة بناء عدادات حجوزات المكاتب من الحجوزات مع تقرير الانحراف
+
+    Query params (optional):
+      - dry_run: 1 لعرض الانحراف فقط دون تصحيح
+    """
+    try:
+        dry_run = str(request.args.get('dry_run', '')).strip().lower() in ('1', 'true', 'yes')
+        report = recompute_office_balances(fix=not dry_run)
+        db.session.commit()
+        return jsonify(report), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ خطأ في إعادة حساب أرصدة المكاتب: {e}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,203 @@
+"""Range-partition journal_entry_line and safe_box_transaction by year (PostgreSQL).
+
+One-off maintenance step, run with the application stopped:
+
+    python partition_ledger_tables.py                 # convert both tables
+    python partition_ledger_tables.py --dry-run       # print the plan only
+
+Each table is rebuilt as ``PARTITION BY RANGE (<date column>)`` with one
+partition per calendar year (``<table>_y2024`` ...) plus ``<table>_default``;
+rows are copied in one transaction and the id sequence, indexes and foreign
+keys are carried over. The partition keys are journal_entry_line.entry_date
+(a copy of journal_entry.date) and safe_box_transaction.created_at, so reports
+filtered on a fiscal-year range only read that year's partitions.
+
+Afterwards `ensure_year_partitions()` adds partitions for coming years; the
+fiscal-year close endpoint calls it after committing
+(fiscal_years.extend_ledger_partitions). Rows dated in a year that has no
+partition yet (say an entry posted for next year) land in ``<table>_default``;
+adding that year's partition moves them out of the default partition first, as
+PostgreSQL refuses to attach a range the default partition still holds rows
+for. On other backends everything here is a no-op.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+LOGGER = logging.getLogger(__name__)
+
+# table -> partition key column
+PARTITIONED_TABLES = {
+    'journal_entry_line': 'entry_date',
+    'safe_box_transaction': 'created_at',
+}
+# Adding a partition locks the parent table; give up instead of queueing every
+# ledger reader behind a long-running transaction.
+PARTITION_LOCK_TIMEOUT = '5s'
+
+
+def _model_table(table: str):
+    from models import JournalEntryLine, SafeBoxTransaction
+    return {
+        'journal_entry_line': JournalEntryLine.__table__,
+        'safe_box_transaction': SafeBoxTransaction.__table__,
+    }[table]
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return bool(connection.scalar(text(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+        'WHERE c.relname = :table AND pg_table_is_visible(c.oid)'
+    ), {'table': table}))
+
+
+def _partition_years(connection, table: str) -> List[int]:
+    names = connection.scalars(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table'
+    ), {'table': table})
+    pattern = re.compile(rf'^{table}_y(\d{{4}})$')
+    return sorted(int(match.group(1)) for match in map(pattern.match, names) if match)
+
+
+def _year_partition_ddl(table: str, year: int, parent: str = None) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {table}_y{year} PARTITION OF {parent or table} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')")
+
+
+def add_year_partition_statements(table: str, year: int) -> List[str]:
+    """Create `table`'s partition for `year`, moving that year's rows out of the default partition.
+
+    The partition is built detached, filled from ``<table>_default`` and then
+    attached, so a default partition already holding rows of `year` does not
+    make the DDL fail.
+    """
+    key = PARTITIONED_TABLES[table]
+    partition = f'{table}_y{year}'
+    start, end = f"'{year}-01-01'", f"'{year + 1}-01-01'"
+    return [
+        f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'",
+        f'CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        f'WITH moved AS (DELETE FROM {table}_default WHERE {key} >= {start} AND {key} < {end} RETURNING *) '
+        f'INSERT INTO {partition} SELECT * FROM moved',
+        f'ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ({start}) TO ({end})',
+    ]
+
+
+def ensure_year_partitions(engine: Engine, through_year: int) -> List[str]:
+    """Add missing yearly partitions up to `through_year` on already-partitioned tables.
+
+    Run it outside any transaction that touched the ledger tables; the DDL
+    needs locks on them and gives up after PARTITION_LOCK_TIMEOUT.
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    added: List[str] = []
+    for table in PARTITIONED_TABLES:
+        with engine.connect() as connection:
+            if not is_partitioned(connection, table):
+                continue
+            years = _partition_years(connection, table)
+        start = (years[-1] + 1) if years else datetime.now().year
+        for year in range(start, through_year + 1):
+            try:
+                # Own transaction each, so one failure keeps the years added before it.
+                with engine.begin() as connection:
+                    for statement in add_year_partition_statements(table, year):
+                        connection.execute(text(statement))
+                added.append(f'{table}_y{year}')
+            except SQLAlchemyError as exc:
+                LOGGER.error('could not add partition %s_y%s: %s', table, year, exc)
+                break
+    if added:
+        LOGGER.info('Added ledger partitions: %s', ', '.join(added))
+    return added
+
+
+def partition_statements(connection, table: str, through_year: int) -> List[str]:
+    """DDL/DML that rebuilds `table` as a yearly range-partitioned table."""
+    key = PARTITIONED_TABLES[table]
+    model_table = _model_table(table)
+    dialect = connection.dialect
+    staged = f'{table}_partitioned'
+    sequence = connection.scalar(text('SELECT pg_get_serial_sequence(:table, :column)'),
+                                 {'table': table, 'column': 'id'})
+
+    statements = []
+    if table == 'journal_entry_line':
+        statements.append(
+            'UPDATE journal_entry_line l SET entry_date = e.date FROM journal_entry e '
+            'WHERE e.id = l.journal_entry_id AND l.entry_date IS NULL'
+        )
+    # Lines are dated by their entry (entry_date may not be backfilled yet).
+    source_table, source_column = ('journal_entry', 'date') if table == 'journal_entry_line' else (table, key)
+    first_year = connection.scalar(text(f'SELECT EXTRACT(YEAR FROM MIN({source_column}))::int FROM {source_table}'))
+    first_year = min(first_year or datetime.now().year, datetime.now().year)
+
+    statements += [
+        f'CREATE TABLE {staged} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE ({key})',
+        f'ALTER TABLE {staged} ALTER COLUMN {key} SET NOT NULL',
+        f'ALTER TABLE {staged} ADD CONSTRAINT {staged}_pkey PRIMARY KEY (id, {key})',
+    ]
+    statements += [_year_partition_ddl(table, year, parent=staged) for year in range(first_year, through_year + 1)]
+    statements += [
+        f'CREATE TABLE {table}_default PARTITION OF {staged} DEFAULT',
+        f'INSERT INTO {staged} SELECT * FROM {table}',
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {staged}), 1))",
+        f'ALTER SEQUENCE {sequence} OWNED BY {staged}.id',
+        f'DROP TABLE {table}',
+        f'ALTER TABLE {staged} RENAME TO {table}',
+        f'ALTER INDEX {staged}_pkey RENAME TO {table}_pkey',
+    ]
+    statements += [str(CreateIndex(index).compile(dialect=dialect)) for index in model_table.indexes]
+    statements += [
+        str(AddConstraint(constraint).compile(dialect=dialect))
+        for constraint in model_table.foreign_key_constraints
+    ]
+    return statements
+
+
+def partition_tables(engine: Engine, through_year: int, dry_run: bool = False) -> List[str]:
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError('table partitioning is only supported on PostgreSQL')
+    executed: List[str] = []
+    with engine.begin() as connection:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(connection, table):
+                LOGGER.info('%s is already partitioned', table)
+                continue
+            for statement in partition_statements(connection, table, through_year):
+                executed.append(statement)
+                if not dry_run:
+                    connection.execute(text(statement))
+    return executed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--through-year', type=int, default=datetime.now().year + 2,
+                        help='create yearly partitions up to this year (default: current year + 2)')
+    parser.add_argument('--dry-run', action='store_true', help='print the statements without running them')
+    args = parser.parse_args()
+
+    from app import app
+    from models import db
+
+    with app.app_context():
+        for statement in partition_tables(db.engine, args.through_year, dry_run=args.dry_run):
+            print(statement.rstrip() + ';')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+"""Statement engine for customers, suppliers, employees and ledger accounts.
+
+Every statement is a filtered, ordered scan of `journal_entry_line` joined to
+its `journal_entry`. Lines are ordered by (entry date, entry id, line id); that
+key doubles as the keyset cursor, so a page never scans the rows before it.
+
+Balances are never rebuilt in Python from the start of history:
+
+* the opening balance (everything before `date_from`) and the balance carried
+  into a page (everything before its first row) are single SQL aggregates -
+  the newest page instead walks back from the closing balance;
+* running cash and per-karat balances are then accumulated in one ordered pass
+  over the page (or over the streamed export).
+
+Gold figures are normalised to the main karat once per statement instead of
+re-reading Settings for every converted weight.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import false, func, select, tuple_
+from sqlalchemy.orm import contains_eager, joinedload
+
+from models import Account, Customer, Employee, JournalEntry, JournalEntryLine, Settings, Supplier, db
+
+PARTY_TYPES = ('customer', 'supplier', 'employee', 'account')
+
+KARATS = ('18k', '21k', '22k', '24k')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 500
+
+CSV_COLUMNS = (
+    'id', 'date', 'entry_number', 'description', 'account_number', 'account_name',
+    'reference_type', 'reference_id', 'reference_number',
+    'cash_debit', 'cash_credit',
+    'debit_18k', 'credit_18k', 'debit_21k', 'credit_21k',
+    'debit_22k', 'credit_22k', 'debit_24k', 'credit_24k',
+    'gold_debit', 'gold_credit',
+    'running_cash_balance', 'running_gold_balance',
+)
+
+_SUM_COLUMNS = (
+    JournalEntryLine.cash_debit, JournalEntryLine.cash_credit,
+    JournalEntryLine.debit_18k, JournalEntryLine.credit_18k,
+    JournalEntryLine.debit_21k, JournalEntryLine.credit_21k,
+    JournalEntryLine.debit_22k, JournalEntryLine.credit_22k,
+    JournalEntryLine.debit_24k, JournalEntryLine.credit_24k,
+)
+
+_ORDER_KEY = (JournalEntry.date, JournalEntry.id, JournalEntryLine.id)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def _karat_value(karat: str) -> float:
+    return float(karat[:-1])
+
+
+def _main_karat() -> float:
+    settings = Settings.query.with_entities(Settings.main_karat).first()
+    try:
+        value = float(settings[0]) if settings and settings[0] else 21.0
+    except (TypeError, ValueError):
+        value = 21.0
+    return value or 21.0
+
+
+@dataclass
+class Balance:
+    """Cash + per-karat net balance (debit - credit) with turnover totals."""
+
+    cash_debit: float = 0.0
+    cash_credit: float = 0.0
+    debit: Dict[str, float] = field(default_factory=lambda: {k: 0.0 for k in KARATS})
+    credit: Dict[str, float] = field(default_factory=lambda: {k: 0.0 for k in KARATS})
+
+    @classmethod
+    def from_row(cls, row) -> 'Balance':
+        values = [float(v or 0.0) for v in (row or ())] or [0.0] * len(_SUM_COLUMNS)
+        bal = cls(cash_debit=values[0], cash_credit=values[1])
+        for idx, karat in enumerate(KARATS):
+            bal.debit[karat] = values[2 + idx * 2]
+            bal.credit[karat] = values[3 + idx * 2]
+        return bal
+
+    def copy(self) -> 'Balance':
+        return Balance(self.cash_debit, self.cash_credit, dict(self.debit), dict(self.credit))
+
+    def __add__(self, other: 'Balance') -> 'Balance':
+        return Balance(
+            self.cash_debit + other.cash_debit,
+            self.cash_credit + other.cash_credit,
+            {k: self.debit[k] + other.debit[k] for k in KARATS},
+            {k: self.credit[k] + other.credit[k] for k in KARATS},
+        )
+
+    def __sub__(self, other: 'Balance') -> 'Balance':
+        return Balance(
+            self.cash_debit - other.cash_debit,
+            self.cash_credit - other.cash_credit,
+            {k: self.debit[k] - other.debit[k] for k in KARATS},
+            {k: self.credit[k] - other.credit[k] for k in KARATS},
+        )
+
+    def add_line(self, line: JournalEntryLine) -> None:
+        self.cash_debit += line.cash_debit or 0.0
+        self.cash_credit += line.cash_credit or 0.0
+        for karat in KARATS:
+            self.debit[karat] += getattr(line, f'debit_{karat}') or 0.0
+            self.credit[karat] += getattr(line, f'credit_{karat}') or 0.0
+
+    @property
+    def cash(self) -> float:
+        return self.cash_debit - self.cash_credit
+
+    @property
+    def gold_details(self) -> Dict[str, float]:
+        return {k: self.debit[k] - self.credit[k] for k in KARATS}
+
+    def gold_normalized(self, main_karat: float) -> float:
+        return sum(
+            weight * _karat_value(k) / main_karat for k, weight in self.gold_details.items()
+        )
+
+
+@dataclass(frozen=True)
+class StatementScope:
+    """Which journal lines belong to a party's statement."""
+
+    party_type: str
+    party_id: int
+    name: str
+    criteria: Tuple = ()
+    party: object = None
+
+
+def resolve_scope(party_type: str, party_id: int, payable_only: bool = True) -> Optional[StatementScope]:
+    """Build the scope for a party, or return None when the party does not exist.
+
+    Suppliers are restricted to payable (21xx liability) lines by default: invoice
+    entries tag `supplier_id` on every line (inventory, tax, ...) and those would
+    cancel the supplier balance out.
+    """
+    if party_type not in PARTY_TYPES:
+        raise ValueError(f'Unsupported party type: {party_type}')
+
+    if party_type == 'customer':
+        party = db.session.get(Customer, party_id)
+        if party is None:
+            return None
+        return StatementScope('customer', party_id, party.name, (JournalEntryLine.customer_id == party_id,), party)
+
+    if party_type == 'supplier':
+        party = db.session.get(Supplier, party_id)
+        if party is None:
+            return None
+        criteria = [JournalEntryLine.supplier_id == party_id]
+        if payable_only:
+            criteria.append(
+                JournalEntryLine.account_id.in_(
+                    select(Account.id).where(
+                        Account.type == 'Liability',
+                        Account.account_number.like('21%'),
+                    )
+                )
+            )
+        return StatementScope('supplier', party_id, party.name, tuple(criteria), party)
+
+    if party_type == 'employee':
+        party = db.session.get(Employee, party_id)
+        if party is None:
+            return None
+        criterion = JournalEntryLine.account_id == party.account_id if party.account_id else false()
+        return StatementScope('employee', party_id, party.name, (criterion,), party)
+
+    party = db.session.get(Account, party_id)
+    if party is None:
+        return None
+    return StatementScope('account', party_id, party.name, (JournalEntryLine.account_id == party_id,), party)
+
+
+def encode_cursor(line: JournalEntryLine) -> str:
+    raw = json.dumps([line.journal_entry.date.isoformat(), line.journal_entry_id, line.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        entry_date, entry_id, line_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(entry_date), int(entry_id), int(line_id)
+    except Exception as exc:
+        raise InvalidCursor('Invalid cursor') from exc
+
+
+def _day_start(value: Optional[date]) -> Optional[datetime]:
+    return datetime.combine(value, time.min) if value else None
+
+
+class PartyStatement:
+    """Opening balance, totals, keyset pages and streamed rows for one scope."""
+
+    def __init__(
+        self,
+        scope: StatementScope,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        main_karat: Optional[float] = None,
+    ):
+        self.scope = scope
+        self.date_from = date_from
+        self.date_to = date_to
+        self.main_karat = float(main_karat) if main_karat else _main_karat()
+        self._from_dt = _day_start(date_from)
+        self._to_dt = _day_start(date_to) + timedelta(days=1) if date_to else None
+        self._opening: Optional[Balance] = None
+        self._totals: Optional[Balance] = None
+
+    # ------------------------------------------------------------------ queries
+    def _filtered(self, query, with_range: bool = True):
+        query = query.filter(
+            *self.scope.criteria,
+            JournalEntryLine.is_deleted.is_(False),
+            JournalEntry.is_deleted.is_(False),
+        )
+        if with_range:
+            if self._from_dt is not None:
+                query = query.filter(JournalEntry.date >= self._from_dt)
+            if self._to_dt is not None:
+                query = query.filter(JournalEntry.date < self._to_dt)
+        return query
+
+    def _sum(self, *extra) -> Balance:
+        query = db.session.query(*[func.coalesce(func.sum(col), 0.0) for col in _SUM_COLUMNS]).select_from(
+            JournalEntryLine
+        ).join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
+        query = self._filtered(query, with_range=False).filter(*extra)
+        return Balance.from_row(query.one())
+
+    def _lines_query(self):
+        query = (
+            JournalEntryLine.query
+            .join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
+            .options(contains_eager(JournalEntryLine.journal_entry), joinedload(JournalEntryLine.account))
+        )
+        return self._filtered(query)
+
+    # ----------------------------------------------------------------- balances
+    def opening_balance(self) -> Balance:
+        """Balance of everything dated before `date_from` (zero without one)."""
+        if self._opening is None:
+            if self._from_dt is None:
+                self._opening = Balance()
+            else:
+                self._opening = self._sum(JournalEntry.date < self._from_dt)
+        return self._opening
+
+    def period_totals(self) -> Balance:
+        """Debit/credit turnover inside the requested date range."""
+        if self._totals is None:
+            extra = []
+            if self._from_dt is not None:
+                extra.append(JournalEntry.date >= self._from_dt)
+            if self._to_dt is not None:
+                extra.append(JournalEntry.date < self._to_dt)
+            self._totals = self._sum(*extra)
+        return self._totals
+
+    def _balance_before(self, key: Tuple[datetime, int, int]) -> Balance:
+        extra = [tuple_(*_ORDER_KEY) < tuple_(*key)]
+        if self._from_dt is not None:
+            extra.append(JournalEntry.date >= self._from_dt)
+        return self.opening_balance() + self._sum(*extra)
+
+    # -------------------------------------------------------------------- rows
+    def serialize_line(self, line: JournalEntryLine, running: Optional[Balance] = None) -> dict:
+        entry = line.journal_entry
+        account = line.account
+        mk = self.main_karat
+        gold_debit = sum((getattr(line, f'debit_{k}') or 0.0) * _karat_value(k) / mk for k in KARATS)
+        gold_credit = sum((getattr(line, f'credit_{k}') or 0.0) * _karat_value(k) / mk for k in KARATS)
+        row = {
+            'id': line.id,
+            'date': entry.date.isoformat() if entry and entry.date else None,
+            'description': line.description or (entry.description if entry else None) or '',
+            'journal_entry_id': line.journal_entry_id,
+            'entry_number': entry.entry_number if entry else None,
+            'reference_type': entry.reference_type if entry else None,
+            'reference_id': entry.reference_id if entry else None,
+            'reference_number': entry.reference_number if entry else None,
+            'account_id': line.account_id,
+            'account_number': account.account_number if account else None,
+            'account_name': account.name if account else None,
+            'cash_debit': line.cash_debit or 0.0,
+            'cash_credit': line.cash_credit or 0.0,
+            'gold_debit': gold_debit,
+            'gold_credit': gold_credit,
+        }
+        for karat in KARATS:
+            row[f'debit_{karat}'] = getattr(line, f'debit_{karat}') or 0.0
+            row[f'credit_{karat}'] = getattr(line, f'credit_{karat}') or 0.0
+        if running is not None:
+            row['running_cash_balance'] = running.cash
+            row['running_gold_balance'] = running.gold_normalized(mk)
+            row['running_gold_details'] = running.gold_details
+        return row
+
+    def page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, descending: bool = False) -> dict:
+        """One keyset page, with running balances for every row on it.
+
+        `cursor` is the `next_cursor` of the previous page; pages continue in the
+        same direction. Rows in a descending page are newest first, but each
+        row's running balance is still the balance after that row.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        # Sort/limit on the narrow key first, then load the full rows by id: the
+        # wide joined rows are never sorted as a whole.
+        key_query = self._filtered(
+            db.session.query(*_ORDER_KEY).join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
+        )
+        if cursor:
+            key = decode_cursor(cursor)
+            if descending:
+                key_query = key_query.filter(tuple_(*_ORDER_KEY) < tuple_(*key))
+            else:
+                key_query = key_query.filter(tuple_(*_ORDER_KEY) > tuple_(*key))
+        order = [col.desc() for col in _ORDER_KEY] if descending else [col.asc() for col in _ORDER_KEY]
+        keys = key_query.order_by(*order).limit(limit + 1).all()
+
+        has_more = len(keys) > limit
+        keys = keys[:limit]
+        line_ids = [key[2] for key in keys]
+        by_id = {
+            line.id: line
+            for line in self._lines_query().filter(JournalEntryLine.id.in_(line_ids)).all()
+        } if line_ids else {}
+        rows = [by_id[line_id] for line_id in line_ids if line_id in by_id]
+        next_cursor = encode_cursor(rows[-1]) if has_more and rows else None
+
+        ascending_rows = list(reversed(rows)) if descending else rows
+        if not ascending_rows or (not descending and not cursor):
+            running = self.opening_balance().copy()
+        elif descending and not cursor:
+            # Newest page: the last row closes the period, so walk back from there.
+            page_turnover = Balance()
+            for line in ascending_rows:
+                page_turnover.add_line(line)
+            running = self.opening_balance() + self.period_totals() - page_turnover
+        else:
+            first = ascending_rows[0]
+            running = self._balance_before((first.journal_entry.date, first.journal_entry_id, first.id))
+        balance_before_page = running.copy()
+
+        serialized = []
+        for line in ascending_rows:
+            running.add_line(line)
+            serialized.append(self.serialize_line(line, running))
+        if descending:
+            serialized.reverse()
+
+        return {
+            'lines': serialized,
+            'balance_before_page': self.balance_payload(balance_before_page),
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'limit': limit,
+            'order': 'desc' if descending else 'asc',
+        }
+
+    def iter_rows(self, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """Stream every line in ascending order with running balances."""
+        running = self.opening_balance().copy()
+        query = self._lines_query().order_by(*[col.asc() for col in _ORDER_KEY])
+        for line in query.yield_per(batch_size):
+            running.add_line(line)
+            yield self.serialize_line(line, running)
+
+    # ------------------------------------------------------------------ summary
+    def balance_payload(self, balance: Balance) -> dict:
+        return {
+            'cash': balance.cash,
+            'gold_normalized': balance.gold_normalized(self.main_karat),
+            'gold_details': balance.gold_details,
+        }
+
+    def summary(self) -> dict:
+        """Opening/closing balances and period totals in the account-statement shape."""
+        opening = self.opening_balance()
+        totals = self.period_totals()
+        closing = opening + totals
+        mk = self.main_karat
+        return {
+            'account_name': self.scope.name,
+            'party_type': self.scope.party_type,
+            'party_id': self.scope.party_id,
+            'main_karat': mk,
+            'date_from': self.date_from.isoformat() if self.date_from else None,
+            'date_to': self.date_to.isoformat() if self.date_to else None,
+            'opening_balance_cash': opening.cash,
+            'opening_balance_gold_normalized': opening.gold_normalized(mk),
+            'opening_balance_gold_details': opening.gold_details,
+            'totals': {
+                'cash_debit': totals.cash_debit,
+                'cash_credit': totals.cash_credit,
+                'gold_debit_normalized': sum(totals.debit[k] * _karat_value(k) / mk for k in KARATS),
+                'gold_credit_normalized': sum(totals.credit[k] * _karat_value(k) / mk for k in KARATS),
+                'debit_by_karat': dict(totals.debit),
+                'credit_by_karat': dict(totals.credit),
+            },
+            'closing_balance_cash': closing.cash,
+            'closing_balance_gold_normalized': closing.gold_normalized(mk),
+            'closing_balance_gold_details': closing.gold_details,
+        }
+
+    def full(self) -> dict:
+        """Summary plus every line (the legacy un-paginated statement)."""
+        payload = self.summary()
+        payload['lines'] = list(self.iter_rows())
+        return payload
@@ -0,0 +1,160 @@
+"""Read-only payment-method catalog for the POS.
+
+POS screens poll `/payment-methods*` and `/payment-types` constantly. The
+catalog keeps one serialized snapshot per process (payment methods with their
+default safe box eagerly loaded, active payment types, and an
+invoice_type -> methods index) and rebuilds it only when its version changes.
+
+Committing any change to PaymentMethod, PaymentType or SafeBox rows bumps the
+``payment_methods`` version in cache_version within the same transaction, so
+every worker rebuilds within PAYMENT_METHOD_CATALOG_VERSION_CHECK_SECONDS
+(see versioned_cache; Redis, when enabled, only shortens the poll). Responses
+carry a content-hash ETag so unchanged catalogs answer 304.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from config import PAYMENT_METHOD_CATALOG_VERSION_CHECK_SECONDS
+from models import PAYMENT_METHOD_ALLOWED_INVOICE_TYPES, PaymentMethod, PaymentType, SafeBox
+from versioned_cache import VersionedCache, mark_changed, register_cache
+
+CACHE_NAME = 'payment_methods'
+
+
+def _etag_for(payload) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return 'pm-' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+@dataclass
+class CatalogSnapshot:
+    version: int
+    methods: Tuple[dict, ...]
+    active_flags: Tuple[bool, ...]
+    by_invoice_type: Dict[str, Tuple[int, ...]]
+    payment_types: Tuple[dict, ...]
+    _views: Dict[Tuple[bool, Optional[str]], Tuple[List[dict], str]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def methods_view(self, active_only: bool = False, invoice_type: Optional[str] = None) -> Tuple[List[dict], str]:
+        key = (bool(active_only), invoice_type)
+        cached = self._views.get(key)
+        if cached is not None:
+            return cached
+        if invoice_type:
+            positions = self.by_invoice_type.get(invoice_type, ())
+        else:
+            positions = range(len(self.methods))
+        payload = [
+            self.methods[pos]
+            for pos in positions
+            if not active_only or self.active_flags[pos]
+        ]
+        view = (payload, _etag_for(payload))
+        with self._lock:
+            self._views[key] = view
+        return view
+
+    def payment_types_view(self) -> Tuple[List[dict], str]:
+        key = (True, '__payment_types__')
+        cached = self._views.get(key)
+        if cached is not None:
+            return cached
+        payload = list(self.payment_types)
+        view = (payload, _etag_for(payload))
+        with self._lock:
+            self._views[key] = view
+        return view
+
+
+def _load_snapshot(version: int) -> CatalogSnapshot:
+    rows = (
+        PaymentMethod.query
+        .options(joinedload(PaymentMethod.default_safe_box))
+        .order_by(PaymentMethod.id)
+        .all()
+    )
+    methods = tuple(pm.to_dict() for pm in rows)
+    active_flags = tuple(bool(pm.is_active) for pm in rows)
+
+    by_invoice_type: Dict[str, List[int]] = {t: [] for t in PAYMENT_METHOD_ALLOWED_INVOICE_TYPES}
+    for pos, pm in enumerate(rows):
+        applicable = pm.applicable_invoice_types
+        if not applicable:
+            targets = list(by_invoice_type.keys())
+        else:
+            targets = applicable
+        for invoice_type in targets:
+            by_invoice_type.setdefault(invoice_type, []).append(pos)
+
+    payment_types = tuple(
+        pt.to_dict()
+        for pt in PaymentType.query.filter_by(is_active=True).order_by(PaymentType.sort_order).all()
+    )
+    return CatalogSnapshot(
+        version=version,
+        methods=methods,
+        active_flags=active_flags,
+        by_invoice_type={k: tuple(v) for k, v in by_invoice_type.items()},
+        payment_types=payment_types,
+    )
+
+
+class PaymentMethodCatalog:
+    def __init__(self, check_seconds: float = PAYMENT_METHOD_CATALOG_VERSION_CHECK_SECONDS):
+        self.cache: VersionedCache[CatalogSnapshot] = VersionedCache(CACHE_NAME, _load_snapshot, check_seconds)
+
+    @property
+    def version(self) -> int:
+        return self.cache.version
+
+    def snapshot(self) -> CatalogSnapshot:
+        return self.cache.get()
+
+    def invalidate(self, broadcast: bool = True) -> None:
+        self.cache.invalidate(broadcast=broadcast)
+
+
+payment_method_catalog = PaymentMethodCatalog()
+register_cache(payment_method_catalog.cache)
+
+
+def invalidate_payment_method_catalog() -> None:
+    payment_method_catalog.invalidate()
+
+
+@event.listens_for(PaymentMethod, 'after_insert')
+@event.listens_for(PaymentMethod, 'after_update')
+@event.listens_for(PaymentMethod, 'after_delete')
+@event.listens_for(PaymentType, 'after_insert')
+@event.listens_for(PaymentType, 'after_update')
+@event.listens_for(PaymentType, 'after_delete')
+@event.listens_for(SafeBox, 'after_update')
+@event.listens_for(SafeBox, 'after_delete')
+def _catalog_row_changed(mapper, connection, target):
+    mark_changed(Session.object_session(target), CACHE_NAME)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _bump_after_bulk(context):
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None and mapper.class_ in (PaymentMethod, PaymentType, SafeBox):
+        mark_changed(context.session, CACHE_NAME)
+
+
+@event.listens_for(PaymentMethod.__table__, 'after_create')
+@event.listens_for(PaymentMethod.__table__, 'after_drop')
+@event.listens_for(PaymentType.__table__, 'after_create')
+@event.listens_for(PaymentType.__table__, 'after_drop')
+def _bump_after_ddl(target, connection, **kw):
+    payment_method_catalog.invalidate()
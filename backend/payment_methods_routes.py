@@ -18,6 +18,7 @@ from models import (
     SafeBox,
     Settings,
 )
+from payment_method_catalog import payment_method_catalog
 
 
 INVOICE_TYPE_OPTIONS = [
@@ -132,20 +133,6 @@ def _normalize_applicable_invoice_types(raw_types):
     return normalized
 
 
-def _filter_payment_methods_by_invoice_type(payment_methods, invoice_type):
-    if not invoice_type:
-        return payment_methods
-
-    filtered = []
-    for method in payment_methods:
-        applicable = method.applicable_invoice_types
-        if not applicable:
-            filtered.append(method)
-            continue
-        if invoice_type in applicable:
-            filtered.append(method)
-    return filtered
-
 LEGACY_FALLBACK_PAYMENT_METHODS: List[Dict[str, Any]] = [
     {
         'name': 'نقداً',
@@ -420,7 +407,12 @@ def _normalize_applicable_types(raw_value: Any) -> List[str]:
     return list(PAYMENT_METHOD_ALLOWED_INVOICE_TYPES)
 
 
-def _sync_payment_methods_from_settings() -> None:
+def sync_payment_methods_from_settings() -> None:
+    """Create PaymentMethod rows from legacy Settings.payment_methods JSON.
+
+    Write path only: runs in the startup bootstrap and when settings are saved,
+    never on catalog GETs.
+    """
     legacy_methods = _load_legacy_payment_methods()
     if not legacy_methods:
         return
@@ -555,21 +547,34 @@ def generate_payment_method_account_number(parent_account_id):
     
     return f'{parent_number}.{max_suffix + 1}'
 
+def _catalog_response(payload, etag):
+    """JSON response with ETag; answers 304 when If-None-Match matches."""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def _payment_methods_view(active_only):
+    invoice_type_filter = request.args.get('invoice_type')
+
+    try:
+        invoice_type_filter = _normalize_invoice_type_filter(invoice_type_filter)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    payload, etag = payment_method_catalog.snapshot().methods_view(
+        active_only=active_only,
+        invoice_type=invoice_type_filter,
+    )
+    return _catalog_response(payload, etag)
+
+
 @payment_methods_api.route('/payment-methods', methods=['GET'])
 def get_payment_methods():
     """جلب جميع وسائل الدفع"""
     try:
-        _sync_payment_methods_from_settings()
-        invoice_type_filter = request.args.get('invoice_type')
-
-        try:
-            invoice_type_filter = _normalize_invoice_type_filter(invoice_type_filter)
-        except ValueError as exc:
-            return jsonify({'error': str(exc)}), 400
-
-        payment_methods = PaymentMethod.query.all()
-        payment_methods = _filter_payment_methods_by_invoice_type(payment_methods, invoice_type_filter)
-        return jsonify([pm.to_dict() for pm in payment_methods]), 200
+        return _payment_methods_view(active_only=False)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -577,17 +582,7 @@ def get_payment_methods():
 def get_active_payment_methods():
     """جلب وسائل الدفع النشطة فقط"""
     try:
-        _sync_payment_methods_from_settings()
-        invoice_type_filter = request.args.get('invoice_type')
-
-        try:
-            invoice_type_filter = _normalize_invoice_type_filter(invoice_type_filter)
-        except ValueError as exc:
-            return jsonify({'error': str(exc)}), 400
-
-        payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
-        payment_methods = _filter_payment_methods_by_invoice_type(payment_methods, invoice_type_filter)
-        return jsonify([pm.to_dict() for pm in payment_methods]), 200
+        return _payment_methods_view(active_only=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1081,12 +1076,8 @@ def get_invoice_type_options():
 def get_payment_types():
     """جلب أنواع وسائل الدفع المتاحة (ديناميكي)"""
     try:
-        payment_types = PaymentType.query.filter_by(is_active=True).order_by(PaymentType.sort_order).all()
-
-        if not payment_types:
-            ensure_default_payment_types()
-            payment_types = PaymentType.query.filter_by(is_active=True).order_by(PaymentType.sort_order).all()
-        return jsonify([pt.to_dict() for pt in payment_types]), 200
+        payload, etag = payment_method_catalog.snapshot().payment_types_view()
+        return _catalog_response(payload, etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
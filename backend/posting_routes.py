@@ -1052,6 +1052,7 @@ def close_shift():
             ip_address=request.remote_addr,
             user_agent=request.headers.get('User-Agent'),
             success=True,
+            sync=True,  # the row id doubles as the closing number
         )
         db.session.flush()
         if log:
@@ -1221,12 +1222,14 @@ def close_shift():
 def get_unposted_invoices():
     """عرض جميع الفواتير غير المرحلة"""
     try:
-        invoices = Invoice.query.filter_by(is_posted=False).order_by(Invoice.date.desc()).all()
+        invoices = Invoice.query.filter_by(is_posted=False).order_by(Invoice.date.desc()).options(
+            *Invoice.list_load_options()
+        ).all()
         
         return jsonify({
             'success': True,
             'count': len(invoices),
-            'invoices': [inv.to_dict() for inv in invoices]
+            'invoices': Invoice.to_dict_list(invoices)
         }), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1237,12 +1240,14 @@ def get_unposted_invoices():
 def get_posted_invoices():
     """عرض جميع الفواتير المرحلة"""
     try:
-        invoices = Invoice.query.filter_by(is_posted=True).order_by(Invoice.posted_at.desc()).all()
+        invoices = Invoice.query.filter_by(is_posted=True).order_by(Invoice.posted_at.desc()).options(
+            *Invoice.list_load_options()
+        ).all()
         
         return jsonify({
             'success': True,
             'count': len(invoices),
-            'invoices': [inv.to_dict() for inv in invoices]
+            'invoices': Invoice.to_dict_list(invoices)
         }), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1586,7 +1591,7 @@ def post_invoices_batch():
                     action='post',
                     entity_type='invoice',
                     entity_id=invoice.id,
-                    entity_number=invoice.invoice_number,
+                    entity_number=getattr(invoice, 'invoice_number', None),
                     details=json.dumps({'batch_operation': True}, ensure_ascii=False),
                     ip_address=request.remote_addr,
                     user_agent=request.headers.get('User-Agent')
@@ -1666,7 +1671,7 @@ def unpost_invoice(invoice_id):
                 action='unpost',
                 entity_type='invoice',
                 entity_id=invoice_id,
-                entity_number=invoice.invoice_number,
+                entity_number=getattr(invoice, 'invoice_number', None),
                 success=False,
                 error_message='الفاتورة غير مرحلة أصلاً',
                 ip_address=request.remote_addr,
@@ -1696,7 +1701,7 @@ def unpost_invoice(invoice_id):
             action='unpost',
             entity_type='invoice',
             entity_id=invoice_id,
-            entity_number=invoice.invoice_number,
+            entity_number=getattr(invoice, 'invoice_number', None),
             details=json.dumps({
                 'invoice_type': invoice.invoice_type,
                 'total': float(invoice.total or 0)
@@ -2076,6 +2081,7 @@ def get_audit_logs():
     Query Parameters:
     - limit: عدد السجلات (افتراضي 100)
     - user_name: تصفية حسب اسم المستخدم
+    - user_exact: true لمطابقة اسم المستخدم حرفياً (يستخدم فهرس user_name, timestamp)
     - action: تصفية حسب نوع العملية
     - entity_type: تصفية حسب نوع الكيان
     - entity_id: تصفية حسب معرف الكيان
@@ -2097,7 +2103,9 @@ def get_audit_logs():
         # بناء الاستعلام
         query = AuditLog.query
         
-        if user_name:
+        if user_name and (request.args.get('user_exact') or '').lower() in ('1', 'true', 'yes'):
+            query = query.filter(AuditLog.user_name == user_name)
+        elif user_name:
             query = query.filter(AuditLog.user_name.like(f'%{user_name}%'))
         
         if action:
@@ -2221,12 +2229,14 @@ def get_audit_stats():
     try:
         from sqlalchemy import func
         
-        # إجمالي السجلات
-        total_logs = AuditLog.query.count()
-        
-        # السجلات الناجحة والفاشلة
-        successful = AuditLog.query.filter_by(success=True).count()
-        failed = AuditLog.query.filter_by(success=False).count()
+        # إجمالي السجلات والناجحة والفاشلة (مسح واحد للجدول)
+        from sqlalchemy import case
+
+        total_logs, successful, failed = db.session.query(
+            func.count(AuditLog.id),
+            func.coalesce(func.sum(case((AuditLog.success.is_(True), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((AuditLog.success.is_(False), 1), else_=0)), 0),
+        ).one()
         
         # أكثر العمليات تكراراً
         top_actions = db.session.query(
@@ -21,7 +21,7 @@ import argparse
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
-from bonus_calculator import BonusCalculator
+from bonus_calculator import BonusBatchEngine
 
 
 def get_month_range(year, month):
@@ -81,9 +81,7 @@ def main():
     with app.app_context():
         try:
             # حساب المكافآت
-            bonuses = BonusCalculator.calculate_all_bonuses_for_period(
-                period_start=period_start,
-                period_end=period_end,
+            bonuses = BonusBatchEngine(period_start, period_end).run(
                 auto_approve=args.auto_approve
             )
             
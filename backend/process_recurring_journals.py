@@ -16,7 +16,7 @@ from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
-from backend.recurring_journal_system import process_recurring_journals
+from recurring_journal_system import process_recurring_journals
 
 
 def main():
@@ -0,0 +1,266 @@
+"""SQL statement counting/timing per request and a Prometheus `/metrics` endpoint.
+
+Enabled with DB_METRICS_ENABLED=1. When disabled nothing is registered: no
+engine listeners, no request hooks, no `/metrics` route.
+
+When enabled:
+
+* `before_cursor_execute` / `after_cursor_execute` on the engine count and time
+  every statement; inside a request the totals go to the response as
+  ``X-DB-Queries`` and ``X-DB-Time`` (milliseconds).
+* `/metrics` serves, in Prometheus text format (no client library needed):
+    http_request_duration_seconds   histogram per endpoint (rule) and method
+    http_request_db_queries         histogram of statements per request
+    http_request_db_seconds         histogram of DB time per request
+    db_pool_checkout_seconds        histogram of time to get a pooled connection
+    db_slow_queries_total           counter per endpoint
+    db_slow_query_sample_seconds    the last DB_SLOW_QUERY_SAMPLES statements slower
+                                    than DB_SLOW_QUERY_MS (default 200 ms)
+  The samples carry SQL text, so `/metrics` is denied by default: set
+  METRICS_TOKEN to allow ``Authorization: Bearer <token>``; without a token only
+  direct loopback requests (no proxy forwarding headers) are served.
+
+Metrics live in process memory. Under gunicorn each worker keeps its own and
+every series carries a ``worker`` (pid) label, so sum over it when querying.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+MAX_STATEMENT_CHARS = 300
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(str(os.getenv(name, default)).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_flag(name: str, default: str = '0') -> bool:
+    return str(os.getenv(name, default)).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs: Iterable[Tuple[str, object]]) -> str:
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + body + '}' if body else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, const_labels: Tuple[Tuple[str, object], ...]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot, key=lambda item: item[0]):
+            base = tuple(zip(self.label_names, labels)) + const_labels
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float('inf'),), counts):
+                cumulative += hits
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(base + (("le", le),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(base)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(base)} {count}')
+        return lines
+
+
+class QueryMetrics:
+    """Process-wide metric store (one per app, in ``app.extensions['query_metrics']``)."""
+
+    def __init__(self, slow_query_ms: int = 200, slow_samples: int = 20):
+        self.slow_query_seconds = max(slow_query_ms, 0) / 1000.0
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Request latency.', ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'SQL statements issued per request.', ('endpoint', 'method'),
+            QUERY_COUNT_BUCKETS)
+        self.request_db_time = Histogram(
+            'http_request_db_seconds', 'Time spent in SQL statements per request.', ('endpoint', 'method'),
+            LATENCY_BUCKETS)
+        self.pool_checkout = Histogram(
+            'db_pool_checkout_seconds', 'Time to obtain a pooled DB connection (queue wait + connect).', (),
+            POOL_WAIT_BUCKETS)
+        self._slow_counts: Dict[str, int] = {}
+        self._slow_samples: deque = deque(maxlen=max(slow_samples, 1))
+        self._lock = threading.Lock()
+
+    def record_slow_query(self, endpoint: str, statement: str, seconds: float) -> None:
+        statement = ' '.join(str(statement).split())[:MAX_STATEMENT_CHARS]
+        with self._lock:
+            self._slow_counts[endpoint] = self._slow_counts.get(endpoint, 0) + 1
+            self._slow_samples.append((endpoint, statement, seconds))
+
+    def render(self) -> str:
+        const = (('worker', os.getpid()),)
+        lines: List[str] = []
+        for histogram in (self.request_duration, self.request_queries, self.request_db_time, self.pool_checkout):
+            lines.extend(histogram.render(const))
+        with self._lock:
+            slow_counts = sorted(self._slow_counts.items())
+            samples = list(self._slow_samples)
+        lines.append('# HELP db_slow_queries_total Statements slower than DB_SLOW_QUERY_MS.')
+        lines.append('# TYPE db_slow_queries_total counter')
+        for endpoint, count in slow_counts:
+            lines.append(f'db_slow_queries_total{_labels((("endpoint", endpoint),) + const)} {count}')
+        lines.append('# HELP db_slow_query_sample_seconds Most recent slow statements.')
+        lines.append('# TYPE db_slow_query_sample_seconds gauge')
+        for position, (endpoint, statement, seconds) in enumerate(samples):
+            labels = (('endpoint', endpoint), ('statement', statement), ('sample', position)) + const
+            lines.append(f'db_slow_query_sample_seconds{_labels(labels)} {_number(round(seconds, 6))}')
+        return '\n'.join(lines) + '\n'
+
+
+def _is_local_request() -> bool:
+    # A proxy on the same host connects from loopback too; forwarded requests
+    # are never local.
+    if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+def _metrics_allowed(token: str) -> bool:
+    if token:
+        return request.headers.get('Authorization', '') == f'Bearer {token}'
+    return _is_local_request()
+
+
+def _endpoint_label() -> str:
+    rule = getattr(request, 'url_rule', None)
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _instrument_pool(engine, metrics: QueryMetrics) -> None:
+    pool = engine.pool
+    original = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return original()
+        finally:
+            metrics.pool_checkout.observe((), time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+
+def init_query_metrics(app, db, enabled: Optional[bool] = None) -> Optional[QueryMetrics]:
+    if enabled is None:
+        enabled = _env_flag('DB_METRICS_ENABLED')
+    if not enabled:
+        return None
+
+    metrics = QueryMetrics(
+        slow_query_ms=_env_int('DB_SLOW_QUERY_MS', 200),
+        slow_samples=_env_int('DB_SLOW_QUERY_SAMPLES', 20),
+    )
+    app.extensions['query_metrics'] = metrics
+    token = (os.getenv('METRICS_TOKEN') or '').strip()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'handle_error')
+    def _drop_timer(exception_context):
+        # A failed statement never reaches after_cursor_execute.
+        conn = exception_context.connection
+        started = conn.info.get('query_metrics_started') if conn is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_metrics_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        in_request = has_request_context()
+        if in_request:
+            stats = g.get('db_query_stats')
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+        if metrics.slow_query_seconds and elapsed >= metrics.slow_query_seconds:
+            metrics.record_slow_query(_endpoint_label() if in_request else '-', statement, elapsed)
+
+    _instrument_pool(engine, metrics)
+
+    @event.listens_for(engine, 'engine_disposed')
+    def _reinstrument_pool(disposed_engine):
+        # dispose() (e.g. gunicorn post_fork) swaps in a fresh pool.
+        _instrument_pool(disposed_engine, metrics)
+
+    @app.before_request
+    def _start_request_metrics():
+        g.db_query_stats = [0, 0.0]
+        g.request_metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        stats = g.pop('db_query_stats', None)
+        started = g.pop('request_metrics_started', None)
+        if stats is None or started is None:
+            return response
+        queries, db_seconds = stats
+        response.headers['X-DB-Queries'] = str(queries)
+        response.headers['X-DB-Time'] = f'{db_seconds * 1000.0:.2f}'
+        if request.path != '/metrics':
+            labels = (_endpoint_label(), request.method)
+            metrics.request_duration.observe(labels, time.perf_counter() - started)
+            metrics.request_queries.observe(labels, queries)
+            metrics.request_db_time.observe(labels, db_seconds)
+        return response
+
+    @app.get('/metrics')
+    def prometheus_metrics():
+        if not _metrics_allowed(token):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return metrics
@@ -0,0 +1,94 @@
+"""Recurring journal scheduler.
+
+Runs the same batched processor as ``process_recurring_journals.py``
+(`recurring_journal_system.process_recurring_journals`). Because the processor
+creates every occurrence that fell due while nothing was running, the scheduler
+also runs it once on start to catch up after downtime.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from threading import Thread
+
+import schedule
+
+from recurring_journal_system import due_template_ids, process_recurring_journals
+from scheduler_leases import singleton_job
+
+
+class RecurringJournalScheduler:
+    def __init__(self, app):
+        self.app = app
+        self.is_running = False
+        self._job = None
+        self._run_due = singleton_job(
+            app, 'recurring_journals', self.process_due_journals, window_seconds=12 * 3600
+        )
+
+    def process_due_journals(self):
+        with self.app.app_context():
+            try:
+                check_date = datetime.now()
+                created = process_recurring_journals(check_date)
+                if created:
+                    print(f'[RecurringJournalScheduler] ✓ created {len(created)} recurring entries')
+                # A failing template is logged and skipped by the processor;
+                # fail the run so the lease history records it and it is retried.
+                failed = due_template_ids(check_date)
+                if failed:
+                    raise RuntimeError(f'recurring templates still due after the run: {failed}')
+            except Exception as exc:
+                print(f'[RecurringJournalScheduler] ❌ Unexpected error: {exc}')
+                raise
+
+    def setup_schedule(self):
+        # Run once per day at 01:00 (same slot as the legacy cron job).
+        self._job = schedule.every().day.at('01:00').do(self._run_due)
+        print('[RecurringJournalScheduler] ✓ Recurring journals scheduled daily at 01:00')
+
+    def start(self):
+        if self.is_running:
+            print('[RecurringJournalScheduler] already running')
+            return
+
+        self.setup_schedule()
+        self.is_running = True
+
+        def run_scheduler():
+            # Catch up on anything that fell due while the scheduler was down.
+            # Under the same lease, so replicas starting together post it once.
+            self._run_due()
+            while self.is_running:
+                schedule.run_pending()
+                # Check every minute
+                import time as _time
+
+                _time.sleep(60)
+
+        thread = Thread(target=run_scheduler, daemon=True)
+        thread.start()
+        print('[RecurringJournalScheduler] 🚀 started')
+
+    def stop(self):
+        self.is_running = False
+        if self._job is not None:
+            schedule.cancel_job(self._job)
+            self._job = None
+        print('[RecurringJournalScheduler] stopped')
+
+
+_scheduler_instance: RecurringJournalScheduler | None = None
+
+
+def get_recurring_journal_scheduler(app):
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = RecurringJournalScheduler(app)
+    return _scheduler_instance
+
+
+def start_recurring_journal_scheduler(app):
+    scheduler = get_recurring_journal_scheduler(app)
+    scheduler.start()
+    return scheduler
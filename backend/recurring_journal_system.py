@@ -24,9 +24,20 @@ except ImportError:
         month = month % 12 + 1
         day = min(source_date.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
         return source_date.replace(year=year, month=month, day=day)
-from models import db, JournalEntry, JournalEntryLine
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+import logging
+from dataclasses import dataclass
+
+from models import db, JournalEntry, JournalEntryLine, allocate_journal_entry_numbers, assert_open_period
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, JSON, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, selectinload
+
+LOGGER = logging.getLogger(__name__)
+
+# عدد التكرارات (القيود) في كل معاملة عند التعويض عن فترة توقف
+DEFAULT_CHUNK_SIZE = 50
+# محاولات إعادة الدفعة إذا سبقها قيد آخر إلى نفس رقم القيد
+NUMBER_CONFLICT_RETRIES = 3
 
 
 class RecurringJournalTemplate(db.Model):
@@ -72,9 +83,10 @@ class RecurringJournalTemplate(db.Model):
     def __repr__(self):
         return f'<RecurringTemplate {self.name} - {self.frequency}>'
     
-    def calculate_next_run_date(self):
-        """حساب تاريخ التشغيل القادم"""
-        current = self.next_run_date
+    def calculate_next_run_date(self, current=None):
+        """حساب تاريخ التشغيل القادم (بعد `current`، افتراضياً next_run_date)"""
+        if current is None:
+            current = self.next_run_date
         
         if self.frequency == 'daily':
             next_date = current + timedelta(days=self.interval)
@@ -128,12 +140,29 @@ class RecurringJournalTemplate(db.Model):
         
         return True
     
+    def due_dates(self, check_date=None, limit=None):
+        """كل تواريخ التكرار المستحقة حتى `check_date` دون تعديل القالب
+
+        تبدأ من next_run_date وتتوقف عند check_date أو end_date (أيهما أسبق)،
+        فيمكن تعويض فترة توقف المجدول دفعة واحدة.
+        """
+        if not self.is_active or self.next_run_date is None:
+            return []
+        if check_date is None:
+            check_date = datetime.now()
+        cutoff = min(check_date, self.end_date) if self.end_date else check_date
+
+        dates = []
+        current = self.next_run_date
+        while current <= cutoff and (limit is None or len(dates) < limit):
+            dates.append(current)
+            current = self.calculate_next_run_date(current)
+        return dates
+    
     def create_journal_entry(self):
         """إنشاء قيد يومية من القالب"""
-        from backend.routes import _generate_journal_entry_number
-        
         # إنشاء القيد الرئيسي
-        entry_number = _generate_journal_entry_number(self.next_run_date)
+        entry_number = allocate_journal_entry_numbers(self.next_run_date.year, 1)[0]
         
         new_entry = JournalEntry(
             entry_number=entry_number,
@@ -154,17 +183,7 @@ class RecurringJournalTemplate(db.Model):
         for template_line in self.template_lines:
             new_line = JournalEntryLine(
                 journal_entry_id=new_entry.id,
-                account_id=template_line.account_id,
-                cash_debit=template_line.cash_debit,
-                cash_credit=template_line.cash_credit,
-                debit_18k=template_line.debit_18k,
-                credit_18k=template_line.credit_18k,
-                debit_21k=template_line.debit_21k,
-                credit_21k=template_line.credit_21k,
-                debit_22k=template_line.debit_22k,
-                credit_22k=template_line.credit_22k,
-                debit_24k=template_line.debit_24k,
-                credit_24k=template_line.credit_24k,
+                **template_line.amounts(),
             )
             db.session.add(new_line)
         
@@ -236,6 +255,22 @@ class RecurringJournalLine(db.Model):
     # العلاقة مع الحساب
     account = relationship('Account', foreign_keys=[account_id])
     
+    def amounts(self):
+        """الحساب والمبالغ كما تُنسخ إلى سطر القيد المنشأ"""
+        return {
+            'account_id': self.account_id,
+            'cash_debit': self.cash_debit,
+            'cash_credit': self.cash_credit,
+            'debit_18k': self.debit_18k,
+            'credit_18k': self.credit_18k,
+            'debit_21k': self.debit_21k,
+            'credit_21k': self.credit_21k,
+            'debit_22k': self.debit_22k,
+            'credit_22k': self.credit_22k,
+            'debit_24k': self.debit_24k,
+            'credit_24k': self.credit_24k,
+        }
+    
     def to_dict(self):
         """تحويل خط القيد إلى قاموس"""
         return {
@@ -260,38 +295,180 @@ class RecurringJournalLine(db.Model):
 # JournalEntry.recurring_template_id = Column(Integer, ForeignKey('recurring_journal_template.id'))
 
 
-def process_recurring_journals(check_date=None):
+@dataclass
+class CreatedRecurringEntry:
+    """قيد دوري تم إنشاؤه (نفس الحقول التي يعرضها السكريبت والـ API)"""
+    id: int
+    entry_number: str
+    date: datetime
+    description: str
+    recurring_template_id: int
+
+
+def _lock_template(template_id):
+    """تحميل القالب مع قفل صفه على PostgreSQL حتى لا يعالجه عاملان معاً"""
+    query = (
+        RecurringJournalTemplate.query
+        .filter(RecurringJournalTemplate.id == template_id)
+        .options(selectinload(RecurringJournalTemplate.template_lines))
+        .execution_options(populate_existing=True)
+    )
+    if db.session.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True, of=RecurringJournalTemplate)
+    return query.first()
+
+
+def _create_occurrences(template, dates):
+    """إدراج قيود التواريخ `dates` وأسطرها دفعة واحدة (بدون commit)"""
+    existing = set(
+        db.session.scalars(
+            select(JournalEntry.date).where(
+                JournalEntry.recurring_template_id == template.id,
+                JournalEntry.date.in_(dates),
+            )
+        )
+    )
+    pending = [occurrence for occurrence in dates if occurrence not in existing]
+
+    numbers = {}
+    for year in sorted({occurrence.year for occurrence in pending}):
+        in_year = [occurrence for occurrence in pending if occurrence.year == year]
+        numbers.update(zip(in_year, allocate_journal_entry_numbers(year, len(in_year))))
+
+    created = []
+    if pending:
+        # Core inserts skip the ORM listeners; a catch-up must not write into a closed year.
+        assert_open_period(db.session.connection(), min(pending), 'Recurring journal entry')
+        description = f"{template.description} (دوري - {template.name})"
+        total = template.total_created or 0
+        rows = []
+        for offset, occurrence in enumerate(pending, start=1):
+            rows.append({
+                'entry_number': numbers[occurrence],
+                'date': occurrence,
+                'description': description,
+                'entry_type': 'دوري',
+                'reference_type': 'recurring_template',
+                'reference_id': template.id,
+                'reference_number': f"REC-{template.id}-{total + offset}",
+                'created_by': 'نظام القيود الدورية',
+                'recurring_template_id': template.id,
+            })
+        inserted = db.session.execute(
+            insert(JournalEntry).returning(
+                JournalEntry.id, JournalEntry.entry_number, JournalEntry.date,
+                sort_by_parameter_order=True,
+            ),
+            rows,
+        ).all()
+
+        line_values = [line.amounts() for line in template.template_lines]
+        if line_values:
+            db.session.execute(
+                insert(JournalEntryLine),
+                [
+                    dict(values, journal_entry_id=entry_id, entry_date=entry_date)
+                    for entry_id, _number, entry_date in inserted
+                    for values in line_values
+                ],
+            )
+        created = [
+            CreatedRecurringEntry(entry_id, number, entry_date, description, template.id)
+            for entry_id, number, entry_date in inserted
+        ]
+
+    # التواريخ الموجودة مسبقاً تُعتبر منفذة: نتقدم بعدها دون تكرارها
+    template.last_created_date = dates[-1]
+    template.total_created = (template.total_created or 0) + len(created)
+    template.next_run_date = template.calculate_next_run_date(dates[-1])
+    return created
+
+
+def process_template(template_id, check_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """تعويض كل التكرارات المستحقة لقالب واحد على دفعات
+
+    كل دفعة (حتى `chunk_size` قيد) في معاملة مستقلة، فالخطأ يوقف هذا القالب
+    فقط ويحتفظ بالدفعات السابقة. التشغيل مرة أخرى آمن: التكرار الذي له قيد
+    بنفس (القالب، التاريخ) لا يُنشأ مجدداً. تعارض رقم القيد مع ترحيل متزامن
+    يعيد الدفعة بأرقام جديدة (حتى NUMBER_CONFLICT_RETRIES مرات).
+    """
+    if check_date is None:
+        check_date = datetime.now()
+    chunk_size = max(int(chunk_size), 1)
+
+    created = []
+    conflicts = 0
+    while True:
+        try:
+            template = _lock_template(template_id)
+            if template is None or not template.auto_create:
+                db.session.rollback()
+                break
+            dates = template.due_dates(check_date, limit=chunk_size)
+            if not dates:
+                db.session.rollback()
+                break
+            chunk = _create_occurrences(template, dates)
+            db.session.commit()
+        except IntegrityError as e:
+            # A concurrent posting took one of the allocated numbers; renumber the chunk.
+            db.session.rollback()
+            conflicts += 1
+            if conflicts < NUMBER_CONFLICT_RETRIES:
+                LOGGER.warning('recurring template %s: entry number conflict, retrying chunk', template_id)
+                continue
+            LOGGER.exception('recurring template %s failed', template_id)
+            print(f"✗ خطأ في إنشاء قيود القالب الدوري {template_id}: {str(e)}")
+            break
+        except Exception as e:
+            db.session.rollback()
+            LOGGER.exception('recurring template %s failed', template_id)
+            print(f"✗ خطأ في إنشاء قيود القالب الدوري {template_id}: {str(e)}")
+            break
+        conflicts = 0
+        created.extend(chunk)
+        if len(dates) < chunk_size:
+            break
+    return created
+
+
+def due_template_ids(check_date):
+    """معرفات القوالب النشطة المستحقة في `check_date`
+
+    بعد التشغيل، أي قالب ما زال مستحقاً هو قالب فشلت معالجته.
+    """
+    return db.session.scalars(
+        select(RecurringJournalTemplate.id)
+        .where(
+            RecurringJournalTemplate.is_active.is_(True),
+            RecurringJournalTemplate.auto_create.is_(True),
+            RecurringJournalTemplate.next_run_date <= check_date,
+        )
+        .order_by(RecurringJournalTemplate.id)
+    ).all()
+
+
+def process_recurring_journals(check_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
     """
     معالجة جميع القيود الدورية النشطة وإنشاء القيود اللازمة
     
     Args:
         check_date: التاريخ المراد التحقق منه (افتراضياً: اليوم)
+        chunk_size: عدد القيود في كل معاملة
     
     Returns:
-        قائمة بالقيود المنشأة
+        قائمة بالقيود المنشأة (CreatedRecurringEntry)
     """
     if check_date is None:
         check_date = datetime.now()
     
-    # جلب جميع القوالب النشطة
-    templates = RecurringJournalTemplate.query.filter_by(
-        is_active=True,
-        auto_create=True
-    ).all()
-    
     created_entries = []
     
-    for template in templates:
-        # التحقق من ضرورة إنشاء قيد
-        while template.should_create_entry(check_date):
-            try:
-                entry = template.create_journal_entry()
-                created_entries.append(entry)
-                print(f"✓ تم إنشاء قيد دوري: {template.name} - رقم القيد: {entry.entry_number}")
-            except Exception as e:
-                print(f"✗ خطأ في إنشاء قيد دوري {template.name}: {str(e)}")
-                db.session.rollback()
-                break
+    for template_id in due_template_ids(check_date):
+        created = process_template(template_id, check_date, chunk_size)
+        if created:
+            print(f"✓ تم إنشاء {len(created)} قيد دوري من القالب {template_id}")
+        created_entries.extend(created)
     
     return created_entries
 
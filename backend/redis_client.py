@@ -11,6 +11,7 @@ The application must continue to work without Redis.
 from __future__ import annotations
 
 import os
+import time
 from typing import Optional
 
 
@@ -18,11 +19,27 @@ def get_redis_url() -> str:
     return (os.getenv('REDIS_URL') or '').strip()
 
 
+# Cached client per process. A failed connection is retried at most every
+# _RETRY_SECONDS so hot paths (login) do not pay a connect+ping per call.
+_RETRY_SECONDS = 30.0
+_client: Optional[object] = None
+_client_url: str = ''
+_last_failure_at: float = 0.0
+
+
 def get_redis() -> Optional[object]:
+    global _client, _client_url, _last_failure_at
+
     url = get_redis_url()
     if not url:
         return None
 
+    if _client is not None and _client_url == url:
+        return _client
+
+    if _client_url == url and (time.monotonic() - _last_failure_at) < _RETRY_SECONDS:
+        return None
+
     try:
         import redis  # type: ignore
     except Exception:
@@ -32,6 +49,12 @@ def get_redis() -> Optional[object]:
         client = redis.Redis.from_url(url, decode_responses=True)
         # Cheap connectivity check; if it fails we treat Redis as unavailable.
         client.ping()
-        return client
     except Exception:
+        _client = None
+        _client_url = url
+        _last_failure_at = time.monotonic()
         return None
+
+    _client = client
+    _client_url = url
+    return client
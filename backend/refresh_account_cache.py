@@ -11,20 +11,14 @@ def refresh_account_cache():
     """
     تحديث الـ cache للبحث السريع عن الحسابات
     """
-    from routes import _ACCOUNT_NUMBER_CACHE
+    from mapping_resolver import invalidate_mapping_cache, mapping_resolver
     
-    # مسح الـ cache القديم
-    _ACCOUNT_NUMBER_CACHE.clear()
+    # مسح الـ cache القديم (وإبلاغ بقية الـ workers عبر Redis) ثم إعادة التحميل
+    invalidate_mapping_cache()
+    size = len(mapping_resolver.table().account_ids)
     
-    # جلب جميع الحسابات وإضافتها للـ cache
-    all_accounts = Account.query.all()
-    
-    for account in all_accounts:
-        if account.account_number:
-            _ACCOUNT_NUMBER_CACHE[str(account.account_number)] = account.id
-    
-    print(f"✅ تم تحديث cache الحسابات: {len(_ACCOUNT_NUMBER_CACHE)} حساب")
-    return len(_ACCOUNT_NUMBER_CACHE)
+    print(f"✅ تم تحديث cache الحسابات: {size} حساب")
+    return size
 
 
 def preload_critical_accounts():
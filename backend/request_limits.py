@@ -0,0 +1,140 @@
+"""Per-request DB limits that keep heavy reports from starving POS endpoints.
+
+Two mechanisms, both configured from env:
+
+1) Statement timeouts (PostgreSQL only): every transaction opened while serving
+   a heavy endpoint (reports, full general ledger) runs `SET LOCAL
+   statement_timeout`. Regular requests are only bounded when
+   DB_STATEMENT_TIMEOUT_MS is set; long synchronous maintenance endpoints
+   (year close, resets, chart import, ...) never are, so they cannot be cut off
+   halfway (STATEMENT_TIMEOUT_EXEMPT_PATH_PREFIXES, defaults below).
+     DB_HEAVY_STATEMENT_TIMEOUT_MS  default 120000 (0 disables)
+     DB_STATEMENT_TIMEOUT_MS        default 0 (off)
+
+2) Heavy-request gate: at most HEAVY_REQUEST_MAX_CONCURRENCY heavy requests run
+   at once per worker process; others wait up to HEAVY_REQUEST_QUEUE_SECONDS and
+   then get 503 + Retry-After. With gthread workers this leaves the remaining
+   threads (and DB pool connections) free for cashier traffic.
+     HEAVY_REQUEST_MAX_CONCURRENCY  default 2 (0 disables)
+     HEAVY_REQUEST_QUEUE_SECONDS    default 5
+
+Heavy endpoints are matched by path prefix (HEAVY_REQUEST_PATH_PREFIXES,
+comma-separated; defaults below). Requests replayed by the background job worker
+(jobs.py) are exempt from both.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional, Tuple
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event, text
+
+DEFAULT_HEAVY_PATH_PREFIXES = (
+    '/api/reports/',
+    '/api/general_ledger_all',
+    '/api/trial_balance',
+    '/api/gold-costing/recompute',
+)
+
+# Synchronous maintenance/export endpoints that legitimately run long; a
+# statement timeout would abort them halfway.
+DEFAULT_TIMEOUT_EXEMPT_PATH_PREFIXES = (
+    '/api/fiscal-years/',
+    '/api/system/reset',
+    '/api/accounts/import',
+    '/api/accounts/renumber',
+    '/api/gold-costing/reset',
+    '/api/safe-boxes/gold/unify',
+    '/api/initialize-payment-system',
+    '/api/statements/',
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_prefixes(name: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+    raw = (os.getenv(name) or '').strip()
+    if not raw:
+        return default
+    return tuple(p.strip() for p in raw.split(',') if p.strip())
+
+
+def _heavy_prefixes() -> Tuple[str, ...]:
+    return _env_prefixes('HEAVY_REQUEST_PATH_PREFIXES', DEFAULT_HEAVY_PATH_PREFIXES)
+
+
+def is_heavy_path(path: str, prefixes: Optional[Tuple[str, ...]] = None) -> bool:
+    path = path or ''
+    return any(path.startswith(prefix) for prefix in (prefixes or _heavy_prefixes()))
+
+
+def init_request_limits(app, db) -> None:
+    statement_timeout_ms = _env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    heavy_statement_timeout_ms = _env_int('DB_HEAVY_STATEMENT_TIMEOUT_MS', 120000)
+    max_heavy = _env_int('HEAVY_REQUEST_MAX_CONCURRENCY', 2)
+    queue_seconds = max(_env_int('HEAVY_REQUEST_QUEUE_SECONDS', 5), 0)
+    prefixes = _heavy_prefixes()
+    exempt_prefixes = _env_prefixes('STATEMENT_TIMEOUT_EXEMPT_PATH_PREFIXES', DEFAULT_TIMEOUT_EXEMPT_PATH_PREFIXES)
+
+    heavy_gate = threading.BoundedSemaphore(max_heavy) if max_heavy > 0 else None
+    app.extensions['request_limits'] = {
+        'statement_timeout_ms': statement_timeout_ms,
+        'heavy_statement_timeout_ms': heavy_statement_timeout_ms,
+        'heavy_max_concurrency': max_heavy,
+        'heavy_path_prefixes': prefixes,
+        'timeout_exempt_path_prefixes': exempt_prefixes,
+    }
+
+    @app.before_request
+    def _classify_and_gate_request():
+        # Requests replayed by the background job worker are exactly the ones
+        # that should not be gated or cut short.
+        heavy = is_heavy_path(request.path, prefixes) and not g.get('background_job_id')
+        g.request_is_heavy = heavy
+        if g.get('background_job_id') or is_heavy_path(request.path, exempt_prefixes):
+            g.statement_timeout_ms = 0
+        else:
+            g.statement_timeout_ms = heavy_statement_timeout_ms if heavy else statement_timeout_ms
+        g.heavy_slot_acquired = False
+        if not heavy or heavy_gate is None:
+            return None
+        if not heavy_gate.acquire(timeout=queue_seconds):
+            response = jsonify({
+                'success': False,
+                'error': 'server_busy',
+                'message': 'يوجد عدد كبير من التقارير قيد التنفيذ. الرجاء المحاولة بعد قليل',
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(queue_seconds, 1))
+            return response
+        g.heavy_slot_acquired = True
+        return None
+
+    @app.teardown_request
+    def _release_heavy_slot(_exc=None):
+        if heavy_gate is not None and g.pop('heavy_slot_acquired', False):
+            heavy_gate.release()
+
+    if statement_timeout_ms <= 0 and heavy_statement_timeout_ms <= 0:
+        return
+
+    @event.listens_for(db.session, 'after_begin')
+    def _apply_statement_timeout(session, transaction, connection):
+        if not has_request_context():
+            return
+        if connection.dialect.name not in ('postgresql', 'postgres'):
+            return
+        timeout_ms = g.get('statement_timeout_ms') or 0
+        if timeout_ms > 0:
+            connection.execute(text(f'SET LOCAL statement_timeout = {int(timeout_ms)}'))
@@ -20,12 +20,14 @@ from datetime import datetime
 from typing import Dict
 
 from app import app, db
+from fiscal_years import clear_fiscal_years
 from gold_costing_service import GoldCostingService
 from models import (
     Account,
     AuditLog,
     Customer,
     GoldPrice,
+    InventoryCostingCheckpoint,
     InventoryCostingConfig,
     Invoice,
     InvoiceItem,
@@ -96,6 +98,8 @@ def reset_operations(
     stats['supplier_gold_transactions'] = _bulk_delete(SupplierGoldTransaction)
     stats['journal_entry_lines'] = _bulk_delete(JournalEntryLine)
     stats['journal_entries'] = _bulk_delete(JournalEntry)
+    # Closing snapshots summarise the deleted rows; closed years would reject new postings.
+    stats.update(clear_fiscal_years())
     stats['invoices'] = _bulk_delete(Invoice)
 
     if purge_vouchers:
@@ -119,6 +123,7 @@ def reset_operations(
         stats['suppliers'] = _bulk_delete(Supplier)
 
     stats['inventory_costing_config'] = _bulk_delete(InventoryCostingConfig)
+    stats['inventory_costing_checkpoints'] = _bulk_delete(InventoryCostingCheckpoint)
     db.session.flush()
     # Recreate an empty config row for future operations
     GoldCostingService._get_config()  # pylint: disable=protected-access
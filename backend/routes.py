@@ -4,7 +4,8 @@ import json
 import os
 import shutil
 import subprocess
-from flask import Blueprint, request, jsonify, g, current_app, send_file
+from flask import Blueprint, Response, request, jsonify, g, current_app, send_file, stream_with_context, url_for
+import csv
 import io
 import os
 import json
@@ -12,8 +13,9 @@ import tempfile
 import zipfile
 import sqlite3
 from datetime import datetime
+from types import SimpleNamespace
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy.orm import sessionmaker, joinedload, contains_eager
 from sqlalchemy import func, or_, and_, case, cast, String
 from gold_price import fetch_gold_price, save_gold_price
 from models import (
@@ -35,6 +37,7 @@ from models import (
     InvoicePayment,
     SafeBoxTransaction,
     AccountingMapping,
+    InventoryCostingCheckpoint,
     InventoryCostingConfig,
     WeightClosingOrder,
     WeightClosingExecution,
@@ -51,6 +54,10 @@ from models import (
     Category,
     AuditLog,
     SupplierGoldTransaction,
+    BackgroundJob,
+    SchedulerJobRun,
+    FiscalYear,
+    ClosedFiscalYearError,
 )
 from utils import normalize_number
 try:
@@ -59,6 +66,8 @@ except ImportError:  # Local scripts running from backend/ directory
     from config import WEIGHT_SUPPORT_ACCOUNTS, REQUIRE_AUTH_FOR_INVOICE_CREATE
 from office_supplier_service import ensure_office_supplier
 from office_account_service import ensure_office_account
+from office_balances import apply_office_deltas, reservation_deltas
+from chart_import import ChartImportError, import_chart, read_chart, renumber_chart
 from party_account_service import ensure_customer_accounts, ensure_supplier_accounts
 from code_generator import generate_item_code, generate_barcode_from_item_code, validate_item_code
 from dual_system_helpers import (
@@ -68,11 +77,66 @@ from dual_system_helpers import (
     link_memo_accounts_helper,
 )
 from services.journals import create_wage_weight_release_journal
+from fiscal_years import (
+    ACCOUNT_COLUMNS as FISCAL_ACCOUNT_COLUMNS,
+    account_totals,
+    clear_fiscal_years,
+    close_fiscal_year,
+    closed_through,
+    extend_ledger_partitions,
+    reopen_fiscal_year,
+    safe_box_totals,
+    year_start,
+)
+from date_ranges import (
+    date_bounds,
+    day_range,
+    parse_iso_date as _parse_iso_date,
+    store_now,
+    store_today,
+    within,
+    year_range,
+)
 from services.weight_execution import list_weight_profiles, resolve_weight_profile
-from gold_costing_service import GoldCostingService
+from gold_costing_service import GoldCostingService, rebuild_costing
+from mapping_resolver import DEFAULT_MAPPING_OPERATION_TYPE, invalidate_mapping_cache, mapping_resolver
+from party_statement import CSV_COLUMNS, DEFAULT_PAGE_SIZE, PARTY_TYPES, InvalidCursor, PartyStatement, resolve_scope
+from weight_closing_queue import iter_open_orders, open_totals, recompute_open_totals
+from jobs import (
+    ACTIVE_STATUSES as JOB_ACTIVE_STATUSES,
+    owner_ref as job_owner_ref,
+    background_capable,
+    request_cancel as request_job_cancel,
+    user_can_see_job,
+)
+from idempotency import idempotent
+from invoice_posting_context import current_posting_context, uses_posting_context
+from general_ledger_export import (
+    EXPORT_FORMATS as LEDGER_EXPORT_FORMATS,
+    WRITERS as LEDGER_EXPORT_WRITERS,
+    LedgerFilters,
+    account_branches as ledger_account_branches,
+    default_columns,
+    export_chunks as ledger_export_chunks,
+    ledger_rows,
+    line_weight as ledger_line_weight,
+    parse_columns,
+    xlsx_available,
+)
+from ledger_checks import (
+    BRIDGE_ALERT_TYPE,
+    INVENTORY_ALERT_TYPE,
+    bridge_balance_report,
+    check_statuses,
+    inventory_reconciliation_report,
+    last_check,
+)
 from category_weight_tracking import (
+    count_category_weight_balances,
     get_category_weight_balances,
+    get_category_weight_balances_as_of,
     record_category_weight_movements_for_invoice_payload,
+    refresh_category_weight_snapshots,
 )
 from datetime import datetime, date, time, timedelta
 from collections import defaultdict
@@ -518,6 +582,12 @@ def _infer_permission_code(path: str, method: str) -> str | None:
         code = f'journal.{action}'
         return code if code in ALL_PERMISSIONS else None
 
+    # Unified party statements: /statements/<party_type>/<id> -> <party>s.view
+    if resource == 'statements' and remainder:
+        party_module = _PERMISSION_RESOURCE_MAP.get(f'{remainder[0]}s')
+        code = f'{party_module}.view' if party_module else None
+        return code if code in ALL_PERMISSIONS else None
+
     if resource == 'gold_price' or resource == 'gold-price':
         if m == 'GET':
             action = 'view'
@@ -641,19 +711,6 @@ def _enforce_api_auth_and_permissions():
     return None
 
 
-def _parse_iso_date(value, field_name: str):
-    if value in (None, ''):
-        return None
-    if isinstance(value, date):
-        return value
-    if isinstance(value, datetime):
-        return value.date()
-    try:
-        return date.fromisoformat(str(value))
-    except ValueError:
-        raise ValueError(f'Invalid {field_name} format. Expected YYYY-MM-DD')
-
-
 class InlineItemCreationError(Exception):
     """Validation/creation errors for inline purchase items."""
 
@@ -825,6 +882,168 @@ def review_system_alert(alert_id: int):
     return jsonify({'success': True, 'alert': row.to_dict()}), 200
 
 
+def _visible_job_or_404(job_id: int):
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or not user_can_see_job(g.get('current_user'), job):
+        return None
+    return job
+
+
+@api.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Background jobs of the current user (all jobs for admins), newest first."""
+    query = BackgroundJob.query
+    user = g.get('current_user')
+    if not bool(getattr(user, 'is_admin', False)):
+        user_id, user_kind, _username = job_owner_ref(user)
+        query = query.filter(
+            BackgroundJob.created_by_user_id == user_id,
+            BackgroundJob.created_by_user_kind == user_kind,
+        )
+    status = (request.args.get('status') or '').strip().lower()
+    if status:
+        query = query.filter(BackgroundJob.status == status)
+    job_type = (request.args.get('job_type') or '').strip()
+    if job_type:
+        query = query.filter(BackgroundJob.job_type == job_type)
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    rows = query.order_by(BackgroundJob.id.desc()).limit(limit).all()
+    return jsonify({'success': True, 'count': len(rows), 'jobs': [r.to_dict(include_result=False) for r in rows]}), 200
+
+
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id: int):
+    """Poll a background job: status, progress and (once finished) its JSON result."""
+    job = _visible_job_or_404(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'job_not_found'}), 404
+    payload = job.to_dict()
+    if job.result_content_type is not None:
+        payload['result_url'] = url_for('api.get_job_result', job_id=job.id)
+    return jsonify({'success': True, 'job': payload}), 200
+
+
+@api.route('/jobs/<int:job_id>/result', methods=['GET'])
+def get_job_result(job_id: int):
+    """Download the file produced by a finished job (or its JSON result)."""
+    job = _visible_job_or_404(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'job_not_found'}), 404
+    if job.status in JOB_ACTIVE_STATUSES:
+        return jsonify({'success': False, 'error': 'job_not_finished', 'status': job.status}), 409
+    if job.result_content_type is None:
+        return jsonify({'success': True, 'status': job.status, 'result': job.to_dict()['result']}), 200
+
+    response = Response(job.result_blob or b'', content_type=job.result_content_type)
+    if job.result_filename:
+        response.headers['Content-Disposition'] = f'attachment; filename="{job.result_filename}"'
+    return response
+
+
+@api.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id: int):
+    """Cancel a queued job, or ask a running one to stop at its next checkpoint."""
+    job = _visible_job_or_404(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'job_not_found'}), 404
+    if job.status not in JOB_ACTIVE_STATUSES:
+        return jsonify({'success': False, 'error': 'job_finished', 'job': job.to_dict(include_result=False)}), 409
+    job = request_job_cancel(job)
+    return jsonify({'success': True, 'job': job.to_dict(include_result=False)}), 202
+
+
+@api.route('/scheduler/runs', methods=['GET'])
+def list_scheduler_runs():
+    """Scheduled job runs (admins): per-job duration/outcome summary and the latest runs."""
+    user = g.get('current_user')
+    if not bool(getattr(user, 'is_admin', False)):
+        return jsonify({'success': False, 'error': 'forbidden'}), 403
+
+    days = min(max(request.args.get('days', 7, type=int), 1), 90)
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = (
+        db.session.query(
+            SchedulerJobRun.job_name,
+            func.count(SchedulerJobRun.id),
+            func.sum(case((SchedulerJobRun.status == 'failed', 1), else_=0)),
+            func.avg(SchedulerJobRun.duration_ms),
+            func.max(SchedulerJobRun.duration_ms),
+            func.max(SchedulerJobRun.started_at),
+        )
+        .filter(SchedulerJobRun.started_at >= since)
+        .group_by(SchedulerJobRun.job_name)
+        .order_by(func.max(SchedulerJobRun.duration_ms).desc())
+        .all()
+    )
+    summary = [
+        {
+            'job_name': job_name,
+            'runs': runs,
+            'failed': int(failed or 0),
+            'avg_duration_ms': round(float(avg_ms), 1) if avg_ms is not None else None,
+            'max_duration_ms': max_ms,
+            'last_started_at': last_started.isoformat() if last_started else None,
+        }
+        for job_name, runs, failed, avg_ms, max_ms, last_started in rows
+    ]
+
+    query = SchedulerJobRun.query
+    job_name = (request.args.get('job_name') or '').strip()
+    if job_name:
+        query = query.filter(SchedulerJobRun.job_name == job_name)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    recent = query.order_by(SchedulerJobRun.started_at.desc()).limit(limit).all()
+    return jsonify({'success': True, 'days': days, 'jobs': summary, 'runs': [r.to_dict() for r in recent]}), 200
+
+
+@api.app_errorhandler(ClosedFiscalYearError)
+def handle_closed_fiscal_year(error):
+    db.session.rollback()
+    return jsonify({'success': False, 'error': 'fiscal_year_closed', 'message': str(error)}), 409
+
+
+@api.route('/fiscal-years', methods=['GET'])
+@require_permission('system.settings')
+def list_fiscal_years():
+    """Fiscal years with their close status; years without a row are open."""
+    rows = FiscalYear.query.order_by(FiscalYear.year.desc()).all()
+    return jsonify({
+        'success': True,
+        'closed_through': closed_through(),
+        'fiscal_years': [row.to_dict() for row in rows],
+    }), 200
+
+
+@api.route('/fiscal-years/<int:year>/close', methods=['POST'])
+@require_permission('system.settings')
+def close_fiscal_year_endpoint(year):
+    """Snapshot closing balances of `year` and make its entries read-only."""
+    user_name = getattr(getattr(g, 'current_user', None), 'username', None)
+    try:
+        result = close_fiscal_year(year, closed_by=user_name)
+        db.session.commit()
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(exc)}), 400
+    # After the commit: the partition DDL would wait on the close's own locks.
+    extend_ledger_partitions()
+    return jsonify({'success': True, 'fiscal_year': result}), 200
+
+
+@api.route('/fiscal-years/<int:year>/reopen', methods=['POST'])
+@require_permission('system.settings')
+def reopen_fiscal_year_endpoint(year):
+    """Drop the snapshot of the latest closed year so its entries can be edited again."""
+    try:
+        result = reopen_fiscal_year(year)
+        db.session.commit()
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(exc)}), 400
+    return jsonify({'success': True, 'fiscal_year': result}), 200
+
+
 def _coerce_float(value, default=0.0):
     if value in (None, '', False):
         return default
@@ -899,7 +1118,11 @@ def get_current_gold_price():
     source = 'database'
     updated_at = None
 
-    latest = GoldPrice.query.order_by(GoldPrice.date.desc()).first()
+    posting = current_posting_context()
+    if posting is not None:
+        latest = posting.latest_gold_price
+    else:
+        latest = GoldPrice.query.order_by(GoldPrice.date.desc()).first()
     if latest and latest.price:
         try:
             price_per_gram_24k = (latest.price / 31.1035) * 3.75
@@ -1254,7 +1477,8 @@ def list_weight_closing_profiles():
 
 
 def _load_weight_closing_settings():
-    settings_row = Settings.query.first()
+    posting = current_posting_context()
+    settings_row = posting.settings if posting is not None else Settings.query.first()
     if settings_row and settings_row.weight_closing_settings:
         try:
             payload = json.loads(settings_row.weight_closing_settings)
@@ -1283,7 +1507,7 @@ def _generate_journal_entry_number(prefix='JE'):
     year = today.year
     yearly_count = (
         db.session.query(func.count(JournalEntry.id))
-        .filter(db.extract('year', JournalEntry.date) == year)
+        .filter(*within(JournalEntry.date, *year_range(year)))
         .scalar()
         or 0
     ) + 1
@@ -1409,6 +1633,7 @@ def _resolve_inventory_account_id_for_invoice(invoice_type: str, gold_type: str)
         preferred = settings.get('inventory_account_id')
 
     fallback_number = 1310 if kind == 'scrap' else 1300
+    posting = current_posting_context()
 
     def _resolve(value) -> int | None:
         if value in (None, '', 0, False):
@@ -1420,17 +1645,23 @@ def _resolve_inventory_account_id_for_invoice(invoice_type: str, gold_type: str)
         if v <= 0:
             return None
 
-        acc = Account.query.get(v)
+        acc = posting.account(v) if posting is not None else Account.query.get(v)
         if not acc:
-            acc = Account.query.filter_by(account_number=str(v)).first()
+            acc = _account_by_number(v)
         return int(acc.id) if acc else None
 
+    def _account_by_number(number) -> Account | None:
+        if posting is not None:
+            return posting.account_by_number(number)
+        return Account.query.filter_by(account_number=str(number)).first()
+
     resolved = _resolve(preferred)
     if resolved:
         return resolved
 
-    # Default: resolve by chart account_number.
-    return _resolve(fallback_number)
+    # Default: resolve by chart account_number (never as an id).
+    acc = _account_by_number(fallback_number)
+    return int(acc.id) if acc else None
 
 
 def _invoice_weight_in_main_karat(invoice: Invoice) -> float:
@@ -1438,7 +1669,10 @@ def _invoice_weight_in_main_karat(invoice: Invoice) -> float:
         return 0.0
     try:
         if hasattr(invoice, 'calculate_total_weight'):
-            value = invoice.calculate_total_weight() or 0.0
+            posting = current_posting_context()
+            value = invoice.calculate_total_weight(
+                main_karat=float(posting.main_karat) if posting is not None else None
+            ) or 0.0
             if value:
                 return float(value)
     except Exception:
@@ -1848,10 +2082,16 @@ def update_settings():
             settings.backup_retention_count = count
     
     db.session.commit()
+
+    if 'payment_methods' in data:
+        from payment_methods_routes import sync_payment_methods_from_settings
+        sync_payment_methods_from_settings()
+
     return jsonify(settings.to_dict())
 
 @api.route('/system/reset', methods=['POST'])
 @require_permission('system.settings')
+@background_capable(title='System reset')
 def system_reset():
     """System reset with multiple safety levels.
 
@@ -2109,12 +2349,16 @@ def _reset_transactions():
         # حذف القيود المحاسبية وسطورها
         JournalEntryLine.query.delete()
         JournalEntry.query.delete()
+        # لقطات الإقفال السنوي تلخص القيود المحذوفة، والسنوات المقفلة كانت ستمنع الترحيل فيها
+        clear_fiscal_years()
 
         # حذف الفواتير وعناصرها ومدفوعاتها
         InvoicePayment.query.delete()
         InvoiceKaratLine.query.delete()
         InvoiceItem.query.delete()
         Invoice.query.delete()
+        # نقاط استئناف حساب متوسط التكلفة مبنية على الفواتير المحذوفة
+        InventoryCostingCheckpoint.query.delete()
 
         # حذف السندات وسطورها
         VoucherAccountLine.query.delete()
@@ -2245,6 +2489,8 @@ def _reset_balances_only():
     """Reset only SafeBox ledger movements (opening custody to zero)."""
     try:
         SafeBoxTransaction.query.delete()
+        # Closed-year snapshots would keep the deleted movements in the balances.
+        clear_fiscal_years()
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -2427,6 +2673,7 @@ def _reset_full_system_wipe():
         Branch,
         BonusRule,
         Category,
+        CategoryWeightMonthlySnapshot,
         CategoryWeightMovement,
         GoldPrice,
         InventoryCostingConfig,
@@ -2452,8 +2699,10 @@ def _reset_full_system_wipe():
             print(f"⚠️ {msg}")
 
     # 1) Transactions/operational tables that block SafeBox/Account deletion
+    _step('Delete CategoryWeightMonthlySnapshot (blocks SafeBox)', lambda: CategoryWeightMonthlySnapshot.query.delete())
     _step('Delete CategoryWeightMovement (blocks SafeBox)', lambda: CategoryWeightMovement.query.delete())
     _step('Delete SafeBoxTransaction (blocks SafeBox)', lambda: SafeBoxTransaction.query.delete())
+    _step('Delete fiscal years and closing snapshots (block Account/SafeBox)', clear_fiscal_years)
     _step('Delete recurring journals (block Account)', lambda: RecurringJournalLine.query.delete())
     _step('Delete recurring journal templates (block Account)', lambda: RecurringJournalTemplate.query.delete())
 
@@ -2485,6 +2734,7 @@ def _reset_full_system_wipe():
     _step('Delete WeightClosingLog', lambda: WeightClosingLog.query.delete())
     _step('Delete SupplierGoldTransaction', lambda: SupplierGoldTransaction.query.delete())
     _step('Delete InventoryCostingConfig', lambda: InventoryCostingConfig.query.delete())
+    _step('Delete InventoryCostingCheckpoint', lambda: InventoryCostingCheckpoint.query.delete())
 
     # 2) Master data that can reference safebox/account
     _step('Detach PaymentMethod -> SafeBox (default/settlement)', lambda: PaymentMethod.query.update({
@@ -2578,6 +2828,7 @@ def _reset_full_system_wipe():
             'accounting_mappings': AccountingMapping.query.count(),
             'accounts': Account.query.count(),
             'bonus_rules': BonusRule.query.count(),
+            'fiscal_years': FiscalYear.query.count(),
         }
 
         not_empty = {k: v for k, v in remaining.items() if int(v or 0) != 0}
@@ -3199,6 +3450,14 @@ def system_backup_restore():
                 'error': 'restore_failed',
             }), 500
 
+    # The restored database has its own chart/mappings; drop cached ids everywhere.
+    invalidate_mapping_cache()
+    try:
+        recompute_open_totals()
+    except Exception as exc:
+        db.session.rollback()
+        print(f"[WARNING] Weight closing totals recompute after restore failed: {exc}")
+
     _append_restore_audit(
         event='system_backup_restore_success',
         success=True,
@@ -3378,45 +3637,107 @@ def delete_customer(id):
         db.session.rollback()
         return jsonify({'error': f'Failed to delete customer: {str(e)}'}), 500
 
+def _statement_page_args(default_order):
+    """Parse limit/cursor/order query params shared by the statement endpoints."""
+    raw_limit = request.args.get('limit')
+    try:
+        limit = int(raw_limit) if raw_limit not in (None, '') else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit parameter')
+    order = (request.args.get('order') or default_order).strip().lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('Invalid order parameter. Expected asc or desc')
+    return limit, (request.args.get('cursor') or None), order == 'desc'
+
+
+def _party_statement_from_request(party_type, party_id):
+    """Build a PartyStatement from date_from/date_to (and payable_only for suppliers).
+
+    Returns None when the party does not exist; raises ValueError on bad params.
+    """
+    date_from = _parse_iso_date(request.args.get('date_from'), 'date_from')
+    date_to = _parse_iso_date(request.args.get('date_to'), 'date_to')
+    payable_only = (request.args.get('payable_only') or '1').strip().lower() not in ('0', 'false', 'no', 'off')
+    scope = resolve_scope(party_type, party_id, payable_only=payable_only)
+    if scope is None:
+        return None
+    return PartyStatement(scope, date_from=date_from, date_to=date_to)
+
+
+def _paged_statement_payload(statement, default_order):
+    limit, cursor, descending = _statement_page_args(default_order)
+    payload = statement.summary()
+    payload.update(statement.page(limit=limit, cursor=cursor, descending=descending))
+    return payload
+
+
 @api.route('/customers/<int:id>/statement', methods=['GET'])
 def get_customer_statement(id):
     """
-    كشف حساب العميل - عرض جميع القيود اليومية المتعلقة بالعميل
+    كشف حساب العميل - القيود اليومية المرتبطة بالعميل مع الرصيد الافتتاحي والأرصدة الجارية.
+
+    Query params: date_from, date_to, limit (default 100), cursor, order (desc|asc, default desc).
+    الصفحة الأولى هي أحدث الحركات؛ `next_cursor` يعيد الصفحة التالية.
     """
     customer = Customer.query.get_or_404(id)
-    
-    # Get all journal entry lines linked to this customer
-    lines = JournalEntryLine.query.filter_by(customer_id=id).join(
-        JournalEntry
-    ).order_by(JournalEntry.date.desc(), JournalEntry.id.desc()).all()
-    
-    # Format the statement
-    statement_lines = []
-    for line in lines:
-        entry = line.journal_entry
-        statement_lines.append({
-            'id': line.id,
-            'date': entry.date.isoformat(),
-            'entry_number': entry.entry_number,
-            'description': entry.description,
-            'account_number': line.account.account_number if line.account else None,
-            'account_name': line.account.name if line.account else None,
-            'debit_cash': float(line.debit_cash) if line.debit_cash else 0.0,
-            'credit_cash': float(line.credit_cash) if line.credit_cash else 0.0,
-            'debit_gold_18k': float(line.debit_gold_18k) if line.debit_gold_18k else 0.0,
-            'credit_gold_18k': float(line.credit_gold_18k) if line.credit_gold_18k else 0.0,
-            'debit_gold_21k': float(line.debit_gold_21k) if line.debit_gold_21k else 0.0,
-            'credit_gold_21k': float(line.credit_gold_21k) if line.credit_gold_21k else 0.0,
-            'debit_gold_22k': float(line.debit_gold_22k) if line.debit_gold_22k else 0.0,
-            'credit_gold_22k': float(line.credit_gold_22k) if line.credit_gold_22k else 0.0,
-            'debit_gold_24k': float(line.debit_gold_24k) if line.debit_gold_24k else 0.0,
-            'credit_gold_24k': float(line.credit_gold_24k) if line.credit_gold_24k else 0.0,
-        })
-    
-    return jsonify({
-        'customer': customer.to_dict(),
-        'statement': statement_lines
-    })
+    try:
+        statement = _party_statement_from_request('customer', id)
+        payload = _paged_statement_payload(statement, default_order='desc')
+    except (ValueError, InvalidCursor) as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    payload['customer'] = customer.to_dict()
+    payload['statement'] = payload['lines']
+    return jsonify(payload)
+
+
+@api.route('/statements/<party_type>/<int:party_id>', methods=['GET'])
+@background_capable(title='Party statement export')
+def get_party_statement(party_type, party_id):
+    """Unified statement for customer / supplier / employee / account.
+
+    Query params: date_from, date_to, payable_only (suppliers, default 1) and
+    format=json|csv|ndjson. JSON is keyset-paginated (limit, cursor, order);
+    csv/ndjson stream every line in date order with running balances.
+    """
+    if party_type not in PARTY_TYPES:
+        return jsonify({'error': f'Unsupported party type: {party_type}'}), 400
+
+    export_format = (request.args.get('format') or 'json').strip().lower()
+    if export_format not in ('json', 'csv', 'ndjson'):
+        return jsonify({'error': 'Invalid format. Expected json, csv or ndjson'}), 400
+
+    try:
+        statement = _party_statement_from_request(party_type, party_id)
+        if statement is None:
+            return jsonify({'error': 'Not found'}), 404
+        if export_format == 'json':
+            return jsonify(_paged_statement_payload(statement, default_order='asc'))
+    except (ValueError, InvalidCursor) as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    filename = f'statement_{party_type}_{party_id}.{export_format}'
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+
+    if export_format == 'ndjson':
+        def _ndjson():
+            for row in statement.iter_rows():
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(_ndjson()), mimetype='application/x-ndjson', headers=headers)
+
+    def _csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for row in statement.iter_rows():
+            writer.writerow([row.get(column) for column in CSV_COLUMNS])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(_csv()), mimetype='text/csv; charset=utf-8', headers=headers)
 
 @api.route('/customers/next-code', methods=['GET'])
 def get_next_customer_code():
@@ -3893,8 +4214,7 @@ def get_supplier_ledger(supplier_id):
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    date_from_dt = datetime.combine(date_from_value, datetime.min.time()) if date_from_value else None
-    date_to_dt = datetime.combine(date_to_value, datetime.min.time()) + timedelta(days=1) if date_to_value else None
+    date_from_dt, date_to_dt = date_bounds(date_from_value, date_to_value)
 
     base_query = (
         JournalEntryLine.query
@@ -3909,24 +4229,15 @@ def get_supplier_ledger(supplier_id):
     if date_to_dt:
         base_query = base_query.filter(JournalEntry.date < date_to_dt)
 
-    totals_row = (
-        base_query
-        .with_entities(
-            func.coalesce(func.sum(JournalEntryLine.cash_debit), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.cash_credit), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.debit_18k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.credit_18k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.debit_21k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.credit_21k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.debit_22k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.credit_22k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.debit_24k), 0.0),
-            func.coalesce(func.sum(JournalEntryLine.credit_24k), 0.0),
-        )
-        .first()
-    )
-
-    cash_debit_total, cash_credit_total, d18, c18, d21, c21, d22, c22, d24, c24 = totals_row or (0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    # Ledger covers every supplier-tagged line (not only payables).
+    totals = PartyStatement(
+        resolve_scope('supplier', supplier_id, payable_only=False),
+        date_from=date_from_value,
+        date_to=date_to_value,
+    ).period_totals()
+    cash_debit_total, cash_credit_total = totals.cash_debit, totals.cash_credit
+    d18, d21, d22, d24 = (totals.debit[k] for k in ('18k', '21k', '22k', '24k'))
+    c18, c21, c22, c24 = (totals.credit[k] for k in ('18k', '21k', '22k', '24k'))
 
     total_items = base_query.count()
     total_pages = ((total_items + per_page - 1) // per_page) if total_items else 0
@@ -4028,107 +4339,26 @@ def get_supplier_weight_statement(supplier_id):
 
     ملاحظة: هذا الـ endpoint يُستخدم من شاشة كشف الحساب ويتوقع نفس صيغة
     `/accounts/<id>/statement` (lines/totals/closing balances).
-    """
-    supplier = Supplier.query.get_or_404(supplier_id)
-    main_karat = get_main_karat()
 
-    running_balance_cash = 0.0
-    running_balances_gold = {'18k': 0.0, '21k': 0.0, '22k': 0.0, '24k': 0.0}
+    Query params: date_from/date_to (opening balance computed in SQL) and,
+    optionally, limit/cursor/order for keyset pages. Without limit/cursor the
+    full statement is returned as before.
+    """
+    Supplier.query.get_or_404(supplier_id)
 
     # IMPORTANT:
     # The DB may tag `supplier_id` on multiple lines within the same journal entry
     # (inventory/tax/etc). For a supplier statement we only want the line(s)
     # affecting supplier payable accounts, otherwise debits/credits cancel out.
-    journal_lines = (
-        JournalEntryLine.query
-        .join(JournalEntry)
-        .join(Account, JournalEntryLine.account_id == Account.id)
-        .filter(JournalEntryLine.supplier_id == supplier_id)
-        .filter(JournalEntryLine.is_deleted == False)  # noqa: E712
-        .filter(Account.type == 'Liability')
-        .filter(Account.account_number.like('21%'))
-        .order_by(JournalEntry.date.asc(), JournalEntry.id.asc(), JournalEntryLine.id.asc())
-        .all()
-    )
-
-    statement_lines = []
-    total_cash_debit = 0.0
-    total_cash_credit = 0.0
-    total_gold_debit_normalized = 0.0
-    total_gold_credit_normalized = 0.0
-
-    for line in journal_lines:
-        # Update running balances for each karat
-        running_balances_gold['18k'] += (line.debit_18k or 0.0) - (line.credit_18k or 0.0)
-        running_balances_gold['21k'] += (line.debit_21k or 0.0) - (line.credit_21k or 0.0)
-        running_balances_gold['22k'] += (line.debit_22k or 0.0) - (line.credit_22k or 0.0)
-        running_balances_gold['24k'] += (line.debit_24k or 0.0) - (line.credit_24k or 0.0)
-        running_balance_cash += (line.cash_debit or 0.0) - (line.cash_credit or 0.0)
-
-        gold_debit_normalized = (
-            convert_to_main_karat(line.debit_18k or 0.0, 18) +
-            convert_to_main_karat(line.debit_21k or 0.0, 21) +
-            convert_to_main_karat(line.debit_22k or 0.0, 22) +
-            convert_to_main_karat(line.debit_24k or 0.0, 24)
-        )
-        gold_credit_normalized = (
-            convert_to_main_karat(line.credit_18k or 0.0, 18) +
-            convert_to_main_karat(line.credit_21k or 0.0, 21) +
-            convert_to_main_karat(line.credit_22k or 0.0, 22) +
-            convert_to_main_karat(line.credit_24k or 0.0, 24)
-        )
-
-        statement_lines.append({
-            'id': line.id,
-            'date': line.journal_entry.date.isoformat(),
-            'description': (line.description or line.journal_entry.description or ''),
-            'journal_entry_id': line.journal_entry_id,
-            'entry_number': line.journal_entry.entry_number if line.journal_entry else None,
-            'reference_type': line.journal_entry.reference_type if line.journal_entry else None,
-            'reference_id': line.journal_entry.reference_id if line.journal_entry else None,
-            'reference_number': line.journal_entry.reference_number if line.journal_entry else None,
-            'cash_debit': line.cash_debit or 0.0,
-            'cash_credit': line.cash_credit or 0.0,
-            'gold_debit': gold_debit_normalized,
-            'gold_credit': gold_credit_normalized,
-            'debit_18k': line.debit_18k or 0.0,
-            'credit_18k': line.credit_18k or 0.0,
-            'debit_21k': line.debit_21k or 0.0,
-            'credit_21k': line.credit_21k or 0.0,
-            'debit_22k': line.debit_22k or 0.0,
-            'credit_22k': line.credit_22k or 0.0,
-            'debit_24k': line.debit_24k or 0.0,
-            'credit_24k': line.credit_24k or 0.0,
-        })
-
-        total_cash_debit += float(line.cash_debit or 0.0)
-        total_cash_credit += float(line.cash_credit or 0.0)
-        total_gold_debit_normalized += float(gold_debit_normalized or 0.0)
-        total_gold_credit_normalized += float(gold_credit_normalized or 0.0)
-
-    closing_balance_gold_normalized = (
-        convert_to_main_karat(running_balances_gold['18k'], 18) +
-        convert_to_main_karat(running_balances_gold['21k'], 21) +
-        convert_to_main_karat(running_balances_gold['22k'], 22) +
-        convert_to_main_karat(running_balances_gold['24k'], 24)
-    )
+    # (resolve_scope applies that filter for suppliers.)
+    try:
+        statement = _party_statement_from_request('supplier', supplier_id)
+        if request.args.get('limit') or request.args.get('cursor'):
+            return jsonify(_paged_statement_payload(statement, default_order='asc'))
+    except (ValueError, InvalidCursor) as exc:
+        return jsonify({'error': str(exc)}), 400
 
-    return jsonify({
-        'account_name': supplier.name,
-        'main_karat': main_karat,
-        'opening_balance_cash': 0.0,
-        'opening_balance_gold_normalized': 0.0,
-        'lines': statement_lines,
-        'totals': {
-            'cash_debit': total_cash_debit,
-            'cash_credit': total_cash_credit,
-            'gold_debit_normalized': total_gold_debit_normalized,
-            'gold_credit_normalized': total_gold_credit_normalized,
-        },
-        'closing_balance_cash': running_balance_cash,
-        'closing_balance_gold_normalized': closing_balance_gold_normalized,
-        'closing_balance_gold_details': running_balances_gold,
-    })
+    return jsonify(statement.full())
 
 
 @api.route('/suppliers/<int:supplier_id>/weight-summary', methods=['GET'])
@@ -4600,17 +4830,79 @@ def category_weight_balances():
 
     group_by_karat_raw = (request.args.get('group_by_karat') or '').strip().lower()
     group_by_karat = group_by_karat_raw in ('1', 'true', 'yes', 'y', 'on')
+    running_total_raw = (request.args.get('running_total') or '').strip().lower()
+    include_running_total = running_total_raw in ('1', 'true', 'yes', 'y', 'on')
 
-    return jsonify(
-        get_category_weight_balances(
-            safe_box_id=safe_box_id,
-            category_id=category_id,
-            karat=karat,
-            group_by_karat=group_by_karat,
-            gold_type=gold_type,
-        )
+    try:
+        as_of = _parse_iso_date(request.args.get('as_of'), 'as_of')
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    # Paging is opt-in: without per_page the response stays a plain list.
+    per_page = request.args.get('per_page', type=int)
+    page = max(request.args.get('page', default=1, type=int) or 1, 1)
+    limit = None
+    offset = 0
+    if per_page:
+        per_page = min(max(per_page, 1), 500)
+        limit = per_page
+        offset = (page - 1) * per_page
+
+    filters = dict(
+        safe_box_id=safe_box_id,
+        category_id=category_id,
+        karat=karat,
+        group_by_karat=group_by_karat,
+        gold_type=gold_type,
     )
 
+    if as_of:
+        rows = get_category_weight_balances_as_of(as_of, include_running_total=include_running_total, **filters)
+        total_items = len(rows)
+        if limit is not None:
+            rows = rows[offset:offset + limit]
+    else:
+        rows = get_category_weight_balances(
+            limit=limit,
+            offset=offset,
+            include_running_total=include_running_total,
+            **filters,
+        )
+        total_items = count_category_weight_balances(**filters) if limit is not None else len(rows)
+
+    if limit is None:
+        return jsonify(rows)
+
+    return jsonify({
+        'balances': rows,
+        'as_of': as_of.isoformat() if as_of else None,
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total_items + per_page - 1) // per_page if per_page else 1,
+            'total_items': total_items,
+        },
+    })
+
+
+@api.route('/category-weight/snapshots/refresh', methods=['POST'])
+@require_permission('items.edit')
+def category_weight_snapshots_refresh():
+    """Materialise monthly balance snapshots for closed months (used by as_of balances)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        through = _parse_iso_date(data.get('through'), 'through')
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    try:
+        result = refresh_category_weight_snapshots(through=through)
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        return jsonify({'error': str(exc)}), 500
+    return jsonify(result)
+
 
 @api.route('/category-weight/movements', methods=['GET'])
 @require_permission('items.view')
@@ -4628,16 +4920,7 @@ def category_weight_movements():
     limit = request.args.get('limit', default=200, type=int)
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date:
-            start_value = _parse_iso_date(start_date, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date:
-            end_value = _parse_iso_date(end_date, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
+        start_dt, end_dt = date_bounds(start_date, end_date)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
@@ -4967,88 +5250,11 @@ def _costing_zero_config() -> dict:
     return config.to_dict()
 
 
-def _rebuild_costing_from_invoices(limit: int | None = None) -> dict:
-    """Rebuild moving average by replaying invoices chronologically."""
-
-    # Start from a clean slate
-    _costing_zero_config()
-
-    # Invoice types that affect inventory weight
-    add_types = {'شراء', 'شراء من عميل', 'مرتجع بيع'}
-    consume_types = {'بيع', 'مرتجع شراء', 'مرتجع شراء (مورد)'}
-    relevant_types = add_types.union(consume_types)
-
-    query = (
-        Invoice.query
-        .filter(Invoice.invoice_type.in_(list(relevant_types)))
-        .options(joinedload(Invoice.karat_lines))
-        .order_by(Invoice.date.asc())
-    )
-    if limit is not None:
-        query = query.limit(int(limit))
-
-    processed = 0
-    for inv in query.all():
-        try:
-            weight_main = float(inv.calculate_total_weight() or 0.0)
-        except Exception:
-            weight_main = float(getattr(inv, 'total_weight', 0.0) or 0.0)
-
-        if weight_main <= 0:
-            continue
-
-        if inv.invoice_type in consume_types:
-            GoldCostingService.consume_inventory(weight_main, auto_commit=False)
-            processed += 1
-            continue
-
-        # Add inventory (purchase or sales return)
-        gold_value_cash = 0.0
-        wage_value_cash = 0.0
-
-        if getattr(inv, 'karat_lines', None):
-            gold_value_cash = sum((line.gold_value_cash or 0.0) for line in inv.karat_lines)
-            wage_value_cash = sum((line.manufacturing_wage_cash or 0.0) for line in inv.karat_lines)
-
-        # Fallbacks when karat_lines are not present
-        if gold_value_cash == 0.0 and getattr(inv, 'gold_subtotal', None) is not None:
-            gold_value_cash = float(inv.gold_subtotal or 0.0)
-        if wage_value_cash == 0.0 and getattr(inv, 'wage_subtotal', None) is not None:
-            wage_value_cash = float(inv.wage_subtotal or 0.0)
-
-        # For sales return, if snapshot components exist, they are usually the most accurate
-        if inv.invoice_type == 'مرتجع بيع':
-            gold_component = float(getattr(inv, 'avg_cost_gold_component', 0.0) or 0.0)
-            wage_component = float(getattr(inv, 'avg_cost_manufacturing_component', 0.0) or 0.0)
-            if gold_component > 0 or wage_component > 0:
-                GoldCostingService.update_average_on_purchase(
-                    weight_main,
-                    gold_component,
-                    wage_component,
-                    auto_commit=False,
-                )
-                processed += 1
-                continue
-
-        gold_price_per_gram = (gold_value_cash / weight_main) if weight_main > 0 else 0.0
-        wage_per_gram = (wage_value_cash / weight_main) if weight_main > 0 else 0.0
-
-        # Last-resort: if everything is 0, try using invoice total as total cost
-        if gold_price_per_gram == 0.0 and wage_per_gram == 0.0:
-            total_cash = float(getattr(inv, 'total', 0.0) or 0.0)
-            gold_price_per_gram = (total_cash / weight_main) if weight_main > 0 else 0.0
-
-        GoldCostingService.update_average_on_purchase(
-            weight_main,
-            gold_price_per_gram,
-            wage_per_gram,
-            auto_commit=False,
-        )
-        processed += 1
-
-    db.session.commit()
+def _rebuild_costing_from_invoices(limit: int | None = None, from_date=None, full: bool = False) -> dict:
+    """Rebuild moving average by replaying invoices chronologically (from the nearest checkpoint)."""
+    result = rebuild_costing(limit=limit, from_date=from_date, full=full)
     return {
-        'processed_invoices': processed,
+        **result,
         **_costing_snapshot_payload(),
     }
 
@@ -5074,13 +5280,27 @@ def calculate_gold_costing_cogs():
 
 
 @api.route('/gold-costing/recompute', methods=['POST'])
+@background_capable(executor='process', title='Gold costing rebuild')
 def recompute_gold_costing():
+    """Resume the costing replay from the latest valid checkpoint.
+
+    from_date=YYYY-MM-DD discards checkpoints from that day on (e.g. after a
+    direct data fix); full=1 or limit replays every invoice from zero.
+    """
     limit = request.args.get('limit', type=int)
-    result = _rebuild_costing_from_invoices(limit=limit)
+    full = (request.args.get('full') or '').strip().lower() in ('1', 'true', 'yes')
+    from_date = None
+    if request.args.get('from_date'):
+        try:
+            from_date = datetime.strptime(request.args['from_date'], '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'from_date must be YYYY-MM-DD'}), 400
+    result = _rebuild_costing_from_invoices(limit=limit, from_date=from_date, full=full)
     return jsonify({'status': 'success', 'result': result})
 
 
 @api.route('/gold-costing/reset', methods=['POST'])
+@background_capable(executor='process', title='Gold costing reset')
 def reset_gold_costing():
     data = request.get_json(silent=True) or {}
     mode = (data.get('mode') or '').strip().lower()
@@ -5091,7 +5311,7 @@ def reset_gold_costing():
         limit_int = None
 
     if mode == 'rebuild':
-        result = _rebuild_costing_from_invoices(limit=limit_int)
+        result = _rebuild_costing_from_invoices(limit=limit_int, full=True)
         return jsonify({'status': 'success', 'result': result})
 
     if mode == 'zero':
@@ -5159,16 +5379,15 @@ def get_invoices():
     else:
         order = Invoice.date.desc() # Default sort
     
-    query = query.order_by(order)
+    query = query.order_by(order).options(*Invoice.list_load_options())
 
     # Pagination
     paginated_invoices = query.paginate(page=page, per_page=per_page, error_out=False)
     invoices = paginated_invoices.items
 
     result = []
-    for inv in invoices:
-        invoice_dict = inv.to_dict()  # 🆕 استخدام to_dict() لتضمين payments
-        
+    # 🆕 to_dict_list: نفس مخرجات to_dict() مع جلب الموظفين/المستخدمين دفعة واحدة للصفحة
+    for inv, invoice_dict in zip(invoices, Invoice.to_dict_list(invoices)):
         # إضافة أسماء العملاء والموردين
         customer_name = inv.customer.name if inv.customer else (inv.supplier.name if inv.supplier else "N/A")
         supplier_name = inv.supplier.name if inv.supplier else "N/A"
@@ -5557,48 +5776,23 @@ def get_safe_box_balance(safe_box_id: int):
     """Compute safe box balance from ledger transactions."""
     safe_box = SafeBox.query.get_or_404(safe_box_id)
 
-    q = SafeBoxTransaction.query.filter_by(safe_box_id=safe_box_id)
     from_value = request.args.get('from')
     to_value = request.args.get('to')
     try:
-        if from_value:
-            q = q.filter(SafeBoxTransaction.created_at >= datetime.fromisoformat(from_value))
+        from_dt = datetime.fromisoformat(from_value) if from_value else None
     except Exception:
         return jsonify({'error': 'invalid_from_date'}), 400
     try:
-        if to_value:
-            q = q.filter(SafeBoxTransaction.created_at <= datetime.fromisoformat(to_value))
+        to_dt = datetime.fromisoformat(to_value) if to_value else None
     except Exception:
         return jsonify({'error': 'invalid_to_date'}), 400
 
-    cash_in = q.with_entities(func.coalesce(func.sum(SafeBoxTransaction.amount_cash), 0.0)).filter(
-        SafeBoxTransaction.direction == 'in'
-    ).scalar() or 0.0
-    cash_out = q.with_entities(func.coalesce(func.sum(SafeBoxTransaction.amount_cash), 0.0)).filter(
-        SafeBoxTransaction.direction == 'out'
-    ).scalar() or 0.0
-
-    def _sum_weight(field_name: str, direction: str) -> float:
-        col = getattr(SafeBoxTransaction, field_name)
-        return (
-            q.with_entities(func.coalesce(func.sum(col), 0.0))
-            .filter(SafeBoxTransaction.direction == direction)
-            .scalar()
-            or 0.0
-        )
-
-    w_in = {
-        '18k': float(_sum_weight('weight_18k', 'in')),
-        '21k': float(_sum_weight('weight_21k', 'in')),
-        '22k': float(_sum_weight('weight_22k', 'in')),
-        '24k': float(_sum_weight('weight_24k', 'in')),
-    }
-    w_out = {
-        '18k': float(_sum_weight('weight_18k', 'out')),
-        '21k': float(_sum_weight('weight_21k', 'out')),
-        '22k': float(_sum_weight('weight_22k', 'out')),
-        '24k': float(_sum_weight('weight_24k', 'out')),
-    }
+    # Without `from` the balance starts from the latest closed fiscal-year snapshot.
+    sums = safe_box_totals([safe_box_id], until=to_dt, start=from_dt).get(safe_box_id) or {}
+    cash_in = sums.get('cash_in', 0.0)
+    cash_out = sums.get('cash_out', 0.0)
+    w_in = {k: float(sums.get(f'weight_in_{k}', 0.0)) for k in ['18k', '21k', '22k', '24k']}
+    w_out = {k: float(sums.get(f'weight_out_{k}', 0.0)) for k in ['18k', '21k', '22k', '24k']}
 
     return jsonify({
         'safe_box_id': safe_box.id,
@@ -5656,47 +5850,29 @@ def list_safe_box_balances():
 
     main_karat = float(get_main_karat() or 21)
 
-    def _ledger_balance_for_safe(safe_id: int) -> dict:
-        q = SafeBoxTransaction.query.filter_by(safe_box_id=safe_id)
-        if from_dt:
-            q = q.filter(SafeBoxTransaction.created_at >= from_dt)
-        if to_dt:
-            q = q.filter(SafeBoxTransaction.created_at <= to_dt)
-
-        cash_in = (
-            q.with_entities(func.coalesce(func.sum(SafeBoxTransaction.amount_cash), 0.0))
-            .filter(SafeBoxTransaction.direction == 'in')
-            .scalar()
-            or 0.0
-        )
-        cash_out = (
-            q.with_entities(func.coalesce(func.sum(SafeBoxTransaction.amount_cash), 0.0))
-            .filter(SafeBoxTransaction.direction == 'out')
-            .scalar()
-            or 0.0
-        )
-
-        def _sum_weight(field_name: str, direction: str) -> float:
-            col = getattr(SafeBoxTransaction, field_name)
-            return (
-                q.with_entities(func.coalesce(func.sum(col), 0.0))
-                .filter(SafeBoxTransaction.direction == direction)
-                .scalar()
-                or 0.0
-            )
+    # One grouped pass for every safe box; without `from` it starts from the
+    # latest closed fiscal-year snapshot.
+    ledger_sums = safe_box_totals([sb.id for sb in safes], until=to_dt, start=from_dt)
+    date_range = SafeBoxTransaction.query.with_entities(
+        SafeBoxTransaction.safe_box_id,
+        func.min(SafeBoxTransaction.created_at),
+        func.max(SafeBoxTransaction.created_at),
+    ).filter(SafeBoxTransaction.safe_box_id.in_([sb.id for sb in safes]))
+    if from_dt:
+        date_range = date_range.filter(SafeBoxTransaction.created_at >= from_dt)
+    if to_dt:
+        date_range = date_range.filter(SafeBoxTransaction.created_at <= to_dt)
+    date_ranges = {
+        safe_id: (first_dt, last_dt)
+        for safe_id, first_dt, last_dt in date_range.group_by(SafeBoxTransaction.safe_box_id)
+    } if safes else {}
 
-        w_in = {
-            '18k': float(_sum_weight('weight_18k', 'in')),
-            '21k': float(_sum_weight('weight_21k', 'in')),
-            '22k': float(_sum_weight('weight_22k', 'in')),
-            '24k': float(_sum_weight('weight_24k', 'in')),
-        }
-        w_out = {
-            '18k': float(_sum_weight('weight_18k', 'out')),
-            '21k': float(_sum_weight('weight_21k', 'out')),
-            '22k': float(_sum_weight('weight_22k', 'out')),
-            '24k': float(_sum_weight('weight_24k', 'out')),
-        }
+    def _ledger_balance_for_safe(safe_id: int) -> dict:
+        sums = ledger_sums.get(safe_id) or {}
+        cash_in = sums.get('cash_in', 0.0)
+        cash_out = sums.get('cash_out', 0.0)
+        w_in = {k: float(sums.get(f'weight_in_{k}', 0.0)) for k in ['18k', '21k', '22k', '24k']}
+        w_out = {k: float(sums.get(f'weight_out_{k}', 0.0)) for k in ['18k', '21k', '22k', '24k']}
         w_bal = {
             k: float(w_in.get(k, 0.0) or 0.0) - float(w_out.get(k, 0.0) or 0.0)
             for k in ['18k', '21k', '22k', '24k']
@@ -5710,8 +5886,7 @@ def list_safe_box_balances():
         except Exception:
             total_weight_main = 0.0
 
-        first_dt = q.with_entities(func.min(SafeBoxTransaction.created_at)).scalar()
-        last_dt = q.with_entities(func.max(SafeBoxTransaction.created_at)).scalar()
+        first_dt, last_dt = date_ranges.get(safe_id, (None, None))
 
         return {
             'cash_in': round(float(cash_in), 2),
@@ -5778,8 +5953,6 @@ def set_invoice_print_template(invoice_id: int):
 
 # ==================== دالة مساعدة للربط المحاسبي ====================
 
-DEFAULT_MAPPING_OPERATION_TYPE = 'افتراضي'
-
 def get_account_id_for_mapping(operation_type, account_type):
     """
     الحصول على معرف الحساب المحاسبي لعملية معينة
@@ -5791,118 +5964,20 @@ def get_account_id_for_mapping(operation_type, account_type):
     Returns:
         int: معرف الحساب المحاسبي، أو None إذا لم يتم العثور عليه
     
-    الدالة تحاول:
+    الدالة تحاول (من جدول الربط المحمّل في الذاكرة - mapping_resolver):
     1. البحث في إعدادات الربط المخصصة (AccountingMapping)
-    2. إذا لم تجد، تستخدم الحسابات الافتراضية
+    2. الربط الافتراضي العام (DEFAULT_MAPPING_OPERATION_TYPE)
+    3. أرقام الحسابات الافتراضية الداخلية (DEFAULT_ACCOUNT_NUMBERS)
     """
-    from models import AccountingMapping
-    
-    # 1. محاولة الحصول على الحساب من الإعدادات المخصصة (للعملية نفسها)
-    mapping = db.session.query(AccountingMapping).filter_by(
-        operation_type=operation_type,
-        account_type=account_type,
-        is_active=True
-    ).first()
-    
-    if mapping:
-        return mapping.account_id
-
-    # 2. محاولة fallback للربط الافتراضي العام (قائمة واحدة لكل الأنواع)
-    if operation_type != DEFAULT_MAPPING_OPERATION_TYPE:
-        default_mapping = db.session.query(AccountingMapping).filter_by(
-            operation_type=DEFAULT_MAPPING_OPERATION_TYPE,
-            account_type=account_type,
-            is_active=True
-        ).first()
-        if default_mapping:
-            return default_mapping.account_id
-    
-    # 3. fallback لأرقام افتراضية داخلية (عند عدم وجود أي ربط محفوظ)
-    DEFAULT_ACCOUNTS = {
-        # المخزون النقدي (حسب العيار)
-        'inventory_18k': 1300,  # مخزون ذهب عيار 18
-        'inventory_21k': 1310,  # مخزون ذهب عيار 21  
-        'inventory_22k': 1320,  # مخزون ذهب عيار 22
-        'inventory_24k': 1330,  # مخزون ذهب عيار 24
-        
-        # 🆕 مخزون أجور المصنعية
-        'manufacturing_wage_inventory': 1350,  # مخزون أجور المصنعية
-        
-        # المخزون الوزني (حسب العيار) - حسابات المذكرة
-        'inventory_weight_18k': 7300,  # مخزون وزني عيار 18
-        'inventory_weight_21k': 7310,  # مخزون وزني عيار 21
-        'inventory_weight_22k': 7320,  # مخزون وزني عيار 22
-        'inventory_weight_24k': 7330,  # مخزون وزني عيار 24
-        
-        # النقدية والبنوك
-        'cash': 1100,           # الصندوق
-        'bank': 1110,           # بنك الأهلي
-        'bank_rajhi': 1120,     # بنك الراجحي
-        
-        # العملاء والموردين
-        'customers': 1200,      # عملاء بيع ذهب
-        'customers_scrap': 1210,  # عملاء شراء كسر
-        'suppliers': 210,       # موردو ذهب خام
-        'suppliers_processed': 220,  # موردو ذهب مشغول
-        
-        # الإيرادات
-        'revenue': 40,          # إيرادات بيع ذهب
-        'sales_gold_new': 40,   # إيرادات بيع ذهب
-        'sales_wage': 41,       # إيرادات مصنعية
-    'sales_returns': 40,    # مردودات المبيعات (تخفيض الإيراد)
-        
-        # التكاليف
-        'cost': 50,             # تكلفة المبيعات
-        'cost_of_sales': 50,    # تكلفة المبيعات
-    'purchase_returns': 50, # مردودات المشتريات (تعديل التكلفة)
-
-    # الضرائب والعمولات
-    'vat_payable': 2210,        # ضريبة القيمة المضافة المستحقة
-    'vat_receivable': 1500,     # ضريبة القيمة المضافة (مدفوعة)
-    'commission': 5150,         # مصروف عمولات الدفع الإلكتروني
-    'commission_vat': 1501,     # ضريبة عمولات نقاط البيع (مدفوعة)
-        
-        # المصروفات
-        'operating_expenses': 51,  # مصاريف تشغيلية
-        
-        # حقوق الملكية
-        'capital': 31,          # رأس المال
-        'retained_earnings': 32,  # الأرباح المحتجزة
-        
-        # حسابات للجسر والمصنعية في مشتريات الموردين
-        'supplier_bridge': None,
-    'manufacturing_wage': 5105,  # مصروفات أجور المصنعية
-    }
-    
-    default_account_number = DEFAULT_ACCOUNTS.get(account_type)
-    if default_account_number is None:
-        return None
-
-    # أرقام fallback تمثل account_number وليس المعرف الفعلي، لذلك نحولها هنا
-    account = Account.query.filter_by(account_number=str(default_account_number)).first()
-    if account:
-        return account.id
-
-    if account_type == 'manufacturing_wage':
+    account_id = mapping_resolver.account_id_for_mapping(operation_type, account_type)
+    if account_id is None and account_type == 'manufacturing_wage':
         return _ensure_manufacturing_wage_expense_account()
-
-    return None
-
-
-_ACCOUNT_NUMBER_CACHE = {}
+    return account_id
 
 
 def get_account_id_by_number(account_number):
     """Fast lookup for account.id using its structured account number."""
-    if not account_number:
-        return None
-    key = str(account_number)
-    if key in _ACCOUNT_NUMBER_CACHE:
-        return _ACCOUNT_NUMBER_CACHE[key]
-    account = Account.query.filter_by(account_number=key).first()
-    account_id = account.id if account else None
-    _ACCOUNT_NUMBER_CACHE[key] = account_id
-    return account_id
+    return mapping_resolver.account_id_by_number(account_number)
 
 
 def _ensure_manufacturing_wage_expense_account():
@@ -5923,7 +5998,6 @@ def _ensure_manufacturing_wage_expense_account():
     )
     db.session.add(account)
     db.session.commit()
-    _ACCOUNT_NUMBER_CACHE[target_number] = account.id
     return account.id
 
 
@@ -6111,8 +6185,11 @@ def calculate_profit_in_gold(items_sold):
 
 
 @api.route('/invoices', methods=['POST'])
+@idempotent
+@uses_posting_context
 def add_invoice():
     data = request.get_json(silent=True)
+    posting = current_posting_context()
     print(f"\n=== 📝 Invoice Creation Request ===")
     print(f"Received data: {data}")
     
@@ -6125,7 +6202,7 @@ def add_invoice():
     auth_required = bool(REQUIRE_AUTH_FOR_INVOICE_CREATE)
     if not auth_required:
         try:
-            settings = Settings.query.first()
+            settings = posting.settings
             auth_required = bool(getattr(settings, 'require_auth_for_invoice_create', False)) if settings else False
         except Exception:
             auth_required = bool(REQUIRE_AUTH_FOR_INVOICE_CREATE)
@@ -6141,7 +6218,7 @@ def add_invoice():
 
     if not allow_partial_payments:
         try:
-            settings_row = Settings.query.first()
+            settings_row = posting.settings
             allow_partial_payments = bool(getattr(settings_row, 'allow_partial_invoice_payments', False)) if settings_row else False
         except Exception:
             allow_partial_payments = False
@@ -6149,6 +6226,9 @@ def add_invoice():
     if auth_required and not current_user:
         return jsonify({'error': 'Authentication required to create invoices'}), 401
 
+    # Load every entity the payload references once; later stages read from `posting`.
+    posting.preload(data)
+
     # 🆕 الحصول على سعر الذهب الحالي في بداية الدالة (يُستخدم في عدة أماكن)
     gold_price_data = get_current_gold_price()
 
@@ -6205,7 +6285,7 @@ def add_invoice():
     # Snapshot VAT settings once per request.
     settings_row = None
     try:
-        settings_row = Settings.query.first()
+        settings_row = posting.settings
     except Exception:
         settings_row = None
 
@@ -6423,7 +6503,7 @@ def add_invoice():
             return jsonify({'error': 'branch_id must be numeric'}), 400
         try:
             from models import Branch
-            branch_row = Branch.query.get(branch_id)
+            branch_row = posting.branch(branch_id)
             if not branch_row:
                 return jsonify({'error': f'Branch with ID {branch_id} not found'}), 404
             if hasattr(branch_row, 'active') and not bool(getattr(branch_row, 'active', True)):
@@ -6440,7 +6520,7 @@ def add_invoice():
         except (TypeError, ValueError):
             return jsonify({'error': 'office_id must be numeric'}), 400
         try:
-            office_row = Office.query.get(office_id)
+            office_row = posting.office(office_id)
             if not office_row:
                 return jsonify({'error': f'Office with ID {office_id} not found'}), 404
             if hasattr(office_row, 'active') and not bool(getattr(office_row, 'active', True)):
@@ -6528,7 +6608,7 @@ def add_invoice():
             if not pm_id:
                 return jsonify({'error': 'payment_method_id is required for each payment'}), 400
             
-            pm_obj = PaymentMethod.query.get(pm_id)
+            pm_obj = posting.payment_method(pm_id)
             if not pm_obj:
                 return jsonify({'error': f'Payment method with ID {pm_id} not found'}), 404
             
@@ -6585,7 +6665,7 @@ def add_invoice():
     
     # وسيلة دفع واحدة (للتوافق مع الكود القديم)
     elif payment_method_id:
-        payment_method_obj = PaymentMethod.query.get(payment_method_id)
+        payment_method_obj = posting.payment_method(payment_method_id)
         if not payment_method_obj:
             return jsonify({'error': f'Payment method with ID {payment_method_id} not found'}), 404
         
@@ -6675,7 +6755,7 @@ def add_invoice():
 
             if employee_display_name is None and employee_id_for_invoice:
                 try:
-                    emp = Employee.query.get(employee_id_for_invoice)
+                    emp = posting.employee(employee_id_for_invoice)
                     if emp and emp.name:
                         employee_display_name = emp.name
                 except Exception:
@@ -6790,7 +6870,7 @@ def add_invoice():
             print(f"\n📦 DEBUG - item_data: {item_data}")  # 🔍 Debug logging
 
             item_id = item_data.get('item_id')
-            item = Item.query.get(item_id) if item_id else None
+            item = posting.item(item_id) if item_id else None
 
             if (item_data.get('create_inline') or False) and not item:
                 try:
@@ -7198,7 +7278,7 @@ def add_invoice():
             - Else default cash safe
             """
             try:
-                settings_row = Settings.query.first()
+                settings_row = posting.settings
             except Exception:
                 settings_row = None
 
@@ -7206,7 +7286,7 @@ def add_invoice():
                 try:
                     emp = getattr(new_invoice, 'employee', None)
                     if not emp and getattr(new_invoice, 'employee_id', None):
-                        emp = Employee.query.get(int(new_invoice.employee_id))
+                        emp = posting.employee(new_invoice.employee_id)
                     emp_cash = getattr(emp, 'cash_safe_box_id', None) if emp else None
                     if emp_cash not in (None, '', 0, '0', False):
                         return int(emp_cash)
@@ -7234,7 +7314,7 @@ def add_invoice():
             for payment in payments_data:
                 pm_id = payment.get('payment_method_id')
                 pm_amount = _to_float(payment.get('amount', 0.0))
-                pm_obj = PaymentMethod.query.get(pm_id)
+                pm_obj = posting.payment_method(pm_id)
 
                 is_receivable = _is_receivable_payment_method(pm_obj)
 
@@ -7253,7 +7333,7 @@ def add_invoice():
                         resolved_safe_box_id = new_invoice.safe_box_id
                     if resolved_safe_box_id is None and _is_cash_payment_method(pm_obj):
                         try:
-                            settings_row = Settings.query.first()
+                            settings_row = posting.settings
                         except Exception:
                             settings_row = None
                         if bool(getattr(settings_row, 'employee_cash_safes_enabled', False)):
@@ -7271,7 +7351,7 @@ def add_invoice():
                         emp_cash_safe_id = None
                         emp = getattr(new_invoice, 'employee', None)
                         if not emp and getattr(new_invoice, 'employee_id', None):
-                            emp = Employee.query.get(int(new_invoice.employee_id))
+                            emp = posting.employee(new_invoice.employee_id)
                         raw_emp_cash = getattr(emp, 'cash_safe_box_id', None) if emp else None
                         if raw_emp_cash not in (None, '', 0, '0', False):
                             emp_cash_safe_id = int(raw_emp_cash)
@@ -7304,7 +7384,7 @@ def add_invoice():
                         }), 400
 
                     # Validate safe box exists (avoid FK failures and keep atomicity explicit)
-                    safe_box_obj = SafeBox.query.get(resolved_safe_box_id)
+                    safe_box_obj = posting.safe_box(resolved_safe_box_id)
                     if not safe_box_obj:
                         db.session.rollback()
                         return jsonify({
@@ -7388,7 +7468,7 @@ def add_invoice():
         
         # وسيلة دفع واحدة (للتوافق مع الكود القديم)
         elif payment_method_id:
-            pm_obj = PaymentMethod.query.get(payment_method_id)
+            pm_obj = posting.payment_method(payment_method_id)
             pm_commission_rate = pm_obj.commission_rate if pm_obj else 0.0
 
             is_receivable = _is_receivable_payment_method(pm_obj)
@@ -7408,7 +7488,7 @@ def add_invoice():
                         'payment_method_name': getattr(pm_obj, 'name', None) if pm_obj else None,
                     }), 400
 
-                safe_box_obj = SafeBox.query.get(resolved_safe_box_id)
+                safe_box_obj = posting.safe_box(resolved_safe_box_id)
                 if not safe_box_obj:
                     db.session.rollback()
                     return jsonify({
@@ -7503,7 +7583,7 @@ def add_invoice():
             # - If employee gold safes are enabled: prefer employee gold safe (if set)
             # - If disabled: use main scrap gold safe
             try:
-                srow = Settings.query.first()
+                srow = posting.settings
             except Exception:
                 srow = None
 
@@ -7512,7 +7592,7 @@ def add_invoice():
             try:
                 emp = getattr(new_invoice, 'employee', None)
                 if not emp and getattr(new_invoice, 'employee_id', None):
-                    emp = Employee.query.get(int(new_invoice.employee_id))
+                    emp = posting.employee(new_invoice.employee_id)
                 raw_emp_gold = getattr(emp, 'gold_safe_box_id', None) if emp else None
                 if raw_emp_gold not in (None, '', 0, '0', False):
                     emp_gold_safe_id = int(raw_emp_gold)
@@ -7545,7 +7625,7 @@ def add_invoice():
             except Exception:
                 pass
 
-            gold_safe = SafeBox.query.get(settled_gold_safe_box_id)
+            gold_safe = posting.safe_box(settled_gold_safe_box_id)
             if not gold_safe:
                 db.session.rollback()
                 return jsonify({
@@ -7647,7 +7727,7 @@ def add_invoice():
         if not has_valid_karat_lines:
             for item_data in data.get('items', []):
                 item_id = item_data.get('item_id')
-                item = Item.query.get(item_id) if item_id else None
+                item = posting.item(item_id) if item_id else None
 
                 # ✅ أولوية لبيانات الوزن/العيار المرسلة مع الفاتورة
                 karat_value = item_data.get('karat') if item_data.get('karat') not in (None, '') else (item.karat if item else None)
@@ -7682,7 +7762,7 @@ def add_invoice():
             target_gold_safe_id = None
             settings_row = None
             try:
-                settings_row = Settings.query.first()
+                settings_row = posting.settings
             except Exception:
                 settings_row = None
             
@@ -7696,7 +7776,7 @@ def add_invoice():
                         except Exception:
                             emp_id = None
                         if emp_id:
-                            holder = Employee.query.get(emp_id)
+                            holder = posting.employee(emp_id)
                             if holder and getattr(holder, 'gold_safe_box_id', None):
                                 target_gold_safe_id = int(holder.gold_safe_box_id)
                                 print(f"\n🔍 SCRAP_RECEIPT: Using explicit holder employee {emp_id} gold safe: {target_gold_safe_id}")
@@ -7714,7 +7794,7 @@ def add_invoice():
                         except Exception:
                             emp_id = None
                         if emp_id:
-                            holder = Employee.query.get(emp_id)
+                            holder = posting.employee(emp_id)
                             if holder and getattr(holder, 'gold_safe_box_id', None):
                                 target_gold_safe_id = int(holder.gold_safe_box_id)
                                 print(f"\n🔍 SCRAP_RECEIPT: Using invoice employee {emp_id} gold safe: {target_gold_safe_id}")
@@ -7753,7 +7833,7 @@ def add_invoice():
             # even when approval is required, so draft invoices don't fail balance checks.
             if target_gold_safe_id is not None:
                 try:
-                    gold_safe = SafeBox.query.get(target_gold_safe_id)
+                    gold_safe = posting.safe_box(target_gold_safe_id)
                     if gold_safe and (gold_safe.safe_type or '').lower() == 'gold' and bool(getattr(gold_safe, 'is_active', True)):
                         try:
                             if getattr(gold_safe, 'account', None) is not None:
@@ -7798,7 +7878,7 @@ def add_invoice():
 
         if (not approval_required) and inv_type_for_gold in ('بيع', 'مرتجع بيع'):
             try:
-                settings_row = Settings.query.first()
+                settings_row = posting.settings
             except Exception:
                 settings_row = None
 
@@ -7813,7 +7893,7 @@ def add_invoice():
 
             try:
                 if target_gold_safe_id not in (None, '', 0, '0', False):
-                    sb = SafeBox.query.get(int(target_gold_safe_id))
+                    sb = posting.safe_box(target_gold_safe_id)
                 else:
                     sb = None
             except Exception:
@@ -7849,19 +7929,19 @@ def add_invoice():
         # 🆕 منطق محدث لدعم 6 أنواع من الفواتير
         
         # الحسابات الأساسية
-        cash_account = Account.query.filter_by(name='صندوق النقدية').first()
-        inventory_account = Account.query.filter_by(name='المخزون').first()
-        sales_account = Account.query.filter(Account.name.like('مبيعات%')).first()
-        revenue_account = Account.query.filter(Account.name.like('الإيرادات%')).first()
-        purchases_account = Account.query.filter_by(name='تكلفة البضاعة المباعة').first()
+        cash_account = posting.account_by_name('صندوق النقدية')
+        inventory_account = posting.account_by_name('المخزون')
+        sales_account = posting.account_by_name_prefix('مبيعات')
+        revenue_account = posting.account_by_name_prefix('الإيرادات')
+        purchases_account = posting.account_by_name('تكلفة البضاعة المباعة')
         
         # حساب الطرف (عميل أو مورد)
         party_account = None
         if new_invoice.customer_id:
-            customer = Customer.query.get(new_invoice.customer_id)
+            customer = posting.customer(new_invoice.customer_id)
             if customer:
                 try:
-                    if not customer.account_id or not Account.query.get(customer.account_id):
+                    if not customer.account_id or not posting.account(customer.account_id):
                         ensure_customer_accounts(customer)
                 except Exception as exc:
                     return jsonify({
@@ -7871,12 +7951,12 @@ def add_invoice():
                     }), 400
 
                 if customer.account_id:
-                    party_account = Account.query.get(customer.account_id)
+                    party_account = posting.account(customer.account_id)
         elif new_invoice.supplier_id:
-            supplier = Supplier.query.get(new_invoice.supplier_id)
+            supplier = posting.supplier(new_invoice.supplier_id)
             if supplier:
                 try:
-                    if not supplier.account_id or not Account.query.get(supplier.account_id):
+                    if not supplier.account_id or not posting.account(supplier.account_id):
                         ensure_supplier_accounts(supplier)
                 except Exception as exc:
                     return jsonify({
@@ -7886,7 +7966,7 @@ def add_invoice():
                     }), 400
 
                 if supplier.account_id:
-                    party_account = Account.query.get(supplier.account_id)
+                    party_account = posting.account(supplier.account_id)
         
         # إذا لم يكن هناك طرف، استخدم الصندوق
         if not party_account:
@@ -7895,12 +7975,12 @@ def add_invoice():
         # معرف حساب العميل/الطرف المستخدم في القيود اللاحقة (مثل القيود الوزنية)
         customer_account_id = None
         # ✅ الصحيح: حساب النقدية الوزني هو 71100 (وليس 7100)
-        default_memo_cash_account = Account.query.filter_by(account_number='71100').first()
+        default_memo_cash_account = posting.account_by_number('71100')
         default_memo_cash_account_id = default_memo_cash_account.id if default_memo_cash_account else None
 
         memo_party_account = None
         if party_account and party_account.memo_account_id:
-            memo_party_account = Account.query.get(party_account.memo_account_id)
+            memo_party_account = posting.account(party_account.memo_account_id)
             if not memo_party_account:
                 print(
                     f"⚠️ Linked memo account {party_account.memo_account_id} for account {party_account.account_number} not found. "
@@ -7922,7 +8002,7 @@ def add_invoice():
         # 🔧 توليد رقم القيد
         year = new_invoice.date.year
         entry_count = JournalEntry.query.filter(
-            db.extract('year', JournalEntry.date) == year
+            *within(JournalEntry.date, *year_range(year))
         ).count() + 1
         entry_number_str = f'JE-{year}-{entry_count:05d}'
         
@@ -8004,7 +8084,7 @@ def add_invoice():
             # 🆕 دعم وسائل دفع متعددة
             if payments_data and len(payments_data) > 0:
                 for payment in payments_data:
-                    pm_obj = PaymentMethod.query.get(payment['payment_method_id'])
+                    pm_obj = posting.payment_method(payment['payment_method_id'])
                     pm_amount = _to_float(payment.get('amount', 0.0))
                     pm_commission = _to_float(payment.get('commission_amount', 0.0))
                     pm_commission_vat = _to_float(payment.get('commission_vat', 0.0))
@@ -8016,7 +8096,7 @@ def add_invoice():
                     safe_box = None
                     safe_box_id = payment.get('safe_box_id')
                     if safe_box_id:
-                        safe_box = SafeBox.query.get(safe_box_id)
+                        safe_box = posting.safe_box(safe_box_id)
                     elif pm_obj and pm_obj.default_safe_box:
                         safe_box = pm_obj.default_safe_box
 
@@ -8075,7 +8155,7 @@ def add_invoice():
                                 'error': 'cash_account_missing',
                                 'message': 'لا يوجد حساب نقدية افتراضي. الرجاء ضبط ربط حسابات (cash) أو إنشاء حساب "صندوق النقدية" أو تحديد خزينة للدفع.',
                             }), 400
-                        if not Account.query.get(acc_id):
+                        if not posting.account(acc_id):
                             db.session.rollback()
                             return jsonify({
                                 'error': 'account_not_found',
@@ -8123,7 +8203,7 @@ def add_invoice():
                 # 🆕 الحصول على الحساب من الخزينة
                 safe_box = None
                 if safe_box_id:
-                    safe_box = SafeBox.query.get(safe_box_id)
+                    safe_box = posting.safe_box(safe_box_id)
                 elif payment_method_obj and payment_method_obj.default_safe_box:
                     safe_box = payment_method_obj.default_safe_box
 
@@ -8179,7 +8259,7 @@ def add_invoice():
                             'error': 'cash_account_missing',
                             'message': 'لا يوجد حساب نقدية افتراضي. الرجاء ضبط ربط حسابات (cash) أو إنشاء حساب "صندوق النقدية" أو تحديد خزينة للدفع.',
                         }), 400
-                    if not Account.query.get(acc_id):
+                    if not posting.account(acc_id):
                         db.session.rollback()
                         return jsonify({
                             'error': 'account_not_found',
@@ -8247,7 +8327,7 @@ def add_invoice():
                             'error': 'cash_account_missing',
                             'message': 'لا يوجد حساب نقدية افتراضي. الرجاء ضبط ربط حسابات (cash) أو إنشاء حساب "صندوق النقدية".',
                         }), 400
-                    if not Account.query.get(acc_id):
+                    if not posting.account(acc_id):
                         db.session.rollback()
                         return jsonify({
                             'error': 'account_not_found',
@@ -8692,6 +8772,7 @@ def add_invoice():
                     _upsert_weight_closing_order(
                         new_invoice,
                         close_price_per_gram=closing_price,
+                        is_new_invoice=True,
                         settings=_load_weight_closing_settings(),
                     )
             except Exception as exc:
@@ -8768,7 +8849,7 @@ def add_invoice():
             if not is_offset_settlement:
                 # 🆕 الحصول على الحساب من الخزينة
                 if safe_box_id:
-                    safe_box = SafeBox.query.get(safe_box_id)
+                    safe_box = posting.safe_box(safe_box_id)
                 elif payment_method_obj and payment_method_obj.default_safe_box:
                     safe_box = payment_method_obj.default_safe_box
 
@@ -8789,7 +8870,7 @@ def add_invoice():
                     'message': 'لا يوجد حساب لتسجيل مقابل الشراء (نقداً/تقاص). الرجاء ضبط ربط الحسابات أو حساب العميل.',
                 }), 400
 
-            if not Account.query.get(acc_id):
+            if not posting.account(acc_id):
                 db.session.rollback()
                 return jsonify({
                     'error': 'account_not_found',
@@ -9005,7 +9086,7 @@ def add_invoice():
                         )
 
                     # Weight memo: debit physical weight to inventory memo account
-                    inv_acc_obj = Account.query.get(inv_acc_id)
+                    inv_acc_obj = posting.account(inv_acc_id)
                     memo_inv_id = inv_acc_obj.memo_account_id if inv_acc_obj else None
                     if memo_inv_id:
                         create_dual_journal_entry(
@@ -9050,7 +9131,7 @@ def add_invoice():
 
             # Weight memo counterpart: credit physical weight to customer's memo weight account
             customer_fin_acc_id = customers_acc_id or (party_account.id if party_account else None)
-            customer_fin_acc = Account.query.get(customer_fin_acc_id) if customer_fin_acc_id else None
+            customer_fin_acc = posting.account(customer_fin_acc_id) if customer_fin_acc_id else None
             memo_customer_id = customer_fin_acc.memo_account_id if customer_fin_acc else None
             if memo_customer_id:
                 create_dual_journal_entry(
@@ -9154,7 +9235,7 @@ def add_invoice():
                 # Default chart uses account_number 1500 for VAT receivable.
                 if not vat_receivable_acc_id:
                     try:
-                        vat_acc = Account.query.filter_by(account_number='1500').first()
+                        vat_acc = posting.account_by_number('1500')
                         if not vat_acc:
                             vat_acc = Account(
                                 account_number='1500',
@@ -9219,7 +9300,7 @@ def add_invoice():
                     fallback_id = _mapping('suppliers') or _mapping('suppliers_weight')
                     if fallback_id:
                         supplier_fin_account_id = fallback_id
-                        supplier_fin_account_obj = Account.query.get(fallback_id)
+                        supplier_fin_account_obj = posting.account(fallback_id)
                         supplier_memo_account_id = getattr(supplier_fin_account_obj, 'memo_account_id', None)
 
                 if supplier_memo_account_id:
@@ -9438,7 +9519,7 @@ def add_invoice():
                             # وإذا لم يوجد، استخدم fallback ثم الحساب المالي نفسه لمنع عدم توازن الوزن.
                             weight_inventory_memo_acc_id = None
                             try:
-                                inv_acc_obj = Account.query.get(inv_account_id)
+                                inv_acc_obj = posting.account(inv_account_id)
                                 if inv_acc_obj and inv_acc_obj.memo_account_id:
                                     weight_inventory_memo_acc_id = inv_acc_obj.memo_account_id
                             except Exception:
@@ -9494,7 +9575,7 @@ def add_invoice():
 
                     if inv_for_karat:
                         try:
-                            inv_acc_obj = Account.query.get(inv_for_karat)
+                            inv_acc_obj = posting.account(inv_for_karat)
                             if inv_acc_obj and inv_acc_obj.memo_account_id:
                                 weight_target_acc_id = inv_acc_obj.memo_account_id
                         except Exception:
@@ -9606,7 +9687,7 @@ def add_invoice():
                 #         while the cash-equivalent wage cost is balanced via the bridge
                 supplier_obj = None
                 try:
-                    supplier_obj = Supplier.query.get(new_invoice.supplier_id) if new_invoice.supplier_id else None
+                    supplier_obj = posting.supplier(new_invoice.supplier_id) if new_invoice.supplier_id else None
                 except Exception:
                     supplier_obj = None
 
@@ -10083,6 +10164,7 @@ def add_invoice():
             record_category_weight_movements_for_invoice_payload(
                 invoice_id=new_invoice.id,
                 items_payload=(data.get('items') if isinstance(data, dict) else None),
+                is_new_invoice=True,
             )
         except Exception as exc:
             # Do not block posting for tracking failures.
@@ -10206,137 +10288,83 @@ def export_accounts():
 
 @api.route('/accounts/import', methods=['POST'])
 @require_permission('accounts.edit')
+@background_capable(title='Chart of accounts import')
 def import_accounts():
     """Import (upsert) chart of accounts structure.
 
-    - Upserts by account_number
-    - Does NOT import balances
-    - Relinks parent/memo relationships in a second pass
-    """
-    payload = request.get_json(silent=True)
-    if payload is None:
-        return jsonify({'error': 'Invalid or missing JSON body'}), 400
-
-    accounts_data = payload
-    if isinstance(payload, dict):
-        accounts_data = payload.get('accounts', payload.get('data'))
-
-    if not isinstance(accounts_data, list):
-        return jsonify({'error': 'accounts must be a JSON array'}), 400
-
-    # Normalize & validate
-    normalized = []
-    for idx, row in enumerate(accounts_data, start=1):
-        if not isinstance(row, dict):
-            return jsonify({'error': f'Invalid account row at index {idx}'}), 400
-
-        account_number = (row.get('account_number') or '').strip()
-        name = (row.get('name') or '').strip()
-        acc_type = (row.get('type') or '').strip()
-        transaction_type = (row.get('transaction_type') or 'both').strip() or 'both'
-
-        if not account_number:
-            return jsonify({'error': f'account_number is required (index {idx})'}), 400
-        if not name:
-            return jsonify({'error': f'name is required (account {account_number})'}), 400
-        if not acc_type:
-            return jsonify({'error': f'type is required (account {account_number})'}), 400
-
-        normalized.append({
-            'account_number': account_number,
-            'name': name,
-            'type': acc_type,
-            'transaction_type': transaction_type,
-            'tracks_weight': bool(row.get('tracks_weight', False)),
-            'bank_name': row.get('bank_name'),
-            'account_number_external': row.get('account_number_external'),
-            'account_type': row.get('account_type'),
-            'parent_account_number': (row.get('parent_account_number') or None),
-            'memo_account_number': (row.get('memo_account_number') or None),
-        })
-
-    numbers = [r['account_number'] for r in normalized]
-    existing = Account.query.filter(Account.account_number.in_(numbers)).all()
-    existing_by_number = {acc.account_number: acc for acc in existing}
+    - Upserts by account_number; does NOT import balances
+    - Body: the /accounts/export JSON (or a bare list), or a multipart `file`
+      (.json or .csv with the export's columns)
+    - The whole chart is validated first (duplicates, missing parent/memo
+      references, parent cycles) and written in one transaction
+    - Rows without transaction_type are imported as 'both'
 
-    created = 0
-    updated = 0
+    Query params (optional):
+      - dry_run: 1 to return the diff without writing
+      - memo_twins: 1 to add the '7' + number memo twin of every financial account lacking one
+    """
+    def flag(name):
+        return str(request.args.get(name, '')).strip().lower() in ('1', 'true', 'yes')
 
-    # Pass 1: upsert core fields (no relationships)
-    for row in normalized:
-        acc = existing_by_number.get(row['account_number'])
-        if acc is None:
-            acc = Account(
-                account_number=row['account_number'],
-                name=row['name'],
-                type=row['type'],
-                transaction_type=row['transaction_type'],
-                tracks_weight=row['tracks_weight'],
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            rows = read_chart(
+                upload.read(),
+                'csv' if (upload.filename or '').lower().endswith('.csv') else 'json',
+                default_transaction_type='both',
             )
-            created += 1
         else:
-            acc.name = row['name']
-            acc.type = row['type']
-            acc.transaction_type = row['transaction_type']
-            acc.tracks_weight = row['tracks_weight']
-            updated += 1
-
-        acc.bank_name = row['bank_name']
-        acc.account_number_external = row['account_number_external']
-        acc.account_type = row['account_type']
-
-        db.session.add(acc)
-
-    db.session.flush()
-
-    # Build mapping after upserts
-    imported_accounts = Account.query.filter(Account.account_number.in_(numbers)).all()
-    number_to_id = {acc.account_number: acc.id for acc in imported_accounts}
-    accounts_by_number = {acc.account_number: acc for acc in imported_accounts}
-
-    # Validate referenced parents/memos exist in import set
-    missing_refs = []
-    for row in normalized:
-        p = row.get('parent_account_number')
-        m = row.get('memo_account_number')
-        if p and p not in number_to_id:
-            missing_refs.append({'account_number': row['account_number'], 'missing': 'parent_account_number', 'ref': p})
-        if m and m not in number_to_id:
-            missing_refs.append({'account_number': row['account_number'], 'missing': 'memo_account_number', 'ref': m})
-    if missing_refs:
+            payload = request.get_json(silent=True)
+            if payload is None:
+                return jsonify({'error': 'Invalid or missing JSON body'}), 400
+            rows = read_chart(payload, default_transaction_type='both')
+        result = import_chart(rows, memo_twins=flag('memo_twins'), dry_run=flag('dry_run'))
+    except ChartImportError as exc:
         db.session.rollback()
-        return jsonify({
-            'error': 'missing_references',
-            'message': 'Some parent/memo references are missing from the import payload',
-            'missing': missing_refs,
-        }), 400
-
-    # Pass 2: set relationships
-    relinked = 0
-    for row in normalized:
-        acc = accounts_by_number[row['account_number']]
-        parent_num = row.get('parent_account_number')
-        memo_num = row.get('memo_account_number')
+        return jsonify({'error': 'invalid_chart', 'message': str(exc), 'errors': exc.errors}), 400
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({'error': str(exc)}), 400
 
-        new_parent_id = number_to_id.get(parent_num) if parent_num else None
-        new_memo_id = number_to_id.get(memo_num) if memo_num else None
+    if not result['dry_run']:
+        db.session.commit()
+    return jsonify({'success': True, **result}), 200
 
-        if acc.parent_id != new_parent_id or acc.memo_account_id != new_memo_id:
-            relinked += 1
 
-        acc.parent_id = new_parent_id
-        acc.memo_account_id = new_memo_id
-        db.session.add(acc)
+@api.route('/accounts/renumber', methods=['POST'])
+@require_permission('accounts.edit')
+def renumber_account_numbers():
+    """Renumber accounts in one set-based update.
+
+    Body: {"mapping": {"old_number": "new_number", ...}} (or a list of
+    {"from": ..., "to": ...}), optional "follow_memo_twins" (default true).
+    Numbers the system looks up directly (1100, 1300, ...) are refused unless
+    "allow_protected" is true.
+    Query param dry_run=1 returns the planned changes without writing.
+    """
+    payload = request.get_json(silent=True) or {}
+    mapping = payload.get('mapping')
+    if isinstance(mapping, list):
+        mapping = {item.get('from'): item.get('to') for item in mapping if isinstance(item, dict)}
+    if not isinstance(mapping, dict) or not mapping:
+        return jsonify({'error': 'mapping is required'}), 400
 
-    db.session.commit()
+    dry_run = str(request.args.get('dry_run', '')).strip().lower() in ('1', 'true', 'yes')
+    try:
+        result = renumber_chart(
+            mapping,
+            follow_memo_twins=payload.get('follow_memo_twins', True) is not False,
+            dry_run=dry_run,
+            allow_protected=payload.get('allow_protected') is True,
+        )
+    except ChartImportError as exc:
+        db.session.rollback()
+        return jsonify({'error': 'invalid_mapping', 'message': str(exc), 'errors': exc.errors}), 400
 
-    return jsonify({
-        'success': True,
-        'created': created,
-        'updated': updated,
-        'relinked': relinked,
-        'count': len(normalized),
-    }), 200
+    if not dry_run:
+        db.session.commit()
+    return jsonify({'success': True, **result}), 200
 
 
 @api.route('/accounts/balances', methods=['GET'])
@@ -10346,28 +10374,20 @@ def get_accounts_balances():
     """
     # جلب جميع الحسابات
     accounts = Account.query.all()
-    
+
+    # الأرصدة من آخر سنة مالية مقفلة + الأسطر التي بعدها (استعلام واحد لكل الحسابات)
+    totals = account_totals()
+    empty = dict.fromkeys(FISCAL_ACCOUNT_COLUMNS, 0.0)
+
     balances = {}
     
     for acc in accounts:
-        # حساب الأرصدة من journal_entry_line
-        account_lines = db.session.query(
-            func.sum(JournalEntryLine.cash_debit - JournalEntryLine.cash_credit).label('balance_cash'),
-            func.sum(JournalEntryLine.debit_18k - JournalEntryLine.credit_18k).label('balance_18k'),
-            func.sum(JournalEntryLine.debit_21k - JournalEntryLine.credit_21k).label('balance_21k'),
-            func.sum(JournalEntryLine.debit_22k - JournalEntryLine.credit_22k).label('balance_22k'),
-            func.sum(JournalEntryLine.debit_24k - JournalEntryLine.credit_24k).label('balance_24k')
-        ).filter(
-            JournalEntryLine.account_id == acc.id,
-            JournalEntryLine.is_deleted == False
-        ).first()
-        
-        # تحويل None إلى 0
-        balance_cash = account_lines.balance_cash or 0.0
-        balance_18k = account_lines.balance_18k or 0.0
-        balance_21k = account_lines.balance_21k or 0.0
-        balance_22k = account_lines.balance_22k or 0.0
-        balance_24k = account_lines.balance_24k or 0.0
+        sums = totals.get(acc.id, empty)
+        balance_cash = sums['cash_debit'] - sums['cash_credit']
+        balance_18k = sums['debit_18k'] - sums['credit_18k']
+        balance_21k = sums['debit_21k'] - sums['credit_21k']
+        balance_22k = sums['debit_22k'] - sums['credit_22k']
+        balance_24k = sums['debit_24k'] - sums['credit_24k']
         
         # حفظ الأرصدة
         balances[acc.id] = {
@@ -10785,7 +10805,8 @@ def get_journal_entries():
     return jsonify(result)
 
 def get_main_karat():
-    settings = Settings.query.first()
+    posting = current_posting_context()
+    settings = posting.settings if posting is not None else Settings.query.first()
     return settings.main_karat if settings else 21
 
 def convert_to_main_karat(weight, karat):
@@ -10801,6 +10822,19 @@ def convert_to_main_karat(weight, karat):
     return (weight * karat_val) / main_karat
 
 
+def main_karat_converter():
+    """convert_to_main_karat with the main karat read once, for loops over many rows."""
+    main_karat = _coerce_float(get_main_karat(), 0.0)
+
+    def convert(weight, karat):
+        karat_val = _coerce_float(karat, 0.0)
+        if karat_val == 0 or main_karat == 0:
+            return 0
+        return (weight * karat_val) / main_karat
+
+    return convert
+
+
 def convert_from_main_karat(weight, karat):
     """
     يحول من الوزن بالعيار الرئيسي إلى عيار محدد مع معالجة الأنواع النصية.
@@ -10815,7 +10849,8 @@ def convert_from_main_karat(weight, karat):
 
 
 def _get_manufacturing_wage_mode():
-    settings = Settings.query.first()
+    posting = current_posting_context()
+    settings = posting.settings if posting is not None else Settings.query.first()
     if not settings or not getattr(settings, 'manufacturing_wage_mode', None):
         return 'expense'
     return settings.manufacturing_wage_mode or 'expense'
@@ -11338,18 +11373,7 @@ def get_sales_overview_report():
     gold_type_filter = request.args.get('gold_type')
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date:
-            start_value = _parse_iso_date(start_date, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date:
-            end_value = _parse_iso_date(end_date, 'end_date')
-            # استخدم < end_dt لتجنب مشاكل المناطق الزمنية
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
-
+        start_dt, end_dt = date_bounds(start_date, end_date)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
@@ -11575,17 +11599,7 @@ def get_employee_scrap_ledger_report():
     include_unassigned = (request.args.get('include_unassigned', 'true').lower() == 'true')
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date:
-            start_value = _parse_iso_date(start_date, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date:
-            end_value = _parse_iso_date(end_date, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
-
+        start_dt, end_dt = date_bounds(start_date, end_date)
         branch_id = int(branch_id_param) if branch_id_param not in (None, '') else None
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
@@ -11802,17 +11816,7 @@ def get_sales_by_customer_report():
     order_direction = (request.args.get('order_direction') or 'desc').lower()
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date:
-            start_value = _parse_iso_date(start_date, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date:
-            end_value = _parse_iso_date(end_date, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
-
+        start_dt, end_dt = date_bounds(start_date, end_date)
         limit = int(limit_param) if limit_param else 25
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
@@ -12008,17 +12012,7 @@ def get_sales_by_item_report():
     order_direction = (request.args.get('order_direction') or 'desc').lower()
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date:
-            start_value = _parse_iso_date(start_date, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date:
-            end_value = _parse_iso_date(end_date, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
-
+        start_dt, end_dt = date_bounds(start_date, end_date)
         limit = int(limit_param) if limit_param else 25
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
@@ -13084,22 +13078,13 @@ def get_inventory_movement_report():
         group_interval = 'day'
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date_param:
-            start_value = _parse_iso_date(start_date_param, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date_param:
-            end_value = _parse_iso_date(end_date_param, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
+        start_dt, end_dt = date_bounds(start_date_param, end_date_param)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    now = datetime.utcnow()
     if end_dt is None:
-        end_dt = datetime.combine(now.date(), datetime.min.time()) + timedelta(days=1)
+        # Default window ends with today in the store's timezone.
+        end_dt = day_range()[1]
     if start_dt is None:
         start_dt = end_dt - timedelta(days=30)
 
@@ -13489,6 +13474,7 @@ def get_inventory_movement_report():
 
 @api.route('/general_ledger_all', methods=['GET'])
 @require_permission('reports.financial')
+@background_capable(title='General ledger export')
 def get_general_ledger_all():
     """
     دفتر الأستاذ العام - عرض جميع الحركات
@@ -13498,7 +13484,15 @@ def get_general_ledger_all():
     - end_date: تاريخ النهاية (YYYY-MM-DD)
     - show_balances: عرض الأرصدة التراكمية (true/false)
     - karat_detail: عرض تفاصيل الأعيرة (true/false)
+    - format: json (default) | csv | ndjson | xlsx — exports stream row by row
+      with running balances per account
+    - columns: comma-separated export columns (exports only)
+    - gzip: 1 to gzip the export (Content-Encoding: gzip)
     """
+    export_format = (request.args.get('format') or 'json').strip().lower()
+    if export_format not in ('json',) + LEDGER_EXPORT_FORMATS:
+        return jsonify({'error': 'Invalid format. Expected json, csv, ndjson or xlsx'}), 400
+
     account_id = request.args.get('account_id', type=int)
     start_date_param = request.args.get('start_date')
     end_date_param = request.args.get('end_date')
@@ -13514,14 +13508,10 @@ def get_general_ledger_all():
 
     # Parse/validate date filters
     try:
-        start_value = _parse_iso_date(start_date_param, 'start_date') if start_date_param else None
-        end_value = _parse_iso_date(end_date_param, 'end_date') if end_date_param else None
+        start_dt, end_dt = date_bounds(start_date_param, end_date_param)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    start_dt = datetime.combine(start_value, datetime.min.time()) if start_value else None
-    end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1) if end_value else None
-
     if start_dt and end_dt and end_dt <= start_dt:
         end_dt = start_dt + timedelta(days=1)
 
@@ -13543,52 +13533,42 @@ def get_general_ledger_all():
                 seen.append(value)
         reference_filters = seen
 
-    query = (
-        JournalEntryLine.query
-        .join(JournalEntry, JournalEntry.id == JournalEntryLine.journal_entry_id)
-        .join(Account, Account.id == JournalEntryLine.account_id)
-        .options(
-            joinedload(JournalEntryLine.account).joinedload(Account.safe_boxes),
-            joinedload(JournalEntryLine.journal_entry),
-        )
-        .filter(JournalEntryLine.is_deleted == False)
-        .filter(JournalEntry.is_deleted == False)
+    branch_normalized = (branch_param or '').strip().lower() or None
+    filters = LedgerFilters(
+        account_id=account_id,
+        start_dt=start_dt,
+        end_dt=end_dt,
+        posted_only=posted_only,
+        reference_types=reference_filters,
+        created_by=created_by_param,
+        posted_by=posted_by_param,
+        user=user_param,
+        branch=branch_normalized,
     )
+    main_karat_value = _coerce_float(get_main_karat(), 0.0) or 21.0
 
-    if account_id:
-        query = query.filter(JournalEntryLine.account_id == account_id)
-    if start_dt:
-        query = query.filter(JournalEntry.date >= start_dt)
-    if end_dt:
-        query = query.filter(JournalEntry.date < end_dt)
-    if posted_only:
-        query = query.filter(JournalEntry.is_posted == True)
-    if reference_filters:
-        query = query.filter(JournalEntry.reference_type.in_(reference_filters))
-    if created_by_param:
-        query = query.filter(JournalEntry.created_by == created_by_param)
-    if posted_by_param:
-        query = query.filter(JournalEntry.posted_by == posted_by_param)
-    if user_param:
-        query = query.filter(or_(
-            JournalEntry.created_by == user_param,
-            JournalEntry.posted_by == user_param,
-        ))
-
-    branch_normalized = None
-    if branch_param:
-        branch_normalized = branch_param.strip().lower()
-        if branch_normalized:
-            query = query.outerjoin(SafeBox, SafeBox.account_id == Account.id)
-            query = query.filter(
-                func.lower(func.coalesce(SafeBox.branch, '')) == branch_normalized
-            )
+    if export_format != 'json':
+        try:
+            columns = parse_columns(request.args.get('columns')) or default_columns(show_balances, karat_detail)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        if export_format == 'xlsx' and not xlsx_available():
+            return jsonify({'error': 'XLSX export requires openpyxl on the server'}), 501
+        # The job runner stores the body as-is, so only compress live downloads.
+        compress = (
+            (request.args.get('gzip') or '').strip().lower() in ('1', 'true', 'yes')
+            and not g.get('background_job_id')
+        )
+        content_type = LEDGER_EXPORT_WRITERS[export_format][1]
+        headers = {'Content-Disposition': f'attachment; filename=general_ledger.{export_format}'}
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+        chunks = ledger_export_chunks(filters, export_format, columns, main_karat_value, compress=compress)
+        return Response(stream_with_context(chunks), content_type=content_type, headers=headers)
 
-    lines = (
-        query
-        .order_by(JournalEntry.date.asc(), JournalEntry.id.asc(), JournalEntryLine.id.asc())
-        .all()
-    )
+    lines = ledger_rows(filters)
+    branches = ledger_account_branches()
 
     running_cash_balance = 0.0
     running_gold_18k = 0.0
@@ -13603,8 +13583,8 @@ def get_general_ledger_all():
     entries_payload = []
 
     for line in lines:
-        gold_debit_normalized = _line_weight_total_in_main_karat(line, 'debit')
-        gold_credit_normalized = _line_weight_total_in_main_karat(line, 'credit')
+        gold_debit_normalized = ledger_line_weight(line, 'debit', main_karat_value)
+        gold_credit_normalized = ledger_line_weight(line, 'credit', main_karat_value)
 
         cash_debit = float(line.cash_debit or 0.0)
         cash_credit = float(line.cash_credit or 0.0)
@@ -13620,29 +13600,22 @@ def get_general_ledger_all():
         running_gold_22k += (line.debit_22k or 0.0) - (line.credit_22k or 0.0)
         running_gold_24k += (line.debit_24k or 0.0) - (line.credit_24k or 0.0)
 
-        account_branch = None
-        if line.account and getattr(line.account, 'safe_boxes', None):
-            for safe_box in line.account.safe_boxes:
-                if safe_box and safe_box.branch:
-                    account_branch = safe_box.branch
-                    break
-
         entry_data = {
             'id': line.id,
             'journal_entry_id': line.journal_entry_id,
-            'journal_entry_number': line.journal_entry.entry_number if line.journal_entry else None,
-            'date': line.journal_entry.date.isoformat() if line.journal_entry and line.journal_entry.date else None,
-            'description': (line.journal_entry.description if line.journal_entry else None) or line.description,
-            'entry_type': line.journal_entry.entry_type if line.journal_entry else None,
+            'journal_entry_number': line.entry_number,
+            'date': line.entry_date.isoformat() if line.entry_date else None,
+            'description': line.entry_description or line.description,
+            'entry_type': line.entry_type,
             'account_id': line.account_id,
-            'account_name': line.account.name if line.account else 'حساب غير معروف',
-            'account_number': line.account.account_number if line.account else None,
-            'account_branch': account_branch,
-            'reference_type': line.journal_entry.reference_type if line.journal_entry else None,
-            'reference_number': line.journal_entry.reference_number if line.journal_entry else None,
-            'is_posted': bool(line.journal_entry.is_posted) if line.journal_entry else False,
-            'created_by': line.journal_entry.created_by if line.journal_entry else None,
-            'posted_by': line.journal_entry.posted_by if line.journal_entry else None,
+            'account_name': line.account_name or 'حساب غير معروف',
+            'account_number': line.account_number,
+            'account_branch': branches.get(line.account_id),
+            'reference_type': line.reference_type,
+            'reference_number': line.reference_number,
+            'is_posted': bool(line.is_posted),
+            'created_by': line.created_by,
+            'posted_by': line.posted_by,
             'cash_debit': round(cash_debit, 2),
             'cash_credit': round(cash_credit, 2),
             'gold_debit': round(gold_debit_normalized, 3),
@@ -13673,10 +13646,10 @@ def get_general_ledger_all():
             entry_data['running_balance'] = {
                 'cash': round(running_cash_balance, 2),
                 'gold_normalized': round(
-                    convert_to_main_karat(running_gold_18k, 18)
-                    + convert_to_main_karat(running_gold_21k, 21)
-                    + convert_to_main_karat(running_gold_22k, 22)
-                    + convert_to_main_karat(running_gold_24k, 24),
+                    running_gold_18k * 18 / main_karat_value
+                    + running_gold_21k * 21 / main_karat_value
+                    + running_gold_22k * 22 / main_karat_value
+                    + running_gold_24k * 24 / main_karat_value,
                     3,
                 ),
             }
@@ -13702,10 +13675,10 @@ def get_general_ledger_all():
         'final_balance': {
             'cash': round(running_cash_balance, 2),
             'gold_normalized': round(
-                convert_to_main_karat(running_gold_18k, 18)
-                + convert_to_main_karat(running_gold_21k, 21)
-                + convert_to_main_karat(running_gold_22k, 22)
-                + convert_to_main_karat(running_gold_24k, 24),
+                running_gold_18k * 18 / main_karat_value
+                + running_gold_21k * 21 / main_karat_value
+                + running_gold_22k * 22 / main_karat_value
+                + running_gold_24k * 24 / main_karat_value,
                 3,
             ),
         },
@@ -13764,13 +13737,9 @@ def get_analytics_summary():
     dimension_code = code_map.get(group_by, 'office')
 
     try:
-        start_value = _parse_iso_date(start_date_param, 'start_date') if start_date_param else None
-        end_value = _parse_iso_date(end_date_param, 'end_date') if end_date_param else None
+        start_dt, end_dt = date_bounds(start_date_param, end_date_param)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
-
-    start_dt = datetime.combine(start_value, datetime.min.time()) if start_value else None
-    end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1) if end_value else None
     if start_dt and end_dt and end_dt <= start_dt:
         end_dt = start_dt + timedelta(days=1)
 
@@ -14010,22 +13979,13 @@ def get_sales_vs_purchases_trend():
         group_interval = 'day'
 
     try:
-        start_dt = None
-        end_dt = None
-
-        if start_date_param:
-            start_value = _parse_iso_date(start_date_param, 'start_date')
-            start_dt = datetime.combine(start_value, datetime.min.time())
-
-        if end_date_param:
-            end_value = _parse_iso_date(end_date_param, 'end_date')
-            end_dt = datetime.combine(end_value, datetime.min.time()) + timedelta(days=1)
+        start_dt, end_dt = date_bounds(start_date_param, end_date_param)
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    now = datetime.utcnow()
     if end_dt is None:
-        end_dt = datetime.combine(now.date(), datetime.min.time()) + timedelta(days=1)
+        # Default window ends with today in the store's timezone.
+        end_dt = day_range()[1]
     if start_dt is None:
         start_dt = end_dt - timedelta(days=30)
 
@@ -14233,8 +14193,8 @@ def get_customer_balances_aging():
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    cutoff_date = cutoff_value or datetime.utcnow().date()
-    cutoff_end = datetime.combine(cutoff_date, datetime.min.time()) + timedelta(days=1)
+    cutoff_date = cutoff_value or store_today()
+    cutoff_end = day_range(cutoff_date)[1]
 
     try:
         top_limit = int(top_limit_param) if top_limit_param else 5
@@ -14658,21 +14618,32 @@ def get_account_ledger(account_id):
     end_date = request.args.get('end_date')
     karat_detail = request.args.get('karat_detail', 'true').lower() == 'true'
     
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
+
+    # Without a start date the ledger opens at the first open fiscal year:
+    # closed years are carried in by their snapshot.
+    opened_after_year = None
+    if start_dt is None:
+        opened_after_year = closed_through()
+        if opened_after_year is not None:
+            start_dt = year_start(opened_after_year + 1)
+
+    to_main_karat = main_karat_converter()
+
     # Build query
-    query = JournalEntryLine.query.join(JournalEntry).filter(
+    query = JournalEntryLine.query.join(JournalEntry).options(
+        contains_eager(JournalEntryLine.journal_entry)
+    ).filter(
         JournalEntryLine.account_id == account_id,
         JournalEntryLine.is_deleted == False
     )
     
     # Apply date filters
-    if start_date:
-        from datetime import datetime
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-        query = query.filter(JournalEntry.date >= start_dt)
+    if start_dt is not None:
+        query = query.filter(JournalEntry.date >= start_dt, JournalEntryLine.entry_date >= start_dt)
     
-    if end_date:
-        from datetime import datetime
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    if end_dt is not None:
         query = query.filter(JournalEntry.date <= end_dt)
     
     # Get opening balance (before start_date if specified)
@@ -14682,20 +14653,14 @@ def get_account_ledger(account_id):
     opening_22k = 0
     opening_24k = 0
     
-    if start_date:
-        opening_query = JournalEntryLine.query.join(JournalEntry).filter(
-            JournalEntryLine.account_id == account_id,
-            JournalEntryLine.is_deleted == False,
-            JournalEntry.date < start_dt
-        )
-        
-        opening_lines = opening_query.all()
-        for line in opening_lines:
-            opening_cash += (line.cash_debit or 0) - (line.cash_credit or 0)
-            opening_18k += (line.debit_18k or 0) - (line.credit_18k or 0)
-            opening_21k += (line.debit_21k or 0) - (line.credit_21k or 0)
-            opening_22k += (line.debit_22k or 0) - (line.credit_22k or 0)
-            opening_24k += (line.debit_24k or 0) - (line.credit_24k or 0)
+    if start_dt is not None:
+        opening = account_totals([account_id], until=start_dt, inclusive=False).get(account_id)
+        if opening:
+            opening_cash = opening['cash_debit'] - opening['cash_credit']
+            opening_18k = opening['debit_18k'] - opening['credit_18k']
+            opening_21k = opening['debit_21k'] - opening['credit_21k']
+            opening_22k = opening['debit_22k'] - opening['credit_22k']
+            opening_24k = opening['debit_24k'] - opening['credit_24k']
     
     # Order by date
     lines = query.order_by(JournalEntry.date.asc(), JournalEntry.id.asc()).all()
@@ -14711,16 +14676,16 @@ def get_account_ledger(account_id):
     for line in lines:
         # Calculate normalized gold
         gold_debit_normalized = (
-            convert_to_main_karat(line.debit_18k or 0, 18) +
-            convert_to_main_karat(line.debit_21k or 0, 21) +
-            convert_to_main_karat(line.debit_22k or 0, 22) +
-            convert_to_main_karat(line.debit_24k or 0, 24)
+            to_main_karat(line.debit_18k or 0, 18) +
+            to_main_karat(line.debit_21k or 0, 21) +
+            to_main_karat(line.debit_22k or 0, 22) +
+            to_main_karat(line.debit_24k or 0, 24)
         )
         gold_credit_normalized = (
-            convert_to_main_karat(line.credit_18k or 0, 18) +
-            convert_to_main_karat(line.credit_21k or 0, 21) +
-            convert_to_main_karat(line.credit_22k or 0, 22) +
-            convert_to_main_karat(line.credit_24k or 0, 24)
+            to_main_karat(line.credit_18k or 0, 18) +
+            to_main_karat(line.credit_21k or 0, 21) +
+            to_main_karat(line.credit_22k or 0, 22) +
+            to_main_karat(line.credit_24k or 0, 24)
         )
         
         # Update running balances
@@ -14742,10 +14707,10 @@ def get_account_ledger(account_id):
             'running_balance': {
                 'cash': round(running_cash, 2),
                 'gold_normalized': round(
-                    convert_to_main_karat(running_18k, 18) +
-                    convert_to_main_karat(running_21k, 21) +
-                    convert_to_main_karat(running_22k, 22) +
-                    convert_to_main_karat(running_24k, 24),
+                    to_main_karat(running_18k, 18) +
+                    to_main_karat(running_21k, 21) +
+                    to_main_karat(running_22k, 22) +
+                    to_main_karat(running_24k, 24),
                     3
                 )
             }
@@ -14791,10 +14756,10 @@ def get_account_ledger(account_id):
         'opening_balance': {
             'cash': round(opening_cash, 2),
             'gold_normalized': round(
-                convert_to_main_karat(opening_18k, 18) +
-                convert_to_main_karat(opening_21k, 21) +
-                convert_to_main_karat(opening_22k, 22) +
-                convert_to_main_karat(opening_24k, 24),
+                to_main_karat(opening_18k, 18) +
+                to_main_karat(opening_21k, 21) +
+                to_main_karat(opening_22k, 22) +
+                to_main_karat(opening_24k, 24),
                 3
             ),
             'by_karat': {
@@ -14807,10 +14772,10 @@ def get_account_ledger(account_id):
         'closing_balance': {
             'cash': round(running_cash, 2),
             'gold_normalized': round(
-                convert_to_main_karat(running_18k, 18) +
-                convert_to_main_karat(running_21k, 21) +
-                convert_to_main_karat(running_22k, 22) +
-                convert_to_main_karat(running_24k, 24),
+                to_main_karat(running_18k, 18) +
+                to_main_karat(running_21k, 21) +
+                to_main_karat(running_22k, 22) +
+                to_main_karat(running_24k, 24),
                 3
             ),
             'by_karat': {
@@ -14825,7 +14790,8 @@ def get_account_ledger(account_id):
         'filters': {
             'start_date': start_date,
             'end_date': end_date,
-            'karat_detail': karat_detail
+            'karat_detail': karat_detail,
+            'opened_after_fiscal_year': opened_after_year,
         }
     })
 
@@ -14845,40 +14811,36 @@ def get_trial_balance():
     end_date = request.args.get('end_date')
     karat_detail = request.args.get('karat_detail', 'false').lower() == 'true'
     
-    # Start building the query
-    query = db.session.query(
-        Account.id,
-        Account.name,
-        Account.account_number,
-        func.sum(JournalEntryLine.cash_debit).label('total_cash_debit'),
-        func.sum(JournalEntryLine.cash_credit).label('total_cash_credit'),
-        func.sum(JournalEntryLine.debit_18k).label('total_debit_18k'),
-        func.sum(JournalEntryLine.credit_18k).label('total_credit_18k'),
-        func.sum(JournalEntryLine.debit_21k).label('total_debit_21k'),
-        func.sum(JournalEntryLine.credit_21k).label('total_credit_21k'),
-        func.sum(JournalEntryLine.debit_22k).label('total_debit_22k'),
-        func.sum(JournalEntryLine.credit_22k).label('total_credit_22k'),
-        func.sum(JournalEntryLine.debit_24k).label('total_debit_24k'),
-        func.sum(JournalEntryLine.credit_24k).label('total_credit_24k')
-    ).join(Account).join(JournalEntry)
-    
-    # Apply date filters if provided
-    if start_date:
-        try:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(JournalEntry.entry_date >= start_dt)
-        except ValueError:
-            return jsonify({'error': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
-    
-    if end_date:
-        try:
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(JournalEntry.entry_date <= end_dt)
-        except ValueError:
-            return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
-    
-    query_result = query.group_by(Account.id, Account.name, Account.account_number).all()
+    try:
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    except ValueError:
+        return jsonify({'error': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
+    try:
+        end_dt = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
+
+    # Cumulative totals start from the latest closed fiscal-year snapshot;
+    # a start_date limits them to the period instead.
+    sums = account_totals(until=end_dt, start=start_dt)
+
+    names = {
+        row.id: row
+        for row in db.session.query(Account.id, Account.name, Account.account_number)
+        .filter(Account.id.in_(list(sums)))
+    } if sums else {}
+    query_result = [
+        SimpleNamespace(
+            id=account_id,
+            name=names[account_id].name,
+            account_number=names[account_id].account_number,
+            **{f'total_{column}': values.get(column) for column in FISCAL_ACCOUNT_COLUMNS},
+        )
+        for account_id, values in sorted(sums.items())
+        if account_id in names
+    ]
 
+    to_main_karat = main_karat_converter()
     trial_balance = []
     
     # Initialize grand totals
@@ -14957,16 +14919,16 @@ def get_trial_balance():
         else:
             # Normalize gold weights to main karat
             gold_debit = (
-                convert_to_main_karat(row.total_debit_18k or 0, 18) +
-                convert_to_main_karat(row.total_debit_21k or 0, 21) +
-                convert_to_main_karat(row.total_debit_22k or 0, 22) +
-                convert_to_main_karat(row.total_debit_24k or 0, 24)
+                to_main_karat(row.total_debit_18k or 0, 18) +
+                to_main_karat(row.total_debit_21k or 0, 21) +
+                to_main_karat(row.total_debit_22k or 0, 22) +
+                to_main_karat(row.total_debit_24k or 0, 24)
             )
             gold_credit = (
-                convert_to_main_karat(row.total_credit_18k or 0, 18) +
-                convert_to_main_karat(row.total_credit_21k or 0, 21) +
-                convert_to_main_karat(row.total_credit_22k or 0, 22) +
-                convert_to_main_karat(row.total_credit_24k or 0, 24)
+                to_main_karat(row.total_credit_18k or 0, 18) +
+                to_main_karat(row.total_credit_21k or 0, 21) +
+                to_main_karat(row.total_credit_22k or 0, 22) +
+                to_main_karat(row.total_credit_24k or 0, 24)
             )
             
             # Only add accounts that have transactions
@@ -16264,7 +16226,7 @@ def create_journal_entry_from_voucher(voucher):
         # توليد رقم القيد
         year = voucher.date.year
         entry_number = JournalEntry.query.filter(
-            db.extract('year', JournalEntry.date) == year
+            *within(JournalEntry.date, *year_range(year))
         ).count() + 1
         entry_number_str = f'JE-{year}-{entry_number:05d}'
         
@@ -17099,6 +17061,7 @@ def get_vouchers_stats():
 # ========================================
 @api.route('/initialize-payment-system', methods=['POST'])
 @require_permission('system.settings')
+@background_capable(title='Initialize payment system')
 def initialize_payment_system():
     """
     تهيئة شجرة الحسابات ووسائل الدفع الافتراضية
@@ -17397,10 +17360,9 @@ def get_gold_price_history_report():
     except ValueError as exc:
         return jsonify({'error': str(exc)}), 400
 
-    now = datetime.utcnow()
-    default_start = (now - timedelta(days=90)).date()
-    applied_start = start_value or default_start
-    applied_end = end_value or now.date()
+    today = store_today()
+    applied_start = start_value or (today - timedelta(days=90))
+    applied_end = end_value or today
 
     if applied_start > applied_end:
         return jsonify({'error': 'start_date must be before end_date'}), 400
@@ -17411,13 +17373,11 @@ def get_gold_price_history_report():
         return jsonify({'error': 'Invalid limit parameter'}), 400
     limit = max(12, min(limit, 730))
 
-    start_dt = datetime.combine(applied_start, datetime.min.time())
-    end_dt = datetime.combine(applied_end, datetime.min.time()) + timedelta(days=1)
+    start_dt, end_dt = date_bounds(applied_start, applied_end)
 
     price_rows = (
         GoldPrice.query
-        .filter(GoldPrice.date >= start_dt)
-        .filter(GoldPrice.date < end_dt)
+        .filter(*within(GoldPrice.date, start_dt, end_dt))
         .order_by(GoldPrice.date.asc())
         .all()
     )
@@ -17454,7 +17414,7 @@ def get_gold_price_history_report():
     price_points = []
 
     for row in price_rows:
-        timestamp = row.date or now
+        timestamp = row.date or store_now()
         price_value = float(row.price or 0.0)
         key = bucket_key(timestamp)
         bucket = bucket_map.get(key)
@@ -18620,6 +18580,7 @@ def get_gold_safe_box_by_karat(karat):
 
 @api.route('/safe-boxes/gold/unify', methods=['POST'])
 @require_permission('safe_boxes.edit')
+@background_capable(title='Unify gold safe boxes')
 def unify_gold_safe_boxes():
     """Unify legacy karat-specific gold safe boxes into a single multi-karat safe.
 
@@ -19675,7 +19636,12 @@ def create_bnpl_settlement():
 # ============================================================================
 
 
-def _upsert_weight_closing_order(invoice: Invoice, close_price_per_gram: float, settings=None):
+def _upsert_weight_closing_order(invoice: Invoice, close_price_per_gram: float, settings=None, is_new_invoice=False):
+    """Create or refresh the weight-closing order of `invoice`.
+
+    `is_new_invoice` (invoice created in this transaction) skips the lookup of
+    an existing order.
+    """
     if not invoice:
         raise ValueError('invoice is required')
 
@@ -19685,7 +19651,7 @@ def _upsert_weight_closing_order(invoice: Invoice, close_price_per_gram: float,
     total_weight_main_karat = round(_invoice_weight_in_main_karat(invoice), 6)
     total_cash_value = round(total_weight_main_karat * close_price, 2)
 
-    order = WeightClosingOrder.query.filter_by(invoice_id=invoice.id).first()
+    order = None if is_new_invoice else WeightClosingOrder.query.filter_by(invoice_id=invoice.id).first()
     if order:
         order.main_karat = main_karat
         order.close_price_per_gram = close_price
@@ -19771,22 +19737,35 @@ def _auto_consume_weight_closing(
     if requested_weight <= 0:
         return summary
 
-    orders = (
-        WeightClosingOrder.query.filter(WeightClosingOrder.status.in_(['open', 'partially_closed']))
-        .order_by(WeightClosingOrder.created_at.asc())
-        .all()
-    )
+    # The execution karat, inventory and bridge accounts depend only on the
+    # source invoice: resolve them once, not once per consumed order.
+    execution_karat = None
+    inventory_account_id = None
+    bridge_id = None
+    if journal_entry_id and invoice:
+        karat_line = InvoiceKaratLine.query.filter_by(invoice_id=invoice.id).first()
+        execution_karat = karat_line.karat if karat_line else get_main_karat()
+
+        inventory_account_id = _get_inventory_account_by_karat(execution_karat)
+
+        bridge_account_id = Account.query.filter_by(account_number='1290').first()
+        if not bridge_account_id:
+            bridge_account_id = Account.query.filter_by(name='جسر مشتريات الكسر والتسكير').first()
+        bridge_id = bridge_account_id.id if bridge_account_id else None
 
     remaining = requested_weight
     cash_spent = 0.0
 
-    for order in orders:
+    # FIFO over open orders in small ordered batches (row-locked with SKIP LOCKED
+    # on PostgreSQL so concurrent consumers never execute the same order).
+    for order in iter_open_orders():
         if remaining <= 0:
             break
 
         available = max((order.total_weight_main_karat or 0.0) - (order.executed_weight_main_karat or 0.0), 0.0)
         if available <= 0:
             order.status = 'closed'
+            order.remaining_weight_main_karat = 0.0
             summary['orders_closed'].append(order.id)
             continue
 
@@ -19796,16 +19775,6 @@ def _auto_consume_weight_closing(
 
         # إنشاء قيد محاسبي للتنفيذ إذا كان هناك journal_entry_id
         if journal_entry_id and invoice:
-            karat_line = InvoiceKaratLine.query.filter_by(invoice_id=invoice.id).first()
-            execution_karat = karat_line.karat if karat_line else get_main_karat()
-
-            inventory_account_id = _get_inventory_account_by_karat(execution_karat)
-
-            bridge_account_id = Account.query.filter_by(account_number='1290').first()
-            if not bridge_account_id:
-                bridge_account_id = Account.query.filter_by(name='جسر مشتريات الكسر والتسكير').first()
-            bridge_id = bridge_account_id.id if bridge_account_id else None
-
             if bridge_id:
                 weight_in_karat = convert_from_main_karat(chunk, execution_karat)
 
@@ -19878,6 +19847,20 @@ def _auto_consume_weight_closing(
     return summary
 
 
+@api.route('/weight-closing/summary', methods=['GET'])
+@require_permission('journal.post')
+def get_weight_closing_summary():
+    """Open weight-closing orders and remaining weight (maintained counter, no scan)."""
+    return jsonify(open_totals())
+
+
+@api.route('/weight-closing/summary/recompute', methods=['POST'])
+@require_permission('journal.post')
+def recompute_weight_closing_summary():
+    """Rebuild the open-orders counter from the order table (drift repair)."""
+    return jsonify(recompute_open_totals())
+
+
 @api.route('/weight-closing/cash-settlement', methods=['POST'])
 @require_permission('journal.post')
 def create_weight_closing_cash_settlement():
@@ -20312,10 +20295,7 @@ def create_office_reservation():
         if reservation.weight_remaining_main_karat <= 0.0001:
             reservation.status = 'executed'
 
-        office.total_reservations = (office.total_reservations or 0) + 1
-        office.total_weight_purchased = (office.total_weight_purchased or 0.0) + weight_main_karat
-        office.total_amount_paid = (office.total_amount_paid or 0.0) + paid_amount
-        db.session.add(office)
+        apply_office_deltas(office.id, **reservation_deltas(reservation))
 
         db.session.commit()
 
@@ -20349,8 +20329,7 @@ def get_weight_based_income_statement():
         if not start_date_str or not end_date_str:
             return jsonify({'error': 'يجب تحديد تاريخ البداية والنهاية'}), 400
         
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1)
+        start_date, end_date = date_bounds(start_date_str, end_date_str)
 
         # سعر الذهب المباشر (عيار 24) لتحويل النقد إلى وزن عند الحاجة
         latest_gold_price = GoldPrice.query.order_by(GoldPrice.date.desc()).first()
@@ -20653,13 +20632,8 @@ def get_dual_account_statement():
             JournalEntry.is_posted == True
         )
         
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            query = query.filter(JournalEntry.date >= start_date)
-        
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-            query = query.filter(JournalEntry.date <= end_date)
+        start_dt, end_dt = date_bounds(start_date_str, end_date_str)
+        query = query.filter(*within(JournalEntry.date, start_dt, end_dt))
         
         lines = query.order_by(JournalEntry.date, JournalEntry.id).all()
         
@@ -20724,8 +20698,7 @@ def get_income_statement():
         if not start_date_str or not end_date_str:
             return jsonify({'error': 'يجب تحديد تاريخ البداية والنهاية'}), 400
         
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1)
+        start_date, end_date = date_bounds(start_date_str, end_date_str)
 
         # جلب قيود اليومية المرحّلة فقط
         entries = db.session.query(JournalEntryLine).join(JournalEntry).filter(
@@ -20929,95 +20902,30 @@ def get_bridge_balance_monitor():
     2. يحدد أي حساب جسر به رصيد غير صفري
     3. يوفر تفاصيل للتحقيق في الخلل المحاسبي
     
+    يُقرأ آخر فحص سجّله المجدول (SystemAlert)، ويُحسب مباشرة عند ?refresh=1
+    أو إن لم يُسجَّل أي فحص بعد.
+    
     Returns:
     - bridge_accounts: قائمة حسابات الجسر مع أرصدتها
     - alerts: تحذيرات لأي حساب به رصيد غير صفري
     - status: 'balanced' أو 'unbalanced'
+    - checked_at / source: وقت الفحص ومصدره (scheduled أو live)
     """
     try:
-        # البحث عن حسابات الجسر
-        # 1. من الإعدادات المحاسبية
-        bridge_mapping = AccountingMapping.query.filter(
-            or_(
-                AccountingMapping.mapping_key == 'supplier_bridge',
-                AccountingMapping.mapping_key == 'customer_bridge',
-                AccountingMapping.mapping_key.like('%bridge%')
-            )
-        ).all()
-        
-        bridge_account_ids = set()
-        for mapping in bridge_mapping:
-            if mapping.account_id:
-                bridge_account_ids.add(mapping.account_id)
-        
-        # 2. من أسماء الحسابات التي تحتوي على "جسر"
-        bridge_accounts_by_name = Account.query.filter(
-            or_(
-                Account.name.like('%جسر%'),
-                Account.name.like('%bridge%'),
-                Account.account_number.like('%999%')  # نمط شائع لحسابات الجسر
-            )
-        ).all()
-        
-        for acc in bridge_accounts_by_name:
-            bridge_account_ids.add(acc.id)
-        
-        # جمع البيانات
-        accounts_data = []
-        alerts = []
-        total_imbalance = 0.0
-        
-        for acc_id in bridge_account_ids:
-            account = Account.query.get(acc_id)
-            if not account:
-                continue
-            
-            balance = account.balance_cash or 0.0
-            
-            # التحقق من التوازن (هامش خطأ 0.01)
-            is_balanced = abs(balance) <= 0.01
-            
-            account_info = {
-                'account_id': account.id,
-                'account_number': account.account_number,
-                'account_name': account.name,
-                'balance': round(balance, 2),
-                'is_balanced': is_balanced,
-                'status': '✅ متوازن' if is_balanced else '⚠️ غير متوازن'
-            }
-            
-            accounts_data.append(account_info)
-            
-            if not is_balanced:
-                total_imbalance += abs(balance)
-                alerts.append({
-                    'severity': 'warning' if abs(balance) < 10 else 'error',
-                    'account_number': account.account_number,
-                    'account_name': account.name,
-                    'balance': round(balance, 2),
-                    'message': f'حساب الجسر {account.account_number} ({account.name}) به رصيد غير صفري: {balance:.2f} ريال',
-                    'recommendation': 'يرجى مراجعة القيود المحاسبية للفواتير المرتبطة بهذا الحساب'
-                })
-        
-        overall_status = 'balanced' if len(alerts) == 0 else 'unbalanced'
+        refresh = (request.args.get('refresh') or '').strip().lower() in ('1', 'true', 'yes')
+        last = None if refresh else last_check(BRIDGE_ALERT_TYPE)
+        if last is not None:
+            payload = dict(last['result'], checked_at=last['checked_at'], source='scheduled')
+        else:
+            payload = dict(bridge_balance_report(), checked_at=datetime.now().isoformat(), source='live')
         
-        return jsonify({
-            'status': overall_status,
-            'summary': {
-                'total_bridge_accounts': len(accounts_data),
-                'balanced_accounts': sum(1 for acc in accounts_data if acc['is_balanced']),
-                'unbalanced_accounts': sum(1 for acc in accounts_data if not acc['is_balanced']),
-                'total_imbalance': round(total_imbalance, 2)
-            },
-            'bridge_accounts': accounts_data,
-            'alerts': alerts,
-            'notes': [
-                '📌 القاعدة الذهبية: رصيد حساب الجسر = صفر دائماً',
-                '⚠️ أي رصيد غير صفري يشير إلى خلل محاسبي',
-                '🔍 يجب التحقيق في القيود المرتبطة بالحسابات غير المتوازنة',
-                '💡 هامش الخطأ المسموح: ±0.01 ريال (للفواصل العشرية)'
-            ]
-        }), 200
+        payload['notes'] = [
+            '📌 القاعدة الذهبية: رصيد حساب الجسر = صفر دائماً',
+            '⚠️ أي رصيد غير صفري يشير إلى خلل محاسبي',
+            '🔍 يجب التحقيق في القيود المرتبطة بالحسابات غير المتوازنة',
+            '💡 هامش الخطأ المسموح: ±0.01 ريال (للفواصل العشرية)'
+        ]
+        return jsonify(payload), 200
         
     except Exception as e:
         print(f"❌ Error generating bridge balance monitor: {e}")
@@ -21044,7 +20952,8 @@ def get_cash_trial_balance():
         if end_date_str:
             end_date = datetime.fromisoformat(end_date_str).date()
         else:
-            end_date = datetime.now().date()
+            end_date = store_today()
+        end_dt = day_range(end_date)[1]
         
         # جلب جميع الحسابات النقدية
         cash_accounts = Account.query.filter_by(transaction_type='cash').order_by(Account.account_number).all()
@@ -21057,7 +20966,7 @@ def get_cash_trial_balance():
             # حساب الرصيد من القيود حتى التاريخ المحدد
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date <= end_date
+                JournalEntry.date < end_dt
             ).all()
             
             debit_sum = sum(line.cash_debit or 0 for line in lines)
@@ -21119,7 +21028,8 @@ def get_gold_trial_balance():
         if end_date_str:
             end_date = datetime.fromisoformat(end_date_str).date()
         else:
-            end_date = datetime.now().date()
+            end_date = store_today()
+        end_dt = day_range(end_date)[1]
         
         karat_filter = request.args.get('karat')
         main_karat = MAIN_KARAT or 21
@@ -21135,7 +21045,7 @@ def get_gold_trial_balance():
             # حساب الرصيد من القيود حتى التاريخ المحدد
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date <= end_date
+                JournalEntry.date < end_dt
             ).all()
             
             # جمع الأوزان من جميع الأعيرة (محولة للعيار الرئيسي)
@@ -21194,127 +21104,32 @@ def get_inventory_reconciliation_report():
 
     يقارن بين:
     - حسابات المخزون المالية 13xx (قيمة بالريال)
-    - وحسابات المخزون الوزنية 7131xx (وزن بالجرام محوّل للعيار الرئيسي)
+    - وحسابات المخزون الوزنية (الحساب الموازي memo_account_id، أو 7 + الرقم)
 
     ويعرض لكل زوج (مالي ↔ وزني):
     - الرصيد المالي (ريال)
     - الرصيد الوزني (جرام)
     - نسبة القيمة لكل جرام (ريال/جرام) إن أمكن
+
+    بدون ?date يُقرأ آخر فحص سجّله المجدول (ما لم يُطلب ?refresh=1).
     """
     try:
-        from config import MAIN_KARAT
-
         end_date_str = request.args.get('date')
-        if end_date_str:
-            end_date = datetime.fromisoformat(end_date_str).date()
-        else:
-            end_date = datetime.now().date()
-
-        main_karat = MAIN_KARAT or 21
-
-        # 1) حساب أرصدة المخزون المالية 13xx
-        financial_accounts = Account.query.filter(
-            Account.account_number.like('13%'),
-            Account.transaction_type.in_(['cash', 'both']),
-        ).order_by(Account.account_number).all()
-
-        financial_balances = {}
-        for acc in financial_accounts:
-            lines = (
-                JournalEntryLine.query
-                .join(JournalEntry)
-                .filter(
-                    JournalEntryLine.account_id == acc.id,
-                    JournalEntry.date <= end_date,
-                )
-                .all()
-            )
-
-            debit_cash = sum(line.cash_debit or 0 for line in lines)
-            credit_cash = sum(line.cash_credit or 0 for line in lines)
-            balance_cash = debit_cash - credit_cash
-
-            financial_balances[acc.account_number] = {
-                'account': acc,
-                'balance_cash': balance_cash,
-            }
-
-        # 2) حساب أرصدة المخزون الوزنية 7131xx (وزن محوَّل للعيار الرئيسي)
-        gold_accounts = Account.query.filter(
-            Account.account_number.like('7131%'),
-            Account.transaction_type == 'gold',
-        ).order_by(Account.account_number).all()
+        refresh = (request.args.get('refresh') or '').strip().lower() in ('1', 'true', 'yes')
+        last = None
+        if not end_date_str and not refresh:
+            last = last_check(INVENTORY_ALERT_TYPE)
 
-        gold_balances = {}
-        for acc in gold_accounts:
-            lines = (
-                JournalEntryLine.query
-                .join(JournalEntry)
-                .filter(
-                    JournalEntryLine.account_id == acc.id,
-                    JournalEntry.date <= end_date,
-                )
-                .all()
+        if last is not None:
+            payload = dict(last['result'], checked_at=last['checked_at'], source='scheduled')
+        else:
+            end_date = datetime.fromisoformat(end_date_str).date() if end_date_str else None
+            payload = dict(
+                inventory_reconciliation_report(end_date),
+                checked_at=datetime.now().isoformat(),
+                source='live',
             )
-
-            debit_18k = sum(line.debit_18k or 0 for line in lines) * (18 / main_karat)
-            debit_21k = sum(line.debit_21k or 0 for line in lines) * (21 / main_karat)
-            debit_22k = sum(line.debit_22k or 0 for line in lines) * (22 / main_karat)
-            debit_24k = sum(line.debit_24k or 0 for line in lines) * (24 / main_karat)
-
-            credit_18k = sum(line.credit_18k or 0 for line in lines) * (18 / main_karat)
-            credit_21k = sum(line.credit_21k or 0 for line in lines) * (21 / main_karat)
-            credit_22k = sum(line.credit_22k or 0 for line in lines) * (22 / main_karat)
-            credit_24k = sum(line.credit_24k or 0 for line in lines) * (24 / main_karat)
-
-            total_debit_weight = debit_18k + debit_21k + debit_22k + debit_24k
-            total_credit_weight = credit_18k + credit_21k + credit_22k + credit_24k
-            balance_weight = total_debit_weight - total_credit_weight
-
-            gold_balances[acc.account_number] = {
-                'account': acc,
-                'balance_grams': balance_weight,
-            }
-
-        # 3) مطابقة 1310 ↔ 71310, 1320 ↔ 71320, 1340 ↔ 71330 ... الخ
-        rows = []
-        all_numbers = sorted(set(list(financial_balances.keys()) + list(gold_balances.keys())))
-
-        for number in all_numbers:
-            fin = financial_balances.get(number)
-            # نظير وزني متوقع بإضافة 7 في البداية (إن لم يكن 7131xx مباشرة)
-            expected_gold_number = None
-            if number.startswith('13') and not number.startswith('7131'):
-                # مثال: 1310 → 71310
-                expected_gold_number = '7' + number
-            else:
-                expected_gold_number = number
-
-            gold = gold_balances.get(expected_gold_number)
-
-            balance_cash = fin['balance_cash'] if fin else 0.0
-            balance_grams = gold['balance_grams'] if gold else 0.0
-
-            price_per_gram = None
-            if balance_grams and abs(balance_grams) > 0.0001:
-                price_per_gram = balance_cash / balance_grams
-
-            rows.append({
-                'financial_account': fin['account'].account_number if fin else number,
-                'financial_name': fin['account'].name if fin else None,
-                'gold_account': gold['account'].account_number if gold else expected_gold_number,
-                'gold_name': gold['account'].name if gold else None,
-                'balance_cash': round(float(balance_cash or 0.0), 2),
-                'balance_grams': round(float(balance_grams or 0.0), 3),
-                'price_per_gram': round(float(price_per_gram), 2) if price_per_gram is not None else None,
-            })
-
-        return jsonify({
-            'report_type': 'inventory_reconciliation',
-            'date': end_date.isoformat(),
-            'main_karat': main_karat,
-            'rows': rows,
-        }), 200
+        return jsonify(payload), 200
 
     except Exception as e:
         print(f"❌ Error generating inventory reconciliation report: {e}")
@@ -21344,10 +21159,10 @@ def get_gold_weight_trial_balance_by_safe_box():
         if end_date_str:
             end_date = datetime.fromisoformat(end_date_str).date()
         else:
-            end_date = datetime.now().date()
+            end_date = store_today()
 
         main_karat = float(MAIN_KARAT or 21)
-        end_dt = datetime.combine(end_date, time.max)
+        end_dt = day_range(end_date)[1]
 
         def _to_float(v):
             try:
@@ -21383,7 +21198,7 @@ def get_gold_weight_trial_balance_by_safe_box():
                     func.coalesce(func.sum(SafeBoxTransaction.weight_24k * sign), 0.0).label('b24'),
                 )
                 .filter(SafeBoxTransaction.safe_box_id == safe_id)
-                .filter(SafeBoxTransaction.created_at <= end_dt)
+                .filter(SafeBoxTransaction.created_at < end_dt)
                 .first()
             )
 
@@ -21421,7 +21236,7 @@ def get_gold_weight_trial_balance_by_safe_box():
                 )
                 .join(JournalEntry)
                 .filter(JournalEntryLine.account_id == account_id)
-                .filter(JournalEntry.date <= end_date)
+                .filter(JournalEntry.date < end_dt)
                 .first()
             )
 
@@ -21548,6 +21363,7 @@ def get_cash_income_statement():
 
         start_date = datetime.fromisoformat(start_date_str).date()
         end_date = datetime.fromisoformat(end_date_str).date()
+        start_dt, end_dt = date_bounds(start_date, end_date)
 
         # ---------- صافي المبيعات النقدية ----------
         revenue_accounts = Account.query.filter(
@@ -21560,8 +21376,8 @@ def get_cash_income_statement():
         for account in revenue_accounts:
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date >= start_date,
-                JournalEntry.date <= end_date
+                JournalEntry.date >= start_dt,
+                JournalEntry.date < end_dt
             ).all()
 
             credit_sum = sum(line.cash_credit or 0 for line in lines)
@@ -21585,8 +21401,8 @@ def get_cash_income_statement():
         for karat in (18, 21, 22, 24):
             sold_weight = db.session.query(func.coalesce(func.sum(InvoiceKaratLine.weight_grams), 0.0)).join(Invoice).filter(
                 InvoiceKaratLine.karat == str(karat),
-                Invoice.date >= start_date,
-                Invoice.date <= end_date,
+                Invoice.date >= start_dt,
+                Invoice.date < end_dt,
                 Invoice.is_posted == True,
                 Invoice.invoice_type.in_(['بيع'])
             ).scalar() or 0.0
@@ -21617,8 +21433,8 @@ def get_cash_income_statement():
         if manufacturing_wage_expense_acc_id:
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == manufacturing_wage_expense_acc_id,
-                JournalEntry.date >= start_date,
-                JournalEntry.date <= end_date
+                JournalEntry.date >= start_dt,
+                JournalEntry.date < end_dt
             ).all()
             debit_sum = sum(line.cash_debit or 0 for line in lines)
             credit_sum = sum(line.cash_credit or 0 for line in lines)
@@ -21649,8 +21465,8 @@ def get_cash_income_statement():
 
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date >= start_date,
-                JournalEntry.date <= end_date
+                JournalEntry.date >= start_dt,
+                JournalEntry.date < end_dt
             ).all()
             debit_sum = sum(line.cash_debit or 0 for line in lines)
             credit_sum = sum(line.cash_credit or 0 for line in lines)
@@ -21748,6 +21564,7 @@ def get_gold_income_statement():
         
         start_date = datetime.fromisoformat(start_date_str).date()
         end_date = datetime.fromisoformat(end_date_str).date()
+        start_dt, end_dt = date_bounds(start_date, end_date)
         main_karat = MAIN_KARAT or 21
         
         # جلب حسابات الإيرادات (74xx) من شجرة المذكرة
@@ -21768,8 +21585,8 @@ def get_gold_income_statement():
         for account in revenue_accounts:
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date >= start_date,
-                JournalEntry.date <= end_date
+                JournalEntry.date >= start_dt,
+                JournalEntry.date < end_dt
             ).all()
             
             # جمع الأوزان من جميع الأعيرة (محولة للعيار الرئيسي)
@@ -21801,8 +21618,8 @@ def get_gold_income_statement():
         for account in expense_accounts:
             lines = JournalEntryLine.query.join(JournalEntry).filter(
                 JournalEntryLine.account_id == account.id,
-                JournalEntry.date >= start_date,
-                JournalEntry.date <= end_date
+                JournalEntry.date >= start_dt,
+                JournalEntry.date < end_dt
             ).all()
             
             # جمع الأوزان من جميع الأعيرة (محولة للعيار الرئيسي)
@@ -21865,9 +21682,8 @@ def get_admin_dashboard():
     """
     from models import SafeBox, SafeBoxTransaction, Invoice, AuditLog, GoldPrice, SystemAlert
 
-    now = datetime.now()
-    today_start = datetime.combine(now.date(), datetime.min.time())
-    tomorrow_start = today_start + timedelta(days=1)
+    now = store_now()
+    today_start, tomorrow_start = day_range(now.date())
 
     # --- Ledger-derived balances (current, all-time) ---
     signed_cash_expr = case(
@@ -22033,6 +21849,12 @@ def get_admin_dashboard():
         critical_unreviewed_count = 0
         critical_latest = None
 
+    # --- Ledger checks (last status recorded by the reconciliation scheduler) ---
+    try:
+        ledger_checks = check_statuses()
+    except Exception:
+        ledger_checks = {}
+
     # --- Alerts: last shift closing (system-wide) ---
     last_shift_alert = None
     try:
@@ -22617,6 +22439,7 @@ def get_admin_dashboard():
             'last_shift_closing': last_shift_alert,
             'critical_unreviewed_count': int(critical_unreviewed_count or 0),
             'critical_unreviewed_latest': critical_latest,
+            'ledger_checks': ledger_checks,
             'unposted_invoices_count': unposted_invoices_count,
             'critical_bar': critical_bar[:3],
         },
@@ -3,6 +3,14 @@
 Use this in production as a separate process/container, so the web server
 (gunicorn) can run multiple workers without duplicating scheduler jobs.
 
+Every scheduled job takes a per-job lease first (scheduler_leases.py), so two
+replicas of this process can run side by side for availability: each job slot
+still runs once, and every run is recorded in ``scheduler_job_run``.
+
+The same process runs the background job worker (jobs.JobWorker) that executes
+queued long-running requests (``?async=1``). Set RUN_JOB_WORKER=0 to run only
+the schedulers here.
+
 Example:
 	python run_schedulers.py
 """
@@ -11,13 +19,17 @@ import os
 
 from backend.app import app
 from backend.schedulers import start_all_schedulers, run_forever
+from jobs import JobWorker
 
 
 def main():
 	os.environ.setdefault('YASAR_ENV', os.getenv('YASAR_ENV', 'production'))
 	start_all_schedulers(app)
 	print('[INFO] Schedulers are running')
-	run_forever()
+	if os.getenv('RUN_JOB_WORKER', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+		run_forever()
+		return
+	JobWorker(app).run_forever()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,259 @@
+"""Single-runner coordination for scheduled jobs.
+
+Every scheduler (backup, gold price, clearing settlements, bonuses, recurring
+journals, ledger checks, idempotency purge) registers its jobs through
+`singleton_job`, so running two scheduler replicas - or accidentally starting
+the schedulers inside gunicorn workers - no longer runs the work twice:
+
+* PostgreSQL: the run holds ``pg_try_advisory_lock(<job key>)`` on a dedicated
+  connection; the lock disappears with the connection if the process dies.
+* Other backends (SQLite): a `SchedulerLease` row per job; the runner owns it
+  while ``expires_at`` is in the future and extends it from a heartbeat thread.
+  A crashed runner's lease expires after SCHEDULER_LEASE_SECONDS.
+
+A lock only stops *concurrent* runs. Replicas fire the same daily job a few
+seconds apart, so after taking the lock a run is also skipped when the same
+job already succeeded within its ``window_seconds`` (about half its period).
+
+Each run that executes is recorded in `SchedulerJobRun` with its duration and
+outcome (``GET /scheduler/runs`` summarizes them). A run counts as failed only
+if the job raises, so jobs log their errors and re-raise rather than swallow
+them; a swallowed failure would be recorded as a success and suppress retries
+for the whole window. Lease and run bookkeeping go
+through their own connections, independent of the job's session.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time as _time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Callable, Optional
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models import SchedulerJobRun, SchedulerLease, db
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def advisory_key(job_name: str) -> int:
+    """Stable signed 64-bit key for pg_try_advisory_lock."""
+    digest = hashlib.sha256(f'scheduler:{job_name}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def _new_holder() -> str:
+    # Per run, not per process: the `schedule` module is shared by all
+    # scheduler threads of a process, so the same job can fire twice in one pid.
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class _AdvisoryLock:
+    """Session-level PostgreSQL advisory lock held on its own connection."""
+
+    def __init__(self, job_name: str):
+        self.key = advisory_key(job_name)
+        self._connection = None
+
+    def acquire(self) -> bool:
+        connection = db.engine.connect()
+        try:
+            acquired = bool(connection.scalar(text('SELECT pg_try_advisory_lock(:key)'), {'key': self.key}))
+            connection.commit()  # the lock outlives the transaction; don't sit idle in one
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def heartbeat(self) -> None:
+        pass
+
+    def release(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': self.key})
+            connection.commit()
+        finally:
+            connection.close()
+
+
+class _LeaseRow:
+    """`SchedulerLease` row with expiry, for backends without advisory locks."""
+
+    def __init__(self, job_name: str, holder: str, lease_seconds: int):
+        self.job_name = job_name
+        self.holder = holder
+        self.lease_seconds = lease_seconds
+
+    def acquire(self) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        with db.engine.begin() as connection:
+            taken = connection.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.job_name == self.job_name, SchedulerLease.expires_at < now)
+                .values(holder=self.holder, acquired_at=now, heartbeat_at=now, expires_at=expires_at)
+            ).rowcount
+        if taken:
+            return True
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(SchedulerLease).values(
+                    job_name=self.job_name, holder=self.holder,
+                    acquired_at=now, heartbeat_at=now, expires_at=expires_at,
+                ))
+            return True
+        except IntegrityError:
+            return False  # held by a live runner
+
+    def heartbeat(self) -> None:
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.job_name == self.job_name, SchedulerLease.holder == self.holder)
+                .values(heartbeat_at=now, expires_at=now + timedelta(seconds=self.lease_seconds))
+            )
+
+    def release(self) -> None:
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.job_name == self.job_name, SchedulerLease.holder == self.holder)
+                .values(heartbeat_at=now, expires_at=now)
+            )
+
+
+class _Heartbeat:
+    def __init__(self, app, lease, interval: float):
+        self.app = app
+        self.lease = lease
+        self.interval = max(interval, 1.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.lease.heartbeat()
+            except Exception as exc:
+                # SQLite: the job's own write transaction may hold the lock; retry next tick.
+                LOGGER.debug('scheduler lease heartbeat failed: %s', exc)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join(timeout=self.interval)
+
+
+def _recently_succeeded(job_name: str, window_seconds: int) -> bool:
+    if window_seconds <= 0:
+        return False
+    cutoff = datetime.utcnow() - timedelta(seconds=window_seconds)
+    with db.engine.connect() as connection:
+        return connection.scalar(
+            select(func.count())
+            .select_from(SchedulerJobRun)
+            .where(
+                SchedulerJobRun.job_name == job_name,
+                SchedulerJobRun.started_at >= cutoff,
+                SchedulerJobRun.status == 'succeeded',
+            )
+        ) > 0
+
+
+def _record_run(job_name: str, holder: str, status: str, started_at: datetime, duration_ms: int,
+                error: Optional[str]) -> None:
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(insert(SchedulerJobRun).values(
+                job_name=job_name, holder=holder, status=status, started_at=started_at,
+                finished_at=datetime.utcnow(), duration_ms=duration_ms, error=error,
+            ))
+    except Exception as exc:
+        LOGGER.warning('could not record scheduler run of %s: %s', job_name, exc)
+
+
+def run_singleton(app, job_name: str, func: Callable, *args, window_seconds: int = 0,
+                  lease_seconds: Optional[int] = None, **kwargs):
+    """Run `func` unless another runner holds `job_name` or it just succeeded.
+
+    Returns the function's result, or None when the run was skipped.
+    Exceptions from `func` are recorded and re-raised.
+    """
+    lease_seconds = lease_seconds or max(_env_int('SCHEDULER_LEASE_SECONDS', 300), 10)
+    holder = _new_holder()
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            lease = _AdvisoryLock(job_name)
+        else:
+            lease = _LeaseRow(job_name, holder, lease_seconds)
+        if not lease.acquire():
+            print(f'[Scheduler] ⏭️ {job_name}: running on another instance, skipped')
+            return None
+        try:
+            if _recently_succeeded(job_name, window_seconds):
+                print(f'[Scheduler] ⏭️ {job_name}: already ran within {window_seconds}s, skipped')
+                return None
+
+            started_at = datetime.utcnow()
+            started = _time.monotonic()
+            status, error = 'succeeded', None
+            try:
+                with _Heartbeat(app, lease, lease_seconds / 3.0):
+                    return func(*args, **kwargs)
+            except Exception as exc:
+                status, error = 'failed', f'{exc}\n{traceback.format_exc(limit=5)}'
+                raise
+            finally:
+                duration_ms = int((_time.monotonic() - started) * 1000)
+                _record_run(job_name, holder, status, started_at, duration_ms, error)
+        finally:
+            lease.release()
+
+
+def singleton_job(app, job_name: str, func: Callable, window_seconds: int = 0,
+                  lease_seconds: Optional[int] = None) -> Callable:
+    """Wrap a scheduler method for ``schedule.every(...).do(...)`` (see module docstring).
+
+    `func` must raise when the work fails - that is what records the run as
+    failed and lets the next tick (or another replica) retry it. The wrapper
+    logs the exception instead of propagating it, so a failing job does not
+    kill the scheduler thread.
+    """
+    @wraps(func)
+    def job(*args, **kwargs):
+        try:
+            return run_singleton(app, job_name, func, *args, window_seconds=window_seconds,
+                                 lease_seconds=lease_seconds, **kwargs)
+        except Exception:
+            LOGGER.exception('scheduled job %s failed', job_name)
+            return None
+    return job
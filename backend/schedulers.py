@@ -5,7 +5,9 @@ def start_all_schedulers(app):
 	"""Start all background schedulers.
 
 	In production (gunicorn multi-worker), do NOT run this inside the web workers.
-	Run it in a dedicated process/container (see docker-compose.prod.yml).
+	Run it in a dedicated process/container (see docker-compose.prod.yml). Jobs
+	are wrapped in scheduler_leases.singleton_job, so a duplicate start runs
+	each job once instead of twice, but still wastes threads.
 	"""
 	# Bonus scheduler (optional)
 	try:
@@ -35,6 +37,27 @@ def start_all_schedulers(app):
 	except Exception as exc:
 		print(f"[WARNING] Clearing settlement scheduler not started: {exc}")
 
+	# Recurring journal scheduler
+	try:
+		from recurring_journal_scheduler import start_recurring_journal_scheduler
+		start_recurring_journal_scheduler(app)
+	except Exception as exc:
+		print(f"[WARNING] Recurring journal scheduler not started: {exc}")
+
+	# Ledger checks scheduler (bridge balances / inventory reconciliation)
+	try:
+		from ledger_check_scheduler import start_ledger_check_scheduler
+		start_ledger_check_scheduler(app)
+	except Exception as exc:
+		print(f"[WARNING] Ledger check scheduler not started: {exc}")
+
+	# Idempotency key retention
+	try:
+		from idempotency_scheduler import start_idempotency_purge_scheduler
+		start_idempotency_purge_scheduler(app)
+	except Exception as exc:
+		print(f"[WARNING] Idempotency purge scheduler not started: {exc}")
+
 
 def run_forever(poll_seconds: float = 3600.0):
 	"""Keep the scheduler process alive."""
@@ -12,7 +12,7 @@ from typing import Iterable
 
 from sqlalchemy import inspect, text
 from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 LOGGER = logging.getLogger(__name__)
 
@@ -125,6 +125,41 @@ def _ensure_columns(
     return added
 
 
+def _ensure_indexes(
+    engine: Engine,
+    table: str,
+    indexes: Iterable[tuple[str, tuple[str, ...]]],
+) -> list[str]:
+    """Ensure each ``(index_name, columns)`` index exists on ``table``.
+
+    Uses ``CREATE INDEX IF NOT EXISTS`` (SQLite and PostgreSQL both support it),
+    so concurrent workers racing on startup are harmless.
+    """
+    added: list[str] = []
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        try:
+            if not inspector.has_table(table):
+                return []
+        except Exception:
+            pass
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+
+    for name, columns in indexes:
+        if name in existing:
+            continue
+        LOGGER.warning("Missing index %s on %s detected at runtime; creating it", name, table)
+        ddl = text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        try:
+            with engine.begin() as ddl_connection:
+                ddl_connection.execute(ddl)
+            added.append(f"{table}.{name}")
+        except SQLAlchemyError as exc:
+            LOGGER.error("Auto schema guard failed creating index %s: %s", name, exc)
+
+    return added
+
+
 def _log_added(columns_added: list[str]) -> None:
     if columns_added:
         LOGGER.info("Auto-added missing columns: %s", ", ".join(columns_added))
@@ -481,3 +516,166 @@ def ensure_journal_line_dimension_columns(engine: Engine) -> None:
         return
 
     _log_added(columns_added)
+
+
+def ensure_journal_statement_indexes(engine: Engine) -> None:
+    """Ensure the indexes behind party statements exist on journal tables."""
+    indexes_added: list[str] = []
+    try:
+        indexes_added.extend(
+            _ensure_indexes(
+                engine,
+                "journal_entry_line",
+                [
+                    ("ix_jel_customer_entry", ("customer_id", "journal_entry_id")),
+                    ("ix_jel_supplier_entry", ("supplier_id", "journal_entry_id")),
+                    ("ix_jel_account_entry", ("account_id", "journal_entry_id")),
+                ],
+            )
+        )
+        indexes_added.extend(
+            _ensure_indexes(
+                engine,
+                "journal_entry",
+                [("ix_journal_entry_date_id", ("date", "id"))],
+            )
+        )
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_weight_closing_queue_indexes(engine: Engine) -> None:
+    """Ensure the (status, created_at) index used by the FIFO closing queue exists."""
+    try:
+        indexes_added = _ensure_indexes(
+            engine,
+            "weight_closing_order",
+            [("ix_wco_status_created", ("status", "created_at"))],
+        )
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_recurring_journal_indexes(engine: Engine) -> None:
+    """Ensure the (template, date) index behind recurring occurrence checks exists."""
+    try:
+        indexes_added = _ensure_indexes(
+            engine,
+            "journal_entry",
+            [("ix_journal_entry_recurring_date", ("recurring_template_id", "date"))],
+        )
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_audit_log_indexes(engine: Engine) -> None:
+    """Ensure the time-ordered entity/user indexes behind the audit log endpoints exist."""
+    try:
+        indexes_added = _ensure_indexes(
+            engine,
+            "audit_logs",
+            [
+                ("idx_audit_entity_timestamp", ("entity_type", "entity_id", "timestamp")),
+                ("idx_audit_user_timestamp", ("user_name", "timestamp")),
+            ],
+        )
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_invoice_date_indexes(engine: Engine) -> None:
+    """Ensure the (invoice_type, date) index behind date-range summaries and reports exists."""
+    try:
+        indexes_added = _ensure_indexes(
+            engine,
+            "invoice",
+            [("ix_invoice_type_date", ("invoice_type", "date"))],
+        )
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_journal_line_entry_date(engine: Engine) -> None:
+    """Ensure journal_entry_line.entry_date exists, is backfilled and indexed (see fiscal_years).
+
+    The backfill runs on every start, not only when the column is added: balances
+    filter on entry_date, so a line stored without it (raw SQL, a worker still
+    on older code) would silently drop out of them.
+    """
+    try:
+        columns_added = _ensure_columns(engine, "journal_entry_line", [("entry_date", "DATETIME", "NULL")])
+        indexes_added = _ensure_indexes(
+            engine,
+            "journal_entry_line",
+            [("ix_jel_entry_date_account", ("entry_date", "account_id"))],
+        )
+        with engine.begin() as connection:
+            backfilled = connection.execute(text(
+                "UPDATE journal_entry_line SET entry_date = "
+                "(SELECT journal_entry.date FROM journal_entry WHERE journal_entry.id = journal_entry_line.journal_entry_id) "
+                "WHERE entry_date IS NULL"
+            )).rowcount
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed: %s", exc)
+        return
+
+    _log_added(columns_added)
+    if backfilled and backfilled > 0:
+        LOGGER.warning("Backfilled entry_date on %s journal lines stored without it", backfilled)
+    if indexes_added:
+        LOGGER.info("Auto-added missing indexes: %s", ", ".join(indexes_added))
+
+
+def ensure_category_weight_snapshot_unique_index(engine: Engine) -> None:
+    """Ensure one category-weight snapshot row per bucket (see CategoryWeightMonthlySnapshot).
+
+    The index is over expressions, which SQLite reflection skips, so existence
+    is left to ``CREATE UNIQUE INDEX IF NOT EXISTS``. Older deployments may
+    already hold duplicate buckets, which make the create fail; snapshots are
+    derived data, so they are then cleared (and rebuilt by the next
+    refresh_category_weight_snapshots()) before retrying.
+    """
+    table = "category_weight_monthly_snapshot"
+    name = "uq_cw_snapshot_bucket"
+    ddl = text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} "
+        "(month, safe_box_id, category_id, COALESCE(karat, -1), COALESCE(gold_type, ''))"
+    )
+    try:
+        with engine.connect() as connection:
+            if not inspect(connection).has_table(table):
+                return
+        try:
+            with engine.begin() as connection:
+                connection.execute(ddl)
+            return
+        except IntegrityError:
+            LOGGER.warning("Duplicate rows block index %s on %s; rebuilding snapshots", name, table)
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM {table}"))
+            connection.execute(ddl)
+    except SQLAlchemyError as exc:
+        LOGGER.error("Auto schema guard failed creating index %s: %s", name, exc)
+        return
+
+    LOGGER.info("Auto-added missing indexes: %s.%s", table, name)
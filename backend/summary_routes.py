@@ -1,23 +1,35 @@
-from flask import Blueprint, jsonify
-from backend.models import db, Invoice, InvoiceItem
-from datetime import datetime, date
+from flask import Blueprint, jsonify, request
+from models import db, Invoice, InvoiceItem
 from sqlalchemy import func
 
+from auth_decorators import require_permission
+from date_ranges import parse_iso_date, period_range, within
+
 summary_bp = Blueprint('summary_bp', __name__)
 
 @summary_bp.route('/summary/pos', methods=['GET'])
+@require_permission('reports.sales')
 def get_pos_summary():
-    """Provides a summary of Point of Sale (POS) data for the current day."""
-    today = date.today()
-
-    # 1. Total Sales and Number of Invoices for today
+    """Provides a summary of Point of Sale (POS) data for the current day.
+
+    Query params (optional):
+      - period: day (default) | week | month
+      - date: YYYY-MM-DD inside the period (default: today in the store's timezone)
+    """
+    try:
+        day = parse_iso_date(request.args.get('date'), 'date')
+        start, end = period_range((request.args.get('period') or 'day').strip().lower(), day)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    # Half-open bounds on Invoice.date: an index range scan on (invoice_type, date).
+    in_period = [Invoice.invoice_type == 'بيع', *within(Invoice.date, start, end)]
+
+    # 1. Total Sales and Number of Invoices for the period
     sales_data = db.session.query(
         func.sum(Invoice.total).label('total_sales'),
         func.count(Invoice.id).label('invoice_count')
-    ).filter(
-        func.date(Invoice.date) == today,
-        Invoice.invoice_type == 'بيع'  # Filter for sales invoices only
-    ).first()
+    ).filter(*in_period).first()
 
     total_sales = sales_data.total_sales or 0
     invoice_count = sales_data.invoice_count or 0
@@ -25,17 +37,18 @@ def get_pos_summary():
     # 2. Average Sale Amount
     average_sale = total_sales / invoice_count if invoice_count > 0 else 0
 
-    # 3. Top-selling items for today
+    # 3. Top-selling items for the period
     top_items = db.session.query(
         InvoiceItem.name,
         func.sum(InvoiceItem.quantity).label('total_quantity')
-    ).join(Invoice).filter(
-        func.date(Invoice.date) == today,
-        Invoice.invoice_type == 'بيع'
-    ).group_by(InvoiceItem.name).order_by(func.sum(InvoiceItem.quantity).desc()).limit(5).all()
+    ).join(Invoice).filter(*in_period).group_by(InvoiceItem.name).order_by(
+        func.sum(InvoiceItem.quantity).desc()
+    ).limit(5).all()
 
     summary = {
-        'date': today.isoformat(),
+        'date': start.date().isoformat(),
+        'period_start': start.isoformat(),
+        'period_end': end.isoformat(),
         'total_sales': round(total_sales, 2),
         'invoice_count': invoice_count,
         'average_sale': round(average_sale, 2),
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the write-behind audit log pipeline (queue, bulk writer, spool)."""
+
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from sqlalchemy import event
+
+from audit_pipeline import AuditWriter, SPOOL_PREFIX, init_audit_pipeline
+from models import db, AuditLog
+
+
+class AuditPipelineTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.writer = AuditWriter(self.app, spool_dir=self.spool_dir, batch_size=50, threaded=False)
+        init_audit_pipeline(self.app, self.writer)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        self.app.extensions.pop('audit_writer', None)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _log(self, action, **kwargs):
+        return AuditLog.log_action(
+            user_name=kwargs.pop('user_name', 'admin'), action=action, entity_type='Invoice',
+            entity_id=kwargs.pop('entity_id', 1), **kwargs,
+        )
+
+    def test_records_follow_the_callers_transaction_and_are_bulk_inserted(self):
+        AuditLog.query.count()  # opens a transaction
+        for entity_id in range(1, 121):
+            self.assertIsNone(self._log('post', entity_id=entity_id, details={'batch_operation': True}))
+        db.session.rollback()
+        self._log('post_batch', success=False, error_message='boom')  # after rollback: queued now
+
+        AuditLog.query.count()
+        for entity_id in range(1, 121):
+            self._log('post', entity_id=entity_id, details={'batch_operation': True})
+        db.session.commit()
+
+        inserts = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO audit_logs'):
+                inserts.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            self.writer.flush()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+
+        # 121 rows in batches of 50, one executemany per batch.
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(AuditLog.query.filter_by(action='post').count(), 120)
+        failed = AuditLog.query.filter_by(action='post_batch').one()
+        self.assertFalse(failed.success)
+        row = AuditLog.query.filter_by(action='post', entity_id=7).one()
+        self.assertEqual(json.loads(row.details), {'batch_operation': True})
+
+    def test_sync_mode_joins_the_session(self):
+        log = self._log('login_failed', sync=True, success=False)
+        self.assertIsInstance(log, AuditLog)
+        db.session.flush()
+        self.assertIsNotNone(log.id)
+        self.assertEqual(self.writer._queue.qsize(), 0)
+
+    def test_unavailable_database_spools_and_replays(self):
+        db.session.commit()
+        AuditLog.__table__.drop(db.engine)
+        self._log('approve_voucher', entity_id=5)
+        self.writer.flush()
+
+        spooled = glob.glob(os.path.join(self.spool_dir, f'{SPOOL_PREFIX}*.jsonl'))
+        self.assertEqual(len(spooled), 1)
+
+        AuditLog.__table__.create(db.engine)
+        self._log('cancel_voucher', entity_id=5)
+        self.writer.flush()
+
+        self.assertEqual(glob.glob(os.path.join(self.spool_dir, '*')), [])
+        actions = sorted(row.action for row in AuditLog.query.all())
+        self.assertEqual(actions, ['approve_voucher', 'cancel_voucher'])
+
+    def test_full_queue_overflows_to_the_spool(self):
+        writer = AuditWriter(self.app, spool_dir=self.spool_dir, queue_size=2, threaded=False)
+        self.app.extensions['audit_writer'] = writer
+        db.session.commit()
+        for entity_id in range(5):
+            self._log('post', entity_id=entity_id)
+        self.assertEqual(writer._queue.qsize(), 2)
+
+        writer.flush()  # writes the queued two, then replays the spooled three
+        self.assertEqual(AuditLog.query.count(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
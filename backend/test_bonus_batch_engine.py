@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the set-based bonus engine (BonusBatchEngine)."""
+
+import os
+import sys
+import unittest
+from datetime import date, datetime
+
+from flask import Flask
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from sqlalchemy import event
+
+from models import (
+    db,
+    AppUser,
+    BonusInvoiceLink,
+    BonusRule,
+    Employee,
+    EmployeeBonus,
+    Invoice,
+)
+from bonus_calculator import BonusBatchEngine, BonusCalculator
+
+
+class BonusBatchEngineTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        self.period_start = date(2025, 1, 1)
+        self.period_end = date(2025, 1, 31)
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _seed(self):
+        self.employees = []
+        for idx in range(3):
+            emp = Employee(employee_code=f'E-{idx:06d}', name=f'موظف {idx}', salary=5000.0, is_active=True)
+            db.session.add(emp)
+            db.session.flush()
+            db.session.add(AppUser(username=f'user{idx}', password_hash='x', employee_id=emp.id))
+            self.employees.append(emp)
+
+        self.profit_rule = BonusRule(
+            name='نسبة من الربح',
+            rule_type='profit_based',
+            bonus_type='profit_percentage',
+            bonus_value=10.0,
+            applicable_invoice_types=['بيع'],
+            conditions={'profit_type': 'cash'},
+        )
+        self.sales_rule = BonusRule(
+            name='هدف مبيعات',
+            rule_type='sales_target',
+            bonus_type='fixed',
+            bonus_value=250.0,
+            conditions={'sales_target': 1500},
+        )
+        db.session.add_all([self.profit_rule, self.sales_rule])
+
+        type_id = 1
+        for idx, totals in enumerate([(1000.0, 800.0), (300.0,), ()]):
+            for total in totals:
+                db.session.add(Invoice(
+                    invoice_type_id=type_id,
+                    invoice_type='بيع',
+                    date=datetime(2025, 1, 10, 12, 0),
+                    total=total,
+                    total_tax=0.0,
+                    total_cost=total / 2,
+                    is_posted=True,
+                    posted_by=f'user{idx}',
+                ))
+                type_id += 1
+        # فاتورة خارج الفترة لا يجب احتسابها
+        db.session.add(Invoice(
+            invoice_type_id=type_id,
+            invoice_type='بيع',
+            date=datetime(2025, 2, 1, 0, 0),
+            total=9999.0,
+            total_cost=0.0,
+            is_posted=True,
+            posted_by='user0',
+        ))
+        db.session.commit()
+
+    def _per_pair_results(self):
+        results = {}
+        for emp in Employee.query.all():
+            for rule in BonusRule.query.all():
+                bonus = BonusCalculator.calculate_bonus(emp, rule, self.period_start, self.period_end)
+                if bonus:
+                    results[(emp.id, rule.id)] = bonus.amount
+        db.session.rollback()
+        return results
+
+    def test_matches_per_pair_calculation(self):
+        expected = self._per_pair_results()
+
+        bonuses = BonusBatchEngine(self.period_start, self.period_end).run()
+
+        actual = {(b.employee_id, b.bonus_rule_id): b.amount for b in bonuses}
+        self.assertEqual(actual, expected)
+        # user0: profit 900 -> 90, sales 1800 >= 1500 -> 250 ; user1: profit 150 -> 15
+        self.assertAlmostEqual(actual[(self.employees[0].id, self.profit_rule.id)], 90.0)
+        self.assertAlmostEqual(actual[(self.employees[0].id, self.sales_rule.id)], 250.0)
+        self.assertNotIn((self.employees[1].id, self.sales_rule.id), actual)
+        self.assertNotIn((self.employees[2].id, self.profit_rule.id), actual)
+
+    def test_rerun_upserts_without_duplicates(self):
+        BonusBatchEngine(self.period_start, self.period_end).run()
+        BonusBatchEngine(self.period_start, self.period_end).run()
+
+        self.assertEqual(EmployeeBonus.query.count(), 3)
+        profit_bonus = EmployeeBonus.query.filter_by(
+            employee_id=self.employees[0].id, bonus_rule_id=self.profit_rule.id
+        ).one()
+        linked = {l.invoice_id for l in BonusInvoiceLink.query.filter_by(bonus_id=profit_bonus.id)}
+        self.assertEqual(linked, set(profit_bonus.calculation_data['invoice_ids']))
+        self.assertEqual(len(linked), 2)
+
+    def test_query_count_is_independent_of_employee_count(self):
+        statements = []
+
+        def _count(*_args, **_kwargs):
+            statements.append(1)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _count)
+        try:
+            BonusBatchEngine(self.period_start, self.period_end).run(refresh_results=False)
+        finally:
+            event.remove(engine, 'before_cursor_execute', _count)
+
+        # employees, rules, invoices, existing bonuses, inserts/links: ثابت لا يعتمد على عدد الأزواج
+        self.assertLessEqual(len(statements), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for category-weight balances (joined names, paging, as-of snapshots)."""
+
+import os
+import sys
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from flask import Flask
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import (
+    db,
+    Account,
+    Category,
+    CategoryWeightMonthlySnapshot,
+    CategoryWeightMovement,
+    SafeBox,
+)
+import category_weight_tracking
+from category_weight_tracking import (
+    count_category_weight_balances,
+    get_category_weight_balances,
+    get_category_weight_balances_as_of,
+    refresh_category_weight_snapshots,
+)
+
+
+class CategoryWeightBalancesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        self._seed()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _seed(self):
+        account = Account(account_number='1310', name='مخزون ذهب', type='Asset')
+        db.session.add(account)
+        db.session.flush()
+        self.safes = []
+        for idx in range(2):
+            sb = SafeBox(name=f'خزينة ذهب {idx}', safe_type='gold', account_id=account.id)
+            db.session.add(sb)
+            self.safes.append(sb)
+        self.categories = []
+        for idx in range(3):
+            cat = Category(name=f'تصنيف {idx}')
+            db.session.add(cat)
+            self.categories.append(cat)
+        db.session.flush()
+
+        # Three months of history: Jan and Feb 2024 are closed, plus one in March.
+        for month, grams in ((1, 10.0), (2, 5.0), (3, -2.0)):
+            for sb in self.safes:
+                for cat in self.categories:
+                    self._movement(sb, cat, datetime(2024, month, 15, 10, 0), grams)
+        db.session.commit()
+
+    def _movement(self, sb, cat, created_at, grams):
+        db.session.add(CategoryWeightMovement(
+            category_id=cat.id,
+            safe_box_id=sb.id,
+            invoice_type='manual_adjustment',
+            gold_type='new',
+            karat=21.0,
+            weight_delta_grams=grams,
+            weight_delta_main_karat=grams,
+            created_at=created_at,
+        ))
+
+    def test_balances_include_names_and_page_with_running_totals(self):
+        full = get_category_weight_balances(include_running_total=True)
+        self.assertEqual(len(full), 6)
+        self.assertEqual(count_category_weight_balances(), 6)
+        self.assertEqual(full[0]['safe_box_name'], 'خزينة ذهب 0')
+        self.assertEqual(full[0]['category_name'], 'تصنيف 0')
+        self.assertAlmostEqual(full[0]['weight_grams_signed'], 13.0)
+        self.assertAlmostEqual(full[-1]['running_weight_grams_signed'], 78.0)
+
+        page2 = get_category_weight_balances(limit=2, offset=2, include_running_total=True)
+        self.assertEqual([r['category_id'] for r in page2], [full[2]['category_id'], full[3]['category_id']])
+        self.assertAlmostEqual(page2[0]['running_weight_grams_signed'], full[2]['running_weight_grams_signed'])
+
+    def test_as_of_matches_full_scan_with_and_without_snapshots(self):
+        as_of = date(2024, 2, 20)
+        before = get_category_weight_balances_as_of(as_of)
+        self.assertAlmostEqual(before[0]['weight_grams_signed'], 15.0)
+
+        result = refresh_category_weight_snapshots()
+        db.session.commit()
+        self.assertGreaterEqual(result['months'], 3)
+        self.assertEqual(CategoryWeightMonthlySnapshot.query.count(), 18)
+
+        self.assertEqual(get_category_weight_balances_as_of(as_of), before)
+        self.assertEqual(
+            [r['weight_grams_signed'] for r in get_category_weight_balances_as_of(date(2030, 1, 1))],
+            [r['weight_grams_signed'] for r in get_category_weight_balances()],
+        )
+
+    def test_backdated_movement_invalidates_later_snapshots(self):
+        refresh_category_weight_snapshots()
+        db.session.commit()
+
+        self._movement(self.safes[0], self.categories[0], datetime(2024, 2, 1, 9, 0), 100.0)
+        db.session.commit()
+
+        remaining_months = {row.month for row in CategoryWeightMonthlySnapshot.query.all()}
+        self.assertEqual(remaining_months, {date(2024, 1, 1)})
+
+        balances = get_category_weight_balances_as_of(date(2024, 2, 28))
+        self.assertAlmostEqual(balances[0]['weight_grams_signed'], 115.0)
+
+    def test_racing_refreshes_keep_one_row_per_bucket(self):
+        movement = CategoryWeightMovement(
+            category_id=self.categories[0].id, safe_box_id=self.safes[0].id, karat=None, gold_type=None,
+            weight_delta_grams=1.0, weight_delta_main_karat=1.0, created_at=datetime(2024, 1, 20),
+        )
+        db.session.add(movement)
+        db.session.commit()
+        refresh_category_weight_snapshots()
+        db.session.commit()
+        expected = get_category_weight_balances_as_of(date(2024, 2, 28))
+
+        # A second worker that read the horizon before the first one committed.
+        with mock.patch.object(category_weight_tracking, '_snapshot_horizon', return_value=None):
+            refresh_category_weight_snapshots()
+        db.session.commit()
+
+        self.assertEqual(CategoryWeightMonthlySnapshot.query.count(), 19)
+        self.assertEqual(get_category_weight_balances_as_of(date(2024, 2, 28)), expected)
+
+    def test_updated_and_bulk_deleted_movements_invalidate_snapshots(self):
+        refresh_category_weight_snapshots()
+        db.session.commit()
+
+        moved = CategoryWeightMovement.query.filter(CategoryWeightMovement.created_at >= datetime(2024, 2, 1)).first()
+        moved.created_at = datetime(2024, 3, 1)  # leaves February
+        db.session.commit()
+        self.assertEqual({row.month for row in CategoryWeightMonthlySnapshot.query.all()}, {date(2024, 1, 1)})
+        self.assertAlmostEqual(sum(r['weight_grams_signed'] for r in get_category_weight_balances_as_of(date(2024, 2, 28))), 85.0)
+
+        refresh_category_weight_snapshots()
+        CategoryWeightMovement.query.filter(CategoryWeightMovement.created_at < datetime(2024, 2, 1)).first().weight_delta_grams = 0.0
+        db.session.commit()
+        self.assertEqual(CategoryWeightMonthlySnapshot.query.count(), 0)
+
+        refresh_category_weight_snapshots()
+        CategoryWeightMovement.query.filter(CategoryWeightMovement.created_at < datetime(2024, 2, 1)).delete()
+        db.session.commit()
+        self.assertEqual(CategoryWeightMonthlySnapshot.query.count(), 0)
+        self.assertAlmostEqual(sum(r['weight_grams_signed'] for r in get_category_weight_balances_as_of(date(2024, 2, 28))), 25.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the chart-of-accounts import engine: validation, bulk apply, dry-run diff and renumbering."""
+
+import io
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from chart_import import (
+    ChartImportError,
+    import_chart,
+    plan_chart,
+    protected_account_numbers,
+    read_chart,
+    renumber_chart,
+)
+from models import db, Account, JournalEntry, JournalEntryLine, User
+from routes import api as api_blueprint
+
+CSV_CHART = """account_number,name,type,transaction_type,tracks_weight,parent_account_number,memo_account_number
+1,الأصول,Asset,cash,false,,
+11,الأصول المتداولة,Asset,cash,false,1,
+1100,الصندوق,Asset,cash,false,11,
+2,الخصوم,Liability,cash,false,,
+"""
+
+
+class ChartImportTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _accounts(self):
+        accounts = Account.query.all()
+        numbers = {account.id: account.account_number for account in accounts}
+        return {
+            account.account_number: (account.name, numbers.get(account.parent_id), numbers.get(account.memo_account_id))
+            for account in accounts
+        }
+
+    def _client(self):
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+        return client
+
+    def test_csv_chart_with_memo_twins_in_few_statements(self):
+        statements = []
+
+        def count(*_args):
+            statements.append(1)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = import_chart(read_chart(CSV_CHART, 'csv'), memo_twins=True)
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(result['created'], 9)  # 4 financial + their 4 twins + memo root 7
+        accounts = self._accounts()
+        self.assertEqual(accounts['1100'], ('الصندوق', '11', '71100'))
+        self.assertEqual(accounts['71100'], ('الصندوق وزني', '711', None))
+        self.assertEqual(accounts['71'][1], '7')
+        self.assertTrue(Account.query.filter_by(account_number='71100').one().tracks_weight)
+        # existing-snapshot select, insert, id select, link update, plus the
+        # accounting-mapping cache_version bump (update, insert on first use)
+        self.assertLessEqual(len(statements), 7)
+
+    def test_validation_reports_every_problem_and_writes_nothing(self):
+        rows = read_chart({'accounts': [
+            {'account_number': '1', 'name': 'الأصول', 'type': 'Asset', 'parent_account_number': '12'},
+            {'account_number': '12', 'name': 'أ', 'type': 'Asset', 'parent_account_number': '1'},
+            {'account_number': '13', 'name': 'ب', 'type': 'Asset', 'memo_account_number': '713'},
+            {'account_number': '13', 'name': 'مكرر', 'type': 'Asset'},
+            {'account_number': '14', 'name': '', 'type': 'Asset', 'transaction_type': 'silver'},
+        ]})
+        with self.assertRaises(ChartImportError) as caught:
+            plan_chart(rows)
+        self.assertEqual(caught.exception.errors, [
+            '13: duplicate account_number',
+            '14: name is required',
+            '14: transaction_type must be one of cash, gold, both',
+        ])
+
+        with self.assertRaises(ChartImportError) as caught:
+            plan_chart(rows[:3])
+        self.assertIn('13: memo_account_number 713 not found', caught.exception.errors)
+        self.assertTrue(any('parent cycle' in error for error in caught.exception.errors))
+        self.assertEqual(Account.query.count(), 0)
+
+    def test_upsert_diff_and_dry_run(self):
+        import_chart(read_chart(CSV_CHART, 'csv'))
+        db.session.commit()
+        changed = read_chart(CSV_CHART.replace('الصندوق,Asset,cash,false,11', 'الصندوق الرئيسي,Asset,cash,false,1'), 'csv')
+        changed += read_chart([{'account_number': '1110', 'name': 'بنك', 'type': 'Asset', 'parent_account_number': '11'}])
+
+        diff = import_chart(changed, dry_run=True)
+        self.assertEqual((diff['created'], diff['updated'], diff['relinked'], diff['unchanged']), (1, 1, 1, 3))
+        self.assertEqual(diff['update'][0]['fields']['name'], {'from': 'الصندوق', 'to': 'الصندوق الرئيسي'})
+        self.assertEqual(diff['relink'][0]['parent_account_number'], {'from': '11', 'to': '1'})
+        self.assertEqual(self._accounts()['1100'], ('الصندوق', '11', None))
+
+        import_chart(changed)
+        db.session.commit()
+        self.assertEqual(self._accounts()['1100'], ('الصندوق الرئيسي', '1', None))
+        self.assertEqual(self._accounts()['1110'][1], '11')
+
+    def test_replace_plan_lists_deletions(self):
+        import_chart(read_chart(CSV_CHART, 'csv'))
+        db.session.commit()
+        plan = plan_chart(read_chart(CSV_CHART, 'csv')[:2], replace=True)
+        self.assertEqual(plan.delete, ['2', '1100'])
+
+    def test_renumber_swaps_and_follows_memo_twins(self):
+        import_chart(read_chart(CSV_CHART, 'csv'), memo_twins=True)
+        db.session.commit()
+        cash_id = Account.query.filter_by(account_number='1100').one().id
+        entry = JournalEntry(entry_number='JE-1', date=datetime(2025, 1, 1), description='قيد')
+        db.session.add(entry)
+        db.session.add(JournalEntryLine(journal_entry=entry, account_id=cash_id, cash_debit=10.0))
+        db.session.commit()
+
+        preview = renumber_chart({'1100': '11', '11': '1100'}, dry_run=True, allow_protected=True)
+        self.assertEqual(
+            [(change['from'], change['to']) for change in preview['changes']],
+            [('11', '1100'), ('711', '71100'), ('1100', '11'), ('71100', '711')],
+        )
+        renumber_chart({'1100': '11', '11': '1100'}, allow_protected=True)
+        db.session.commit()
+
+        cash = Account.query.get(cash_id)
+        self.assertEqual((cash.account_number, cash.memo_account_id is not None), ('11', True))
+        self.assertEqual(self._accounts()['11'], ('الصندوق', '1100', '711'))
+        self.assertEqual(JournalEntryLine.query.one().account_id, cash_id)
+
+        with self.assertRaises(ChartImportError) as caught:
+            renumber_chart({'1': '2', '9': '10'}, allow_protected=True)
+        # 1 -> 2 also moves its twin 71 -> 72, which is taken as well.
+        self.assertEqual(caught.exception.errors, [
+            '9: account not found',
+            '2: already used by another account',
+            '72: already used by another account',
+        ])
+
+    def test_renumber_refuses_system_account_numbers(self):
+        import_chart(read_chart(CSV_CHART, 'csv'), memo_twins=True)
+        db.session.commit()
+        with self.assertRaises(ChartImportError) as caught:
+            renumber_chart({'1100': '1199', '2': '1300'})
+        self.assertEqual(caught.exception.errors, [
+            '1100: account number is referenced by the system (set allow_protected to renumber it)',
+            '1300: account number is referenced by the system (set allow_protected to renumber it)',
+            '71100: account number is referenced by the system (set allow_protected to renumber it)',
+            '71300: account number is referenced by the system (set allow_protected to renumber it)',  # twin of 2
+        ])
+        self.assertIn('1300', protected_account_numbers())  # config WEIGHT_SUPPORT_ACCOUNTS
+
+        client = self._client()
+        refused = client.post('/api/accounts/renumber', json={'mapping': {'1100': '1199'}})
+        self.assertEqual(refused.status_code, 400)
+        allowed = client.post('/api/accounts/renumber', json={'mapping': {'1100': '1199'}, 'allow_protected': True})
+        self.assertEqual(allowed.get_json()['count'], 2)
+        self.assertEqual(Account.query.filter_by(account_number='71199').count(), 1)
+
+    def test_missing_transaction_type_defaults(self):
+        rows = [{'account_number': '1W1', 'name': 'ذهب', 'type': 'Asset'}]
+        self.assertEqual(read_chart(rows)[0]['transaction_type'], 'gold')
+        self.assertEqual(read_chart(rows, default_transaction_type='both')[0]['transaction_type'], 'both')
+
+        client = self._client()
+        client.post('/api/accounts/import', json=[{'account_number': '1', 'name': 'الأصول', 'type': 'Asset'}])
+        self.assertEqual(Account.query.one().transaction_type, 'both')
+
+    def test_import_and_renumber_endpoints(self):
+        client = self._client()
+        upload = client.post(
+            '/api/accounts/import?memo_twins=1&dry_run=1',
+            data={'file': (io.BytesIO(CSV_CHART.encode('utf-8')), 'chart.csv')},
+            content_type='multipart/form-data',
+        )
+        self.assertEqual(upload.status_code, 200)
+        self.assertEqual((upload.get_json()['dry_run'], upload.get_json()['created']), (True, 9))
+        self.assertEqual(Account.query.count(), 0)
+
+        exported_rows = [{'account_number': '1', 'name': 'الأصول', 'type': 'Asset', 'transaction_type': 'cash'}]
+        self.assertEqual(client.post('/api/accounts/import', json={'accounts': exported_rows}).get_json()['created'], 1)
+        bad = client.post('/api/accounts/import', json=[{'account_number': '2', 'name': 'x', 'type': 'Asset', 'parent_account_number': '9'}])
+        self.assertEqual((bad.status_code, bad.get_json()['errors']), (400, ['2: parent_account_number 9 not found']))
+
+        renumbered = client.post('/api/accounts/renumber', json={'mapping': [{'from': '1', 'to': '10'}]})
+        self.assertEqual(renumbered.get_json()['count'], 1)
+        self.assertEqual(Account.query.one().account_number, '10')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the half-open date-range helper and the sargable POS summary."""
+
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import text
+
+import date_ranges
+from auth_decorators import generate_token
+from date_ranges import date_bounds, month_range, period_range, week_range, year_range
+from models import db, Invoice, InvoiceItem, User
+from summary_routes import summary_bp
+
+
+class DateRangeHelperTestCase(unittest.TestCase):
+    def test_periods_are_half_open(self):
+        day = date(2025, 12, 31)  # a Wednesday
+        self.assertEqual(period_range('day', day), (datetime(2025, 12, 31), datetime(2026, 1, 1)))
+        self.assertEqual(week_range(day), (datetime(2025, 12, 29), datetime(2026, 1, 5)))
+        self.assertEqual(month_range(day), (datetime(2025, 12, 1), datetime(2026, 1, 1)))
+        self.assertEqual(year_range(2024), (datetime(2024, 1, 1), datetime(2025, 1, 1)))
+        with self.assertRaises(ValueError):
+            period_range('quarter', day)
+
+    def test_date_bounds_cover_whole_end_day(self):
+        self.assertEqual(date_bounds('2025-03-01', '2025-03-31'), (datetime(2025, 3, 1), datetime(2025, 4, 1)))
+        self.assertEqual(date_bounds(None, ''), (None, None))
+        with self.assertRaisesRegex(ValueError, 'date_to'):
+            date_bounds('2025-03-01', '31/03/2025', 'date_from', 'date_to')
+
+    def test_today_follows_store_timezone(self):
+        # 22:30 UTC on Jan 1st is already Jan 2nd in Riyadh (UTC+3).
+        utc_late_evening = datetime(2025, 1, 1, 22, 30, tzinfo=date_ranges._store_zone('UTC'))
+
+        class FrozenDateTime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return utc_late_evening.astimezone(tz) if tz else utc_late_evening.replace(tzinfo=None)
+
+        with mock.patch.object(date_ranges, 'datetime', FrozenDateTime), \
+                mock.patch.object(date_ranges, 'STORE_TIMEZONE', 'Asia/Riyadh'):
+            self.assertEqual(date_ranges.store_today(), date(2025, 1, 2))
+            self.assertEqual(date_ranges.day_range()[0], datetime(2025, 1, 2))
+
+
+class PosSummaryTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(summary_bp, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        for invoice_type_id, (when, invoice_type, total) in enumerate([
+            (datetime(2025, 6, 10, 0, 0), 'بيع', 100.0),
+            (datetime(2025, 6, 10, 23, 59, 59), 'بيع', 300.0),
+            (datetime(2025, 6, 11, 0, 0), 'بيع', 1000.0),
+            (datetime(2025, 6, 9, 23, 59), 'بيع', 1000.0),
+            (datetime(2025, 6, 10, 12, 0), 'شراء', 5000.0),
+        ], start=1):
+            invoice = Invoice(invoice_type_id=invoice_type_id, invoice_type=invoice_type, date=when, total=total)
+            invoice.items.append(InvoiceItem(name='خاتم', quantity=1, price=total))
+            db.session.add(invoice)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_day_summary_includes_both_day_edges_only(self):
+        data = self.client.get('/api/summary/pos?date=2025-06-10').get_json()
+        self.assertEqual(data['invoice_count'], 2)
+        self.assertEqual(data['total_sales'], 400.0)
+        self.assertEqual(data['top_selling_items'], [{'name': 'خاتم', 'quantity': 2}])
+
+        week = self.client.get('/api/summary/pos?date=2025-06-10&period=week').get_json()
+        self.assertEqual(week['invoice_count'], 4)
+        self.assertEqual(week['period_start'], '2025-06-09T00:00:00')
+        self.assertEqual(self.client.get('/api/summary/pos?period=year').status_code, 400)
+
+    def test_summary_filter_uses_type_date_index(self):
+        start, end = period_range('day', date(2025, 6, 10))
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT sum(total), count(id) FROM invoice '
+            'WHERE invoice_type = :invoice_type AND date >= :start AND date < :end'
+        ), {'invoice_type': 'بيع', 'start': start, 'end': end}).all()
+        self.assertIn('ix_invoice_type_date', ' '.join(str(row[-1]) for row in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
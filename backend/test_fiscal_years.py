@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the fiscal-year close: balance snapshots, read-only closed years and reopen."""
+
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import text
+
+from auth_decorators import generate_token
+from fiscal_years import account_totals, close_fiscal_year, reopen_fiscal_year, safe_box_totals
+from models import (
+    db,
+    Account,
+    ClosedFiscalYearError,
+    FiscalYear,
+    FiscalYearAccountBalance,
+    FiscalYearSafeBoxBalance,
+    JournalEntry,
+    JournalEntryLine,
+    SafeBox,
+    SafeBoxTransaction,
+    User,
+)
+from schema_guard import ensure_journal_line_entry_date
+from routes import _reset_balances_only, _reset_transactions, api as api_blueprint
+
+LAST_YEAR = datetime.now().year - 1
+TWO_YEARS_AGO = LAST_YEAR - 1
+
+
+class FiscalYearCloseTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        self.cash = Account(account_number='1100', name='الصندوق', type='Asset')
+        self.sales = Account(account_number='40', name='المبيعات', type='Revenue')
+        self.gold = Account(account_number='7131', name='وزن مخزون 21', type='Asset', transaction_type='gold')
+        db.session.add_all([self.cash, self.sales, self.gold])
+        db.session.flush()
+        self.safe = SafeBox(name='الصندوق الرئيسي', safe_type='cash', account_id=self.cash.id)
+        db.session.add(self.safe)
+        db.session.commit()
+
+        self._entry(datetime(TWO_YEARS_AGO, 3, 1), [
+            (self.cash, {'cash_debit': 1000.0}),
+            (self.sales, {'cash_credit': 1000.0}),
+        ])
+        self._entry(datetime(LAST_YEAR, 6, 15, 14, 30), [
+            (self.cash, {'cash_debit': 250.0}),
+            (self.sales, {'cash_credit': 250.0}),
+            (self.gold, {'debit_21k': 7.5}),
+        ])
+        self._entry(datetime.now().replace(month=1, day=2), [
+            (self.cash, {'cash_credit': 100.0}),
+            (self.sales, {'cash_debit': 100.0}),
+        ])
+        self._safe_tx(datetime(TWO_YEARS_AGO, 3, 1), 'in', 1000.0)
+        self._safe_tx(datetime(LAST_YEAR, 6, 15), 'out', 300.0)
+        self._safe_tx(datetime.now().replace(month=1, day=2), 'in', 40.0)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _entry(self, entry_date, lines):
+        entry = JournalEntry(entry_number=f'JE-FY-{JournalEntry.query.count() + 1:04d}', date=entry_date, description='قيد')
+        db.session.add(entry)
+        for account, amounts in lines:
+            db.session.add(JournalEntryLine(journal_entry=entry, account=account, **amounts))
+        db.session.commit()
+        return entry
+
+    def _safe_tx(self, created_at, direction, amount):
+        db.session.add(SafeBoxTransaction(
+            safe_box_id=self.safe.id, ref_type='manual', direction=direction, amount_cash=amount, created_at=created_at,
+        ))
+        db.session.commit()
+
+    def _client(self):
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+        return client
+
+    def _close_both(self):
+        close_fiscal_year(TWO_YEARS_AGO, closed_by='admin')
+        close_fiscal_year(LAST_YEAR, closed_by='admin')
+        db.session.commit()
+
+    def test_lines_carry_their_entry_date(self):
+        dates = {line.entry_date for line in JournalEntryLine.query.all()}
+        self.assertEqual(dates, {entry.date for entry in JournalEntry.query.all()})
+
+    def test_startup_backfills_lines_stored_without_entry_date(self):
+        now = datetime.now()
+        before = account_totals([self.cash.id], until=now)
+        entry = self._entry(datetime(LAST_YEAR, 8, 1), [(self.cash, {'cash_debit': 30.0})])
+        db.session.execute(text('UPDATE journal_entry_line SET entry_date = NULL WHERE journal_entry_id = :id'),
+                           {'id': entry.id})
+        db.session.commit()
+        self.assertEqual(account_totals([self.cash.id], until=now), before)  # the raw-SQL line drops out
+
+        ensure_journal_line_entry_date(db.engine)
+        db.session.expire_all()
+        self.assertAlmostEqual(account_totals([self.cash.id], until=now)[self.cash.id]['cash_debit'],
+                               before[self.cash.id]['cash_debit'] + 30.0)
+
+    def test_snapshot_matches_full_history(self):
+        before_accounts = account_totals()
+        before_safes = safe_box_totals()
+        self._close_both()
+
+        self.assertEqual(FiscalYearAccountBalance.query.filter_by(year=LAST_YEAR).count(), 3)
+        snapshot = FiscalYearAccountBalance.query.filter_by(year=LAST_YEAR, account_id=self.cash.id).one()
+        self.assertAlmostEqual(snapshot.cash_debit, 1250.0)
+        self.assertAlmostEqual(snapshot.cash_credit, 0.0)
+        self.assertEqual(account_totals(), before_accounts)
+        self.assertEqual(safe_box_totals(), before_safes)
+        # A cut-off inside a closed year starts from the previous snapshot.
+        mid_year = account_totals([self.gold.id], until=datetime(LAST_YEAR, 12, 1))
+        self.assertAlmostEqual(mid_year[self.gold.id]['debit_21k'], 7.5)
+        self.assertEqual(account_totals([self.gold.id], until=datetime(LAST_YEAR, 1, 1)), {})
+
+    def test_close_requires_previous_year(self):
+        with self.assertRaises(ValueError):
+            close_fiscal_year(LAST_YEAR)
+        with self.assertRaises(ValueError):
+            close_fiscal_year(datetime.now().year)
+
+    def test_closed_year_is_read_only(self):
+        self._close_both()
+
+        with self.assertRaises(ClosedFiscalYearError):
+            self._entry(datetime(LAST_YEAR, 12, 31), [(self.cash, {'cash_debit': 1.0})])
+        db.session.rollback()
+
+        line = JournalEntryLine.query.filter_by(account_id=self.gold.id).one()
+        line.debit_21k = 8.0
+        with self.assertRaises(ClosedFiscalYearError):
+            db.session.commit()
+        db.session.rollback()
+
+        with self.assertRaises(ClosedFiscalYearError):
+            self._safe_tx(datetime(TWO_YEARS_AGO, 5, 1), 'in', 5.0)
+        db.session.rollback()
+
+        # Moving a current-year entry back into a closed year is refused too.
+        entry = JournalEntry.query.filter(JournalEntry.date >= datetime(datetime.now().year, 1, 1)).one()
+        entry.date = datetime(LAST_YEAR, 12, 31)
+        with self.assertRaises(ClosedFiscalYearError):
+            db.session.commit()
+        db.session.rollback()
+
+        # The current year stays writable.
+        self._entry(datetime.now(), [(self.cash, {'cash_debit': 5.0}), (self.sales, {'cash_credit': 5.0})])
+
+    def test_reopen_latest_year_only(self):
+        self._close_both()
+        with self.assertRaises(ValueError):
+            reopen_fiscal_year(TWO_YEARS_AGO)
+        reopen_fiscal_year(LAST_YEAR)
+        db.session.commit()
+        self.assertEqual(FiscalYearAccountBalance.query.filter_by(year=LAST_YEAR).count(), 0)
+        self._entry(datetime(LAST_YEAR, 12, 31), [(self.cash, {'cash_debit': 1.0}), (self.sales, {'cash_credit': 1.0})])
+
+    def test_reports_unchanged_by_close(self):
+        client = self._client()
+        urls = [
+            '/api/trial_balance?karat_detail=true',
+            f'/api/trial_balance?end_date={LAST_YEAR}-07-01',
+            '/api/accounts/balances',
+            f'/api/account_ledger/{self.cash.id}?start_date={LAST_YEAR}-06-01',
+            f'/api/safe-boxes/{self.safe.id}/balance',
+        ]
+        before = [client.get(url).get_json() for url in urls]
+        response = client.post(f'/api/fiscal-years/{LAST_YEAR}/close')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.post(f'/api/fiscal-years/{TWO_YEARS_AGO}/close').status_code, 200)
+        self.assertEqual(client.post(f'/api/fiscal-years/{LAST_YEAR}/close').status_code, 200)
+        after = [client.get(url).get_json() for url in urls]
+        self.assertEqual(before, after)
+
+        listing = client.get('/api/fiscal-years').get_json()
+        self.assertEqual(listing['closed_through'], LAST_YEAR)
+
+        # Without a start date the ledger opens at the first open year with the snapshot balance.
+        ledger = client.get(f'/api/account_ledger/{self.cash.id}').get_json()
+        self.assertEqual(ledger['filters']['opened_after_fiscal_year'], LAST_YEAR)
+        self.assertEqual(len(ledger['entries']), 1)
+
+        blocked = client.post(f'/api/fiscal-years/{TWO_YEARS_AGO}/reopen')
+        self.assertEqual(blocked.status_code, 400)
+        self.assertEqual(client.post(f'/api/fiscal-years/{LAST_YEAR}/reopen').status_code, 200)
+
+    def test_resets_drop_snapshots_and_reopen_years(self):
+        self._close_both()
+        _reset_transactions()
+
+        self.assertEqual(JournalEntryLine.query.count(), 0)
+        self.assertEqual((FiscalYear.query.count(), FiscalYearAccountBalance.query.count()), (0, 0))
+        self.assertEqual(account_totals(), {})
+        # Safe-box movements survive a transactions reset; their totals come from the rows.
+        self.assertAlmostEqual(safe_box_totals()[self.safe.id]['cash_in'], 1040.0)
+        # The former closed years accept postings again.
+        self._entry(datetime(LAST_YEAR, 12, 31), [(self.cash, {'cash_debit': 1.0}), (self.sales, {'cash_credit': 1.0})])
+
+        close_fiscal_year(TWO_YEARS_AGO)
+        db.session.commit()
+        _reset_balances_only()
+        self.assertEqual((FiscalYear.query.count(), FiscalYearSafeBoxBalance.query.count()), (0, 0))
+        self.assertEqual(safe_box_totals(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the streaming general ledger export (CSV / NDJSON / XLSX)."""
+
+import csv
+import gzip
+import io
+import json
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from general_ledger_export import xlsx_available
+from models import db, Account, JournalEntry, JournalEntryLine, SafeBox, Settings, User
+from routes import api as api_blueprint
+
+
+class GeneralLedgerExportTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(Settings(main_karat=21))
+        self.cash = Account(account_number='1100', name='الصندوق', type='Asset')
+        self.sales = Account(account_number='4100', name='المبيعات', type='Revenue')
+        db.session.add_all([self.cash, self.sales])
+        db.session.flush()
+        db.session.add(SafeBox(name='صندوق الفرع', safe_type='cash', account_id=self.cash.id, branch='Riyadh'))
+        for day in range(1, 4):
+            entry = JournalEntry(entry_number=f'JE-GL-{day:04d}', date=datetime(2025, 1, day, 10), description='بيع')
+            db.session.add(entry)
+            db.session.add_all([
+                JournalEntryLine(journal_entry=entry, account=self.cash, cash_debit=100.0 * day, debit_18k=2.1),
+                JournalEntryLine(journal_entry=entry, account=self.sales, cash_credit=100.0 * day),
+            ])
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_csv_export_keeps_running_balances_per_account(self):
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if 'journal_entry_line' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            response = self.client.get('/api/general_ledger_all?format=csv')
+            body = response.get_data(as_text=True)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('general_ledger.csv', response.headers['Content-Disposition'])
+        self.assertEqual(len(statements), 1)
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 6)
+        cash_rows = [row for row in rows if row['account_number'] == '1100']
+        sales_rows = [row for row in rows if row['account_number'] == '4100']
+        self.assertEqual([float(row['balance_cash']) for row in cash_rows], [100.0, 300.0, 600.0])
+        self.assertEqual([float(row['balance_cash']) for row in sales_rows], [-100.0, -300.0, -600.0])
+        self.assertEqual(float(cash_rows[-1]['balance_gold']), 5.4)
+        self.assertEqual({row['account_branch'] for row in cash_rows}, {'Riyadh'})
+
+    def test_column_selection_and_gzip_ndjson(self):
+        response = self.client.get('/api/general_ledger_all', query_string={
+            'format': 'ndjson',
+            'columns': 'entry_number,account_number,cash_debit,balance_cash',
+            'account_id': self.cash.id,
+            'gzip': '1',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        records = [json.loads(line) for line in gzip.decompress(response.get_data()).decode('utf-8').splitlines()]
+        self.assertEqual(records[-1], {
+            'entry_number': 'JE-GL-0003', 'account_number': '1100', 'cash_debit': 300.0, 'balance_cash': 600.0,
+        })
+
+        bad = self.client.get('/api/general_ledger_all?format=csv&columns=date,secret')
+        self.assertEqual(bad.status_code, 400)
+        self.assertIn('secret', bad.get_json()['error'])
+
+    def test_json_mode_and_branch_filter(self):
+        payload = self.client.get('/api/general_ledger_all?branch=riyadh&karat_detail=true').get_json()
+        self.assertEqual(payload['summary']['total_entries'], 3)
+        self.assertEqual(payload['entries'][0]['account_branch'], 'Riyadh')
+        self.assertEqual(payload['summary']['final_balance']['cash'], 600.0)
+        self.assertEqual(payload['summary']['final_balance']['gold_normalized'], 5.4)
+
+    @unittest.skipUnless(xlsx_available(), 'openpyxl is not installed')
+    def test_xlsx_export(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get('/api/general_ledger_all?format=xlsx&columns=entry_number,balance_cash')
+        self.assertEqual(response.status_code, 200)
+        sheet = load_workbook(io.BytesIO(response.get_data())).active
+        self.assertEqual([cell.value for cell in sheet[1]], ['entry_number', 'balance_cash'])
+        self.assertEqual(sheet.max_row, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
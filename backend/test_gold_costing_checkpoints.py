@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for checkpointed (incremental) gold costing rebuilds and the batch costing API."""
+
+import unittest
+from datetime import date, datetime
+from math import isclose
+
+from flask import Flask
+from sqlalchemy import event
+
+from gold_costing_service import CostingMovement, GoldCostingService, rebuild_costing
+from models import db, Invoice, InvoiceKaratLine, InventoryCostingCheckpoint, InventoryCostingConfig, Settings
+
+
+class GoldCostingCheckpointTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Settings(main_karat=21))
+        db.session.commit()
+
+        # Purchases on the 1st and 3rd, sales on the 2nd and 4th, over four days.
+        self.invoices = [
+            self._invoice('شراء', datetime(2025, 3, 1, 10), 10.0, 3000.0, 200.0),
+            self._invoice('شراء', datetime(2025, 3, 1, 16), 5.0, 1600.0, 0.0),
+            self._invoice('بيع', datetime(2025, 3, 2, 11), 6.0),
+            self._invoice('شراء', datetime(2025, 3, 3, 9), 4.0, 1400.0, 80.0),
+            self._invoice('بيع', datetime(2025, 3, 4, 12), 3.0),
+        ]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _invoice(self, invoice_type, when, weight, gold_value=0.0, wage_value=0.0):
+        invoice = Invoice(
+            invoice_type_id=Invoice.query.count() + 1,
+            invoice_type=invoice_type,
+            date=when,
+            total=gold_value + wage_value,
+        )
+        invoice.karat_lines.append(InvoiceKaratLine(
+            karat=21, weight_grams=weight, gold_value_cash=gold_value, manufacturing_wage_cash=wage_value,
+        ))
+        db.session.add(invoice)
+        db.session.commit()
+        return invoice
+
+    def _config(self):
+        config = InventoryCostingConfig.query.one()
+        db.session.refresh(config)
+        return config
+
+    def test_full_rebuild_writes_one_checkpoint_per_day(self):
+        result = rebuild_costing(full=True)
+        self.assertEqual((result['processed_invoices'], result['checkpoints_written']), (5, 4))
+        self.assertIsNone(result['resumed_from'])
+
+        config = self._config()
+        self.assertTrue(isclose(config.total_inventory_weight, 10.0))
+        # 15g bought at 4600 gold / 200 wage, 6g sold, 4g at 1400 / 80, 3g sold.
+        expected_gold = (4600.0 - 6 * 4600.0 / 15 + 1400.0) * (1 - 3 / 13)
+        self.assertTrue(isclose(config.total_gold_value, expected_gold))
+        checkpoints = InventoryCostingCheckpoint.query.order_by(InventoryCostingCheckpoint.last_invoice_date).all()
+        self.assertEqual([cp.last_invoice_id for cp in checkpoints], [self.invoices[i].id for i in (1, 2, 3, 4)])
+        self.assertEqual(checkpoints[-1].invoices_replayed, 5)
+
+        # Nothing new: the next recompute replays no invoice and keeps the result.
+        again = rebuild_costing()
+        self.assertEqual(again['replayed_invoices'], 0)
+        self.assertTrue(isclose(self._config().total_gold_value, expected_gold))
+
+    def test_backdated_correction_replays_from_the_nearest_checkpoint(self):
+        rebuild_costing(full=True)
+
+        # Correct the purchase of the 3rd: its checkpoint and later ones go stale.
+        line = self.invoices[3].karat_lines[0]
+        line.gold_value_cash = 1200.0
+        db.session.commit()
+        remaining = InventoryCostingCheckpoint.query.order_by(InventoryCostingCheckpoint.last_invoice_date).all()
+        self.assertEqual([cp.last_invoice_id for cp in remaining], [self.invoices[1].id, self.invoices[2].id])
+
+        result = rebuild_costing()
+        self.assertEqual(result['resumed_from']['last_invoice_id'], self.invoices[2].id)
+        self.assertEqual(result['replayed_invoices'], 2)
+        incremental = self._config().to_dict()
+
+        rebuild_costing(full=True)
+        full = self._config().to_dict()
+        for key in ('total_inventory_weight', 'total_gold_value', 'total_manufacturing_value', 'avg_total_cost_per_gram'):
+            self.assertTrue(isclose(incremental[key], full[key]), key)
+
+    def test_from_date_and_unrelated_updates(self):
+        rebuild_costing(full=True)
+        # Fields the replay does not read leave the checkpoints alone.
+        self.invoices[0].is_posted = True
+        db.session.commit()
+        self.assertEqual(InventoryCostingCheckpoint.query.count(), 4)
+
+        result = rebuild_costing(from_date=date(2025, 3, 2))
+        self.assertEqual(result['resumed_from']['last_invoice_id'], self.invoices[1].id)
+        self.assertEqual(result['replayed_invoices'], 3)
+
+        # A new invoice dated before every checkpoint forces a replay from zero.
+        self._invoice('شراء', datetime(2025, 2, 28), 1.0, 300.0)
+        self.assertEqual(InventoryCostingCheckpoint.query.count(), 0)
+        self.assertEqual(rebuild_costing()['replayed_invoices'], 6)
+
+    def test_batch_movements_match_single_calls(self):
+        movements = [
+            CostingMovement('purchase', 10.0, 300.0, 20.0),
+            CostingMovement('consume', 4.0),
+            CostingMovement('purchase', 2.0, 350.0, 0.0),
+            CostingMovement('consume', 20.0),
+            CostingMovement('purchase', 1.0, 320.0, 10.0),
+        ]
+        GoldCostingService.snapshot()  # creates the config row
+        commits = []
+
+        def _after_commit(session):
+            commits.append(session)
+
+        event.listen(db.session, 'after_commit', _after_commit)
+        try:
+            batch = GoldCostingService.apply_movements(movements)
+        finally:
+            event.remove(db.session, 'after_commit', _after_commit)
+        self.assertEqual(len(commits), 1)
+
+        InventoryCostingConfig.query.delete()
+        db.session.commit()
+        for movement in movements:
+            if movement.kind == 'purchase':
+                GoldCostingService.update_average_on_purchase(
+                    movement.weight_grams, movement.gold_price_per_gram, movement.manufacturing_wage_per_gram,
+                )
+            else:
+                GoldCostingService.consume_inventory(movement.weight_grams)
+        self.assertEqual(GoldCostingService.snapshot(), batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for Idempotency-Key handling on write endpoints (idempotency.py)."""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Blueprint, Flask, g, jsonify, request
+
+import idempotency
+from idempotency import idempotent, purge_expired_idempotency_keys, request_fingerprint
+from models import db, Customer, IdempotencyKey, User
+
+calls = []
+bp = Blueprint('idem_test', __name__)
+
+
+@bp.before_request
+def _as_admin():
+    g.current_user = User.query.filter_by(username='admin').first()
+
+
+@bp.route('/customers', methods=['POST'])
+@idempotent
+def create_customer():
+    calls.append(request.get_json())
+    data = request.get_json()
+    if data.get('fail'):
+        return jsonify({'error': 'boom'}), 500
+    if not data.get('name'):
+        return jsonify({'error': 'name required'}), 400
+    customer = Customer(customer_code=f'C-{len(calls):04d}', name=data['name'])
+    db.session.add(customer)
+    db.session.commit()
+    if data.get('fail_after_commit'):
+        return jsonify({'error': 'boom after commit'}), 500
+    return jsonify({'id': customer.id, 'customer_code': customer.customer_code}), 201
+
+
+class IdempotencyTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(bp, url_prefix='/api')
+
+    def setUp(self):
+        calls.clear()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='admin', password_hash='x', full_name='Admin', is_admin=True))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _post(self, body, key='key-1'):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post('/api/customers', json=body, headers=headers)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self._post({'name': 'عميل', 'phone': '1'})
+        self.assertEqual(first.status_code, 201)
+        # Same JSON with a different key order is the same request.
+        retry = self._post({'phone': '1', 'name': 'عميل'})
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.get_json(), first.get_json())
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(Customer.query.count(), 1)
+
+        # Without the header nothing changes; a new key runs the handler again.
+        self._post({'name': 'عميل'}, key=None)
+        self._post({'name': 'عميل'}, key='key-2')
+        self.assertEqual(Customer.query.count(), 3)
+
+    def test_reused_key_with_other_body_is_rejected(self):
+        self._post({'name': 'أ'})
+        response = self._post({'name': 'ب'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.get_json()['error'], 'idempotency_key_reused')
+        self.assertEqual(len(calls), 1)
+
+    def test_client_errors_are_stored_and_server_errors_release_the_key(self):
+        self.assertEqual(self._post({'name': ''}).status_code, 400)
+        self.assertEqual(self._post({'name': ''}).status_code, 400)
+        self.assertEqual(len(calls), 1)
+
+        self.assertEqual(self._post({'name': 'x', 'fail': True}, key='k5').status_code, 500)
+        self.assertIsNone(IdempotencyKey.query.filter_by(key='k5').first())
+        self._post({'name': 'x', 'fail': True}, key='k5')
+        self.assertEqual(len(calls), 3)
+
+    def test_concurrent_duplicate_gets_409_and_stale_claims_are_taken_over(self):
+        with self.app.test_request_context('/api/customers', method='POST', json={'name': 'عميل'}):
+            fingerprint = request_fingerprint()
+        admin = User.query.filter_by(username='admin').one()
+        row = IdempotencyKey(scope='idem_test.create_customer', owner=f'user:{admin.id}', key='busy',
+                             request_hash=fingerprint, locked_at=datetime.utcnow())
+        db.session.add(row)
+        db.session.commit()
+
+        with mock.patch.dict(os.environ, {'IDEMPOTENCY_WAIT_SECONDS': '0'}):
+            response = self._post({'name': 'عميل'}, key='busy')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(calls, [])
+
+        row.locked_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(self._post({'name': 'عميل'}, key='busy').status_code, 201)
+        self.assertEqual(len(calls), 1)
+
+    def test_claim_is_committed_with_the_handler(self):
+        # The worker dies after the handler's commit, before the response is stored.
+        with mock.patch.object(idempotency, '_store'):
+            self.assertEqual(self._post({'name': 'عميل'}).status_code, 201)
+        self.assertEqual(IdempotencyKey.query.one().status, 'committed')
+
+        with mock.patch.dict(os.environ, {'IDEMPOTENCY_WAIT_SECONDS': '0'}):
+            self.assertEqual(self._post({'name': 'عميل'}).get_json()['error'], 'idempotency_key_in_progress')
+        IdempotencyKey.query.update({'locked_at': datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        lost = self._post({'name': 'عميل'})
+        self.assertEqual((lost.status_code, lost.get_json()['error']), (409, 'idempotency_key_response_lost'))
+        self.assertEqual((len(calls), Customer.query.count()), (1, 1))
+
+    def test_server_error_after_commit_keeps_the_key(self):
+        self.assertEqual(self._post({'name': 'x', 'fail_after_commit': True}).status_code, 500)
+        retry = self._post({'name': 'x', 'fail_after_commit': True})
+        self.assertEqual((retry.status_code, retry.headers['Idempotent-Replayed']), (500, 'true'))
+        self.assertEqual((len(calls), Customer.query.count()), (1, 1))
+
+    def test_purge_expired_keys(self):
+        self._post({'name': 'عميل'})
+        IdempotencyKey.query.update({'created_at': datetime.utcnow() - timedelta(days=10)})
+        db.session.commit()
+        self._post({'name': 'عميل'}, key='fresh')
+        self.assertEqual(purge_expired_idempotency_keys(ttl_hours=24), 1)
+        self.assertEqual([row.key for row in IdempotencyKey.query.all()], ['fresh'])
+
+
+if __name__ == '__main__':
+    unittest.main()
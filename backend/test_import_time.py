@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Import-time budget for the web app (what every gunicorn worker pays).
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter with
+STARTUP_BOOTSTRAP=skip and checks:
+- the cumulative import time of `app` stays under IMPORT_TIME_BUDGET_MS;
+- heavy optional stacks (scraping, Google Drive) are not imported eagerly.
+"""
+
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_TIME_BUDGET_MS = int(os.getenv('IMPORT_TIME_BUDGET_MS', '2500'))
+
+LAZY_MODULES = (
+    'selenium',
+    'webdriver_manager',
+    'yfinance',
+    'bs4',
+    'googleapiclient',
+    'google.oauth2',
+)
+
+
+def _importtime_profile():
+    env = dict(os.environ)
+    env['STARTUP_BOOTSTRAP'] = 'skip'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+
+    cumulative_us = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = [p.strip() for p in line[len('import time:'):].split('|')]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        cumulative_us[parts[2].strip()] = int(parts[1])
+    return cumulative_us
+
+
+def test_app_import_time_within_budget_and_lazy_stacks():
+    profile = _importtime_profile()
+
+    assert 'app' in profile
+    app_ms = profile['app'] / 1000.0
+    assert app_ms <= IMPORT_TIME_BUDGET_MS, (
+        f'import app took {app_ms:.0f} ms (budget {IMPORT_TIME_BUDGET_MS} ms)'
+    )
+
+    eager = sorted(name for name in profile if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES)
+    assert not eager, f'heavy modules imported at startup: {eager}'
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the batched invoice list serializer (Invoice.list_load_options / to_dict_list)."""
+
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from models import (
+    db, Account, AppUser, Branch, Customer, Employee, Invoice, InvoiceItem, InvoiceKaratLine,
+    InvoicePayment, PaymentMethod, SafeBox, Settings, User,
+)
+from routes import api as api_blueprint
+
+
+class InvoiceListSerializerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(Settings(main_karat=21))
+        account = Account(account_number='1100', name='الصندوق', type='Asset')
+        db.session.add(account)
+        db.session.flush()
+        safe = SafeBox(name='صندوق', safe_type='cash', account_id=account.id)
+        db.session.add(safe)
+        db.session.flush()
+        self.method = PaymentMethod(payment_type='mada', name='مدى', default_safe_box_id=safe.id)
+        self.branch = Branch(branch_code='B1', name='الفرع الرئيسي')
+        self.seller = Employee(employee_code='E-1', name='البائع')
+        self.poster = Employee(employee_code='E-2', name='المرحّل')
+        self.customer = Customer(customer_code='C-1', name='عميل')
+        db.session.add_all([self.method, self.branch, self.seller, self.poster, self.customer])
+        db.session.flush()
+        db.session.add(AppUser(username='Poster', password_hash='x', employee_id=self.poster.id))
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _add_invoices(self, count):
+        start = Invoice.query.count()
+        for number in range(start + 1, start + count + 1):
+            invoice = Invoice(
+                invoice_type_id=number, invoice_type='بيع', date=datetime(2025, 5, number % 28 + 1, 10),
+                total=100.0 * number, customer_id=self.customer.id, branch_id=self.branch.id,
+                payment_method_id=self.method.id,
+                employee_id=self.seller.id if number % 2 else None,
+                posted_by=' poster ' if number % 3 else 'unknown',
+            )
+            invoice.items.append(InvoiceItem(name='خاتم', quantity=1, price=100.0, karat=21, weight=2.5))
+            invoice.karat_lines.append(InvoiceKaratLine(karat=21, weight_grams=2.5))
+            invoice.payments.append(InvoicePayment(payment_method_id=self.method.id, amount=100.0, net_amount=98.0))
+            db.session.add(invoice)
+        db.session.commit()
+
+    def _get_page(self, per_page):
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db.session.expire_all()
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            response = self.client.get(f'/api/invoices?per_page={per_page}')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['invoices'], len(statements)
+
+    def test_output_matches_to_dict(self):
+        self._add_invoices(6)
+        listed, _count = self._get_page(10)
+
+        db.session.expire_all()
+        for payload in listed:
+            expected = db.session.get(Invoice, payload['id']).to_dict()
+            self.assertEqual({k: v for k, v in payload.items() if k not in ('customer_name', 'supplier_name')},
+                             expected)
+        names = {payload['invoice_type_id']: payload['employee_name'] for payload in listed}
+        self.assertEqual(names[1], 'البائع')
+        self.assertEqual(names[2], 'المرحّل')
+        self.assertEqual(names[6], 'unknown')
+        self.assertEqual(listed[0]['customer_name'], 'عميل')
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self._add_invoices(3)
+        self._get_page(3)  # first request also records the session activity
+        _listed, small = self._get_page(3)
+        self._add_invoices(9)
+        listed, large = self._get_page(12)
+        self.assertEqual(len(listed), 12)
+        self.assertEqual(small, large)
+
+
+if __name__ == '__main__':
+    unittest.main()
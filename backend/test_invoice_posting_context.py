@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the preloaded invoice posting context (invoice_posting_context.py)."""
+
+import os
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from coa_seed import seed_chart_of_accounts_if_empty
+from invoice_posting_context import InvoicePostingContext
+from mapping_resolver import mapping_resolver
+from models import db, Customer, GoldPrice, JournalEntry, Settings, User
+from payment_methods_routes import ensure_default_payment_types
+from routes import api as api_blueprint, ensure_weight_closing_support_accounts
+
+COA_FILE = os.path.join(os.path.dirname(__file__), '..', 'exports', 'accounts_standard_220126.json')
+
+
+class InvoicePostingContextTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        seed_chart_of_accounts_if_empty(db, COA_FILE)
+        ensure_weight_closing_support_accounts()
+        ensure_default_payment_types()
+        db.session.add(Settings(main_karat=21))
+        db.session.add(GoldPrice(price=2900.0, date=datetime(2025, 5, 1)))
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        self.customer = Customer(customer_code='C-000001', name='عميل')
+        db.session.add_all([admin, self.customer])
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _sale(self):
+        return {
+            'customer_id': self.customer.id,
+            'invoice_type': 'بيع',
+            'date': datetime.now().strftime('%Y-%m-%d'),
+            'items': [{'name': 'خاتم', 'karat': 21, 'weight': 5.5, 'wage': 10.0, 'price': 2000,
+                       'net': 2000, 'tax': 0, 'quantity': 1}],
+            'total': 2000,
+            'amount_paid': 2000,
+            'payment_method': 'نقدي',
+        }
+
+    def _count_selects(self, func):
+        selects = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                selects.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+        return result, len(selects)
+
+    def test_typical_sale_reads_each_entity_once(self):
+        # The first sale for a customer also opens their accounts.
+        self.assertEqual(self.client.post('/api/invoices', json=self._sale()).status_code, 201)
+
+        response, selects = self._count_selects(lambda: self.client.post('/api/invoices', json=self._sale()))
+        self.assertEqual(response.status_code, 201, response.get_data(as_text=True))
+        # ~100 before the context. The 25 left: reloading the customer for the
+        # payload (1), auth (4), the posting preload (5), numbering and the
+        # creator (2), costing config and the average-cost aggregate (2), the
+        # invoice weight and the open-weight bucket (3), the balance check (1)
+        # and serializing the response (7).
+        self.assertLessEqual(selects, 25)
+
+        entry = JournalEntry.query.filter_by(reference_type='invoice', reference_id=response.get_json()['id']).one()
+        self.assertTrue(entry.lines)
+        self.assertGreater(sum(line.cash_debit or 0 for line in entry.lines), 0)
+
+    def test_lookups_after_preload_do_not_query(self):
+        mapping_resolver.table()  # process-wide cache, built once
+        sale = self._sale()
+        posting = InvoicePostingContext()
+        _, preload_selects = self._count_selects(lambda: posting.preload(sale))
+        # settings, gold price, customer, accounts (+ memo twins)
+        self.assertLessEqual(preload_selects, 5)
+
+        def _lookups():
+            for _ in range(3):
+                posting.settings
+                posting.latest_gold_price
+                posting.customer(self.customer.id)
+                posting.account_by_name('صندوق النقدية')
+                posting.account_by_name_prefix('مبيعات')
+                posting.account_by_number('71100')
+            return posting.main_karat
+
+        main_karat, lookup_selects = self._count_selects(_lookups)
+        self.assertEqual(main_karat, 21)
+        self.assertEqual(lookup_selects, 0)
+        self.assertEqual(posting.customer(self.customer.id).name, 'عميل')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the DB-backed background job runner and the /jobs polling API."""
+
+import unittest
+from datetime import datetime
+
+from flask import Flask, g
+
+from auth_decorators import generate_token
+from jobs import JobWorker, claim_next_job, execute_job
+from models import db, BackgroundJob, Customer, JournalEntry, JournalEntryLine, Account, Settings, User
+from routes import api as api_blueprint
+
+
+class BackgroundJobsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(Settings(main_karat=21))
+        self.admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        self.other = User(username='clerk', password_hash='x', full_name='Clerk', is_admin=True)
+        db.session.add_all([self.admin, self.other])
+        db.session.commit()
+        self.client = self._client(self.admin)
+        self.clerk = self._client(self.other)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _client(self, user):
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(user)}'
+        return client
+
+    def _call(self, client, method, url, **kwargs):
+        # Requests share the test's app context, so drop the previous caller.
+        g.pop('current_user', None)
+        return client.open(url, method=method, **kwargs)
+
+    def _run_next(self, executor='thread'):
+        job_id = claim_next_job('test-worker', executor)
+        self.assertIsNotNone(job_id)
+        return execute_job(self.app, job_id)
+
+    def test_async_request_is_queued_and_replayed_by_the_worker(self):
+        response = self._call(self.client, 'POST', '/api/gold-costing/recompute?async=1')
+        self.assertEqual(response.status_code, 202)
+        payload = response.get_json()
+        job_id = payload['job']['id']
+        self.assertEqual(payload['job']['status'], 'queued')
+        self.assertEqual(payload['job']['executor'], 'process')
+        self.assertTrue(response.headers['Location'].endswith(f'/api/jobs/{job_id}'))
+
+        # Thread slots never pick up process jobs.
+        self.assertIsNone(claim_next_job('test-worker', 'thread'))
+        self.assertEqual(self._run_next('process'), 'succeeded')
+
+        job = self._call(self.client, 'GET', f'/api/jobs/{job_id}').get_json()['job']
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['progress'], 1.0)
+        self.assertEqual(job['result']['status_code'], 200)
+        self.assertEqual(job['result']['body']['status'], 'success')
+
+    def test_export_result_is_served_as_a_file(self):
+        account = Account(account_number='1200', name='ذمم العملاء', type='Asset')
+        customer = Customer(customer_code='C-000001', name='عميل')
+        entry = JournalEntry(entry_number='JE-JOB-0001', date=datetime(2024, 1, 5), description='بيع')
+        db.session.add_all([account, customer, entry])
+        db.session.add(JournalEntryLine(journal_entry=entry, account=account, customer=customer, cash_debit=100.0))
+        db.session.commit()
+
+        response = self._call(self.client, 'GET', f'/api/statements/customer/{customer.id}?format=csv',
+                          headers={'Prefer': 'respond-async'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job']['id']
+        self.assertEqual(self._call(self.client, 'GET', f'/api/jobs/{job_id}/result').status_code, 409)
+
+        self.assertEqual(self._run_next(), 'succeeded')
+        job = self._call(self.client, 'GET', f'/api/jobs/{job_id}').get_json()['job']
+        self.assertTrue(job['has_file'])
+        self.assertEqual(job['result_url'], f'/api/jobs/{job_id}/result')
+
+        result = self._call(self.client, 'GET', job['result_url'])
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.mimetype.startswith('text/csv'))
+        self.assertIn(f'statement_customer_{customer.id}.csv', result.headers['Content-Disposition'])
+        self.assertIn('100.0', result.get_data(as_text=True))
+
+    def test_failed_replay_marks_the_job_failed(self):
+        response = self._call(self.client, 'GET', '/api/statements/nobody/1?async=1')
+        job_id = response.get_json()['job']['id']
+        self.assertEqual(self._run_next(), 'failed')
+        job = db.session.get(BackgroundJob, job_id)
+        db.session.refresh(job)
+        self.assertEqual(job.to_dict()['result']['status_code'], 400)
+
+    def test_cancel_and_visibility(self):
+        job_id = self._call(self.client, 'POST', '/api/gold-costing/recompute?async=1').get_json()['job']['id']
+        mine = self._call(self.clerk, 'POST', '/api/gold-costing/recompute?async=1').get_json()['job']['id']
+
+        cancelled = self._call(self.client, 'POST', f'/api/jobs/{job_id}/cancel')
+        self.assertEqual(cancelled.status_code, 202)
+        self.assertEqual(cancelled.get_json()['job']['status'], 'cancelled')
+        self.assertEqual(self._call(self.client, 'POST', f'/api/jobs/{job_id}/cancel').status_code, 409)
+
+        # The cancelled job is never claimed; the other user's job is.
+        worker = JobWorker(self.app, threads=1, processes=0)
+        self.assertEqual(claim_next_job(worker.worker_id, 'process'), mine)
+
+        listed = self._call(self.client, 'GET', '/api/jobs?status=cancelled').get_json()
+        self.assertEqual([job['id'] for job in listed['jobs']], [job_id])
+
+        self.other.is_admin = False
+        db.session.commit()
+        self.assertEqual(self._call(self.clerk, 'GET', f'/api/jobs/{job_id}').status_code, 404)
+        self.assertEqual(self._call(self.clerk, 'GET', f'/api/jobs/{mine}').status_code, 200)
+        self.assertEqual([job['id'] for job in self._call(self.clerk, 'GET', '/api/jobs').get_json()['jobs']], [mine])
+
+
+if __name__ == '__main__':
+    unittest.main()
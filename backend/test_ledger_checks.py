@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the set-based bridge/inventory ledger checks and their recorded status."""
+
+import unittest
+from datetime import date, datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from ledger_checks import (
+    BRIDGE_ALERT_TYPE,
+    INVENTORY_ALERT_TYPE,
+    bridge_balance_report,
+    inventory_reconciliation_report,
+    run_ledger_checks,
+)
+from models import db, Account, AccountingMapping, JournalEntry, JournalEntryLine, SystemAlert, User
+from routes import api as api_blueprint
+
+
+class LedgerChecksTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        self.bridge = Account(account_number='2390', name='حساب جسر الموردين', type='Liability')
+        self.mapped_bridge = Account(account_number='2395', name='وسيط', type='Liability')
+        self.inventory = Account(account_number='1310', name='مخزون 21', type='Asset', transaction_type='cash')
+        # Weight twin linked via memo_account_id with a non-conventional number.
+        self.inventory_weight = Account(account_number='713199', name='وزن مخزون 21', type='Asset', transaction_type='gold')
+        self.other_inventory = Account(account_number='1320', name='مخزون 18', type='Asset', transaction_type='cash')
+        self.cash = Account(account_number='1100', name='الصندوق', type='Asset')
+        db.session.add_all([
+            self.bridge, self.mapped_bridge, self.inventory, self.inventory_weight, self.other_inventory, self.cash,
+        ])
+        db.session.flush()
+        self.inventory.memo_account_id = self.inventory_weight.id
+        db.session.add(AccountingMapping(operation_type='شراء', account_type='supplier_bridge', account_id=self.mapped_bridge.id))
+        db.session.commit()
+
+        self._entry(datetime(2025, 1, 10, 15, 0), [
+            (self.inventory, {'cash_debit': 3000.0}),
+            (self.bridge, {'cash_credit': 3000.0}),
+            (self.inventory_weight, {'debit_21k': 10.0}),
+        ])
+        self._entry(datetime(2025, 1, 11), [
+            (self.bridge, {'cash_debit': 3000.0}),
+            (self.mapped_bridge, {'cash_debit': 25.0}),
+            (self.cash, {'cash_credit': 25.0}),
+        ])
+        self._entry(datetime(2025, 2, 1), [
+            (self.other_inventory, {'cash_debit': 500.0}),
+            (self.cash, {'cash_credit': 500.0}),
+        ])
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _entry(self, entry_date, lines):
+        entry = JournalEntry(entry_number=f'JE-LC-{JournalEntry.query.count() + 1:04d}', date=entry_date, description='قيد')
+        db.session.add(entry)
+        for account, amounts in lines:
+            db.session.add(JournalEntryLine(journal_entry=entry, account=account, **amounts))
+        db.session.commit()
+
+    def test_bridge_report_uses_one_balance_aggregate(self):
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            report = bridge_balance_report()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+
+        # Bridge account set + one grouped balance query.
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(report['status'], 'unbalanced')
+        by_number = {row['account_number']: row for row in report['bridge_accounts']}
+        self.assertTrue(by_number['2390']['is_balanced'])
+        self.assertEqual(by_number['2395']['balance'], 25.0)
+        self.assertEqual(report['alerts'][0]['severity'], 'error')
+
+    def test_inventory_pairs_follow_memo_twins_and_end_date(self):
+        report = inventory_reconciliation_report(date(2025, 1, 10), main_karat=21)
+        rows = {row['financial_account']: row for row in report['rows']}
+        self.assertEqual(rows['1310']['gold_account'], '713199')
+        self.assertEqual(rows['1310']['balance_cash'], 3000.0)
+        self.assertEqual(rows['1310']['balance_grams'], 10.0)
+        self.assertEqual(rows['1310']['price_per_gram'], 300.0)
+        # The end date is inclusive even for entries later in the day; 1320 is after it.
+        self.assertEqual(rows['1320']['balance_cash'], 0.0)
+        self.assertEqual(report['status'], 'consistent')
+
+        later = inventory_reconciliation_report(main_karat=21)
+        self.assertEqual(later['status'], 'mismatch')
+        self.assertEqual([row['financial_account'] for row in later['issues']], ['1320'])
+
+    def test_scheduled_results_are_recorded_and_served(self):
+        run_ledger_checks()
+        run_ledger_checks()
+        bridge_alerts = SystemAlert.query.filter_by(alert_type=BRIDGE_ALERT_TYPE).all()
+        # An unchanged status refreshes the existing row instead of piling up alerts.
+        self.assertEqual(len(bridge_alerts), 1)
+        self.assertEqual(bridge_alerts[0].severity, 'critical')
+        self.assertEqual(SystemAlert.query.filter_by(alert_type=INVENTORY_ALERT_TYPE).one().severity, 'warning')
+
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+        # Fix the imbalance: the cached report still shows the recorded status
+        # until the next run, ?refresh=1 recomputes it live.
+        self._entry(datetime(2025, 3, 1), [
+            (self.cash, {'cash_debit': 25.0}),
+            (self.mapped_bridge, {'cash_credit': 25.0}),
+        ])
+        cached = client.get('/api/reports/bridge-balance-monitor').get_json()
+        self.assertEqual((cached['status'], cached['source']), ('unbalanced', 'scheduled'))
+        live = client.get('/api/reports/bridge-balance-monitor?refresh=1').get_json()
+        self.assertEqual((live['status'], live['source']), ('balanced', 'live'))
+
+        run_ledger_checks()
+        self.assertEqual(SystemAlert.query.filter_by(alert_type=BRIDGE_ALERT_TYPE).count(), 2)
+        inventory = client.get('/api/reports/inventory_reconciliation').get_json()
+        self.assertEqual(inventory['source'], 'scheduled')
+        dated = client.get('/api/reports/inventory_reconciliation?date=2025-01-31').get_json()
+        self.assertEqual((dated['status'], dated['source']), ('consistent', 'live'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the login throughput helpers (token bucket, buffered attempts, hash pool)."""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import db, LoginAttempt
+import login_throttle
+from login_throttle import InProcessTokenBucket, LoginAttemptBuffer, PasswordCheckBusy, verify_password_hash
+
+
+class InProcessTokenBucketTestCase(unittest.TestCase):
+    def test_blocks_after_capacity_and_refills_over_window(self):
+        bucket = InProcessTokenBucket(capacity=5, window_seconds=60)
+        key = 'rl:login:10.0.0.1:cashier'
+
+        for _ in range(4):
+            bucket.consume(key, now=0.0)
+        self.assertFalse(bucket.is_blocked(key, now=0.0))
+
+        bucket.consume(key, now=0.0)
+        self.assertTrue(bucket.is_blocked(key, now=0.0))
+        self.assertFalse(bucket.is_blocked('rl:login:10.0.0.1:other', now=0.0))
+
+        # One token every 12 seconds.
+        self.assertFalse(bucket.is_blocked(key, now=12.5))
+
+    def test_key_count_is_bounded(self):
+        bucket = InProcessTokenBucket(capacity=1, window_seconds=60, max_keys=3)
+        for idx in range(10):
+            bucket.consume(f'k{idx}', now=0.0)
+        self.assertEqual(len(bucket._buckets), 3)
+        self.assertTrue(bucket.is_blocked('k9', now=0.0))
+        self.assertFalse(bucket.is_blocked('k0', now=0.0))
+
+
+class LoginAttemptBufferTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_flush_writes_pending_rows_in_bulk(self):
+        buffer = LoginAttemptBuffer(flush_seconds=3600, max_pending=3)
+        for idx in range(5):
+            buffer.add(self.app, {
+                'username': f'user{idx}',
+                'ip_address': '127.0.0.1',
+                'success': idx % 2 == 0,
+            })
+
+        self.assertEqual(buffer.pending_count(), 3)
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(buffer.pending_count(), 0)
+        self.assertEqual(
+            sorted(a.username for a in LoginAttempt.query.all()),
+            ['user2', 'user3', 'user4'],
+        )
+
+
+class VerifyPasswordHashTestCase(unittest.TestCase):
+    def test_matches_werkzeug_check(self):
+        hashed = generate_password_hash('s3cret', method='pbkdf2:sha256')
+        self.assertTrue(verify_password_hash(hashed, 's3cret'))
+        self.assertFalse(verify_password_hash(hashed, 'wrong'))
+        self.assertFalse(verify_password_hash(None, 's3cret'))
+
+    def test_full_queue_fails_fast(self):
+        hashed = generate_password_hash('s3cret', method='pbkdf2:sha256')
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch.object(login_throttle, '_hash_slots', slots):
+            self.assertTrue(slots.acquire(blocking=False))  # the pool is saturated
+            started = time.monotonic()
+            with self.assertRaises(PasswordCheckBusy):
+                verify_password_hash(hashed, 's3cret')
+            self.assertLess(time.monotonic() - started, 1.0)
+
+            slots.release()
+            self.assertTrue(verify_password_hash(hashed, 's3cret'))
+            # The slot is released once the check completes.
+            deadline = time.monotonic() + 5
+            while not slots.acquire(blocking=False):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
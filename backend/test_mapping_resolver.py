@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the cached accounting-mapping resolver."""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import db, Account, AccountingMapping
+from mapping_resolver import DEFAULT_MAPPING_OPERATION_TYPE, MappingResolver, mapping_resolver
+import versioned_cache
+
+
+class MappingResolverTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        self.cash = Account(account_number='1100', name='الصندوق', type='Asset')
+        self.bank = Account(account_number='1110', name='بنك', type='Asset')
+        self.revenue = Account(account_number='40', name='إيرادات', type='Revenue')
+        db.session.add_all([self.cash, self.bank, self.revenue])
+        db.session.flush()
+        db.session.add_all([
+            AccountingMapping(operation_type='بيع', account_type='cash', account_id=self.bank.id, is_active=True),
+            AccountingMapping(
+                operation_type=DEFAULT_MAPPING_OPERATION_TYPE,
+                account_type='revenue',
+                account_id=self.revenue.id,
+                is_active=True,
+            ),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _count_queries(self, fn):
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+        return result, len(statements)
+
+    def test_resolution_order_matches_legacy_lookup(self):
+        resolver = MappingResolver(check_seconds=0)
+        self.assertEqual(resolver.account_id_for_mapping('بيع', 'cash'), self.bank.id)
+        self.assertEqual(resolver.account_id_for_mapping('شراء', 'cash'), self.cash.id)
+        self.assertEqual(resolver.account_id_for_mapping('شراء', 'revenue'), self.revenue.id)
+        self.assertIsNone(resolver.account_id_for_mapping('شراء', 'supplier_bridge'))
+        self.assertEqual(resolver.account_id_by_number('40'), self.revenue.id)
+        self.assertIsNone(resolver.account_id_by_number('999'))
+
+    def test_repeated_lookups_hit_memory(self):
+        resolver = MappingResolver(check_seconds=60)
+        resolver.table()
+
+        def _lookups():
+            for _ in range(50):
+                resolver.account_id_for_mapping('بيع', 'cash')
+                resolver.account_id_for_mapping('شراء', 'revenue')
+                resolver.account_id_by_number('1100')
+
+        _, query_count = self._count_queries(_lookups)
+        self.assertEqual(query_count, 0)
+
+    def test_commit_of_mapping_or_account_change_bumps_version(self):
+        mapping_resolver.table()
+        version = mapping_resolver.version
+
+        mapping = AccountingMapping.query.filter_by(operation_type='بيع', account_type='cash').first()
+        mapping.account_id = self.cash.id
+        db.session.commit()
+        self.assertGreater(mapping_resolver.version, version)
+        self.assertEqual(mapping_resolver.account_id_for_mapping('بيع', 'cash'), self.cash.id)
+
+        version = mapping_resolver.version
+        self.bank.account_number = '1111'
+        db.session.commit()
+        self.assertGreater(mapping_resolver.version, version)
+        self.assertEqual(mapping_resolver.account_id_by_number('1111'), self.bank.id)
+        self.assertIsNone(mapping_resolver.account_id_by_number('1110'))
+
+        # Changes that do not touch the number index keep the table.
+        version = mapping_resolver.version
+        self.bank.name = 'بنك الراجحي'
+        db.session.commit()
+        self.assertEqual(mapping_resolver.version, version)
+
+    def test_other_processes_see_commits_without_redis(self):
+        # Neither resolver is the process-wide one, so like another worker they
+        # can only learn about the change from the cache_version row.
+        with mock.patch.object(versioned_cache, 'ENABLE_REDIS_CACHE', False):
+            worker_a = MappingResolver(check_seconds=0)
+            worker_b = MappingResolver(check_seconds=0)
+            self.assertEqual(worker_a.account_id_for_mapping('بيع', 'cash'), self.bank.id)
+            self.assertEqual(worker_b.account_id_by_number('1110'), self.bank.id)
+
+            mapping = AccountingMapping.query.filter_by(operation_type='بيع', account_type='cash').first()
+            mapping.account_id = self.revenue.id
+            self.bank.account_number = '1120'
+            db.session.commit()
+
+            self.assertEqual(worker_a.account_id_for_mapping('بيع', 'cash'), self.revenue.id)
+            self.assertEqual(worker_b.account_id_by_number('1120'), self.bank.id)
+            self.assertIsNone(worker_b.account_id_by_number('1110'))
+
+            # Uncommitted changes are not published.
+            mapping.account_id = self.cash.id
+            db.session.flush()
+            self.assertEqual(worker_a.table().mapped_account_id('بيع', 'cash'), self.revenue.id)
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for office counters and balances: atomic deltas, the set-based recompute and the office endpoints."""
+
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from ledger_checks import OFFICE_BALANCE_ALERT_TYPE, run_ledger_checks
+from models import db, EmployeeBonus, Employee, Office, OfficeReservation, SystemAlert, User
+from office_balances import (
+    apply_office_deltas,
+    expected_office_balances,
+    office_balance_drift,
+    recompute_office_balances,
+    reservation_deltas,
+    reservation_positions,
+)
+from offices_routes import offices_bp
+
+
+class OfficeBalancesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(offices_bp)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        self.office = Office(office_code='O-000001', name='مكتب الرياض', balance_cash=500.0, balance_gold_21k=2.0)
+        self.idle_office = Office(office_code='O-000002', name='مكتب جدة', active=False)
+        db.session.add_all([self.office, self.idle_office])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _reserve(self, office, karat, grams, total, paid):
+        reservation = OfficeReservation(
+            office_id=office.id,
+            reservation_code=f'RES-{OfficeReservation.query.count() + 1:04d}',
+            reservation_date=datetime(2025, 5, 1),
+            karat=karat,
+            weight_grams=grams,
+            weight_main_karat=grams * karat / 21,
+            price_per_gram=total / grams,
+            execution_price_per_gram=total / grams,
+            total_amount=total,
+            paid_amount=paid,
+        )
+        db.session.add(reservation)
+        db.session.flush()
+        apply_office_deltas(office.id, **reservation_deltas(reservation))
+        db.session.commit()
+        return reservation
+
+    def _client(self):
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+        return client
+
+    def test_postings_keep_counters_in_step_with_source_rows(self):
+        self._reserve(self.office, 21, 10.0, 2300.0, 2000.0)
+        self._reserve(self.office, 24, 4.0, 1000.0, 1000.0)
+
+        office = db.session.get(Office, self.office.id)
+        self.assertEqual(office.total_reservations, 2)
+        self.assertAlmostEqual(office.total_amount_paid, 3000.0)
+        self.assertAlmostEqual(office.total_weight_purchased, 10.0 + 4.0 * 24 / 21)
+        # Treasury balances are what the office holds; reservations don't move them.
+        self.assertAlmostEqual(office.balance_cash, 500.0)
+        self.assertAlmostEqual(office.balance_gold_21k, 2.0)
+        self.assertEqual(office_balance_drift(), {})
+
+        position = reservation_positions([self.office.id])[self.office.id]
+        self.assertAlmostEqual(position['cash'], -300.0)
+        self.assertEqual((position['gold']['21k'], position['gold']['24k'], position['gold']['18k']), (-10.0, -4.0, 0.0))
+
+        with self.assertRaises(ValueError):
+            apply_office_deltas(self.office.id, balance_gold_14k=1.0)
+
+    def test_recompute_reports_and_fixes_drift(self):
+        self._reserve(self.office, 21, 10.0, 2300.0, 2000.0)
+        employee = Employee(employee_code='EMP-1', name='أحمد')
+        db.session.add(employee)
+        db.session.flush()
+        db.session.add(EmployeeBonus(employee_id=employee.id, bonus_type='sales', amount=50.0, status='paid', office_id=self.office.id))
+        office = db.session.get(Office, self.office.id)
+        office.total_reservations = 7  # a lost/duplicated update
+        office.total_amount_paid = 1500.0
+        db.session.commit()
+
+        report = recompute_office_balances()
+        self.assertEqual(report['status'], 'drift')
+        self.assertEqual(report['checked_offices'], 2)
+        columns = report['drift'][0]['columns']
+        self.assertEqual(set(columns), {'total_reservations', 'total_amount_paid'})
+        self.assertEqual(columns['total_amount_paid']['expected'], 2000.0)
+        self.assertEqual(db.session.get(Office, self.office.id).total_reservations, 7)
+
+        self.assertEqual(recompute_office_balances(fix=True)['status'], 'fixed')
+        db.session.commit()
+        office = db.session.get(Office, self.office.id)
+        self.assertEqual((office.total_reservations, office.total_amount_paid), (1, 2000.0))
+        # The treasury cash (funded outside the system) is never rewritten.
+        self.assertAlmostEqual(office.balance_cash, 500.0)
+        self.assertEqual(recompute_office_balances()['status'], 'consistent')
+        self.assertEqual(expected_office_balances([self.idle_office.id])[self.idle_office.id]['total_reservations'], 0)
+
+    def test_scheduled_check_only_reports(self):
+        office = db.session.get(Office, self.office.id)
+        office.balance_gold_18k = 3.0  # treasury gold: not derived, never drift
+        office.total_reservations = 3
+        db.session.commit()
+        results = run_ledger_checks()
+        self.assertEqual(results[OFFICE_BALANCE_ALERT_TYPE]['status'], 'drift')
+        self.assertEqual(set(results[OFFICE_BALANCE_ALERT_TYPE]['drift'][0]['columns']), {'total_reservations'})
+        self.assertEqual(SystemAlert.query.filter_by(alert_type=OFFICE_BALANCE_ALERT_TYPE).one().severity, 'warning')
+        office = db.session.get(Office, self.office.id)
+        self.assertEqual((office.total_reservations, office.balance_gold_18k), (3, 3.0))
+
+    def test_statistics_is_one_grouped_query(self):
+        self._reserve(self.office, 21, 10.0, 2300.0, 2000.0)
+        client = self.app.test_client()
+        statements = []
+
+        def count(*_args):
+            statements.append(1)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            data = client.get('/api/offices/statistics').get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(data, {
+            'total_offices': 2,
+            'active_offices': 1,
+            'inactive_offices': 1,
+            'total_reservations': 1,
+            'total_weight_purchased': 10.0,
+            'total_amount_paid': 2000.0,
+        })
+
+    def test_balance_verification_and_recompute_endpoint(self):
+        self._reserve(self.office, 21, 10.0, 2300.0, 2000.0)
+        db.session.get(Office, self.office.id).total_weight_purchased = 0.0
+        db.session.commit()
+        client = self._client()
+
+        balance = client.get(f'/api/offices/{self.office.id}/balance?verify=1').get_json()
+        self.assertEqual((balance['balance_cash'], balance['balance_gold']['21k']), (500.0, 2.0))
+        self.assertEqual(balance['reservation_position'], {
+            'cash': -300.0,
+            'gold': {'18k': 0.0, '21k': -10.0, '22k': 0.0, '24k': 0.0},
+        })
+        self.assertEqual(balance['verification']['status'], 'drift')
+        self.assertEqual(balance['verification']['drift']['total_weight_purchased']['expected'], 10.0)
+
+        dry_run = client.post('/api/offices/balances/recompute?dry_run=1').get_json()
+        self.assertEqual((dry_run['status'], dry_run['drifted_offices']), ('drift', 1))
+        self.assertEqual(client.post('/api/offices/balances/recompute').get_json()['status'], 'fixed')
+        balance = client.get(f'/api/offices/{self.office.id}/balance?verify=1').get_json()
+        self.assertEqual((balance['statistics']['total_weight_purchased'], balance['verification']['status']), (10.0, 'consistent'))
+
+
+if __name__ == '__main__':
+    unittest.main()
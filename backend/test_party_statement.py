@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the unified party statement engine and its endpoints."""
+
+import json
+import unittest
+from datetime import date, datetime
+
+from flask import Flask
+from sqlalchemy import event
+
+from auth_decorators import generate_token
+from models import db, Account, Customer, JournalEntry, JournalEntryLine, Settings, Supplier, User
+from party_statement import PartyStatement, resolve_scope
+from routes import api as api_blueprint
+
+
+class PartyStatementTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(Settings(main_karat=21))
+        self.customer = Customer(customer_code='C-000001', name='عميل')
+        self.supplier = Supplier(supplier_code='S-000001', name='مورد')
+        self.receivable = Account(account_number='1200', name='ذمم العملاء', type='Asset')
+        self.payable = Account(account_number='2110', name='ذمم الموردين', type='Liability')
+        self.inventory = Account(account_number='1300', name='مخزون', type='Asset')
+        db.session.add_all([self.customer, self.supplier, self.receivable, self.payable, self.inventory])
+        db.session.commit()
+
+        # Ten customer movements, one per month of 2024: +100 cash / +1g 21k, every
+        # third one a payment of -40 cash.
+        for month in range(1, 11):
+            payment = month % 3 == 0
+            self._add_line(
+                datetime(2024, month, 5, 9, 0),
+                account=self.receivable,
+                customer=self.customer,
+                cash_debit=0.0 if payment else 100.0,
+                cash_credit=40.0 if payment else 0.0,
+                debit_21k=0.0 if payment else 1.0,
+            )
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _add_line(self, entry_date, account, customer=None, supplier=None, **amounts):
+        entry = JournalEntry(
+            entry_number=f'JE-PS-{JournalEntry.query.count() + 1:04d}',
+            date=entry_date,
+            description='حركة',
+        )
+        line = JournalEntryLine(journal_entry=entry, account=account, customer=customer, supplier=supplier, **amounts)
+        db.session.add_all([entry, line])
+        db.session.commit()
+        return line
+
+    def _statement(self, **kwargs):
+        return PartyStatement(resolve_scope('customer', self.customer.id), **kwargs)
+
+    def test_keyset_pages_carry_running_balances(self):
+        statement = self._statement()
+        first = statement.page(limit=4)
+        second = statement.page(limit=4, cursor=first['next_cursor'])
+        third = statement.page(limit=4, cursor=second['next_cursor'])
+
+        self.assertEqual([len(first['lines']), len(second['lines']), len(third['lines'])], [4, 4, 2])
+        self.assertFalse(third['has_more'])
+        self.assertIsNone(third['next_cursor'])
+
+        rows = first['lines'] + second['lines'] + third['lines']
+        running = 0.0
+        for row in rows:
+            running += row['cash_debit'] - row['cash_credit']
+            self.assertAlmostEqual(row['running_cash_balance'], running)
+        self.assertAlmostEqual(second['balance_before_page']['cash'], rows[3]['running_cash_balance'])
+        self.assertAlmostEqual(rows[-1]['running_gold_balance'], 7.0)
+
+        newest = statement.page(limit=3, descending=True)
+        self.assertEqual([row['id'] for row in newest['lines']], [row['id'] for row in reversed(rows[-3:])])
+        self.assertAlmostEqual(newest['lines'][0]['running_cash_balance'], rows[-1]['running_cash_balance'])
+
+    def test_opening_balance_and_totals_come_from_sql(self):
+        statement = self._statement(date_from=date(2024, 7, 1), date_to=date(2024, 9, 30))
+        summary = statement.summary()
+        # Jan..Jun: four sales (+400) and two payments (-80).
+        self.assertAlmostEqual(summary['opening_balance_cash'], 320.0)
+        self.assertAlmostEqual(summary['opening_balance_gold_details']['21k'], 4.0)
+        self.assertAlmostEqual(summary['totals']['cash_debit'], 200.0)
+        self.assertAlmostEqual(summary['totals']['cash_credit'], 40.0)
+        self.assertAlmostEqual(summary['closing_balance_cash'], 480.0)
+
+        rows = list(statement.iter_rows())
+        self.assertEqual(len(rows), 3)
+        self.assertAlmostEqual(rows[-1]['running_cash_balance'], summary['closing_balance_cash'])
+
+    def test_page_query_count_is_constant(self):
+        def _count(limit):
+            statements = []
+            statement = self._statement()
+
+            def _before(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', _before)
+            try:
+                statement.page(limit=limit, descending=True)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', _before)
+            return len(statements)
+
+        # Period totals, page keys, page rows (entry + account joined).
+        self.assertEqual(_count(2), _count(50))
+        self.assertLessEqual(_count(50), 3)
+
+    def test_endpoints(self):
+        resp = self.client.get(f'/api/customers/{self.customer.id}/statement?limit=2')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data['customer']['id'], self.customer.id)
+        self.assertEqual(len(data['statement']), 2)
+        self.assertEqual(data['order'], 'desc')
+        self.assertTrue(data['has_more'])
+
+        self._add_line(datetime(2024, 3, 1), account=self.payable, supplier=self.supplier, cash_credit=250.0)
+        self._add_line(datetime(2024, 3, 1), account=self.inventory, supplier=self.supplier, cash_debit=250.0)
+        supplier_statement = self.client.get(f'/api/suppliers/{self.supplier.id}/statement').get_json()
+        self.assertEqual(len(supplier_statement['lines']), 1)
+        self.assertAlmostEqual(supplier_statement['closing_balance_cash'], -250.0)
+
+        ndjson = self.client.get(f'/api/statements/customer/{self.customer.id}?format=ndjson')
+        self.assertEqual(ndjson.status_code, 200)
+        rows = [json.loads(line) for line in ndjson.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(rows), 10)
+
+        csv_resp = self.client.get(f'/api/statements/customer/{self.customer.id}?format=csv')
+        self.assertEqual(len(csv_resp.get_data(as_text=True).strip().splitlines()), 11)
+
+        self.assertEqual(self.client.get('/api/statements/vendor/1').status_code, 400)
+        self.assertEqual(self.client.get('/api/statements/customer/999').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/statements/customer/{self.customer.id}?cursor=bad').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the cached payment-method catalog (GET /payment-methods*)."""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import db, Account, PaymentMethod, SafeBox, Settings
+from payment_method_catalog import PaymentMethodCatalog
+from payment_methods_routes import payment_methods_api
+import versioned_cache
+
+
+class PaymentMethodCatalogTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(payment_methods_api, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        # Legacy JSON disabled: GETs must not seed anything.
+        db.session.add(Settings(payment_methods='[]'))
+        account = Account(account_number='1110', name='بنك', type='Asset')
+        db.session.add(account)
+        db.session.flush()
+        self.safe_box = SafeBox(name='مستحقات مدى', safe_type='clearing', account_id=account.id)
+        db.session.add(self.safe_box)
+        db.session.flush()
+        db.session.add_all([
+            PaymentMethod(
+                payment_type='mada',
+                name='مدى',
+                applicable_invoice_types=['بيع'],
+                default_safe_box_id=self.safe_box.id,
+                is_active=True,
+            ),
+            PaymentMethod(payment_type='cash', name='نقداً', applicable_invoice_types=None, is_active=True),
+            PaymentMethod(payment_type='visa', name='فيزا', applicable_invoice_types=['بيع'], is_active=False),
+        ])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _count_queries(self, fn):
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+        return result, statements
+
+    def test_filters_and_serialization_match_models(self):
+        all_methods = self.client.get('/api/payment-methods').get_json()
+        self.assertEqual([m['name'] for m in all_methods], ['مدى', 'نقداً', 'فيزا'])
+        self.assertEqual(all_methods[0]['default_safe_box']['name'], 'مستحقات مدى')
+
+        active_sale = self.client.get('/api/payment-methods/active?invoice_type=بيع').get_json()
+        self.assertEqual([m['name'] for m in active_sale], ['مدى', 'نقداً'])
+
+        active_scrap = self.client.get('/api/payment-methods/active?invoice_type=شراء من عميل').get_json()
+        self.assertEqual([m['name'] for m in active_scrap], ['نقداً'])
+
+        self.assertEqual(self.client.get('/api/payment-methods?invoice_type=غير').status_code, 400)
+
+    def test_get_is_read_only_cached_and_supports_etag(self):
+        first = self.client.get('/api/payment-methods/active')
+        etag = first.headers.get('ETag')
+        self.assertTrue(etag)
+
+        response, statements = self._count_queries(
+            lambda: self.client.get('/api/payment-methods/active', headers={'If-None-Match': etag})
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(statements, [])
+        self.assertEqual(PaymentMethod.query.count(), 3)
+
+    def test_writes_bump_version_and_change_etag(self):
+        etag = self.client.get('/api/payment-methods/active').headers['ETag']
+
+        resp = self.client.put('/api/payment-methods/update-order', json={
+            'methods': [{'id': 2, 'display_order': 1}],
+        })
+        self.assertEqual(resp.status_code, 200)
+        after_order = self.client.get('/api/payment-methods/active', headers={'If-None-Match': etag})
+        self.assertEqual(after_order.status_code, 200)
+        self.assertNotEqual(after_order.headers['ETag'], etag)
+
+        self.safe_box.name = 'مستحقات مدى - الراجحي'
+        db.session.commit()
+        methods = self.client.get('/api/payment-methods').get_json()
+        self.assertEqual(methods[0]['default_safe_box']['name'], 'مستحقات مدى - الراجحي')
+
+    def test_other_workers_drop_disabled_and_deleted_methods_without_redis(self):
+        with mock.patch.object(versioned_cache, 'ENABLE_REDIS_CACHE', False):
+            worker = PaymentMethodCatalog(check_seconds=0)
+
+            def names():
+                return [m['name'] for m in worker.snapshot().methods_view(active_only=True)[0]]
+
+            self.assertEqual(names(), ['مدى', 'نقداً'])
+
+            PaymentMethod.query.filter_by(name='مدى').one().is_active = False
+            db.session.commit()
+            self.assertEqual(names(), ['نقداً'])
+
+            PaymentMethod.query.filter_by(name='نقداً').delete()
+            db.session.commit()
+            self.assertEqual(names(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
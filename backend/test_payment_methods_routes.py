@@ -2,6 +2,7 @@ import json
 
 from app import app
 from models import db, PaymentMethod, Settings
+from payment_methods_routes import sync_payment_methods_from_settings
 
 
 def _clear_payment_methods():
@@ -10,6 +11,7 @@ def _clear_payment_methods():
 
 
 def _ensure_settings(payment_methods_payload=None):
+    """Save Settings.payment_methods and run the sync (as bootstrap / settings save do)."""
     settings = Settings.query.first()
     if not settings:
         settings = Settings()
@@ -23,6 +25,7 @@ def _ensure_settings(payment_methods_payload=None):
         else None
     )
     db.session.commit()
+    sync_payment_methods_from_settings()
     return settings
 
 
@@ -97,3 +100,19 @@ def test_payment_methods_reflect_settings_changes_without_manual_reset():
 
     with app.app_context():
         assert PaymentMethod.query.count() == 2
+
+
+def test_payment_methods_get_does_not_write():
+    with app.app_context():
+        _clear_payment_methods()
+        settings = Settings.query.first()
+        settings.payment_methods = json.dumps([{'name': 'نقداً', 'commission': 0}], ensure_ascii=False)
+        db.session.commit()
+
+    with app.test_client() as client:
+        response = client.get('/api/payment-methods/active')
+        assert response.status_code == 200
+        assert response.get_json() == []
+
+    with app.app_context():
+        assert PaymentMethod.query.count() == 0
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for per-request SQL metrics and the /metrics endpoint (query_metrics.py)."""
+
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify
+
+from models import db, Customer
+from query_metrics import init_query_metrics
+
+
+def _make_app(enabled, **env):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with mock.patch.dict(os.environ, env):
+        metrics = init_query_metrics(app, db, enabled=enabled)
+
+    @app.get('/customers/<int:count>')
+    def list_customers(count):
+        names = [Customer.query.filter_by(id=i).first() for i in range(count)]
+        return jsonify({'count': len(names)})
+
+    with app.app_context():
+        db.create_all()
+    return app, metrics
+
+
+class QueryMetricsTestCase(unittest.TestCase):
+    def test_headers_histograms_and_slow_samples(self):
+        app, metrics = _make_app(True, METRICS_TOKEN='')
+        metrics.slow_query_seconds = 1e-9  # every statement counts as slow
+        client = app.test_client()
+
+        response = client.get('/customers/3')
+        self.assertEqual(response.headers['X-DB-Queries'], '3')
+        self.assertGreater(float(response.headers['X-DB-Time']), 0.0)
+        self.assertEqual(client.get('/customers/5').headers['X-DB-Queries'], '5')
+
+        body = client.get('/metrics').get_data(as_text=True)
+        worker = f'worker="{os.getpid()}"'
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            f'http_request_duration_seconds_count{{endpoint="/customers/<int:count>",method="GET",{worker}}} 2', body)
+        self.assertIn(
+            f'http_request_db_queries_bucket{{endpoint="/customers/<int:count>",method="GET",{worker},le="2"}} 0',
+            body)
+        self.assertIn(
+            f'http_request_db_queries_bucket{{endpoint="/customers/<int:count>",method="GET",{worker},le="5"}} 2',
+            body)
+        self.assertIn(f'http_request_db_queries_sum{{endpoint="/customers/<int:count>",method="GET",{worker}}} 8',
+                      body)
+        self.assertIn('db_pool_checkout_seconds_count', body)
+        self.assertIn(f'db_slow_queries_total{{endpoint="/customers/<int:count>",{worker}}} 8', body)
+        self.assertIn('db_slow_query_sample_seconds{endpoint="/customers/<int:count>",statement="SELECT', body)
+        self.assertNotIn('endpoint="/metrics"', body)
+
+    def test_metrics_token(self):
+        with mock.patch.dict(os.environ, {'METRICS_TOKEN': 's3cret'}):
+            app, _metrics = _make_app(True)
+        client = app.test_client()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+    def test_without_token_only_local_requests(self):
+        app, _metrics = _make_app(True, METRICS_TOKEN='')
+        client = app.test_client()
+        self.assertEqual(client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code, 200)
+        self.assertEqual(client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.8'}).status_code, 401)
+        proxied = client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'},
+                             headers={'X-Forwarded-For': '203.0.113.9'})
+        self.assertEqual(proxied.status_code, 401)
+
+    def test_failed_statement_pops_its_timer(self):
+        app, _metrics = _make_app(True, METRICS_TOKEN='')
+        with app.app_context():
+            with db.engine.connect() as conn:
+                with self.assertRaises(Exception):
+                    conn.exec_driver_sql('SELECT * FROM no_such_table')
+                self.assertEqual(conn.info.get('query_metrics_started'), [])
+
+    def test_disabled_registers_nothing(self):
+        app, metrics = _make_app(False)
+        self.assertIsNone(metrics)
+        client = app.test_client()
+        response = client.get('/customers/2')
+        self.assertNotIn('X-DB-Queries', response.headers)
+        self.assertEqual(client.get('/metrics').status_code, 404)
+        self.assertNotIn('query_metrics', app.extensions)
+
+
+if __name__ == '__main__':
+    unittest.main()
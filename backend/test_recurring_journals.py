@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the batched, catch-up-safe recurring journal processor."""
+
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from flask import Flask
+
+import recurring_journal_system
+from models import db, Account, JournalEntry, JournalEntryLine, allocate_journal_entry_numbers
+from recurring_journal_system import create_recurring_template, process_recurring_journals
+
+
+class RecurringJournalProcessorTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        self.expense = Account(account_number='5100', name='مصروف رواتب', type='Expense')
+        self.cash = Account(account_number='1100', name='الصندوق', type='Asset')
+        db.session.add_all([self.expense, self.cash])
+        db.session.commit()
+        self.lines = [
+            {'account_id': self.expense.id, 'cash_debit': 100.0},
+            {'account_id': self.cash.id, 'cash_credit': 100.0},
+        ]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def _template(self, name, frequency='daily', start=datetime(2025, 12, 28), **kwargs):
+        return create_recurring_template(
+            name=name,
+            description=name,
+            frequency=frequency,
+            start_date=start,
+            lines_data=self.lines,
+            **kwargs,
+        )
+
+    def test_catch_up_creates_every_due_occurrence_in_chunks(self):
+        template = self._template('يومي')
+        created = process_recurring_journals(datetime(2026, 1, 6, 12, 0), chunk_size=3)
+
+        self.assertEqual(len(created), 10)
+        self.assertEqual([entry.date.day for entry in created], [28, 29, 30, 31, 1, 2, 3, 4, 5, 6])
+        # Numbers are allocated per year of the occurrence.
+        self.assertEqual(created[0].entry_number, 'JE-2025-00001')
+        self.assertEqual(created[3].entry_number, 'JE-2025-00004')
+        self.assertEqual(created[4].entry_number, 'JE-2026-00001')
+        self.assertEqual(JournalEntryLine.query.count(), 20)
+
+        db.session.refresh(template)
+        self.assertEqual(template.total_created, 10)
+        self.assertEqual(template.next_run_date, datetime(2026, 1, 7))
+        self.assertEqual(template.last_created_date, datetime(2026, 1, 6))
+
+    def test_number_taken_by_a_concurrent_posting_retries_the_chunk(self):
+        self._template('يومي')
+        # An invoice posting commits JE-2025-00001 after the catch-up read the
+        # year's last number, so the first allocation overlaps it.
+        db.session.add(JournalEntry(entry_number='JE-2025-00001', date=datetime(2025, 12, 1), description='فاتورة'))
+        db.session.commit()
+        stale = [lambda year, count: [f'JE-{year}-{n:05d}' for n in range(1, count + 1)]]
+
+        def allocate(year, count):
+            return (stale.pop() if stale else allocate_journal_entry_numbers)(year, count)
+
+        with mock.patch.object(recurring_journal_system, 'allocate_journal_entry_numbers', side_effect=allocate):
+            created = process_recurring_journals(datetime(2025, 12, 29))
+
+        self.assertEqual([entry.entry_number for entry in created], ['JE-2025-00002', 'JE-2025-00003'])
+        self.assertEqual(JournalEntry.query.filter_by(entry_number='JE-2025-00001').one().description, 'فاتورة')
+
+    def test_rerun_is_idempotent_per_template_and_date(self):
+        template = self._template('يومي')
+        process_recurring_journals(datetime(2025, 12, 30))
+
+        # Simulate a crash after commit but before the template advanced.
+        template.next_run_date = datetime(2025, 12, 28)
+        db.session.commit()
+
+        created = process_recurring_journals(datetime(2025, 12, 31))
+        self.assertEqual([entry.date.day for entry in created], [31])
+        self.assertEqual(JournalEntry.query.count(), 4)
+        db.session.refresh(template)
+        self.assertEqual(template.next_run_date, datetime(2026, 1, 1))
+
+    def test_failures_stay_within_their_template(self):
+        orphan = Account(account_number='5900', name='محذوف', type='Expense')
+        db.session.add(orphan)
+        db.session.commit()
+        self.lines[0]['account_id'] = orphan.id
+        broken = self._template('معطوب')
+        self.lines[0]['account_id'] = self.expense.id
+        healthy = self._template('سليم', frequency='monthly', start=datetime(2025, 10, 1))
+        # The broken template's expense account disappears behind its back, so
+        # its journal lines violate the account foreign key.
+        db.session.execute(db.text('DELETE FROM account WHERE id = :id'), {'id': orphan.id})
+        db.session.commit()
+        db.session.execute(db.text('PRAGMA foreign_keys = ON'))
+        db.session.commit()
+
+        created = process_recurring_journals(datetime(2026, 1, 15))
+        self.assertEqual({entry.recurring_template_id for entry in created}, {healthy.id})
+        self.assertEqual(len(created), 4)
+
+        db.session.refresh(broken)
+        self.assertEqual(broken.next_run_date, datetime(2025, 12, 28))
+        self.assertEqual(broken.total_created, 0)
+        db.session.commit()
+        db.session.execute(db.text('PRAGMA foreign_keys = OFF'))
+
+    def test_end_date_caps_catch_up(self):
+        self._template('شهري', frequency='monthly', start=datetime(2025, 1, 1), end_date=datetime(2025, 3, 15))
+        created = process_recurring_journals(datetime(2025, 6, 1))
+        self.assertEqual([entry.date.month for entry in created], [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for heavy-endpoint isolation (path classification, concurrency gate, statement timeouts)."""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from flask import Flask, g, jsonify
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import db
+from request_limits import init_request_limits, is_heavy_path
+
+
+class IsHeavyPathTestCase(unittest.TestCase):
+    def test_default_prefixes(self):
+        self.assertTrue(is_heavy_path('/api/reports/sales_overview'))
+        self.assertTrue(is_heavy_path('/api/general_ledger_all'))
+        self.assertFalse(is_heavy_path('/api/invoices'))
+        self.assertFalse(is_heavy_path('/api/gold_price'))
+
+    def test_env_override(self):
+        with mock.patch.dict(os.environ, {'HEAVY_REQUEST_PATH_PREFIXES': '/api/slow, /api/export'}):
+            self.assertTrue(is_heavy_path('/api/export/gl'))
+            self.assertFalse(is_heavy_path('/api/reports/sales_overview'))
+
+
+class HeavyRequestGateTestCase(unittest.TestCase):
+    def setUp(self):
+        env = {
+            'HEAVY_REQUEST_MAX_CONCURRENCY': '1',
+            'HEAVY_REQUEST_QUEUE_SECONDS': '0',
+        }
+        with mock.patch.dict(os.environ, env):
+            self.app = Flask(__name__)
+            self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+            self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+            db.init_app(self.app)
+            init_request_limits(self.app, db)
+
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+        @self.app.route('/api/reports/slow')
+        def slow_report():
+            self.entered.set()
+            self.release.wait(5)
+            return jsonify({'ok': True})
+
+        @self.app.route('/api/gold_price')
+        def gold_price():
+            return jsonify({'ok': True})
+
+    def test_second_heavy_request_is_rejected_while_light_passes(self):
+        statuses = []
+        worker = threading.Thread(
+            target=lambda: statuses.append(self.app.test_client().get('/api/reports/slow').status_code)
+        )
+        worker.start()
+        self.assertTrue(self.entered.wait(5))
+
+        client = self.app.test_client()
+        busy = client.get('/api/reports/slow')
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy.get_json()['error'], 'server_busy')
+        self.assertIn('Retry-After', busy.headers)
+        self.assertEqual(client.get('/api/gold_price').status_code, 200)
+
+        self.release.set()
+        worker.join(5)
+        self.assertEqual(statuses, [200])
+
+        # The slot is released once the first request finishes.
+        self.assertEqual(client.get('/api/reports/slow').status_code, 200)
+
+
+
+class StatementTimeoutTestCase(unittest.TestCase):
+    def _timeouts(self, env, paths):
+        with mock.patch.dict(os.environ, env):
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+            app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+            db.init_app(app)
+            init_request_limits(app, db)
+
+        @app.route('/api/<path:path>', methods=['GET', 'POST'])
+        def any_path(path):
+            return jsonify({'timeout_ms': g.statement_timeout_ms})
+
+        client = app.test_client()
+        return [client.post(path).get_json()['timeout_ms'] for path in paths]
+
+    def test_only_heavy_requests_are_bounded_by_default(self):
+        self.assertEqual(self._timeouts({}, ['/api/reports/sales', '/api/invoices']), [120000, 0])
+
+    def test_long_maintenance_endpoints_are_never_cut_off(self):
+        timeouts = self._timeouts(
+            {'DB_STATEMENT_TIMEOUT_MS': '15000'},
+            ['/api/invoices', '/api/fiscal-years/2024/close', '/api/system/reset', '/api/statements/customer/1'],
+        )
+        self.assertEqual(timeouts, [15000, 0, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
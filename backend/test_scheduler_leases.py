@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for single-runner scheduler coordination (scheduler_leases.py)."""
+
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask
+
+from backup_scheduler import BackupScheduler
+from models import db, SchedulerJobRun, SchedulerLease
+from recurring_journal_scheduler import RecurringJournalScheduler
+from scheduler_leases import _LeaseRow, advisory_key, run_singleton, singleton_job
+
+
+class SchedulerLeasesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_lease_row_excludes_other_holders_until_it_expires(self):
+        first = _LeaseRow('backup', 'host-a:1:x', lease_seconds=60)
+        second = _LeaseRow('backup', 'host-b:2:y', lease_seconds=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+
+        first.release()
+        self.assertTrue(second.acquire())
+
+        # A crashed holder never releases; its lease runs out.
+        SchedulerLease.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        self.assertTrue(first.acquire())
+        self.assertEqual(db.session.get(SchedulerLease, 'backup', populate_existing=True).holder, 'host-a:1:x')
+
+    def test_concurrent_replica_is_skipped_and_the_run_is_recorded(self):
+        calls = []
+
+        def backup():
+            calls.append('outer')
+            # A second replica firing the same job while this one is still running.
+            self.assertIsNone(run_singleton(self.app, 'backup', lambda: calls.append('inner')))
+            return 'done'
+
+        self.assertEqual(run_singleton(self.app, 'backup', backup), 'done')
+        self.assertEqual(calls, ['outer'])
+
+        run = SchedulerJobRun.query.one()
+        self.assertEqual((run.job_name, run.status), ('backup', 'succeeded'))
+        self.assertIsNotNone(run.duration_ms)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_window_skips_a_slot_that_already_ran_elsewhere(self):
+        calls = []
+        job = singleton_job(self.app, 'bonus_daily', lambda: calls.append(1), window_seconds=3600)
+        job()
+        job()  # same slot fired a few seconds later by another replica
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(SchedulerJobRun.query.count(), 1)
+
+        SchedulerJobRun.query.update({'started_at': datetime.utcnow() - timedelta(hours=2)})
+        db.session.commit()
+        job()
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_runs_are_recorded_and_do_not_block_a_retry(self):
+        def broken():
+            raise RuntimeError('disk full')
+
+        with self.assertRaises(RuntimeError):
+            run_singleton(self.app, 'backup', broken, window_seconds=3600)
+        failed = SchedulerJobRun.query.one()
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('disk full', failed.error)
+
+        self.assertEqual(run_singleton(self.app, 'backup', lambda: 'ok', window_seconds=3600), 'ok')
+        self.assertEqual(SchedulerJobRun.query.filter_by(status='succeeded').count(), 1)
+
+    def test_scheduled_job_failure_is_recorded_and_retried(self):
+        scheduler = BackupScheduler(self.app)
+        job = singleton_job(self.app, 'backup', scheduler.run_backup_now, window_seconds=12 * 3600)
+
+        with mock.patch.object(scheduler, '_create_backup_zip', side_effect=OSError('disk full')):
+            self.assertIsNone(job())  # logged, not propagated into the schedule loop
+        self.assertEqual(SchedulerJobRun.query.one().status, 'failed')
+
+        # The failure does not count as "already ran": the next tick retries.
+        with mock.patch.object(scheduler, '_create_backup_zip', return_value=None) as create:
+            job()
+        create.assert_called_once()
+        self.assertEqual(SchedulerJobRun.query.filter_by(status='failed').count(), 2)
+
+    def test_startup_catch_up_runs_under_the_lease(self):
+        scheduler = RecurringJournalScheduler(self.app)
+        other_replica = _LeaseRow('recurring_journals', 'host-b:2:y', lease_seconds=60)
+        self.assertTrue(other_replica.acquire())
+
+        with mock.patch('recurring_journal_scheduler.process_recurring_journals', return_value=[]) as process:
+            scheduler._run_due()
+            process.assert_not_called()
+
+            other_replica.release()
+            scheduler._run_due()
+            process.assert_called_once()
+        self.assertEqual(SchedulerJobRun.query.one().status, 'succeeded')
+
+    def test_advisory_key_is_stable_signed_bigint(self):
+        key = advisory_key('backup')
+        self.assertEqual(key, advisory_key('backup'))
+        self.assertNotEqual(key, advisory_key('bonus_daily'))
+        self.assertTrue(-2 ** 63 <= key < 2 ** 63)
+
+
+if __name__ == '__main__':
+    unittest.main()
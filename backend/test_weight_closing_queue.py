@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests for the FIFO weight-closing queue and its open-weight counter."""
+
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event
+
+import weight_closing_queue
+from auth_decorators import generate_token
+from models import db, Invoice, Settings, User, WeightClosingOpenTotals, WeightClosingOrder
+from routes import _auto_consume_weight_closing, api as api_blueprint
+from weight_closing_queue import iter_open_orders, open_totals, recompute_open_totals
+
+
+class WeightClosingQueueTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        cls.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(cls.app)
+        cls.app.register_blueprint(api_blueprint, url_prefix='/api')
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        db.session.add(Settings(main_karat=21))
+        db.session.commit()
+
+        base = datetime(2025, 1, 1, 9, 0)
+        # Created newest-first so FIFO order differs from insertion order.
+        self.orders = []
+        for idx in reversed(range(5)):
+            invoice = Invoice(invoice_type_id=idx + 1, date=base, total=0.0, invoice_type='بيع')
+            db.session.add(invoice)
+            db.session.flush()
+            order = WeightClosingOrder(
+                invoice_id=invoice.id,
+                order_number=f'WCO-{idx}',
+                status='open',
+                close_price_per_gram=300.0,
+                total_weight_main_karat=10.0,
+                executed_weight_main_karat=0.0,
+                remaining_weight_main_karat=10.0,
+                created_at=base + timedelta(hours=idx),
+            )
+            db.session.add(order)
+            self.orders.insert(0, order)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_batches_are_fifo_and_fetched_lazily(self):
+        self.assertEqual([o.id for o in iter_open_orders(batch_size=2)], [o.id for o in self.orders])
+
+        statements = []
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _before)
+        try:
+            first = next(iter_open_orders(batch_size=2))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _before)
+        self.assertEqual(first.id, self.orders[0].id)
+        # One ordered batch + one prefetch of its invoices; later batches untouched.
+        self.assertEqual(len(statements), 2)
+
+    def test_consumption_is_fifo_and_keeps_counter_in_step(self):
+        self.assertEqual(open_totals()['open_orders'], 5)
+        self.assertAlmostEqual(open_totals()['open_weight_main_karat'], 50.0)
+
+        summary = _auto_consume_weight_closing(weight_override=25.0, price_per_gram=300.0)
+        db.session.commit()
+
+        self.assertEqual(summary['orders_closed'], [self.orders[0].id, self.orders[1].id])
+        self.assertEqual(summary['orders_updated'][-1], self.orders[2].id)
+        self.assertEqual(self.orders[2].status, 'partially_closed')
+        self.assertEqual(self.orders[2].invoice.weight_closing_remaining_weight, 5.0)
+
+        totals = open_totals()
+        self.assertEqual(totals['open_orders'], 3)
+        self.assertAlmostEqual(totals['open_weight_main_karat'], 25.0)
+        self.assertEqual(recompute_open_totals()['open_orders'], 3)
+
+    def test_counter_follows_deletes_and_bulk_wipes(self):
+        open_totals()
+        db.session.delete(self.orders[4])
+        db.session.commit()
+        self.assertEqual(open_totals()['open_orders'], 4)
+        self.assertAlmostEqual(open_totals()['open_weight_main_karat'], 40.0)
+
+        WeightClosingOrder.query.delete()
+        db.session.commit()
+        self.assertEqual(open_totals()['open_orders'], 0)
+        self.assertAlmostEqual(open_totals()['open_weight_main_karat'], 0.0)
+
+    def test_workers_write_separate_buckets_summed_on_read(self):
+        recompute_open_totals()
+        for bucket, order in ((3, self.orders[0]), (7, self.orders[1]), (3, self.orders[2])):
+            with mock.patch.object(weight_closing_queue, '_worker_bucket', return_value=bucket):
+                db.session.refresh(order)  # consumers load the order before changing it
+                order.remaining_weight_main_karat = 4.0
+                db.session.commit()
+
+        self.assertEqual(
+            sorted((row.id, row.open_orders) for row in WeightClosingOpenTotals.query.all()),
+            [(0, 5), (3, 0), (7, 0)],
+        )
+        self.assertAlmostEqual(
+            {row.id: row.open_weight_main_karat for row in WeightClosingOpenTotals.query.all()}[3], -12.0
+        )
+        self.assertAlmostEqual(open_totals()['open_weight_main_karat'], 32.0)
+
+        recompute_open_totals()
+        self.assertEqual([row.id for row in WeightClosingOpenTotals.query.all()], [0])
+        self.assertAlmostEqual(open_totals()['open_weight_main_karat'], 32.0)
+
+    def test_summary_get_is_read_only_and_recompute_is_a_post(self):
+        admin = User(username='admin', password_hash='x', full_name='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        client = self.app.test_client()
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {generate_token(admin)}'
+        totals = WeightClosingOpenTotals.__table__
+        db.session.execute(totals.delete())
+        db.session.execute(totals.insert().values(id=0, open_orders=99, open_weight_main_karat=0.0))
+        db.session.commit()
+
+        self.assertEqual(client.get('/api/weight-closing/summary?recompute=1').get_json()['open_orders'], 99)
+        self.assertEqual(client.post('/api/weight-closing/summary/recompute').get_json()['open_orders'], 5)
+        self.assertEqual(client.get('/api/weight-closing/summary').get_json()['open_orders'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
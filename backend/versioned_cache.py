@@ -0,0 +1,207 @@
+"""Per-process caches of small, rarely-changing tables with cross-process invalidation.
+
+A `VersionedCache` keeps one value built by its loader and rebuilds it when the
+cache's version changes. The authoritative version is a row in
+``cache_version`` (models.CacheVersion):
+
+- writers mark the session with `mark_changed(session, name)` (usually from
+  mapper / bulk listeners); when that session commits, the row is bumped in the
+  same transaction, so the new version becomes visible exactly when the data
+  does, in every gunicorn worker and in the scheduler;
+- each process polls the row at most every ``check_seconds``.
+
+Redis is only an accelerator: with it enabled every commit also increments
+``cache:<name>:version`` and processes poll that key instead, reading the table
+only every CACHE_VERSION_DB_CHECK_SECONDS in case a publish was lost. When Redis
+is disabled or unreachable the table is polled directly.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from config import CACHE_VERSION_DB_CHECK_SECONDS, ENABLE_REDIS_CACHE
+from models import CacheVersion, db
+from redis_client import get_redis
+
+T = TypeVar('T')
+
+_SESSION_CHANGED_KEY = 'versioned_cache_changed'
+
+# Process-wide caches, invalidated locally as soon as this process commits a change.
+_registry: Dict[str, 'VersionedCache'] = {}
+
+
+def _redis():
+    return get_redis() if ENABLE_REDIS_CACHE else None
+
+
+def read_shared_version(name: str) -> Optional[int]:
+    return db.session.execute(select(CacheVersion.version).where(CacheVersion.name == name)).scalar()
+
+
+def bump_shared_version(session, name: str) -> None:
+    """Increment the ``cache_version`` row for `name` in `session`'s transaction."""
+    now = datetime.utcnow()
+    result = session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        session.execute(insert(CacheVersion).values(name=name, version=1, updated_at=now))
+
+
+class VersionedCache(Generic[T]):
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[int], T],
+        check_seconds: float,
+        db_check_seconds: float = CACHE_VERSION_DB_CHECK_SECONDS,
+    ):
+        self.name = name
+        self.redis_key = f'cache:{name}:version'
+        self.check_seconds = max(float(check_seconds), 0.0)
+        self.db_check_seconds = max(float(db_check_seconds), 0.0)
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._version = 0
+        self._seen_redis: Optional[str] = None
+        self._seen_db: Optional[int] = None
+        self._last_check: Optional[float] = None
+        self._last_db_check: Optional[float] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._value = None
+
+    def _sync(self) -> None:
+        now = time.monotonic()
+        if self._last_check is not None and (now - self._last_check) < self.check_seconds:
+            return
+        self._last_check = now
+        changed = False
+
+        polled_redis = False
+        r = _redis()
+        if r is not None:
+            try:
+                shared = r.get(self.redis_key)
+            except Exception:
+                shared = None
+            else:
+                polled_redis = True
+                shared = shared.decode('utf-8') if hasattr(shared, 'decode') else shared
+                if shared != self._seen_redis:
+                    self._seen_redis = shared
+                    changed = True
+
+        if (
+            not polled_redis
+            or self._last_db_check is None
+            or (now - self._last_db_check) >= self.db_check_seconds
+        ):
+            self._last_db_check = now
+            version = read_shared_version(self.name)
+            if version != self._seen_db:
+                self._seen_db = version
+                changed = True
+
+        if changed:
+            self._drop()
+
+    def get(self) -> T:
+        self._sync()
+        value = self._value
+        if value is not None:
+            return value
+        with self._lock:
+            if self._value is None:
+                self._value = self._loader(self._version)
+            return self._value
+
+    def invalidate(self, broadcast: bool = True) -> None:
+        """Drop the local value; with `broadcast`, also publish the change to Redis.
+
+        Other processes learn about committed changes from ``cache_version``
+        regardless; the Redis publish only makes them notice sooner.
+        """
+        self._drop()
+        if not broadcast:
+            return
+        r = _redis()
+        if r is None:
+            return
+        try:
+            shared = r.incr(self.redis_key)
+        except Exception:
+            return
+        self._seen_redis = str(shared)
+
+
+def register_cache(cache: VersionedCache) -> VersionedCache:
+    """Make `cache` the process-wide instance that commits in this process invalidate directly."""
+    _registry[cache.name] = cache
+    return cache
+
+
+def invalidate_cache(name: str, broadcast: bool = True) -> None:
+    cache = _registry.get(name)
+    if cache is not None:
+        cache.invalidate(broadcast=broadcast)
+
+
+def mark_changed(session, name: str) -> None:
+    """Bump cache `name` when `session` commits (in the same transaction)."""
+    if session is not None:
+        session.info.setdefault(_SESSION_CHANGED_KEY, set()).add(name)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_before_commit(session):
+    if session.in_nested_transaction():
+        return
+    # Flush first: the mapper listeners that mark the session run during flush.
+    session.flush()
+    for name in sorted(session.info.get(_SESSION_CHANGED_KEY, ())):
+        bump_shared_version(session, name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for name in session.info.pop(_SESSION_CHANGED_KEY, ()):
+        invalidate_cache(name)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_after_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        return
+    # A cache may have been built from flushed-but-rolled-back rows; nothing
+    # was committed, so other processes are unaffected.
+    for name in session.info.pop(_SESSION_CHANGED_KEY, ()):
+        invalidate_cache(name, broadcast=False)
+
+
+__all__ = [
+    'VersionedCache',
+    'bump_shared_version',
+    'invalidate_cache',
+    'mark_changed',
+    'read_shared_version',
+    'register_cache',
+]
@@ -0,0 +1,294 @@
+"""FIFO queue over open weight-closing orders, plus the open-weight counter.
+
+Scrap purchases and cash settlements consume open orders oldest first. Instead
+of loading every open order, `iter_open_orders` walks the queue in small
+batches on the (status, created_at) index and, on PostgreSQL, locks each batch
+with ``FOR UPDATE SKIP LOCKED`` so two concurrent consumers never execute the
+same order twice (the second one simply moves on to the next free orders).
+
+`WeightClosingOpenTotals` keeps the number of open orders and their remaining
+weight as a sum of bucket rows: row 0 holds the last recomputed baseline and
+rows 1..TOTALS_BUCKETS collect deltas. Every flush that inserts, updates or
+deletes a WeightClosingOrder applies its delta with one atomic
+``UPDATE ... SET x = x + :delta`` on the bucket of the current worker thread,
+so concurrent consumers don't queue on a single row lock. Bulk deletes
+(system wipes) and unknown prior state fall back to a full recompute, which
+folds every bucket back into row 0. Reads sum the (few) bucket rows.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Iterator, Optional, Tuple
+
+from sqlalchemy import and_, event, func, inspect, or_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+
+from models import WeightClosingOpenTotals, WeightClosingOrder, db
+
+LOGGER = logging.getLogger(__name__)
+
+OPEN_STATUSES = ('open', 'partially_closed')
+DEFAULT_BATCH_SIZE = 50
+BASELINE_BUCKET = 0
+TOTALS_BUCKETS = 16
+
+_totals_table = WeightClosingOpenTotals.__table__
+_orders_table = WeightClosingOrder.__table__
+
+_UNKNOWN = object()
+_SESSION_DELTA_KEY = 'weight_closing_open_delta'
+
+
+def iter_open_orders(batch_size: int = DEFAULT_BATCH_SIZE, lock: bool = True) -> Iterator[WeightClosingOrder]:
+    """Yield open orders oldest first, fetching `batch_size` rows at a time.
+
+    The caller stops iterating once its weight is consumed, so only the batches
+    actually needed are read (and locked). Invoices are prefetched per batch.
+    """
+    batch_size = max(int(batch_size), 1)
+    skip_locked = lock and db.session.get_bind().dialect.name == 'postgresql'
+    last: Optional[Tuple[object, int]] = None
+
+    while True:
+        query = (
+            WeightClosingOrder.query
+            .filter(WeightClosingOrder.status.in_(OPEN_STATUSES))
+            .options(selectinload(WeightClosingOrder.invoice))
+            .order_by(WeightClosingOrder.created_at.asc(), WeightClosingOrder.id.asc())
+        )
+        if last is not None:
+            created_at, order_id = last
+            if created_at is None:
+                query = query.filter(WeightClosingOrder.id > order_id)
+            else:
+                query = query.filter(or_(
+                    WeightClosingOrder.created_at > created_at,
+                    and_(WeightClosingOrder.created_at == created_at, WeightClosingOrder.id > order_id),
+                ))
+        if skip_locked:
+            query = query.with_for_update(skip_locked=True, of=WeightClosingOrder)
+
+        batch = query.limit(batch_size).all()
+        for order in batch:
+            yield order
+        if len(batch) < batch_size:
+            return
+        last = (batch[-1].created_at, batch[-1].id)
+
+
+# ---------------------------------------------------------------------------
+# Open-weight counter
+# ---------------------------------------------------------------------------
+
+def _contribution(status, remaining) -> Tuple[int, float]:
+    if status in OPEN_STATUSES:
+        return 1, float(remaining or 0.0)
+    return 0, 0.0
+
+
+def _value_before(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return _UNKNOWN
+
+
+def _scan_open_orders(connection) -> Tuple[int, float]:
+    open_orders, open_weight = connection.execute(
+        select(
+            func.count(_orders_table.c.id),
+            func.coalesce(func.sum(_orders_table.c.remaining_weight_main_karat), 0.0),
+        ).where(_orders_table.c.status.in_(OPEN_STATUSES))
+    ).one()
+    return int(open_orders or 0), float(open_weight or 0.0)
+
+
+def _recompute(connection) -> dict:
+    open_orders, open_weight = _scan_open_orders(connection)
+    values = {
+        'open_orders': open_orders,
+        'open_weight_main_karat': open_weight,
+        'updated_at': func.now(),
+    }
+    connection.execute(_totals_table.delete().where(_totals_table.c.id != BASELINE_BUCKET))
+    result = connection.execute(
+        _totals_table.update().where(_totals_table.c.id == BASELINE_BUCKET).values(**values)
+    )
+    if result.rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(_totals_table.insert().values(id=BASELINE_BUCKET, **values))
+        except IntegrityError:
+            # Another worker created the row first; ours is recomputed next time.
+            pass
+    return values
+
+
+def _worker_bucket() -> int:
+    return 1 + hash((os.getpid(), threading.get_ident())) % TOTALS_BUCKETS
+
+
+def _add_to_bucket(connection, bucket: int, open_orders: int, open_weight: float) -> bool:
+    result = connection.execute(
+        _totals_table.update()
+        .where(_totals_table.c.id == bucket)
+        .values(
+            open_orders=_totals_table.c.open_orders + open_orders,
+            open_weight_main_karat=_totals_table.c.open_weight_main_karat + open_weight,
+            updated_at=func.now(),
+        )
+    )
+    return bool(result.rowcount)
+
+
+def _apply_delta(connection, open_orders: int, open_weight: float) -> None:
+    bucket = _worker_bucket()
+    if _add_to_bucket(connection, bucket, open_orders, open_weight):
+        return
+    baseline = connection.execute(
+        select(_totals_table.c.id).where(_totals_table.c.id == BASELINE_BUCKET)
+    ).first()
+    if baseline is None:
+        # No baseline yet (first use, or a database from before the buckets).
+        _recompute(connection)
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(_totals_table.insert().values(
+                id=bucket,
+                open_orders=open_orders,
+                open_weight_main_karat=open_weight,
+                updated_at=func.now(),
+            ))
+    except IntegrityError:
+        # Another transaction created the bucket meanwhile.
+        _add_to_bucket(connection, bucket, open_orders, open_weight)
+
+
+def _session_delta(target) -> Optional[dict]:
+    session = Session.object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_SESSION_DELTA_KEY, {'orders': 0, 'weight': 0.0, 'recompute': False})
+
+
+def _old_contribution(target):
+    state = inspect(target)
+    old_status = _value_before(state, 'status')
+    old_remaining = _value_before(state, 'remaining_weight_main_karat')
+    if old_status is _UNKNOWN or old_remaining is _UNKNOWN:
+        return None
+    return _contribution(old_status, old_remaining)
+
+
+@event.listens_for(WeightClosingOrder, 'after_insert')
+def _order_inserted(mapper, connection, target):
+    delta = _session_delta(target)
+    if delta is not None:
+        count, weight = _contribution(target.status, target.remaining_weight_main_karat)
+        delta['orders'] += count
+        delta['weight'] += weight
+
+
+@event.listens_for(WeightClosingOrder, 'after_update')
+def _order_updated(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.status.history.has_changes()
+            or state.attrs.remaining_weight_main_karat.history.has_changes()):
+        return
+    delta = _session_delta(target)
+    if delta is None:
+        return
+    old = _old_contribution(target)
+    if old is None:
+        delta['recompute'] = True
+        return
+    new_count, new_weight = _contribution(target.status, target.remaining_weight_main_karat)
+    delta['orders'] += new_count - old[0]
+    delta['weight'] += new_weight - old[1]
+
+
+@event.listens_for(WeightClosingOrder, 'after_delete')
+def _order_deleted(mapper, connection, target):
+    delta = _session_delta(target)
+    if delta is None:
+        return
+    old = _old_contribution(target)
+    if old is None:
+        delta['recompute'] = True
+        return
+    delta['orders'] -= old[0]
+    delta['weight'] -= old[1]
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_flush_delta(session, flush_context):
+    delta = session.info.pop(_SESSION_DELTA_KEY, None)
+    if not delta or not (delta['recompute'] or delta['orders'] or delta['weight']):
+        return
+    connection = session.connection()
+    # A savepoint keeps a missing/locked counter from failing the order write
+    # itself; the counter is then repaired by recompute_open_totals().
+    try:
+        with connection.begin_nested():
+            if delta['recompute']:
+                _recompute(connection)
+            else:
+                _apply_delta(connection, delta['orders'], delta['weight'])
+    except SQLAlchemyError as exc:
+        LOGGER.warning('weight closing open totals not updated: %s', exc)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_pending_delta(session, previous_transaction):
+    session.info.pop(_SESSION_DELTA_KEY, None)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _recompute_after_bulk(context):
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None and mapper.class_ is WeightClosingOrder:
+        connection = context.session.connection()
+        try:
+            with connection.begin_nested():
+                _recompute(connection)
+        except SQLAlchemyError as exc:
+            LOGGER.warning('weight closing open totals not recomputed: %s', exc)
+
+
+def recompute_open_totals() -> dict:
+    """Rebuild the counter from the order table (drift repair / after restores)."""
+    _totals_table.create(db.session.get_bind(), checkfirst=True)
+    _recompute(db.session.connection())
+    db.session.commit()
+    return open_totals()
+
+
+def open_totals() -> dict:
+    """Open orders and remaining weight from the bucket rows (read-only).
+
+    Before the counter exists the order table is scanned instead; nothing is
+    written, the first order change creates the baseline.
+    """
+    buckets, open_orders, open_weight, updated_at = db.session.execute(
+        select(
+            func.count(_totals_table.c.id),
+            func.sum(_totals_table.c.open_orders),
+            func.sum(_totals_table.c.open_weight_main_karat),
+            func.max(_totals_table.c.updated_at),
+        )
+    ).one()
+    if not buckets:
+        open_orders, open_weight = _scan_open_orders(db.session.connection())
+    return {
+        'open_orders': int(open_orders or 0),
+        'open_weight_main_karat': round(open_weight or 0.0, 6),
+        'updated_at': updated_at.isoformat() if updated_at else None,
+    }